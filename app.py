@@ -1,45 +1,66 @@
 from __future__ import annotations
 
 import os
-import json
 import asyncio
 import inspect
-import threading
+import time
+import uuid
 from pathlib import Path
-from typing import Any, Dict, Optional
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
 import streamlit as st
 from dotenv import load_dotenv
-import pandas as pd
 
-from team_factory import build_team
-from db import build_engine, list_tables, get_columns, get_row_count, sample_table
-from memory_store import MemoryStore, safe_json_dumps  
+# team_factory (autogen), db (sqlalchemy), executor and pandas are imported where they are
+# used: Streamlit executes this script for the first render before anything else is shown
+from memory_store import MemoryStore
 from prompts import STEPS
 
 # New imports for structured execution
-from models import SQLBuildOutput,AnalysisPlan,TableDescription
+from models import SQLBuildOutput,SQLArtifact,AnalysisPlan,TableDescription,DashboardSpec
 from llm_json import parse_llm_json
-from executor import execute_and_cache_artifacts
 
 from ui_formatter import beautify_step
-from models import TableDescription
-from llm_json import parse_llm_json
 from table_describer import build_table_description_prompt
+from schema_index import SchemaIndex, build_schema_index, select_profile_slice, select_step_tables, table_id
+from prompt_layout import build_step_prompt
+from step_context import build_carryover, carryover_block, context_metrics
+from live_stream import LiveStreamRenderer
+from jobs import Job, JobContext, get_job_manager, CANCELLED, FAILED, SUCCEEDED
+from loop_service import get_loop_service
+from log_store import LogStore
+from single_flight import get_single_flight
+from tracing import current_trace
+from usage_accounting import UsageRecorder, aggregate
+from startup import prewarm
+from model_manager import FAILED as MODEL_FAILED, WARMING as MODEL_WARMING, get_model_manager
 
 
 
 
 load_dotenv()
 
+if os.getenv("PREWARM", "0") == "1":
+    prewarm()  # once per process, in the background
+
+LOG_PAGE_SIZE = int(os.getenv("LOG_PAGE_SIZE", "10"))
+CATALOG_PAGE_SIZE = int(os.getenv("CATALOG_PAGE_SIZE", "25"))
+
 st.set_page_config(page_title="Agentic Analytics Team (Ollama)", layout="wide")
 
 
 # ---------- helpers ----------
 
 def ensure_session():
+    if "session_id" not in st.session_state:
+        # kept in the URL so a browser reload reattaches to the same persisted log
+        sid = st.query_params.get("sid") or uuid.uuid4().hex[:12]
+        st.query_params["sid"] = sid
+        st.session_state.session_id = sid
     if "logs" not in st.session_state:
-        st.session_state.logs = []
+        st.session_state.logs = LogStore(
+            Path(os.getenv("CACHE_DIR", "./cache")) / "logs" / st.session_state.session_id
+        )
     if "current_step_idx" not in st.session_state:
         st.session_state.current_step_idx = 0
     if "approved_steps" not in st.session_state:
@@ -54,30 +75,195 @@ def ensure_session():
         st.session_state.execution_bundle = None
     if "dataset_previews" not in st.session_state:
         st.session_state.dataset_previews = None
+    if "analysis_plan" not in st.session_state:
+        st.session_state.analysis_plan = None
+    if "dashboard_spec" not in st.session_state:
+        st.session_state.dashboard_spec = None
+    if "chart_data_stats" not in st.session_state:
+        st.session_state.chart_data_stats = None
+    if "schema_index" not in st.session_state:
+        st.session_state.schema_index = None
+    if "step_carryover" not in st.session_state:
+        st.session_state.step_carryover = {}
+    if "step_metrics" not in st.session_state:
+        st.session_state.step_metrics = []
+    if "stream_stats" not in st.session_state:
+        st.session_state.stream_stats = {}
+    if "cancelled_step" not in st.session_state:
+        st.session_state.cancelled_step = None
+    if "applied_jobs" not in st.session_state:
+        st.session_state.applied_jobs = set()
+    if "log_md" not in st.session_state:
+        st.session_state.log_md = {}
+    if "run_traces" not in st.session_state:
+        st.session_state.run_traces = []
+    if "agent_usage" not in st.session_state:
+        st.session_state.agent_usage = []
+    if "guard_review" not in st.session_state:
+        st.session_state.guard_review = None
 
 
 def log(step: str, agent: str, content: str):
-    st.session_state.logs.append({"step": step, "agent": agent, "content": content})
+    st.session_state.logs.append(step, agent, content)
+
+
+def formatted_log(step_key: str, entry) -> str:
+    """beautify_step output, memoized per log entry (entries are immutable once logged)."""
+    cache: Dict[int, str] = st.session_state.log_md
+    md = cache.get(entry.id)
+    if md is None:
+        if len(cache) > 2 * LOG_PAGE_SIZE * len(STEPS):
+            cache.clear()
+        md = beautify_step(step_key, entry.agent, st.session_state.logs.content(entry))
+        cache[entry.id] = md
+    return md
 
 
 def render_logs(step_key: str):
-    items = [x for x in st.session_state.logs if x["step"] == step_key]
+    store: LogStore = st.session_state.logs
+    items = store.entries(step_key)
     if not items:
         st.info ("No output yet for this step.")
         return
-    for i, it in enumerate(items):
-        with st.expander(f"{it['agent']} output #{i+1}", expanded=(i == len(items) - 1)):
-            formatted = beautify_step(step_key,it['agent'],it['content'])
-            st.markdown(formatted,unsafe_allow_html=False)
-
-
-async def run_team_stream(team, task: str, step_key: str):
-    async for msg in team.run_stream(task=task):
-        agent = getattr(msg, "source", None) or getattr(msg, "name", None) or msg.__class__.__name__
-        content = getattr(msg, "content", None)
-        if content is None:
-            content = str(msg)
-        log(step_key, str(agent), str(content))
+    start = 0
+    if len(items) > LOG_PAGE_SIZE:
+        show_all = st.toggle(f"Show all {len(items)} outputs", key=f"log_all_{step_key}")
+        if not show_all:
+            start = len(items) - LOG_PAGE_SIZE
+            st.caption(f"Showing the latest {LOG_PAGE_SIZE} of {len(items)} outputs.")
+    for i in range(start, len(items)):
+        it = items[i]
+        with st.expander(f"{it.agent} output #{i+1}", expanded=(i == len(items) - 1)):
+            st.markdown(formatted_log(step_key, it),unsafe_allow_html=False)
+
+
+def render_model_status():
+    mgr = get_model_manager()
+    info = mgr.summary()
+    if mgr.status == MODEL_WARMING:
+        st.caption(f"⏳ Loading `{info['model']}` on the Ollama server…")
+    elif mgr.status == MODEL_FAILED:
+        st.warning(f"Model warm-up failed: {mgr.error}")
+        if st.button("Retry warm-up"):
+            mgr.warm_up()
+    elif info["warmup_load_s"] is not None:
+        st.caption(
+            f"`{info['model']}` resident (keep_alive {mgr.settings.keep_alive}, num_ctx {mgr.settings.num_ctx}); "
+            f"warm-up load {info['warmup_load_s']}s"
+        )
+    timings = mgr.timings()
+    if timings:
+        with st.expander(f"⏱ Model timings ({info['calls']} calls, {info['reloads']} reloads)"):
+            st.dataframe([t.to_dict() for t in timings[-50:]], width='stretch')
+
+
+def render_catalog(tables: List[Dict[str, Any]]):
+    """Searchable, paginated catalog: only one page of table expanders is built per rerun."""
+    query = st.text_input("Search tables", key="catalog_query", placeholder="name, column or business term")
+    if query.strip():
+        index = st.session_state.schema_index
+        if index is not None:
+            by_id = {f"{t['schema']}.{t['table']}": t for t in tables}
+            matches = [by_id[tid] for tid, _ in index.search(query, k=len(by_id)) if tid in by_id]
+        else:
+            q = query.strip().lower()
+            matches = [t for t in tables if q in f"{t['schema']}.{t['table']}".lower()]
+    else:
+        matches = tables
+
+    n_pages = max(1, -(-len(matches) // CATALOG_PAGE_SIZE))
+    page = 1
+    if n_pages > 1:
+        page = int(st.number_input(f"Page (of {n_pages})", min_value=1, max_value=n_pages, value=1, key="catalog_page"))
+    page_items = matches[(page - 1) * CATALOG_PAGE_SIZE : page * CATALOG_PAGE_SIZE]
+    st.caption(f"{len(matches)} of {len(tables)} tables")
+
+    for t in page_items:
+        with st.expander(f"📄 {t['schema']}.{t['table']}"):
+            st.markdown(f"**Description**: {t.get('table_description', '—')}")
+            st.markdown(f"**Business Meaning**: {t.get('business_meaning', '—')}")
+
+            if t.get("important_columns"):
+                st.markdown("**Important Columns**")
+                st.write(", ".join(t["important_columns"]))
+
+            if t.get("dashboard_use_cases"):
+                st.markdown("**Dashboard Use Cases**")
+                for uc in t["dashboard_use_cases"]:
+                    st.markdown(f"- {uc}")
+
+            if t.get("typical_joins"):
+                st.markdown("**Typical Joins**")
+                for j in t["typical_joins"]:
+                    st.markdown(f"- {j}")
+
+
+async def run_team_stream(
+    team,
+    task: str,
+    reset: bool = True,
+    renderer: Optional[LiveStreamRenderer] = None,
+    cancellation_token=None,
+    usage: Optional[UsageRecorder] = None,
+) -> List[Tuple[str, str]]:
+    """
+    Runs the team on `task` and returns [(agent, content), ...] for this run.
+    The team is reset first so agents don't carry earlier steps' transcripts;
+    earlier results reach the prompt through the compact carry-over instead.
+
+    Token chunks go to `renderer` (live text + TTFT/tok-s stats), not to the result.
+    If `cancellation_token` is cancelled, generation stops and the partial output
+    of the current agent is returned with a "[cancelled]" marker.
+    Per-message tokens / generation time / TTFT go to `usage` (and to the active trace).
+    No Streamlit calls here: this runs inside background jobs.
+    """
+    from autogen_agentchat.messages import ModelClientStreamingChunkEvent
+    from autogen_core import CancellationToken
+
+    if reset:
+        await team.reset()
+    token = cancellation_token or CancellationToken()
+    messages: List[Tuple[str, str]] = []
+    trace = current_trace()
+    rec = usage if usage is not None else UsageRecorder("", "")
+    rec.turn_start = time.perf_counter()
+    try:
+        async for msg in team.run_stream(task=task, cancellation_token=token):
+            agent = getattr(msg, "source", None) or getattr(msg, "name", None) or msg.__class__.__name__
+            if isinstance(msg, ModelClientStreamingChunkEvent):
+                rec.on_chunk()
+                if renderer is not None:
+                    renderer.on_chunk(str(agent), msg.content)
+                continue
+            content = getattr(msg, "content", None)
+            if content is None:
+                content = str(msg)
+            models_usage = getattr(msg, "models_usage", None)
+            if renderer is not None:
+                renderer.on_message(str(agent), getattr(models_usage, "completion_tokens", None))
+            turn_start = rec.turn_start
+            row = rec.on_message(str(agent), str(content), models_usage)
+            if trace is not None and row is not None:
+                trace.add_span(
+                    f"agent.{agent}",
+                    turn_start,
+                    turn_start + row.gen_s,
+                    cat="agent",
+                    lane="agents",
+                    prompt_tokens=row.prompt_tokens,
+                    completion_tokens=row.completion_tokens,
+                    ttft_s=row.ttft_s,
+                    chars=row.chars,
+                )
+            messages.append((str(agent), str(content)))
+    except (asyncio.CancelledError, Exception):
+        if not token.is_cancelled():
+            raise
+        partial = renderer.partial_text() if renderer is not None else ""
+        if partial and renderer.current is not None:
+            messages.append((renderer.current.agent, partial + "\n\n[cancelled]"))
+            rec.on_message(renderer.current.agent, partial, cancelled=True)
+    return messages
 
 
 def latest_agent_output(step_key: str, agent_name: Optional[str] = None) -> Optional[str]:
@@ -86,103 +272,51 @@ def latest_agent_output(step_key: str, agent_name: Optional[str] = None) -> Opti
     - If agent_name is provided, match exact OR substring (case-insensitive)
     - If not found, fallback to any message in the step that looks like SQLBuilder JSON (contains "artifacts")
     """
-    agent_name_norm = (agent_name or "").strip().lower()
+    store: LogStore = st.session_state.logs
 
     # 1) Try exact / substring match
     if agent_name:
-        for it in reversed(st.session_state.logs):
-            if it["step"] != step_key:
-                continue
-            a = str(it["agent"]).strip().lower()
-            if a == agent_name_norm or agent_name_norm in a:
-                return it["content"]
+        it = store.latest_matching_agent(step_key, agent_name)
+        if it is not None:
+            return store.content(it)
 
     # 2) Fallback: pick latest JSON-ish content for that step
-    for it in reversed(st.session_state.logs):
-        if it["step"] != step_key:
-            continue
-        c = str(it["content"])
-        if '"artifacts"' in c or "'artifacts'" in c:
-            return c
-
     # 3) Last fallback: any content from that step
-    for it in reversed(st.session_state.logs):
-        if it["step"] == step_key:
-            return str(it["content"])
-
-    return None
-
-
-def build_db_profile() -> Dict[str, Any]:
-    engine = build_engine()
-    tables_df = list_tables(engine)
-
-    profile: Dict[str, Any] = {"tables": []}
-    for _, row in tables_df.iterrows():
-        schema = row["schema_name"]
-        table = row["table_name"]
-        cols = get_columns(engine, schema, table)
-        try:
-            cnt = get_row_count(engine, schema, table)
-        except Exception:
-            cnt = None
-        try:
-            samp = sample_table(engine, schema, table, n=500)
-        except Exception:
-            samp = pd.DataFrame()
-
-        profile["tables"].append(
-            {
-                "schema": schema,
-                "table": table,
-                "row_count": cnt,
-                "columns": cols.to_dict(orient="records"),
-                "sample_rows": samp.head(5000).to_dict(orient="records"),
-            }
-        )
-    return profile
-
-
-def step_task_prompt(step_key: str, step_goal: str, user_request: str, db_profile: Dict[str, Any]) -> str:
-    # Use safe_json_dumps so Timestamp/Date won't crash prompts
-    db_json = safe_json_dumps(db_profile, indent=2)[:60000]
-
-    return f"""
-You are a multi-agent TEAM executing ONLY: {step_key}
-Goal: {step_goal}
-
-Context:
-- Model: Ollama deepseek-r1:8b
-- Human-in-loop: ALWAYS (user approves each step in UI)
-- Database profile (tables/columns/samples) is provided as JSON below.
-
-User dashboard request (may be empty in early steps):
-{user_request}
-
-DB_PROFILE_JSON:
-{db_json}
-
-Rules:
-- Be extremely detailed and practical.
-- SQLBuilder must produce SELECT-only SQL (read-only) and MUST output JSON (no extra text).
-- Reviewer must end with exactly "APPROVE_STEP" if the step is acceptable, otherwise list specific fixes.
-- Do NOT proceed to other steps.
-"""
-
+    it = store.latest_artifacts(step_key) or store.latest(step_key)
+    return store.content(it) if it is not None else None
+
+
+def step_task_prompt(
+    step_key: str,
+    step_goal: str,
+    user_request: str,
+    db_profile: Dict[str, Any],
+    schema_index: Optional[SchemaIndex] = None,
+    carryover: str = "",
+    executed: str = "",
+) -> str:
+    # Only ship the tables relevant to this request (BM25 over names/columns/descriptions).
+    # That slice depends on the request only, not the step, so the prompt prefix
+    # (rules + profile) stays byte-identical across steps and Ollama can reuse its KV-cache;
+    # tables this step's goal and carry-over point at beyond it go in the suffix.
+    top_k = int(os.getenv("PROFILE_TOP_K", "25"))
+    sliced = select_profile_slice(db_profile, schema_index, user_request, k=top_k)
+    extra = select_step_tables(
+        db_profile, schema_index, f"{step_goal}\n{carryover}", sliced, k=int(os.getenv("PROFILE_STEP_TOP_K", "5"))
+    )
+    return build_step_prompt(step_key, step_goal, user_request, sliced, carryover, executed, extra)
 
 
 def _team_run_sync(team, prompt: str) -> str:
     """
     team.run() is sometimes async depending on autogen version.
     This helper makes it safe in Streamlit (sync script).
+    Each call starts from a clean team state (one-shot prompts, no shared history).
     """
+    resolve_if_coroutine(team.reset())
     resp = team.run(task=prompt)
     resp = resolve_if_coroutine(resp)
 
-    # If autogen returns coroutine -> run it
-    if asyncio.iscoroutine(resp):
-        resp = asyncio.run(resp)
-
     # Normalize to string content
     if isinstance(resp, str):
         return resp
@@ -195,15 +329,22 @@ def _team_run_sync(team, prompt: str) -> str:
     return str(resp)
 
 
-def enrich_tables_with_descriptions(profile: Dict[str, Any], team) -> Dict[str, Any]:
+def enrich_tables_with_descriptions(
+    profile: Dict[str, Any],
+    team,
+    schema_index: Optional[SchemaIndex] = None,
+    progress: Optional[Callable[[float, str], None]] = None,
+) -> Dict[str, Any]:
     """
     Sync function: generates descriptions table-by-table
-    and stores them in the profile dict.
+    and stores them in the profile dict (and the relevance index, if given).
     """
     tables = profile.get("tables", [])
-    for table in tables:
+    for i, table in enumerate(tables):
         if table.get("table_description"):
             continue
+        if progress is not None:
+            progress(i / max(len(tables), 1), f"Describing {table.get('schema')}.{table.get('table')}")
 
         prompt = build_table_description_prompt(table)
 
@@ -220,31 +361,18 @@ def enrich_tables_with_descriptions(profile: Dict[str, Any], team) -> Dict[str,
         table["typical_joins"] = desc.get("typical_joins", [])
         table["dashboard_use_cases"] = desc.get("dashboard_use_cases", [])
 
+        if schema_index is not None:
+            schema_index.upsert_table(table)
+
     return profile
 
 def run_coro_sync(coro):
     """
-    Run an async coroutine from Streamlit safely (even if an event loop is already running),
-    by executing it in a separate thread with its own event loop.
+    Run an async coroutine from Streamlit (or a job thread) on the process-wide
+    background event loop and wait for the result. One persistent loop means
+    model clients keep their HTTP connections alive across calls.
     """
-    result = {"value": None, "error": None}
-
-    def _runner():
-        try:
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            result["value"] = loop.run_until_complete(coro)
-            loop.close()
-        except Exception as e:
-            result["error"] = e
-
-    t = threading.Thread(target=_runner, daemon=True)
-    t.start()
-    t.join()
-
-    if result["error"]:
-        raise result["error"]
-    return result["value"]
+    return get_loop_service().run(coro)
 
 
 def resolve_if_coroutine(x):
@@ -254,31 +382,396 @@ def resolve_if_coroutine(x):
     return x
 
 
+# ---------- background jobs ----------
+# Job functions run in worker threads: no st.* calls, results are applied to the
+# session by apply_job_result() when the jobs panel sees them finish.
+
+def _job_progress(ctx: JobContext) -> Callable[[float, str], None]:
+    def _progress(fraction: float, message: str) -> None:
+        ctx.check_cancelled()
+        ctx.progress(fraction, message)
+
+    return _progress
+
+
+def job_scan(ctx: JobContext) -> Dict[str, Any]:
+    from db import build_db_profile
+
+    prof = build_db_profile(progress=_job_progress(ctx))
+
+    cache_dir = Path(os.getenv("CACHE_DIR", "./cache"))
+    mem = MemoryStore(cache_dir)
+    with mem.edit_json() as mem_json:
+        mem_json["db_profile"] = prof
+    return {"profile": prof}
+
+
+def job_describe(ctx: JobContext, profile: Dict[str, Any], team) -> Dict[str, Any]:
+    # work on a copy of the table dicts: the session keeps reading the original meanwhile
+    prof = dict(profile)
+    prof["tables"] = [dict(t) for t in profile.get("tables", [])]
+    todo = [t for t in prof["tables"] if not t.get("table_description")]
+    enrich_tables_with_descriptions(prof, team, progress=_job_progress(ctx))
+    # the session's index is updated with just these (apply_job_result): it is read while this runs
+    return {"profile": prof, "described": [table_id(t) for t in todo if t.get("table_description")]}
+
+
+async def _stream_job(ctx: JobContext, team, task: str, renderer: LiveStreamRenderer, usage: UsageRecorder):
+    from autogen_core import CancellationToken
+
+    token = CancellationToken()
+    ctx.on_cancel(lambda: get_loop_service().call_soon(token.cancel))
+    return await run_team_stream(team, task, renderer=renderer, cancellation_token=token, usage=usage)
+
+
+def job_team_run(ctx: JobContext, team, task: str, step_key: str) -> Dict[str, Any]:
+    renderer = LiveStreamRenderer(None)
+    usage = UsageRecorder(run_id=ctx.job_id, step=step_key)
+    ctx.set_live(renderer)
+    ctx.progress(0.0, f"Running {step_key}")
+    t0 = time.perf_counter()
+    messages = run_coro_sync(_stream_job(ctx, team, task, renderer, usage))
+    try:
+        MemoryStore(Path(os.getenv("CACHE_DIR", "./cache"))).save_agent_usage(usage.to_dicts())
+    except Exception:
+        pass  # accounting is best-effort, like job persistence
+    return {
+        "step": step_key,
+        "messages": messages,
+        "stream_stats": renderer.stats(),
+        "usage": usage.to_dicts(),
+        "elapsed_s": time.perf_counter() - t0,
+    }
+
+
+def job_execute(
+    ctx: JobContext,
+    artifacts,
+    analysis_plan: Optional[Dict[str, Any]],
+    dashboard_spec: Optional[Dict[str, Any]] = None,
+    incremental: bool = False,
+) -> Dict[str, Any]:
+    from chart_data import default_chart_store, prepare_chart_data
+    from dashboard_compiler import default_spec, validate_spec
+    from db import build_engine
+    from executor import execute_and_cache_artifacts
+    from models import ExecutionBundle
+    from query_guard import QueryGuardError, guard_from_memory
+
+    engine = build_engine()
+    cache_dir = Path(os.getenv("CACHE_DIR", "./cache"))
+    mem = MemoryStore(cache_dir)
+
+    try:
+        bundle, previews = execute_and_cache_artifacts(
+            engine,
+            mem,
+            artifacts,
+            analysis_plan=analysis_plan,
+            progress=_job_progress(ctx),
+            incremental=incremental,
+            guard=guard_from_memory(mem.load_json()),
+        )
+    except QueryGuardError as e:
+        # nothing ran: hand the findings back so the user can approve these exact queries
+        return {
+            "guard_review": [r.to_dict() for r in e.reviews],
+            "resubmit": {
+                "artifacts": [a.model_dump() for a in artifacts],
+                "analysis_plan": analysis_plan,
+                "dashboard_spec": dashboard_spec,
+                "incremental": incremental,
+            },
+        }
+
+    # Persist to memory.json
+    with mem.edit_json() as mem_json:
+        mem_json["execution_bundle"] = bundle.model_dump()
+        # what refresh.py re-runs headless
+        mem_json["sql_artifacts"] = [a.model_dump() for a in artifacts]
+        if analysis_plan:
+            mem_json["analysis_plan"] = analysis_plan
+        if dashboard_spec:
+            mem_json["dashboard_spec"] = dashboard_spec
+
+    # chart-data stage: aggregated, downsampled payloads for the dashboard widgets
+    plan = AnalysisPlan(**analysis_plan) if analysis_plan else None
+    if dashboard_spec:
+        spec = validate_spec(DashboardSpec(**dashboard_spec), bundle, plan)[0]
+    else:
+        spec = default_spec(bundle, plan)
+    chart_stats = prepare_chart_data(bundle, spec, plan, default_chart_store(), progress=_job_progress(ctx))
+
+    return {
+        "execution_bundle": bundle.model_dump(),
+        "dataset_previews": {k: v.to_dict(orient="records") for k, v in previews.items()},
+        "analysis_plan": analysis_plan,
+        "chart_data": chart_stats,
+    }
+
+
+def job_layout(ctx: JobContext, bundle: Dict[str, Any], plan: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """One small model call for a DashboardSpec; the page itself is compiled without the LLM."""
+    from autogen_core.models import UserMessage
+
+    from dashboard_compiler import spec_prompt
+    from llm import get_model_client
+    from models import ExecutionBundle
+
+    ctx.progress(0.0, "Asking the model for a layout")
+    prompt = spec_prompt(ExecutionBundle(**bundle), AnalysisPlan(**plan) if plan else None)
+    result = run_coro_sync(get_model_client(DashboardSpec).create([UserMessage(content=prompt, source="user")]))
+    spec = parse_llm_json(str(result.content), DashboardSpec)
+    return {"dashboard_spec": spec.model_dump()}
+
+
+def submit_job(kind: str, fn, *args, label: str = "", meta: Optional[Dict[str, Any]] = None) -> str:
+    return get_job_manager().submit(
+        kind, fn, *args, owner=st.session_state.session_id, label=label or kind, meta=meta
+    )
+
+
+def session_jobs() -> List[Job]:
+    return get_job_manager().jobs_for(st.session_state.session_id)
+
+
+def team_busy() -> bool:
+    """Step runs and description passes share the session's team: one at a time."""
+    return any(j.kind in ("describe", "step") and not j.done for j in session_jobs())
+
+
+def _stats_label(stats: Optional[Dict[str, Any]]) -> str:
+    if not stats:
+        return "—"
+    if stats.get("error"):
+        return "failed"
+    label = "sampled" if stats.get("sampled") else "full scan"
+    return label + (f", {len(stats['skipped_columns'])} cols skipped" if stats.get("skipped_columns") else "")
+
+
+def apply_job_result(job: Job) -> None:
+    """Fold a finished job's result into the session (script thread only)."""
+    if job.trace is not None:
+        st.session_state.run_traces.append(
+            {
+                "label": job.label,
+                "status": job.status,
+                "elapsed_s": job.elapsed_s,
+                "path": str(job.trace.path) if job.trace.path else None,
+                "spans": job.trace.summary(),
+            }
+        )
+        del st.session_state.run_traces[: -int(os.getenv("RUN_TRACES_KEEP", "20"))]
+    res = job.result or {}
+    if job.kind in ("scan", "describe") and job.status == SUCCEEDED:
+        st.session_state.db_profile = res["profile"]
+        index = st.session_state.schema_index
+        if job.kind == "describe" and index is not None:
+            described = set(res.get("described", []))
+            for t in res["profile"].get("tables", []):
+                if table_id(t) in described:
+                    index.upsert_table(t)
+        else:
+            st.session_state.schema_index = build_schema_index(res["profile"])
+    elif job.kind == "step" and res:
+        step_key = res["step"]
+        for agent, content in res["messages"]:
+            log(step_key, agent, content)
+        st.session_state.stream_stats[step_key] = res["stream_stats"]
+        st.session_state.agent_usage.extend(res.get("usage", []))
+        st.session_state.step_metrics.append(
+            context_metrics(
+                step_key, job.meta.get("task", ""), job.meta.get("carry_text", ""), res["messages"], res["elapsed_s"]
+            ).to_dict()
+        )
+        if job.status == SUCCEEDED:
+            st.session_state.step_carryover[step_key] = build_carryover(step_key, res["messages"])
+            if step_key == "TASK_7_DASHBOARD_BUILD":
+                spec_text = latest_agent_output(step_key, "dashboard_builder")
+                try:
+                    st.session_state.dashboard_spec = parse_llm_json(spec_text or "", DashboardSpec).model_dump()
+                    _recompile_quietly()
+                except Exception:
+                    pass  # not a layout spec (e.g. a full HTML page): shown as-is below
+        st.session_state.cancelled_step = step_key if job.status == CANCELLED else None
+    elif job.kind == "execute" and job.status == SUCCEEDED and "guard_review" in res:
+        st.session_state.guard_review = res
+    elif job.kind == "execute" and job.status == SUCCEEDED:
+        st.session_state.guard_review = None
+        st.session_state.execution_bundle = res["execution_bundle"]
+        st.session_state.dataset_previews = res["dataset_previews"]
+        st.session_state.analysis_plan = res.get("analysis_plan")
+        st.session_state.chart_data_stats = res.get("chart_data")
+        _recompile_quietly()
+    elif job.kind == "layout" and job.status == SUCCEEDED:
+        st.session_state.dashboard_spec = res["dashboard_spec"]
+        _recompile_quietly()
+
+
+def compile_dashboard_html() -> Optional[List[str]]:
+    """(Re)build the Task-7 page from the prepared chart data; returns the spec parts that were dropped."""
+    from chart_data import default_chart_store
+    from dashboard_compiler import compile_dashboard, validate_spec
+    from data_api import get_data_api
+    from models import ExecutionBundle
+
+    if not st.session_state.execution_bundle:
+        return None
+    bundle = ExecutionBundle(**st.session_state.execution_bundle)
+    plan = AnalysisPlan(**st.session_state.analysis_plan) if st.session_state.analysis_plan else None
+    spec, dropped = None, []
+    if st.session_state.dashboard_spec:
+        spec, dropped = validate_spec(DashboardSpec(**st.session_state.dashboard_spec), bundle, plan)
+    api = get_data_api()
+    st.session_state.dashboard_html = compile_dashboard(
+        bundle, spec, plan, store=default_chart_store(), api_url=api.public_url if api else None
+    )
+    return dropped
+
+
+def _recompile_quietly() -> None:
+    # job results are applied from the jobs panel: a failed build must not break it,
+    # the Task-7 section shows the error when the user compiles explicitly
+    try:
+        compile_dashboard_html()
+    except Exception:
+        pass
+
+
+def render_usage_panel() -> None:
+    scope = st.session_state.get("usage_scope", "This session")
+    if scope == "This session" and not st.session_state.agent_usage:
+        return
+    with st.expander("💰 Tokens & latency per agent"):
+        scope = st.radio("Scope", ["This session", "All runs (cache)"], horizontal=True, key="usage_scope")
+        if scope == "This session":
+            rows = st.session_state.agent_usage
+        else:
+            rows = MemoryStore(Path(os.getenv("CACHE_DIR", "./cache"))).load_agent_usage()
+        if not rows:
+            st.caption("No agent messages recorded yet.")
+            return
+        per_agent = aggregate(rows, ["agent"])
+        per_step = aggregate(rows, ["step"])
+        per_run = aggregate(rows, ["run_id", "step"])
+        c1, c2 = st.columns(2)
+        with c1:
+            st.caption("Generation time per agent (s)")
+            st.bar_chart(per_agent, x="agent", y="gen_s")
+        with c2:
+            st.caption("Tokens per step")
+            st.bar_chart(per_step, x="step", y=["prompt_tokens", "completion_tokens"])
+        st.dataframe(per_agent, width='stretch', hide_index=True)
+        if per_agent["estimated"].any():
+            st.caption(
+                "`estimated`: messages from streams stopped early, which report no token counts; "
+                "their completion tokens are streamed chunks and their prompt tokens are missing from the totals."
+            )
+        st.caption("Per run")
+        st.dataframe(per_run, width='stretch', hide_index=True)
+
+
+def render_timing_panel() -> None:
+    runs = st.session_state.run_traces
+    if not runs:
+        return
+    with st.expander("⏱ Run timings"):
+        idx = st.selectbox(
+            "Run",
+            list(range(len(runs)))[::-1],
+            format_func=lambda i: f"{runs[i]['label']} · {runs[i]['status']} · {runs[i]['elapsed_s'] or 0:.1f}s",
+            key="timing_run",
+        )
+        run = runs[idx]
+        spans = [s for s in run["spans"] if s["depth"] > 0]
+        if not spans:
+            st.caption("No spans recorded for this run.")
+            return
+        import pandas as pd
+
+        df = pd.DataFrame(spans)
+        # inclusive time per span name (nested spans also count toward their parents)
+        by_name = df.groupby("name", as_index=False).agg(total_ms=("dur_ms", "sum"), calls=("dur_ms", "size"))
+        st.bar_chart(by_name.sort_values("total_ms", ascending=False).head(15), x="name", y="total_ms")
+        st.dataframe(df.drop(columns=["name", "depth"]), width='stretch', hide_index=True)
+        if run["path"] and Path(run["path"]).exists():
+            st.download_button(
+                "⬇ Chrome trace (chrome://tracing / ui.perfetto.dev)",
+                Path(run["path"]).read_bytes(),
+                file_name=Path(run["path"]).name,
+                mime="application/json",
+                key=f"trace_dl_{idx}",
+            )
+
+
+def render_query_sharing_panel() -> None:
+    flight = get_single_flight()
+    info = flight.summary()
+    if not info["coalesced"]:
+        return
+    with st.expander(
+        f"🔗 Shared warehouse queries ({info['coalesced']} executions saved, {info['saved_ms'] / 1000:.1f}s)"
+    ):
+        st.caption("Identical queries in flight at the same time, from any session, ran once and shared the result.")
+        import pandas as pd
+
+        df = pd.DataFrame([row for row in flight.stats() if row["coalesced"]]).drop(columns=["key"])
+        st.dataframe(df, width='stretch', hide_index=True)
+
+
+def render_jobs_panel() -> None:
+    mgr = get_job_manager()
+    jobs = session_jobs()
+    if not jobs:
+        return
+
+    newly_done = [j for j in jobs if j.done and j.job_id not in st.session_state.applied_jobs]
+    if newly_done:
+        for j in newly_done:
+            apply_job_result(j)
+            st.session_state.applied_jobs.add(j.job_id)
+        st.rerun()
+
+    with st.expander("⏳ Background jobs", expanded=any(not j.done for j in jobs)):
+        for j in reversed(jobs):
+            elapsed = f"{j.elapsed_s:.0f}s" if j.elapsed_s is not None else "queued"
+            st.markdown(f"**{j.label}** · `{j.status}` · {elapsed}")
+            if not j.done:
+                st.progress(j.progress, text=j.message or None)
+                if st.button("⏹ Cancel", key=f"cancel_{j.job_id}"):
+                    mgr.cancel(j.job_id)
+                if isinstance(j.live, LiveStreamRenderer) and j.live.current is not None:
+                    st.markdown(j.live.markdown())
+            elif j.status == FAILED:
+                st.error(j.error)
+        if any(j.done for j in jobs) and st.button("Clear finished jobs"):
+            for j in jobs:
+                if j.done:
+                    mgr.forget(j.job_id)
+            st.rerun()
+
+
 # ---------- UI ----------
 ensure_session()
 
 st.title("🧠 Agentic Analytics Team")
 
+# Poll background jobs (only while something is running)
+_poll_s = float(os.getenv("JOB_POLL_S", "1.0"))
+_active = any(not j.done for j in session_jobs())
+st.fragment(run_every=_poll_s if _active else None)(render_jobs_panel)()
+render_timing_panel()
+render_query_sharing_panel()
+
 left, right = st.columns([0.52, 0.48], gap="large")
 
 with left:
     st.subheader("1) Connection & DB Scan")
 
-    if st.button("Scan DB (schema + samples)", type="primary"):
-        try:
-            with st.spinner("Scanning DB..."):
-                prof = build_db_profile()
-                st.session_state.db_profile = resolve_if_coroutine(prof)
-
-                cache_dir = Path(os.getenv("CACHE_DIR", "./cache"))
-                mem = MemoryStore(cache_dir)
-                mem_json = mem.load_json()
-                mem_json["db_profile"] = prof
-                mem.save_json(mem_json)
-
-            st.success(f"Scanned {len(prof.get('tables', []))} tables.")
-        except Exception as e:
-            st.error(f"DB scan failed: {e}")
+    scan_running = any(j.kind == "scan" and not j.done for j in session_jobs())
+    if st.button("Scan DB (schema + column stats)", type="primary", disabled=scan_running):
+        submit_job("scan", job_scan, label="DB scan")
+        st.rerun()
 
     st.session_state.db_profile = resolve_if_coroutine(st.session_state.db_profile)
     if not isinstance(st.session_state.db_profile, dict):
@@ -286,18 +779,18 @@ with left:
         st.stop()
 
     if st.session_state.db_profile.get("tables"):
-        if st.button("✨ Generate Table Descriptions (LLM)"):
+        if st.button("✨ Generate Table Descriptions (LLM)", disabled=team_busy()):
             if not st.session_state.get("team_ready"):
                 st.error("Initialize AI Team first.")
             else:
-                try:
-                    with st.spinner("Generating table descriptions..."):
-                        prof = enrich_tables_with_descriptions(st.session_state.db_profile, st.session_state.team)
-                        prof = resolve_if_coroutine(prof)
-                        st.session_state.db_profile = prof
-                    st.success("Descriptions generated ✅")
-                except Exception as e:
-                    st.error(f"Description generation failed: {e}")
+                submit_job(
+                    "describe",
+                    job_describe,
+                    st.session_state.db_profile,
+                    st.session_state.team,
+                    label="Table descriptions",
+                )
+                st.rerun()
 
     st.session_state.db_profile = resolve_if_coroutine(st.session_state.db_profile)
     if not isinstance(st.session_state.db_profile, dict):
@@ -305,11 +798,19 @@ with left:
         st.stop()
 
     if st.session_state.db_profile.get("tables"):
+        import pandas as pd
+
         st.write("**Tables discovered:**")
         st.dataframe(
             pd.DataFrame(
                 [
-                    {"schema": t["schema"], "table": t["table"], "row_count": t["row_count"], "cols": len(t["columns"])}
+                    {
+                        "schema": t["schema"],
+                        "table": t["table"],
+                        "row_count": t["row_count"],
+                        "cols": len(t["columns"]),
+                        "column_stats": _stats_label(t.get("stats")),
+                    }
                     for t in st.session_state.db_profile["tables"]
                 ]
             ),
@@ -329,14 +830,21 @@ with right:
     if not st.session_state.team_ready:
         if st.button("Initialize AI Team"):
             try:
+                from team_factory import build_team
+
                 team, clients = build_team()
                 st.session_state.team = team
                 st.session_state.model_clients = clients
                 st.session_state.team_ready = True
+                if os.getenv("MODEL_WARMUP", "1") == "1":
+                    get_model_manager().warm_up()  # load the model while the user reads / scans
                 st.success("Team initialized.")
             except Exception as e:
                 st.error(f"Team init failed: {e}")
 
+    if st.session_state.team_ready:
+        render_model_status()
+
     step_idx = st.session_state.current_step_idx
     step_key, step_goal = STEPS[step_idx]
     st.write(f"**Current Step:** `{step_key}`")
@@ -345,18 +853,62 @@ with right:
     can_run = st.session_state.team_ready and bool(st.session_state.db_profile.get("tables"))
     if not can_run:
         st.info ("To run steps: Initialize AI Team + Scan DB first.")
+    elif step_key == "TASK_7_DASHBOARD_BUILD" and not st.session_state.execution_bundle:
+        st.info("Execute the Task-4 SQL first: the layout can only use executed datasets and KPI names.")
 
-    run_clicked = st.button("Run This Step", disabled=not can_run)
+    run_clicked = st.button("Run This Step", disabled=not can_run or team_busy())
 
     if run_clicked:
-        task = step_task_prompt(step_key, step_goal, user_request, st.session_state.db_profile)
-        with st.spinner(f"Running {step_key}... (streaming)"):
-            try:
-                asyncio.run(run_team_stream(st.session_state.team, task, step_key))
-                st.success("Step completed (see outputs below).")
-                st.rerun()
-            except Exception as e:
-                st.error(f"Step run failed: {e}")
+        carry_text = carryover_block(st.session_state.step_carryover, exclude_step=step_key)
+        executed = ""
+        if step_key == "TASK_7_DASHBOARD_BUILD" and st.session_state.execution_bundle:
+            # the spec may only name executed datasets / KPIs: validate_spec drops anything else
+            from dashboard_compiler import spec_context
+            from models import ExecutionBundle
+
+            plan = st.session_state.analysis_plan
+            executed = spec_context(
+                ExecutionBundle(**st.session_state.execution_bundle), AnalysisPlan(**plan) if plan else None
+            )
+        task = step_task_prompt(
+            step_key,
+            step_goal,
+            user_request,
+            st.session_state.db_profile,
+            st.session_state.schema_index,
+            carry_text,
+            executed,
+        )
+        st.session_state.cancelled_step = None
+        submit_job(
+            "step",
+            job_team_run,
+            st.session_state.team,
+            task,
+            step_key,
+            label=f"Run {step_key}",
+            meta={"task": task, "carry_text": carry_text},
+        )
+        st.rerun()
+
+    if st.session_state.cancelled_step:
+        st.warning(f"Generation for {st.session_state.cancelled_step} was cancelled; partial output is in the logs.")
+
+    if st.session_state.stream_stats.get(step_key):
+        import pandas as pd
+
+        st.caption("Streaming stats (last run of this step)")
+        st.dataframe(pd.DataFrame(st.session_state.stream_stats[step_key]), width='stretch')
+
+    if st.session_state.step_metrics:
+        with st.expander("📏 Context size per step run"):
+            import pandas as pd
+
+            metrics_df = pd.DataFrame(st.session_state.step_metrics)
+            st.dataframe(metrics_df, width='stretch')
+            st.bar_chart(metrics_df, x="step", y=["prompt_chars", "transcript_chars"])
+
+    render_usage_panel()
 
     st.markdown("---")
     if st.button("✅ Approve & Move to Next Step"):
@@ -370,45 +922,43 @@ with right:
 st.markdown("---")
 st.subheader("Step Outputs (streamed)")
 
-tabs = st.tabs([k for k, _ in STEPS])
-for i, (k, _) in enumerate(STEPS):
-    with tabs[i]:
-        render_logs(k)
+# only the selected step is rendered (st.tabs would build every tab on every rerun)
+step_keys = [k for k, _ in STEPS]
+shown_step = st.radio(
+    "Step",
+    step_keys,
+    index=st.session_state.current_step_idx,
+    horizontal=True,
+    key=f"log_step_{st.session_state.current_step_idx}",
+    label_visibility="collapsed",
+)
+render_logs(shown_step)
 
 #----------------------Table Description -----------------------------
 st.markdown("## 📚 Data Catalog")
 
-for t in st.session_state.db_profile.get("tables", []):
-    with st.expander(f"📄 {t['schema']}.{t['table']}"):
-        st.markdown(f"**Description**: {t.get('table_description', '—')}")
-        st.markdown(f"**Business Meaning**: {t.get('business_meaning', '—')}")
-
-        if t.get("important_columns"):
-            st.markdown("**Important Columns**")
-            st.write(", ".join(t["important_columns"]))
-
-        if t.get("dashboard_use_cases"):
-            st.markdown("**Dashboard Use Cases**")
-            for uc in t["dashboard_use_cases"]:
-                st.markdown(f"- {uc}")
-
-        if t.get("typical_joins"):
-            st.markdown("**Typical Joins**")
-            for j in t["typical_joins"]:
-                st.markdown(f"- {j}")
+render_catalog(st.session_state.db_profile.get("tables", []))
 # ----------------- Task-4/5 execution -----------------
 st.markdown("---")
 st.subheader("🚀 Task-4/5 Execution (Real): SQL → Cache → KPIs → Feed Dashboard")
 
 st.caption("This parses SQLBuilder JSON from TASK_4_INTERMEDIATE_VIEWS, executes SELECT-only SQL, caches results (Parquet/DuckDB), computes KPIs, and prepares real datasets for dashboard generation.")
 
-exec_disabled = not (st.session_state.db_profile.get("tables") and st.session_state.team_ready)
+exec_running = any(j.kind == "execute" and not j.done for j in session_jobs())
+exec_disabled = not (st.session_state.db_profile.get("tables") and st.session_state.team_ready) or exec_running
 
 if st.session_state.logs:
-    agents_in_task4 = sorted({x["agent"] for x in st.session_state.logs if x["step"] == "TASK_4_INTERMEDIATE_VIEWS"})
+    agents_in_task4 = st.session_state.logs.agents("TASK_4_INTERMEDIATE_VIEWS")
     st.caption(f"Agents logged for TASK_4_INTERMEDIATE_VIEWS: {agents_in_task4}")
 
 run_exec = st.button("▶ Execute Task-4 SQL + Compute KPIs (Task-5)", type="primary", disabled=exec_disabled)
+incremental_exec = st.toggle(
+    "Incremental refresh",
+    value=True,
+    key="incremental_exec",
+    help="Datasets with a watermark column only fetch rows newer than the cached high-water mark "
+    "(minus a lookback window) and append them; others, and the first run, execute in full.",
+)
 
 if run_exec:
     sql_text = latest_agent_output("TASK_4_INTERMEDIATE_VIEWS")
@@ -430,96 +980,172 @@ if run_exec:
                 except Exception as e:
                     st.warning(f"Could not parse AnalysisPlan JSON from TASK_3; using generic KPIs. Error: {e}")
 
-            # 3) Execute SQL, cache datasets, compute KPIs (generic + plan-driven)
-            with st.spinner("Executing SQL safely, caching datasets, and computing KPIs..."):
-                engine = build_engine()
-                cache_dir = Path(os.getenv("CACHE_DIR", "./cache"))
-                mem = MemoryStore(cache_dir)
-
-                bundle, previews = execute_and_cache_artifacts(
-                    engine,
-                    mem,
-                    sql_out.artifacts,
-                    analysis_plan=analysis_plan,   # <-- KEY CHANGE
-                )
-
-                # Persist to memory.json
-                mem_json = mem.load_json()
-                mem_json["execution_bundle"] = bundle.model_dump()
-                if analysis_plan:
-                    mem_json["analysis_plan"] = analysis_plan
-                mem.save_json(mem_json)
-
-                # Store in session for UI + dashboard build
-                st.session_state.execution_bundle = bundle.model_dump()
-                st.session_state.dataset_previews = {k: v.to_dict(orient="records") for k, v in previews.items()}
-
-            st.success("Execution complete ✅ Datasets cached + KPIs computed (generic + planner-driven).")
+            # 3) Execute SQL, cache datasets, compute KPIs (generic + plan-driven) in the background;
+            #    the jobs panel stores the bundle + previews in the session when it finishes
+            submit_job(
+                "execute",
+                job_execute,
+                sql_out.artifacts,
+                analysis_plan,
+                st.session_state.dashboard_spec,
+                incremental_exec,
+                label="Execute Task-4 SQL + KPIs",
+            )
+            st.rerun()
 
         except Exception as e:
             st.error(f"Execution failed: {e}")
 
+if st.session_state.guard_review:
+    held = st.session_state.guard_review
+    st.warning("The query guard held this execution back before anything reached the warehouse.")
+    for r in held["guard_review"]:
+        verdict = "blocked by policy" if r["action"] == "block" else "needs confirmation"
+        st.markdown(f"**{r['dataset_name']}** — {verdict}")
+        for f in r["findings"]:
+            st.markdown(f"- `{f['severity']}` {f['detail']}")
+        if r.get("note"):
+            st.caption(r["note"])
+    approvable = [r["sql_hash"] for r in held["guard_review"] if r["action"] == "confirm"]
+    blocked = len(approvable) < len(held["guard_review"])
+    if blocked:
+        st.caption("Blocked queries have to be rewritten (or QUERY_GUARD_POLICY relaxed); approval does not cover them.")
+    if st.button("Run anyway", disabled=not approvable or blocked or exec_running, key="guard_approve"):
+        from query_guard import approve
+
+        mem = MemoryStore(Path(os.getenv("CACHE_DIR", "./cache")))
+        with mem.edit_json() as mem_json:
+            approve(mem_json, approvable)
+        args = held["resubmit"]
+        st.session_state.guard_review = None
+        submit_job(
+            "execute",
+            job_execute,
+            [SQLArtifact(**a) for a in args["artifacts"]],
+            args["analysis_plan"],
+            args["dashboard_spec"],
+            args["incremental"],
+            label="Execute Task-4 SQL + KPIs",
+        )
+        st.rerun()
+
 if st.session_state.execution_bundle:
     st.markdown("### ✅ KPI Reports (computed)")
-    st.json(st.session_state.execution_bundle)
+    refresh_notes = []
+    for ds in st.session_state.execution_bundle.get("datasets", []):
+        note = f"{ds['dataset_name']}: {ds.get('refresh', 'full')}, {ds.get('rows_fetched') or 0:,} rows fetched, {ds['n_rows']:,} cached"
+        if ds.get("computed") == "local":
+            note += " · computed locally"
+        if ds.get("watermark"):
+            note += f" · watermark {ds['watermark']['column']} = {ds['watermark']['value']}"
+        refresh_notes.append(note)
+    st.caption(" | ".join(refresh_notes))
+    src = st.session_state.execution_bundle.get("source_stats") or {}
+    if src:
+        st.caption(
+            f"Warehouse: {src['round_trips']} queries / {src['rows_fetched']:,} rows "
+            f"(each artifact on its own: {src['round_trips_naive']} / {src['rows_fetched_naive']:,}); "
+            f"{len(src['shared'])} shared intermediate(s), {len(src['fallbacks'])} fallback(s)"
+        )
+    if st.toggle("Show execution bundle JSON", key="show_bundle"):
+        st.json(st.session_state.execution_bundle, expanded=False)
 
 if st.session_state.dataset_previews:
     st.markdown("### 👀 Dataset Previews (top rows)")
-    for name, rows in st.session_state.dataset_previews.items():
-        st.write(f"**{name}**")
-        st.dataframe(pd.DataFrame(rows), width='stretch')
+    preview_name = st.selectbox(
+        "Dataset", [None] + list(st.session_state.dataset_previews), key="preview_dataset",
+        format_func=lambda n: "— select a dataset —" if n is None else n,
+    )
+    if preview_name is not None:
+        import pandas as pd
+
+        st.dataframe(pd.DataFrame(st.session_state.dataset_previews[preview_name]), width='stretch')
 
 # ----------------- Build dashboard from cached datasets -----------------
 st.markdown("---")
 st.subheader("📊 Build Real Dashboard from Cached Data (Task-7)")
 
-build_real = st.button("🧱 Generate Dashboard using Cached Datasets", disabled=(not st.session_state.execution_bundle))
+st.caption(
+    "The page is compiled from the cached datasets, KPI reports and the analysis plan's charts "
+    "(no LLM; it is rebuilt automatically after each execution). The model can optionally pick the layout."
+)
 
-if build_real:
+stats = st.session_state.chart_data_stats
+if stats:
+    st.caption(
+        f"Chart data: {stats['charts']} widgets, {stats['bytes'] / 1024:.1f} KB "
+        f"(prepared in {stats['elapsed_s'] * 1000:.0f} ms after execution)"
+    )
+
+if os.getenv("DATA_API", "1") == "1" and st.session_state.execution_bundle:
+    # started once there is something to serve, not on import: dashboards' live filters query it
+    from data_api import data_api_error, data_api_starting, running_data_api, start_data_api_background
+
+    start_data_api_background()
+    api = running_data_api()
+    if api is None and data_api_error() and not data_api_starting():
+        st.warning(f"Data API failed to start, dashboard filters stay static: {data_api_error()}")
+        if st.button("Retry data API", key="data_api_retry"):
+            start_data_api_background(retry=True)
+            st.rerun()
+    elif api is None:
+        st.caption("Data API: starting… (dashboard filters need it)")
+    else:
+        m = api.service.metrics()
+        lat = (
+            f" · p50 {m['p50_ms']:.1f} ms · p99 {m['p99_ms']:.1f} ms · cache hit {m['cache_hit_rate'] or 0:.0%}"
+            if m["queries"] else ""
+        )
+        st.caption(f"Data API: {api.public_url} · {m['queries']} queries{lat} · {m['rejected']} rejected")
+
+layout_running = any(j.kind == "layout" and not j.done for j in session_jobs())
+c_compile, c_layout, c_reset = st.columns(3)
+compile_now = c_compile.button(
+    "🧱 Compile Dashboard from Cached Datasets",
+    disabled=not st.session_state.execution_bundle,
+)
+ask_layout = c_layout.button(
+    "✨ Suggest layout with the model",
+    disabled=(not st.session_state.execution_bundle) or (not st.session_state.team_ready) or layout_running,
+)
+reset_layout = c_reset.button("↺ Default layout", disabled=not st.session_state.dashboard_spec)
+
+if reset_layout:
+    st.session_state.dashboard_spec = None
+    compile_now = True
+
+if compile_now:
     try:
-        bundle = st.session_state.execution_bundle
-        previews = st.session_state.dataset_previews or {}
-
-        task = f"""
-You must build a production HTML/CSS/JS dashboard using Plotly.
-You MUST use the real datasets and KPI reports below.
-
-EXECUTION_BUNDLE_JSON:
-{safe_json_dumps(bundle, indent=2)[:60000]}
-
-DATASET_PREVIEWS_JSON (top rows only):
-{safe_json_dumps(previews, indent=2)[:60000]}
-
-Requirements:
-- KPI cards from KPI report.
-- At least 4 charts:
-  1) trend (if time col exists)
-  2) category breakdown
-  3) distribution of key numeric column
-  4) a table view
-- Filters: date range if available, 1-2 categorical filters.
-- Responsive layout.
-Return full HTML in one block starting with <html>.
-"""
-        with st.spinner("Generating real dashboard HTML..."):
-            asyncio.run(run_team_stream(st.session_state.team, task, "TASK_7_DASHBOARD_BUILD"))
-        st.success("Dashboard generated ✅ Scroll down to render.")
+        t0 = time.perf_counter()
+        dropped = compile_dashboard_html()
+        st.caption(f"Compiled in {(time.perf_counter() - t0) * 1000:.0f} ms")
+        if dropped:
+            st.warning("Layout parts not backed by the data were skipped: " + "; ".join(dropped))
     except Exception as e:
         st.error(f"Dashboard build failed: {e}")
 
+if ask_layout:
+    submit_job(
+        "layout",
+        job_layout,
+        st.session_state.execution_bundle,
+        st.session_state.analysis_plan,
+        label="Dashboard layout (Task-7)",
+    )
+    st.rerun()
+
+if st.session_state.dashboard_spec and st.toggle("Show layout spec JSON", key="show_dashboard_spec"):
+    st.json(st.session_state.dashboard_spec, expanded=False)
+
 st.markdown("---")
 st.subheader("Generated Dashboard (when available)")
 
-latest_html = None
-for it in reversed(st.session_state.logs):
-    if it["agent"] == "dashboard_builder" and "<html" in it["content"].lower():
-        latest_html = it["content"]
-        break
-
-if latest_html:
-    st.session_state.dashboard_html = latest_html
+html_entry = st.session_state.logs.latest_html()
+if html_entry is not None and st.session_state.get("dashboard_html_id") != html_entry.id:
+    st.session_state.dashboard_html = st.session_state.logs.content(html_entry)
+    st.session_state.dashboard_html_id = html_entry.id
 
 if st.session_state.dashboard_html:
     st.components.v1.html(st.session_state.dashboard_html, height=900, scrolling=True)
 else:
-    st.info ("Dashboard HTML will appear after TASK_7_DASHBOARD_BUILD.")
\ No newline at end of file
+    st.info("The dashboard will appear after Task-4/5 execution.")
\ No newline at end of file
@@ -0,0 +1,353 @@
+"""
+Artifact dependency graph for the executor.
+
+Two kinds of edges:
+- explicit: an artifact with `depends_on` is DuckDB SQL over its upstream datasets by name and
+  runs locally on their cached Parquet, after them;
+- shared intermediates: a CTE whose text (modulo case, whitespace and comments) appears in two
+  or more artifacts is fetched from the warehouse once, cached, and every artifact using it runs
+  the rest of its query in DuckDB against that result. An artifact whose remainder still needs
+  base tables or T-SQL-only syntax keeps going to the warehouse unchanged. By default only
+  remote warehouses do this (DAG_SHARE_CTES).
+Artifacts whose SQL is identical are fetched once as well.
+"""
+from __future__ import annotations
+
+import hashlib
+import os
+import re
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Any, Dict, Iterable, List, Mapping, Optional, Sequence, Set, Tuple
+
+from incremental import top_level_words
+from models import SQLArtifact
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+# 1 | 0 | auto. auto shares CTEs with remote warehouses only: on an in-process engine re-running a
+# CTE per artifact is cheaper than round-tripping its result through DuckDB (bench_suite
+# shared_cte_artifacts on SQLite: 0.64 s shared vs 0.45 s unshared)
+SHARE_CTES = os.getenv("DAG_SHARE_CTES", "auto")
+_IN_PROCESS = ("sqlite", "duckdb")
+# an intermediate larger than this costs more to ship than re-running it per artifact saves;
+# its fetch stops there and the consumers run as written
+SHARED_MAX_ROWS = int(os.getenv("DAG_SHARED_MAX_ROWS", "100000"))
+
+
+# ---------- SQL text ----------
+
+_TOKEN = re.compile(
+    r"'(?:[^']|'')*'|\[[^\]]*\]|\"(?:[^\"]|\"\")*\"|--[^\n]*|/\*.*?\*/|\s+|[A-Za-z_@#$][\w@#$]*|\d+(?:\.\d+)?|.",
+    re.S,
+)
+_NAME = re.compile(r"\[[^\]]+\]|\"(?:[^\"]|\"\")+\"|[A-Za-z_#@][\w@#$]*")
+
+
+def normalize_sql(sql: str, fold_case: bool = True) -> str:
+    """
+    Canonical text for matching: comments and layout dropped; with `fold_case` everything but
+    string literals is upper-cased too (SQL Server's default, case-insensitive collation).
+    """
+    out: List[str] = []
+    for m in _TOKEN.finditer(sql.strip().rstrip(";")):
+        t = m.group(0)
+        if t.isspace() or t.startswith("--") or t.startswith("/*"):
+            continue
+        if t[0] == "'" or not fold_case:
+            out.append(t)
+        elif t[0] in '["':
+            out.append(t[1:-1].upper())  # [x], "x" and x name the same column on SQL Server
+        else:
+            out.append(t.upper())
+    return " ".join(out)
+
+
+def _unquote(name: str) -> str:
+    return name[1:-1] if name[:1] in '["' else name
+
+
+def _skip_space(sql: str, i: int) -> int:
+    n = len(sql)
+    while i < n:
+        if sql[i].isspace():
+            i += 1
+        elif sql.startswith("--", i):
+            j = sql.find("\n", i)
+            i = n if j == -1 else j + 1
+        elif sql.startswith("/*", i):
+            j = sql.find("*/", i + 2)
+            i = n if j == -1 else j + 2
+        else:
+            break
+    return i
+
+
+def _close_paren(sql: str, i: int) -> int:
+    """Offset of the ')' matching the '(' at `i`, skipping quotes and comments; -1 if unbalanced."""
+    depth = 0
+    for m in _TOKEN.finditer(sql, i):
+        t = m.group(0)
+        if t == "(":
+            depth += 1
+        elif t == ")":
+            depth -= 1
+            if depth == 0:
+                return m.start()
+    return -1
+
+
+@dataclass
+class Cte:
+    name: str  # as written, e.g. [base] or base
+    columns: str  # "(a, b)" or ""
+    body: str
+
+    @property
+    def key(self) -> str:
+        return normalize_sql(self.columns + " " + self.body)
+
+    def sql(self) -> str:
+        return f"{self.name}{self.columns} AS (\n{self.body}\n)"
+
+
+def split_ctes(sql: str) -> Tuple[List[Cte], str]:
+    """(top-level CTEs, final statement); ([], sql) when there is no WITH or it doesn't parse."""
+    s = sql.strip().rstrip(";").strip()
+    words = top_level_words(s)
+    if not words or words[0][0] != "WITH":
+        return [], s
+    ctes: List[Cte] = []
+    i = words[0][1] + len("WITH")
+    while True:
+        m = _NAME.match(s, _skip_space(s, i))
+        if m is None or m.group(0).upper() == "RECURSIVE":
+            return [], s
+        j = _skip_space(s, m.end())
+        columns = ""
+        if s.startswith("(", j):
+            k = _close_paren(s, j)
+            if k < 0:
+                return [], s
+            columns, j = s[j:k + 1], _skip_space(s, k + 1)
+        if s[j:j + 2].upper() != "AS":
+            return [], s
+        j = _skip_space(s, j + 2)
+        k = _close_paren(s, j) if s.startswith("(", j) else -1
+        if k < 0:
+            return [], s
+        ctes.append(Cte(m.group(0), columns, s[j + 1:k].strip()))
+        j = _skip_space(s, k + 1)
+        if not s.startswith(",", j):
+            return ctes, s[j:]
+        i = j + 1
+
+
+def join_ctes(ctes: Sequence[Cte], main: str) -> str:
+    if not ctes:
+        return main
+    return "WITH " + ",\n".join(c.sql() for c in ctes) + "\n" + main
+
+
+def to_duckdb(sql: str) -> str:
+    """[bracketed] identifiers become "quoted" ones; everything else is left for DuckDB to accept or reject."""
+    return "".join(
+        '"' + t[1:-1].replace('"', '""') + '"' if t[0] == "[" else t
+        for t in (m.group(0) for m in _TOKEN.finditer(sql))
+    )
+
+
+def tables_read(sql: str) -> Optional[Set[str]]:
+    """Lower-cased names of the tables a DuckDB query reads (CTEs excluded); None if DuckDB can't parse it."""
+    import duckdb
+
+    try:
+        return {t.lower() for t in duckdb.get_table_names(sql)}
+    except duckdb.Error:
+        return None
+
+
+# ---------- plan ----------
+
+@dataclass
+class Intermediate:
+    """A CTE shared by several artifacts, fetched from the warehouse once."""
+
+    key: str  # cache key of the materialized result
+    sql: str  # warehouse query producing it
+    consumers: Dict[str, str] = field(default_factory=dict)  # dataset_name -> the CTE's name in that artifact
+
+
+@dataclass
+class ArtifactPlan:
+    order: List[str]  # topological, stable w.r.t. the artifact list
+    depends: Dict[str, List[str]] = field(default_factory=dict)  # explicit edges
+    shared: Dict[str, Intermediate] = field(default_factory=dict)
+    rewritten: Dict[str, str] = field(default_factory=dict)  # dataset -> DuckDB SQL over its intermediates
+    duplicate_of: Dict[str, str] = field(default_factory=dict)
+
+    def needs_source(self, name: str) -> bool:
+        return not (name in self.depends or name in self.rewritten or name in self.duplicate_of)
+
+    def intermediates_of(self, name: str) -> Dict[str, str]:
+        """CTE name in `name`'s query -> cache key of the intermediate it reads."""
+        return {i.consumers[name]: k for k, i in self.shared.items() if name in i.consumers}
+
+
+def _toposort(names: Sequence[str], depends: Mapping[str, Sequence[str]]) -> List[str]:
+    done: Set[str] = set()
+    order: List[str] = []
+    while len(order) < len(names):
+        ready = [n for n in names if n not in done and all(d in done for d in depends.get(n, ()))]
+        if not ready:
+            stuck = [n for n in names if n not in done]
+            raise ValueError(f"artifact dependency cycle among {stuck}")
+        order.extend(ready)
+        done.update(ready)
+    return order
+
+
+def share_ctes(dialect: Optional[str] = None) -> bool:
+    """Whether shared CTEs are fetched once for `dialect` (see DAG_SHARE_CTES)."""
+    if SHARE_CTES in ("0", "1"):
+        return SHARE_CTES == "1"
+    return dialect not in _IN_PROCESS
+
+
+def plan_artifacts(
+    artifacts: Sequence[SQLArtifact], source_only: Iterable[str] = (), dialect: Optional[str] = None
+) -> ArtifactPlan:
+    """
+    Order the artifacts and find what they share. `source_only` names artifacts that must run
+    their own SQL against the warehouse (e.g. incremental candidates, whose fetch is narrowed
+    by their watermark); `dialect` is the warehouse's, for DAG_SHARE_CTES=auto.
+    """
+    names = [a.dataset_name for a in artifacts]
+    if len(set(names)) != len(names):
+        raise ValueError(f"duplicate dataset_name in artifacts: {sorted({n for n in names if names.count(n) > 1})}")
+    depends = {a.dataset_name: list(a.depends_on) for a in artifacts if a.depends_on}
+    for name, deps in depends.items():
+        unknown = [d for d in deps if d not in names]
+        if unknown:
+            raise ValueError(f"{name} depends on unknown datasets {unknown}")
+    plan = ArtifactPlan(order=_toposort(names, depends), depends=depends)
+
+    pinned = set(source_only)
+    candidates = [a for a in artifacts if a.dataset_name not in depends and a.dataset_name not in pinned]
+    first_by_sql: Dict[str, str] = {}
+    for a in candidates:
+        key = normalize_sql(a.sql)
+        if key in first_by_sql:
+            plan.duplicate_of[a.dataset_name] = first_by_sql[key]
+        else:
+            first_by_sql[key] = a.dataset_name
+    if share_ctes(dialect):
+        _share_ctes(plan, [a for a in candidates if a.dataset_name not in plan.duplicate_of])
+    return plan
+
+
+def _share_ctes(plan: ArtifactPlan, artifacts: Sequence[SQLArtifact]) -> None:
+    split = {a.dataset_name: split_ctes(a.sql) for a in artifacts}
+    users: Dict[str, Dict[str, Cte]] = {}
+    for name, (ctes, _) in split.items():
+        names = {_unquote(c.name).upper() for c in ctes}
+        for c in ctes:
+            # only self-contained CTEs: one that reads a sibling CTE isn't the same text elsewhere
+            if names & (set(normalize_sql(c.body).split()) - {_unquote(c.name).upper()}):
+                continue
+            users.setdefault(c.key, {})[name] = c
+
+    for key, by_artifact in users.items():
+        if len(by_artifact) < 2:
+            continue
+        # an artifact is rewritten only when DuckDB can run its remainder on the intermediates alone
+        local: Dict[str, str] = {}
+        for name, cte in by_artifact.items():
+            ctes, main = split[name]
+            shared_here = [c for c in ctes if c.key in users and len(users[c.key]) > 1]
+            sql = to_duckdb(join_ctes([c for c in ctes if c not in shared_here], main))
+            reads = tables_read(sql)
+            if reads is not None and reads <= {_unquote(c.name).lower() for c in shared_here}:
+                local[name] = sql
+        if len(local) < 2:
+            continue
+        cte = next(iter(by_artifact.values()))
+        cache_key = "cte_" + hashlib.sha256(key.encode("utf-8")).hexdigest()[:12]
+        plan.shared[cache_key] = Intermediate(
+            key=cache_key,
+            sql=join_ctes([cte], "SELECT * FROM " + cte.name),
+            consumers={n: _unquote(by_artifact[n].name) for n in local},
+        )
+    # an artifact reading several shared CTEs is local only if all of them were kept
+    for name in {n for i in plan.shared.values() for n in i.consumers}:
+        ctes, main = split[name]
+        kept = {c.lower() for c in plan.intermediates_of(name)}
+        rest = [c for c in ctes if _unquote(c.name).lower() not in kept]
+        sql = to_duckdb(join_ctes(rest, main))
+        reads = tables_read(sql)
+        if reads is not None and reads <= kept:
+            plan.rewritten[name] = sql
+    for inter in plan.shared.values():
+        inter.consumers = {n: c for n, c in inter.consumers.items() if n in plan.rewritten}
+    plan.shared = {k: i for k, i in plan.shared.items() if i.consumers}
+
+
+# ---------- local execution ----------
+
+def run_local(sql: str, tables: Mapping[str, Any], dialect: str = "") -> "pd.DataFrame":
+    """
+    Run DuckDB `sql` with each name in `tables` bound to a DataFrame or a cached dataset path.
+    Division and string comparison follow the warehouse: integer division like SQL Server and
+    SQLite, case-insensitive text on SQL Server (its default collation).
+    """
+    import duckdb
+    import pandas as pd
+
+    from parquet_layout import load_layout
+    from memory_store import parquet_scan
+
+    con = duckdb.connect()
+    try:
+        con.execute("SET integer_division = true")
+        if dialect == "mssql":
+            con.execute("SET default_collation = 'nocase'")
+        for name, src in tables.items():
+            ident = '"' + name.replace('"', '""') + '"'
+            if isinstance(src, pd.DataFrame):
+                con.register(name, src)
+                continue
+            layout = load_layout(src)
+            hidden = layout.fields() if layout is not None and layout.partitioned else []
+            exclude = f" EXCLUDE ({', '.join(hidden)})" if hidden else ""
+            con.execute(f"CREATE VIEW {ident} AS SELECT *{exclude} FROM {parquet_scan(src)}")
+        return con.execute(sql.strip().rstrip(";")).df()
+    finally:
+        con.close()
+
+
+def source_stats(
+    plan: ArtifactPlan,
+    rows: Mapping[str, int],
+    fetched: Mapping[str, int],
+    fallbacks: Sequence[str] = (),
+) -> Dict[str, Any]:
+    """
+    Warehouse round trips and rows fetched for this run vs running every artifact on its own.
+    `fetched` is what each warehouse query (dataset or intermediate key) returned, `rows` the
+    result size of datasets computed locally, i.e. what they would have fetched themselves.
+    """
+    naive = [n for n in plan.order if n not in plan.depends]
+    return {
+        "artifacts": len(plan.order),
+        "round_trips_naive": len(naive),
+        "round_trips": len(fetched),
+        "rows_fetched_naive": int(sum(fetched.get(n, rows.get(n, 0)) for n in naive)),
+        "rows_fetched": int(sum(fetched.values())),
+        "local": sorted(n for n in plan.order if not plan.needs_source(n) and n not in fallbacks),
+        "fallbacks": list(fallbacks),
+        "shared": [
+            {"key": k, "consumers": sorted(i.consumers), "rows": int(fetched.get(k, 0)),
+             "used": not set(i.consumers) & set(fallbacks)}
+            for k, i in plan.shared.items()
+        ],
+    }
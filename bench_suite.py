@@ -0,0 +1,355 @@
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+BACKENDS = ("sqlite", "duckdb")
+
+
+@dataclass
+class WarehouseSpec:
+    n_tables: int = 40
+    n_cols: int = 12
+    n_rows: int = 20_000
+    skew: float = 1.2  # zipf exponent for categorical columns; 0 = uniform
+    seed: int = 7
+    backend: str = "sqlite"
+
+
+# ---------- synthetic warehouse ----------
+
+def synthetic_table(spec: WarehouseSpec, idx: int) -> pd.DataFrame:
+    """
+    One fact-like table: id, customer_id, event_date, category/region (skewed), amount, qty,
+    then filler numeric/text columns up to `n_cols`. Every 5th table gets ~5% NULLs.
+    """
+    rng = np.random.default_rng(spec.seed + idx)
+    n = spec.n_rows
+
+    def skewed(n_values: int) -> np.ndarray:
+        if spec.skew <= 0:
+            return rng.integers(0, n_values, n)
+        w = 1.0 / np.arange(1, n_values + 1) ** spec.skew
+        return rng.choice(n_values, size=n, p=w / w.sum())
+
+    data: Dict[str, Any] = {
+        "id": np.arange(n),
+        "customer_id": skewed(max(10, n // 20)),
+        "event_date": (pd.Timestamp("2023-01-01") + pd.to_timedelta(rng.integers(0, 730, n), unit="D")).strftime("%Y-%m-%d"),
+        "category": np.char.add("cat_", skewed(25).astype(str)),
+        "region": np.char.add("region_", skewed(8).astype(str)),
+        "amount": np.round(rng.lognormal(3.0, 1.0, n), 2),
+        "qty": rng.integers(1, 20, n),
+    }
+    for j in range(max(0, spec.n_cols - len(data))):
+        if j % 3 == 2:
+            data[f"attr_{j}"] = np.char.add("v", rng.integers(0, 500, n).astype(str))
+        else:
+            data[f"metric_{j}"] = np.round(rng.normal(100, 25, n), 3)
+    df = pd.DataFrame(data)
+    if idx % 5 == 4:
+        df.loc[rng.random(n) < 0.05, "amount"] = np.nan
+    return df
+
+
+def generate_warehouse(spec: WarehouseSpec, path: Path) -> str:
+    """Writes the synthetic tables to `path` and returns a SQLAlchemy URL for it."""
+    path = Path(path)
+    if path.exists():
+        path.unlink()
+    if spec.backend == "sqlite":
+        import sqlite3
+
+        con = sqlite3.connect(str(path))
+        for i in range(spec.n_tables):
+            synthetic_table(spec, i).to_sql(f"fact_{i:04d}", con, index=False)
+        con.close()
+        return f"sqlite:///{path}"
+    if spec.backend == "duckdb":
+        import duckdb
+
+        try:
+            import duckdb_engine  # noqa: F401  (SQLAlchemy dialect)
+        except ImportError as e:
+            raise RuntimeError("backend 'duckdb' needs the duckdb-engine package for SQLAlchemy access") from e
+        con = duckdb.connect(str(path))
+        for i in range(spec.n_tables):
+            df = synthetic_table(spec, i)
+            con.register("df", df)
+            con.execute(f"CREATE TABLE fact_{i:04d} AS SELECT * FROM df")
+            con.unregister("df")
+        con.close()
+        return f"duckdb:///{path}"
+    raise ValueError(f"backend must be one of {BACKENDS}")
+
+
+def synthetic_plan_and_artifacts(spec: WarehouseSpec, n_datasets: int = 4) -> Tuple[Dict[str, Any], List[Any]]:
+    from models import AnalysisPlan, KPI, SQLArtifact
+
+    plan = AnalysisPlan(
+        dashboard_goal="Benchmark dashboard",
+        audience="engineering",
+        grain="daily",
+        kpis=[
+            KPI(name="Total revenue", description="sum of amount", formula_hint="sum(amount)"),
+            KPI(name="Active customers", description="distinct customers", formula_hint="count_distinct(customer_id)"),
+            KPI(name="Orders", description="number of rows", formula_hint="count_rows()"),
+            KPI(name="Average basket", description="avg amount", formula_hint="avg(amount)"),
+            KPI(name="Spend p95", description="p95 of amount", formula_hint="p95(amount)"),
+            KPI(name="Total points earned", description="heuristic path"),
+        ],
+    )
+    artifacts = []
+    for i in range(min(n_datasets, spec.n_tables)):
+        t = f"fact_{i:04d}"
+        if i % 2 == 0:
+            sql = f"SELECT event_date, category, SUM(amount) AS amount, SUM(qty) AS qty, COUNT(DISTINCT customer_id) AS customer_id FROM {t} GROUP BY event_date, category"
+        else:
+            sql = f"SELECT * FROM {t}"
+        artifacts.append(SQLArtifact(dataset_name=f"ds_{i}", description=f"dataset {i}", sql=sql))
+    return plan.model_dump(), artifacts
+
+
+def shared_cte_artifacts(spec: WarehouseSpec) -> List[Any]:
+    """Artifacts repeating one CTE, the way the SQL builder tends to write them."""
+    from models import SQLArtifact
+
+    base = (
+        "WITH daily AS (\n"
+        "  SELECT event_date, category, region, SUM(amount) AS amount, SUM(qty) AS qty, COUNT(DISTINCT customer_id) AS customers\n"
+        "  FROM fact_0000 WHERE amount > 5 GROUP BY event_date, category, region\n"
+        ")\n"
+    )
+    return [
+        SQLArtifact(dataset_name="cte_trend", description="daily trend",
+                    sql=base + "SELECT event_date, SUM(amount) AS amount, SUM(customers) AS customers FROM daily GROUP BY event_date"),
+        SQLArtifact(dataset_name="cte_category", description="by category",
+                    sql=base + "SELECT category, SUM(amount) AS amount, SUM(qty) AS qty FROM daily GROUP BY category"),
+        SQLArtifact(dataset_name="cte_region", description="by region",
+                    sql=base + "SELECT region, event_date, SUM(amount) AS amount FROM daily GROUP BY region, event_date"),
+    ]
+
+
+# ---------- cases ----------
+
+def _time(fn: Callable[[], Any], repeats: int) -> Dict[str, float]:
+    times = []
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t0)
+    return {
+        "median_s": statistics.median(times),
+        "min_s": min(times),
+        "max_s": max(times),
+        "repeats": repeats,
+    }
+
+
+def run_suite(spec: WarehouseSpec, repeats: int = 3, workdir: Optional[Path] = None) -> Dict[str, Any]:
+    from sqlalchemy import create_engine
+
+    from chart_data import ChartDataStore, prepare_chart_data
+    from dashboard_compiler import default_spec
+    from db import build_db_profile
+    from executor import execute_and_cache_artifacts, run_sql_select
+    from kpi_engine import compute_kpis_from_plan
+    from memory_store import MemoryStore, safe_json_dumps
+    from models import AnalysisPlan
+    from prompt_layout import build_step_prompt
+    from prompts import STEPS
+    from schema_index import build_schema_index, select_profile_slice
+
+    tmp = tempfile.TemporaryDirectory() if workdir is None else None
+    root = Path(tmp.name) if tmp is not None else Path(workdir)  # type: ignore[union-attr]
+    root.mkdir(parents=True, exist_ok=True)
+    try:
+        t0 = time.perf_counter()
+        url = generate_warehouse(spec, root / f"warehouse.{spec.backend}")
+        gen_s = time.perf_counter() - t0
+        engine = create_engine(url)
+        mem = MemoryStore(root / "cache")
+        plan, artifacts = synthetic_plan_and_artifacts(spec)
+        datasets = {a.dataset_name: run_sql_select(engine, a.sql) for a in artifacts}
+
+        profile: Dict[str, Any] = {}
+
+        def profile_case() -> None:
+            profile.clear()
+            profile.update(build_db_profile(engine))
+
+        cases: Dict[str, Dict[str, float]] = {}
+        cases["build_db_profile"] = _time(profile_case, repeats)
+        # the same scan shipping 500 raw rows per table instead of computing column stats
+        import column_stats
+
+        column_stats.ENABLED = False
+        try:
+            cases["build_db_profile_samples"] = _time(lambda: build_db_profile(engine), repeats)
+        finally:
+            column_stats.ENABLED = True
+        cases["execute_and_cache_artifacts"] = _time(
+            lambda: execute_and_cache_artifacts(engine, mem, artifacts, analysis_plan=plan), repeats
+        )
+        cases["compute_kpis_from_plan"] = _time(lambda: compute_kpis_from_plan(plan, datasets), repeats)
+
+        bundle, _ = execute_and_cache_artifacts(engine, mem, artifacts, analysis_plan=plan)
+        plan_obj = AnalysisPlan(**plan)
+        layout = default_spec(bundle, plan_obj)
+        # fresh store per repeat: measures aggregation + downsampling, not cache hits
+        cases["prepare_chart_data"] = _time(
+            lambda: prepare_chart_data(bundle, layout, plan_obj, ChartDataStore(Path(tempfile.mkdtemp(dir=root)))), repeats
+        )
+
+        # incremental refresh with no new source rows: re-fetches only the lookback window
+        inc_artifacts = [a.model_copy(update={"watermark_column": "event_date"}) for a in artifacts]
+        inc_mem = MemoryStore(root / "cache_incremental")
+        execute_and_cache_artifacts(engine, inc_mem, inc_artifacts, analysis_plan=plan)
+        cases["incremental_refresh"] = _time(
+            lambda: execute_and_cache_artifacts(engine, inc_mem, inc_artifacts, analysis_plan=plan, incremental=True), repeats
+        )
+
+        # three artifacts over one aggregating CTE: fetched once and finished in DuckDB vs three warehouse queries
+        import artifact_dag
+
+        cte_artifacts = shared_cte_artifacts(spec)
+        cte_mem = MemoryStore(root / "cache_dag")
+        share = artifact_dag.SHARE_CTES
+        try:
+            # forced both ways: on SQLite the auto default would not share at all
+            artifact_dag.SHARE_CTES = "1"
+            cases["shared_cte_artifacts"] = _time(lambda: execute_and_cache_artifacts(engine, cte_mem, cte_artifacts), repeats)
+            artifact_dag.SHARE_CTES = "0"
+            cases["shared_cte_artifacts_unshared"] = _time(
+                lambda: execute_and_cache_artifacts(engine, cte_mem, cte_artifacts), repeats
+            )
+        finally:
+            artifact_dag.SHARE_CTES = share
+
+        big = max(datasets.values(), key=len)
+
+        def cache_roundtrip() -> None:
+            mem.cache_df("bench_roundtrip", big)
+            mem.load_cached_df("bench_roundtrip")
+
+        cases["memory_store_roundtrip"] = _time(cache_roundtrip, repeats)
+        cases["safe_json_dumps_profile"] = _time(lambda: safe_json_dumps(profile), repeats)
+
+        index = build_schema_index(profile)
+        step_key, step_goal = STEPS[3]
+        request = "leadership dashboard: revenue by category and region, active customers, daily trend"
+
+        def prompt_case() -> None:
+            sliced = select_profile_slice(profile, index, request, k=25)
+            build_step_prompt(step_key, step_goal, request, sliced)
+
+        cases["build_step_prompt"] = _time(prompt_case, repeats)
+        cases["build_schema_index"] = _time(lambda: build_schema_index(profile), repeats)
+        engine.dispose()
+    finally:
+        if tmp is not None:
+            tmp.cleanup()
+
+    return {"meta": _meta(spec, gen_s), "cases": cases}
+
+
+def _meta(spec: WarehouseSpec, gen_s: float) -> Dict[str, Any]:
+    try:
+        rev = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, cwd=Path(__file__).parent
+        ).stdout.strip()
+    except Exception:
+        rev = ""
+    return {
+        "spec": asdict(spec),
+        "generate_s": gen_s,
+        "git_rev": rev,
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+
+
+# ---------- baseline comparison ----------
+
+def compare(
+    result: Dict[str, Any],
+    baseline: Dict[str, Any],
+    threshold: float = 0.25,
+    min_delta_s: float = 0.005,
+) -> List[Dict[str, Any]]:
+    """
+    Per case: ratio of median times vs. the baseline. A case regresses when it is more than
+    `threshold` slower AND slower by at least `min_delta_s` (ignores noise on tiny cases).
+    """
+    rows = []
+    for name, cur in result["cases"].items():
+        base = baseline.get("cases", {}).get(name)
+        if base is None:
+            rows.append({"case": name, "median_s": cur["median_s"], "baseline_s": None, "ratio": None, "regressed": False})
+            continue
+        ratio = cur["median_s"] / base["median_s"] if base["median_s"] > 0 else float("inf")
+        regressed = ratio > 1 + threshold and cur["median_s"] - base["median_s"] > min_delta_s
+        rows.append(
+            {"case": name, "median_s": cur["median_s"], "baseline_s": base["median_s"], "ratio": ratio, "regressed": regressed}
+        )
+    return rows
+
+
+def _print_table(rows: List[Dict[str, Any]]) -> None:
+    print(f"{'case':32} {'median_s':>10} {'baseline_s':>11} {'ratio':>7}")
+    for r in rows:
+        base = "—" if r["baseline_s"] is None else f"{r['baseline_s']:.4f}"
+        ratio = "—" if r["ratio"] is None else f"{r['ratio']:.2f}"
+        flag = "  REGRESSED" if r["regressed"] else ""
+        print(f"{r['case']:32} {r['median_s']:>10.4f} {base:>11} {ratio:>7}{flag}")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description="End-to-end benchmark on a synthetic warehouse")
+    ap.add_argument("--tables", type=int, default=40)
+    ap.add_argument("--cols", type=int, default=12)
+    ap.add_argument("--rows", type=int, default=20_000)
+    ap.add_argument("--skew", type=float, default=1.2)
+    ap.add_argument("--seed", type=int, default=7)
+    ap.add_argument("--backend", choices=BACKENDS, default="sqlite")
+    ap.add_argument("--repeats", type=int, default=3)
+    ap.add_argument("--out", default=os.getenv("BENCH_OUT", "bench_results.json"))
+    ap.add_argument("--baseline", default=os.getenv("BENCH_BASELINE"), help="compare against this results file")
+    ap.add_argument("--threshold", type=float, default=float(os.getenv("BENCH_THRESHOLD", "0.25")))
+    ap.add_argument("--save-baseline", metavar="PATH", help="also write the results here as the new baseline")
+    args = ap.parse_args(argv)
+
+    spec = WarehouseSpec(args.tables, args.cols, args.rows, args.skew, args.seed, args.backend)
+    result = run_suite(spec, repeats=args.repeats)
+    text = json.dumps(result, indent=2)
+    Path(args.out).write_text(text, encoding="utf-8")
+    if args.save_baseline:
+        Path(args.save_baseline).write_text(text, encoding="utf-8")
+
+    baseline = None
+    if args.baseline and Path(args.baseline).exists():
+        baseline = json.loads(Path(args.baseline).read_text(encoding="utf-8"))
+        if baseline.get("meta", {}).get("spec") != result["meta"]["spec"]:
+            print("warning: baseline was recorded with a different warehouse spec", file=sys.stderr)
+    rows = compare(result, baseline or {"cases": {}}, threshold=args.threshold)
+    _print_table(rows)
+    print(f"results: {args.out}")
+    return 1 if any(r["regressed"] for r in rows) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
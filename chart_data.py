@@ -0,0 +1,343 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from models import AnalysisPlan, DashboardSpec, DatasetSummary, ExecutionBundle, WidgetSpec
+from parquet_layout import read_dataset
+from tracing import span
+
+MAX_POINTS = int(os.getenv("CHART_MAX_POINTS", "500"))  # per trend series after downsampling
+DOWNSAMPLE = os.getenv("CHART_DOWNSAMPLE", "lttb")  # lttb | minmax
+MAX_CATEGORIES = int(os.getenv("CHART_MAX_CATEGORIES", "12"))  # breakdown bars incl. "Other"
+MAX_TABLE_ROWS = int(os.getenv("CHART_MAX_TABLE_ROWS", "100"))
+HIST_BINS = 30
+OTHER = "Other"
+
+
+# ---------- cached frames ----------
+
+_frames: OrderedDict[Tuple[str, int, Tuple[str, ...]], pd.DataFrame] = OrderedDict()
+_frames_lock = threading.Lock()
+
+
+def load_frame(parquet_path: str, time_columns: Sequence[str] = ()) -> pd.DataFrame:
+    """
+    Parquet of a cached dataset with `time_columns` parsed to datetimes, memoized on
+    (path, mtime): recompiling after a layout change costs no I/O or date parsing, a refreshed
+    dataset (rewritten file) is picked up automatically.
+    """
+    p = Path(parquet_path)
+    key = (str(p.resolve()), p.stat().st_mtime_ns, tuple(time_columns))
+    with _frames_lock:
+        df = _frames.get(key)
+        if df is not None:
+            _frames.move_to_end(key)
+            return df
+    with span("charts.read_parquet", cat="io", path=p.name):
+        df = read_dataset(p)
+    for c in time_columns:
+        if c in df.columns and not pd.api.types.is_datetime64_any_dtype(df[c]):
+            df[c] = pd.to_datetime(df[c], errors="coerce")
+    with _frames_lock:
+        _frames[key] = df
+        while len(_frames) > int(os.getenv("DASHBOARD_FRAME_CACHE", "16")):
+            _frames.popitem(last=False)
+    return df
+
+
+# ---------- downsampling ----------
+
+def lttb(x: np.ndarray, y: np.ndarray, n_out: int) -> np.ndarray:
+    """
+    Largest-Triangle-Three-Buckets: indices of `n_out` points that keep the visual shape of
+    the series (peaks and dips survive, unlike taking every k-th point). `x` must be sorted.
+    """
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    out = np.empty(n_out, dtype=np.int64)
+    out[0], out[-1] = 0, n - 1
+    every = (n - 2) / (n_out - 2)
+    a = 0
+    for i in range(n_out - 2):
+        lo = int(i * every) + 1
+        hi = int((i + 1) * every) + 1
+        nlo, nhi = hi, min(int((i + 2) * every) + 1, n)
+        if nlo >= nhi:  # last bucket: the next "average" is the final point
+            ax, ay = x[-1], y[-1]
+        else:
+            ax, ay = x[nlo:nhi].mean(), y[nlo:nhi].mean()
+        area = np.abs((x[a] - ax) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (ay - y[a]))
+        a = lo + int(area.argmax())
+        out[i + 1] = a
+    return out
+
+
+def minmax(y: np.ndarray, n_out: int) -> np.ndarray:
+    """Min and max of each of `n_out // 2` buckets (keeps every extreme; good for spiky series)."""
+    n = len(y)
+    if n_out >= n or n_out < 2:
+        return np.arange(n)
+    y = np.asarray(y, dtype=float)
+    edges = np.linspace(0, n, n_out // 2 + 1).astype(np.int64)
+    keep = [0, n - 1]
+    for lo, hi in zip(edges[:-1], edges[1:]):
+        if hi > lo:
+            keep.append(lo + int(y[lo:hi].argmin()))
+            keep.append(lo + int(y[lo:hi].argmax()))
+    return np.unique(np.asarray(keep, dtype=np.int64))
+
+
+def downsample(x: np.ndarray, y: np.ndarray, n_out: int = MAX_POINTS, method: str = DOWNSAMPLE) -> np.ndarray:
+    if method == "minmax":
+        return minmax(y, n_out)
+    return lttb(x, y, n_out)
+
+
+# ---------- aggregation ----------
+
+def _trend_freq(t: pd.Series, grain: str = "") -> str:
+    """Period of the trend buckets: the plan's grain when it names one, else by time span."""
+    g = grain.lower()
+    for word, freq in (("month", "M"), ("week", "W"), ("day", "D"), ("daily", "D"), ("hour", "h")):
+        if word in g:
+            return freq
+    days = (t.max() - t.min()).days if t.notna().any() else 0
+    return "M" if days > 730 else "W" if days > 120 else "D"
+
+
+def _agg(df: pd.DataFrame, key: pd.Series, y: Optional[str], agg: str) -> pd.Series:
+    # group one column, not the frame: no copy of the other columns per widget
+    if y is None or agg == "count":
+        return key.groupby(key, observed=True).size()
+    g = pd.to_numeric(df[y], errors="coerce").groupby(key, observed=True)
+    return {"sum": g.sum, "avg": g.mean, "min": g.min, "max": g.max}[agg]()
+
+
+def top_n_other(df: pd.DataFrame, key: pd.Series, y: Optional[str], agg: str, n: int) -> pd.Series:
+    """
+    Aggregate by `key` and keep the `n - 1` largest groups plus one "Other" bucket aggregated
+    over all remaining rows (a true avg/min/max of those rows, not an aggregate of aggregates).
+    """
+    if y is None or agg == "count":
+        parts = key.groupby(key, observed=True).size().to_frame("count")
+    else:
+        v = pd.to_numeric(df[y], errors="coerce")
+        parts = v.groupby(key, observed=True).agg(["sum", "count", "min", "max"])
+    value = parts["sum"] / parts["count"] if agg == "avg" else parts["count" if y is None or agg == "count" else agg]
+    value = value.sort_values(ascending=False)
+    if len(value) <= n:
+        return value
+    keep = value.iloc[: n - 1]
+    rest = parts.loc[value.index[n - 1 :]]
+    if y is None or agg == "count":
+        other = rest["count"].sum()
+    elif agg == "sum":
+        other = rest["sum"].sum()
+    elif agg == "avg":
+        other = rest["sum"].sum() / max(rest["count"].sum(), 1)
+    else:
+        other = getattr(rest[agg], agg)()
+    return pd.concat([keep, pd.Series([other], index=[OTHER])])
+
+
+# ---------- compact columnar payloads ----------
+
+def compact_numbers(values: np.ndarray) -> List[Any]:
+    """Floats to 6 significant digits, NaN -> null; ints stay ints."""
+    arr = np.asarray(values)
+    if arr.dtype.kind in "iub":
+        return arr.astype(np.int64).tolist()
+    arr = arr.astype(float)
+    return [None if np.isnan(v) else float(f"{v:.6g}") for v in arr.tolist()]
+
+
+def compact_times(ts: pd.DatetimeIndex) -> List[str]:
+    # date-only strings when no bucket has a time part: shorter, and Plotly reads both
+    if len(ts) and (ts.normalize() == ts).all():
+        return ts.strftime("%Y-%m-%d").tolist()
+    return ts.strftime("%Y-%m-%dT%H:%M:%S").tolist()
+
+
+def compact_cell(v: Any) -> Any:
+    if v is None or isinstance(v, float) and np.isnan(v):
+        return None
+    if isinstance(v, np.integer):
+        return int(v)
+    if isinstance(v, (np.floating, float)):
+        return float(f"{float(v):.6g}")
+    if isinstance(v, pd.Timestamp):
+        return v.isoformat()
+    return v if isinstance(v, (int, str, bool)) else str(v)
+
+
+def widget_data(w: WidgetSpec, df: pd.DataFrame, grain: str = "") -> Dict[str, Any]:
+    """
+    Chart-ready columnar payload for one widget, bounded in size whatever the dataset size:
+    trends are aggregated to the grain then downsampled to MAX_POINTS, breakdowns keep the
+    top categories plus "Other", distributions are binned server-side, tables are capped.
+    """
+    n_source = int(len(df))
+    if w.kind == "trend":
+        t = df[w.x] if pd.api.types.is_datetime64_any_dtype(df[w.x]) else pd.to_datetime(df[w.x], errors="coerce")
+        s = _agg(df, t.dt.to_period(_trend_freq(t, grain)), w.y, w.agg).sort_index().dropna()
+        ts = s.index.to_timestamp()
+        n_points = len(s)
+        method = None
+        if n_points > MAX_POINTS:
+            method = DOWNSAMPLE
+            idx = downsample(ts.asi8.astype(float), s.to_numpy(dtype=float), MAX_POINTS, method)
+            s, ts = s.iloc[idx], ts[idx]
+        return {"x": compact_times(ts), "y": compact_numbers(s.to_numpy()), "n_source": n_source, "n_points": n_points, "downsampled": method}
+    if w.kind == "breakdown":
+        key = df[w.x] if pd.api.types.is_string_dtype(df[w.x]) else df[w.x].astype(str)
+        s = top_n_other(df, key, w.y, w.agg, min(w.limit, MAX_CATEGORIES))
+        return {"x": [str(k) for k in s.index], "y": compact_numbers(s.to_numpy()), "n_source": n_source}
+    if w.kind == "distribution":
+        v = pd.to_numeric(df[w.y], errors="coerce").dropna().to_numpy()
+        if v.size == 0:
+            return {"x": [], "y": [], "width": 0, "n_source": n_source}
+        counts, edges = np.histogram(v, bins=HIST_BINS)
+        return {"x": compact_numbers((edges[:-1] + edges[1:]) / 2), "y": compact_numbers(counts), "width": float(f"{edges[1] - edges[0]:.6g}"), "n_source": n_source}
+    head = df.head(min(w.limit, MAX_TABLE_ROWS))
+    return {
+        "columns": [str(c) for c in head.columns],
+        "rows": [[compact_cell(v) for v in r] for r in head.itertuples(index=False)],
+        "n_source": n_source,
+    }
+
+
+# ---------- stage + store ----------
+
+def widget_key(w: WidgetSpec, ds: DatasetSummary, grain: str = "") -> str:
+    """Cache key of a payload: the widget, the grain, the caps and the dataset file's version."""
+    try:
+        mtime = Path(ds.parquet_path).stat().st_mtime_ns
+    except OSError:
+        mtime = 0
+    blob = json.dumps(
+        [ds.cache_key, mtime, w.kind, w.x, w.y, w.agg, w.limit, grain, MAX_POINTS, DOWNSAMPLE, MAX_CATEGORIES],
+        default=str,
+    )
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()[:24]
+
+
+class ChartDataStore:
+    """Prepared chart payloads as small JSON files (one per widget key) plus an in-memory layer."""
+
+    def __init__(self, root: Path, keep: int = 256) -> None:
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.keep = keep
+        self._mem: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            if key in self._mem:
+                self._mem.move_to_end(key)
+                return self._mem[key]
+        p = self.root / f"{key}.json"
+        if not p.exists():
+            return None
+        payload = json.loads(p.read_text(encoding="utf-8"))
+        self._remember(key, payload)
+        return payload
+
+    def put(self, key: str, payload: Dict[str, Any]) -> int:
+        text = json.dumps(payload, separators=(",", ":"), ensure_ascii=False)
+        tmp = self.root / f"{key}.tmp"
+        tmp.write_text(text, encoding="utf-8")
+        tmp.replace(self.root / f"{key}.json")
+        self._remember(key, payload)
+        return len(text)
+
+    def _remember(self, key: str, payload: Dict[str, Any]) -> None:
+        with self._lock:
+            self._mem[key] = payload
+            self._mem.move_to_end(key)
+            while len(self._mem) > self.keep:
+                self._mem.popitem(last=False)
+
+
+def default_chart_store() -> ChartDataStore:
+    return ChartDataStore(Path(os.getenv("CACHE_DIR", "./cache")) / "charts")
+
+
+def chart_payload(
+    w: WidgetSpec,
+    ds: DatasetSummary,
+    grain: str = "",
+    store: Optional[ChartDataStore] = None,
+) -> Dict[str, Any]:
+    """Payload for one widget: from the store when prepared already, else computed (and stored)."""
+    key = widget_key(w, ds, grain) if store is not None else None
+    if store is not None and key is not None:
+        hit = store.get(key)
+        if hit is not None:
+            return hit
+    with span("charts.prepare", cat="charts", kind=w.kind, dataset=w.dataset) as sp:
+        payload = widget_data(w, load_frame(ds.parquet_path, ds.inferred_time_columns), grain)
+        if store is not None and key is not None:
+            sp.set(bytes=store.put(key, payload))
+    return payload
+
+
+def prepare_chart_data(
+    bundle: ExecutionBundle,
+    spec: DashboardSpec,
+    plan: Optional[AnalysisPlan] = None,
+    store: Optional[ChartDataStore] = None,
+    progress: Optional[Callable[[float, str], None]] = None,
+) -> Dict[str, Any]:
+    """
+    Stage run after execute_and_cache_artifacts: compute and store every widget payload of
+    `spec`, so the dashboard compiles from a few KB of JSON instead of the datasets.
+    """
+    store = store or default_chart_store()
+    datasets = {d.dataset_name: d for d in bundle.datasets}
+    grain = plan.grain if plan else ""
+    t0 = time.perf_counter()
+    total = 0
+    for i, w in enumerate(spec.widgets):
+        ds = datasets.get(w.dataset)
+        if ds is None:
+            continue
+        if progress is not None:
+            progress(i / max(len(spec.widgets), 1), f"Preparing chart data: {w.title or w.kind}")
+        total += len(json.dumps(chart_payload(w, ds, grain, store), separators=(",", ":")))
+    return {"charts": len(spec.widgets), "bytes": total, "elapsed_s": time.perf_counter() - t0}
+
+
+if __name__ == "__main__":
+    # payload size vs. dataset size: hourly series over two years, growing row counts
+    from models import WidgetSpec as _W
+
+    rng = np.random.default_rng(0)
+    print(f"{'rows':>10} {'trend pts':>9} {'trend KB':>9} {'breakdown KB':>13} {'prep ms':>8}")
+    for n in (10_000, 100_000, 1_000_000):
+        df = pd.DataFrame(
+            {
+                "ts": pd.Timestamp("2023-01-01") + pd.to_timedelta(rng.integers(0, 730 * 24, n), unit="h"),
+                "cat": np.char.add("c", rng.zipf(1.3, n).clip(max=5000).astype(str)),
+                "amount": rng.lognormal(3, 1, n),
+            }
+        )
+        t0 = time.perf_counter()
+        trend = widget_data(_W(kind="trend", dataset="d", x="ts", y="amount"), df, grain="hourly")
+        brk = widget_data(_W(kind="breakdown", dataset="d", x="cat", y="amount", agg="avg", limit=10), df)
+        ms = (time.perf_counter() - t0) * 1000
+        kb = lambda p: len(json.dumps(p, separators=(",", ":"))) / 1024  # noqa: E731
+        print(f"{n:>10} {len(trend['x']):>9} {kb(trend):>9.1f} {kb(brk):>13.1f} {ms:>8.0f}")
@@ -0,0 +1,372 @@
+"""
+Column statistics for the DB profile, computed in the warehouse instead of shipping sample rows.
+
+Per table, one aggregate query returns the row count and, for every column, the non-NULL count,
+an (approximate where the engine has it) distinct count and min / max. Without
+APPROX_COUNT_DISTINCT, float / decimal columns get no distinct count and the others count
+distinct values over the first PROFILE_STATS_DISTINCT_ROWS rows only. A count that did not see
+the whole table carries "distinct_rows" (0 when not counted), so prompts read it as a lower bound.
+Low-cardinality text, integer and bit columns can also get their top values from a second,
+grouped query over at most PROFILE_TOP_ROWS rows: which columns qualify is only known from the
+aggregate's distinct counts. A few hundred bytes per column replace the 500 raw rows the profile
+used to carry.
+
+Cost is bounded in cells (rows scanned x columns):
+- the row count comes from metadata where the engine keeps one (SQL Server, PostgreSQL) and
+  from the aggregate's own COUNT(*) elsewhere; nothing counts the table twice;
+- a table known to exceed PROFILE_STATS_SAMPLE_ABOVE rows is profiled on a TABLESAMPLE of about
+  PROFILE_STATS_SAMPLE_TARGET rows where the engine has one (SQL Server, PostgreSQL), and
+  scanned whole elsewhere;
+- the aggregate covers as many columns as fit in PROFILE_STATS_MAX_CELLS; the rest are listed
+  as skipped and carry no stats;
+- top values are read from a TABLESAMPLE of about PROFILE_TOP_ROWS rows, or from the whole table
+  when it is no larger than that, and skipped otherwise (PROFILE_TOP_VALUES=0 turns them off).
+"""
+from __future__ import annotations
+
+import math
+import os
+import threading
+import time
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, Dict, List, Optional, Tuple
+
+import pandas as pd
+from sqlalchemy.engine import Engine
+
+from db import is_mssql, qualified_name, run_sql
+from tracing import span
+
+ENABLED = os.getenv("PROFILE_COLUMN_STATS", "1") == "1"
+SAMPLE_ROWS = int(os.getenv("PROFILE_SAMPLE_ROWS", "5"))  # raw example rows still kept per table
+SAMPLE_ABOVE = int(os.getenv("PROFILE_STATS_SAMPLE_ABOVE", "5000000"))  # 0 = always scan the whole table
+SAMPLE_TARGET = int(os.getenv("PROFILE_STATS_SAMPLE_TARGET", "1000000"))
+MAX_CELLS = int(os.getenv("PROFILE_STATS_MAX_CELLS", "200000000"))
+# without APPROX_COUNT_DISTINCT, distinct counts cover this many rows (a lower bound beyond it)
+DISTINCT_ROWS = int(os.getenv("PROFILE_STATS_DISTINCT_ROWS", "10000"))
+TOP_K = int(os.getenv("PROFILE_TOP_VALUES", "5"))
+TOP_MAX_DISTINCT = int(os.getenv("PROFILE_TOP_MAX_DISTINCT", "200"))
+TOP_ROWS = int(os.getenv("PROFILE_TOP_ROWS", "100000"))  # rows the top-value query reads at most
+VALUE_CHARS = 60
+
+# types that cannot (or should not) be compared, grouped or counted distinct: NULLs only
+_OPAQUE = {"blob", "bytea", "binary", "varbinary", "image", "xml", "json", "jsonb", "geography", "geometry"}
+_MSSQL_OPAQUE = _OPAQUE | {"text", "ntext", "hierarchyid", "sql_variant", "timestamp", "rowversion"}
+_MSSQL_NO_MINMAX = {"uniqueidentifier"}
+
+_SAMPLING = ("mssql", "postgresql")  # TABLESAMPLE SYSTEM (...) REPEATABLE (seed)
+
+_no_approx: set = set()  # engines where APPROX_COUNT_DISTINCT is missing (SQL Server < 2019)
+_no_approx_lock = threading.Lock()
+
+
+def _kind(data_type: str, mssql: bool) -> str:
+    """opaque | bit | text | int | float (floats, decimals, money) | other (dates, ...)."""
+    t = (data_type or "").lower().split("(")[0].strip()
+    if t in (_MSSQL_OPAQUE if mssql else _OPAQUE):
+        return "opaque"
+    if t in ("bit", "bool", "boolean"):
+        return "bit"
+    if "char" in t or t in ("text", "string", "enum", "citext"):
+        return "text"
+    if "int" in t and "interval" not in t and "point" not in t:
+        return "int"
+    if any(k in t for k in ("float", "real", "double", "decimal", "numeric", "money")):
+        return "float"
+    return "other"
+
+
+def _jsonable(v: Any) -> Any:
+    if v is None:
+        return None
+    if hasattr(v, "item") and not isinstance(v, (str, bytes)):
+        v = v.item()  # numpy scalars
+    if isinstance(v, bool) or isinstance(v, int):
+        return v
+    if isinstance(v, float):
+        return None if math.isnan(v) or math.isinf(v) else v
+    if isinstance(v, Decimal):
+        return float(v)
+    if isinstance(v, (datetime, date, pd.Timestamp)):
+        return v.isoformat()
+    if isinstance(v, (bytes, bytearray, memoryview)):
+        return None
+    return str(v)[:VALUE_CHARS]
+
+
+def _source(engine: Engine, schema: str, table: str, rows: Optional[int], target: int) -> Tuple[str, Optional[int]]:
+    """
+    (FROM clause, rows it reads or None for the whole table): a page sample of about `target` rows
+    when `rows` is known to exceed it and the engine has TABLESAMPLE.
+    """
+    qualified = qualified_name(engine, schema, table)
+    if not target or rows is None or rows <= target or engine.dialect.name not in _SAMPLING:
+        return qualified, None
+    pct = 100.0 * target / rows
+    unit = " PERCENT" if is_mssql(engine) else ""
+    # REPEATABLE: the same pages on every profile run, so stats do not drift between scans
+    return f"{qualified} TABLESAMPLE SYSTEM ({pct:.4f}{unit}) REPEATABLE (17)", target
+
+
+def _aggregate_sql(
+    engine: Engine, src: str, cols: List[Tuple[int, str, str]], distinct: str, prefix_rows: int = 0
+) -> str:
+    """
+    One row: COUNT(*) as n, then nn_i / d_i / mn_i / mx_i per column. With distinct="prefix" the
+    distinct counts come from the first `prefix_rows` rows, in a cross-joined subquery of the same
+    statement: exact COUNT(DISTINCT) over a large table costs a sort per column.
+    """
+    q = engine.dialect.identifier_preparer.quote
+    mssql = is_mssql(engine)
+    parts, distincts, picked = ["COUNT(*) AS n"], [], []
+    for i, name, kind in cols:
+        c = q(name)
+        parts.append(f"COUNT({c}) AS nn_{i}")
+        if kind == "opaque":
+            continue
+        v = f"CAST({c} AS INT)" if kind == "bit" and mssql else c
+        if distinct == "approx":
+            parts.append(f"APPROX_COUNT_DISTINCT({v}) AS d_{i}")
+        elif kind == "float":
+            pass  # an exact distinct count of a measure costs a sort and tells the planner nothing
+        elif distinct == "exact":
+            parts.append(f"COUNT(DISTINCT {v}) AS d_{i}")
+        else:
+            distincts.append(f"COUNT(DISTINCT {v}) AS d_{i}")
+            picked.append(c)
+        if kind != "nominmax":
+            parts.append(f"MIN({v}) AS mn_{i}")
+            parts.append(f"MAX({v}) AS mx_{i}")
+    sql = "SELECT " + ", ".join(parts) + f" FROM {src}"
+    if not distincts:
+        return sql
+    n = int(prefix_rows)
+    prefix = (
+        f"SELECT TOP ({n}) {', '.join(picked)} FROM {src}" if mssql
+        else f"SELECT {', '.join(picked)} FROM {src} LIMIT {n}"
+    )
+    return f"SELECT * FROM ({sql}) AS _agg CROSS JOIN (SELECT {', '.join(distincts)} FROM ({prefix}) AS _p) AS _dist"
+
+
+def _top_sql(engine: Engine, src: str, cols: List[Tuple[int, str]], k: int) -> str:
+    q = engine.dialect.identifier_preparer.quote
+    cast = "NVARCHAR(%d)" if is_mssql(engine) else "VARCHAR(%d)"
+    branches = [
+        f"SELECT {i} AS c, CAST({q(name)} AS {cast % VALUE_CHARS}) AS v, COUNT(*) AS n, "
+        f"ROW_NUMBER() OVER (ORDER BY COUNT(*) DESC) AS rk FROM {src} WHERE {q(name)} IS NOT NULL GROUP BY {q(name)}"
+        for i, name in cols
+    ]
+    return "SELECT c, v, n FROM (\n" + "\nUNION ALL\n".join(branches) + f"\n) AS _top WHERE rk <= {int(k)}"
+
+
+def _has_approx(engine: Engine) -> bool:
+    return engine.dialect.name in ("mssql", "duckdb", "snowflake", "bigquery", "oracle")
+
+
+def estimate_rows(engine: Engine, schema: str, table: str) -> Optional[int]:
+    """Row count from catalog metadata (no scan), or None where the engine keeps none."""
+    if is_mssql(engine):
+        sql = """
+        SELECT SUM(p.rows) AS cnt FROM sys.partitions p
+        WHERE p.object_id = OBJECT_ID(:name) AND p.index_id IN (0, 1)
+        """
+        name = f"[{schema}].[{table}]"
+    elif engine.dialect.name == "postgresql":
+        # -1 / 0 until the table is first analyzed
+        sql = "SELECT CAST(reltuples AS BIGINT) AS cnt FROM pg_class WHERE oid = to_regclass(:name)"
+        name = f'"{schema}"."{table}"' if schema else f'"{table}"'
+    else:
+        return None
+    try:
+        df = run_sql(engine, sql, params={"name": name})
+    except Exception:
+        return None
+    if df.empty or df["cnt"].iloc[0] is None or pd.isna(df["cnt"].iloc[0]) or int(df["cnt"].iloc[0]) <= 0:
+        return None
+    return int(df["cnt"].iloc[0])
+
+
+def column_stats(
+    engine: Engine,
+    schema: str,
+    table: str,
+    columns: List[Dict[str, Any]],
+    rows: Optional[int] = None,
+    sample: bool = True,
+) -> Dict[str, Any]:
+    """
+    {"columns": {name: {null_frac, distinct, distinct_rows, min, max, top}}, "rows_scanned", "sampled", "queries",
+    "distinct": "approx" | "exact" | "prefix", "skipped_columns", "ms"}. `rows` is a row count
+    estimate (None when unknown) and decides whether to sample; an unsampled scan's COUNT(*) is the
+    exact row count.
+    """
+    t0 = time.perf_counter()
+    mssql = is_mssql(engine)
+    target = SAMPLE_TARGET if sample and SAMPLE_ABOVE and (rows or 0) > SAMPLE_ABOVE else 0
+    src, sample_n = _source(engine, schema, table, rows, target)
+    scanned = sample_n or rows or 0
+    kinds = []
+    for i, c in enumerate(columns):
+        name = str(c.get("COLUMN_NAME", c.get("name", "")))
+        dt = str(c.get("DATA_TYPE", c.get("data_type", ""))).lower()
+        kind = _kind(dt, mssql)
+        kinds.append((i, name, "nominmax" if mssql and dt in _MSSQL_NO_MINMAX else kind))
+
+    per_query = max(1, MAX_CELLS // max(scanned, 1))
+    skipped = [name for _, name, _ in kinds[per_query:]]
+    kinds = kinds[:per_query]
+
+    key = engine.url.render_as_string(hide_password=True)
+    approx = _has_approx(engine) and key not in _no_approx
+    # with no row count yet, a distinct count may face the whole table: bound it up front
+    prefix = DISTINCT_ROWS and (rows is None or scanned > DISTINCT_ROWS)
+    distinct = "approx" if approx else "prefix" if prefix else "exact"
+    queries = 0
+    with span("db.column_stats", cat="sql", table=f"{schema}.{table}", cols=len(kinds), sampled=bool(sample_n)):
+        try:
+            row = run_sql(engine, _aggregate_sql(engine, src, kinds, distinct, DISTINCT_ROWS)).iloc[0]
+        except Exception:
+            if distinct != "approx":
+                raise
+            with _no_approx_lock:
+                _no_approx.add(key)
+            distinct = "prefix" if prefix else "exact"
+            row = run_sql(engine, _aggregate_sql(engine, src, kinds, distinct, DISTINCT_ROWS)).iloc[0]
+        queries += 1
+    n = int(row["n"])
+    if distinct == "prefix" and n <= DISTINCT_ROWS:
+        distinct = "exact"  # the prefix was the whole table
+    # rows a distinct count saw when that is not the whole table: the count is a lower bound
+    partial = DISTINCT_ROWS if distinct == "prefix" else n if sample_n else None
+    out: Dict[str, Dict[str, Any]] = {}
+    for i, name, kind in kinds:
+        nn = int(row[f"nn_{i}"])
+        st: Dict[str, Any] = {"null_frac": round(1 - nn / n, 4) if n else None}
+        if f"d_{i}" in row.index:
+            st["distinct"] = int(row[f"d_{i}"])
+            if partial:
+                st["distinct_rows"] = partial
+        elif kind == "float":
+            st["distinct"], st["distinct_rows"] = None, 0  # not counted, see _aggregate_sql
+        if f"mn_{i}" in row.index:
+            st["min"], st["max"] = _jsonable(row[f"mn_{i}"]), _jsonable(row[f"mx_{i}"])
+        out[name] = st
+
+    # top values: categorical-looking columns, over at most TOP_ROWS rows (a sample, or the whole
+    # table when it is that small); engines without TABLESAMPLE skip them on larger tables
+    top_src, top_n = _source(engine, schema, table, rows if sample_n else n, TOP_ROWS)
+    top_cols = [
+        (i, name) for i, name, kind in kinds
+        if kind in ("text", "int", "bit")
+        and 0 < out[name].get("distinct", 0) <= TOP_MAX_DISTINCT and out[name]["distinct"] < n
+    ]
+    if top_cols and TOP_K > 0 and (top_n or n <= TOP_ROWS):
+        by_index = dict(top_cols)
+        with span("db.column_top_values", cat="sql", table=f"{schema}.{table}", cols=len(top_cols), sampled=bool(top_n)):
+            try:
+                df = run_sql(engine, _top_sql(engine, top_src, top_cols, TOP_K))
+                queries += 1
+            except Exception:
+                df = pd.DataFrame(columns=["c", "v", "n"])  # stats without top values beat no stats
+        for (c, v, cnt) in df.sort_values(["c", "n"], ascending=[True, False]).itertuples(index=False):
+            out[by_index[int(c)]].setdefault("top", []).append([_jsonable(v), int(cnt)])
+
+    return {
+        "columns": out,
+        "rows_scanned": n,
+        "sampled": bool(sample_n),
+        "queries": queries,
+        "distinct": distinct,
+        "distinct_rows": DISTINCT_ROWS if distinct == "prefix" else n,
+        "top_rows": top_n or n,
+        "skipped_columns": skipped,
+        "ms": round((time.perf_counter() - t0) * 1000, 1),
+    }
+
+
+def apply_stats(table: Dict[str, Any], stats: Dict[str, Any]) -> None:
+    """Fold column stats into the profile's column records; the rest goes to table["stats"]."""
+    by_name = stats.get("columns", {})
+    for c in table.get("columns", []) or []:
+        st = by_name.get(str(c.get("COLUMN_NAME", c.get("name", ""))))
+        if st:
+            c.update(st)
+    table["stats"] = {k: v for k, v in stats.items() if k != "columns"}
+
+
+def _fmt(v: Any) -> str:
+    if isinstance(v, float):
+        return f"{v:.6g}"
+    return str(v)
+
+
+def column_lines(table: Dict[str, Any], max_cols: int = 80) -> str:
+    """One compact line per column for prompts: type, nullability and whatever stats the profile has."""
+    stats = table.get("stats") or {}
+    scanned = stats.get("rows_scanned") or 0
+    top_rows = stats.get("top_rows") or scanned
+    approx = "~" if stats.get("distinct") == "approx" else ""
+    lines = []
+    if scanned:
+        head = f"(stats over {scanned:,} {'sampled ' if stats.get('sampled') else ''}rows"
+        if top_rows < scanned:
+            head += f"; top values over a sample of {top_rows:,}"
+        lines.append(head + ")")
+    for c in (table.get("columns", []) or [])[:max_cols]:
+        name = c.get("COLUMN_NAME", c.get("name", ""))
+        dtype = c.get("DATA_TYPE", c.get("data_type", ""))
+        length = c.get("CHARACTER_MAXIMUM_LENGTH")
+        if length and length == length:  # NaN from pandas for non-text columns
+            dtype = f"{dtype}({'max' if int(length) == -1 else int(length)})"
+        parts = [f"- {name} {dtype}{'' if c.get('IS_NULLABLE', 'YES') == 'YES' else ' NOT NULL'}"]
+        if c.get("null_frac") is not None:
+            parts.append(f"{c['null_frac']:.1%} null")
+        if c.get("distinct_rows") == 0:
+            parts.append("distinct not counted")
+        elif c.get("distinct") is not None:
+            if c.get("distinct_rows"):
+                parts.append(f">={approx}{c['distinct']:,} distinct (in {c['distinct_rows']:,} rows)")
+            else:
+                parts.append(f"{approx}{c['distinct']:,} distinct")
+        if c.get("min") is not None:
+            parts.append(f"{_fmt(c['min'])} .. {_fmt(c['max'])}")
+        if c.get("top"):
+            parts.append("top: " + ", ".join(
+                f"{v} ({n / top_rows:.0%})" if top_rows else f"{v} ({n})" for v, n in c["top"]
+            ))
+        lines.append(" · ".join(parts))
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+    import tempfile
+    from pathlib import Path
+
+    from sqlalchemy import create_engine
+
+    import column_stats  # the module db.py uses, not this __main__ copy
+    from bench_suite import WarehouseSpec, generate_warehouse
+    from db import build_db_profile
+    from memory_store import safe_json_dumps
+
+    ap = argparse.ArgumentParser(description="Profile a synthetic warehouse with column stats vs. raw sample rows")
+    ap.add_argument("--tables", type=int, default=6)
+    ap.add_argument("--rows", type=int, default=200_000)
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(generate_warehouse(WarehouseSpec(n_tables=args.tables, n_rows=args.rows), Path(tmp) / "w.sqlite"))
+        for enabled in (False, True):
+            column_stats.ENABLED = enabled
+            t0 = time.perf_counter()
+            prof = build_db_profile(engine)
+            print(json.dumps({
+                "column_stats": enabled,
+                "wall_s": round(time.perf_counter() - t0, 3),
+                "profile_bytes": len(safe_json_dumps(prof)),
+                "bytes_per_table": len(safe_json_dumps(prof)) // max(len(prof["tables"]), 1),
+            }))
+        print(column_lines(prof["tables"][0]))
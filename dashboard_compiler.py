@@ -0,0 +1,513 @@
+from __future__ import annotations
+
+import html
+import json
+import os
+import re
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from chart_data import ChartDataStore, chart_payload
+from models import AnalysisPlan, DashboardSpec, ExecutionBundle, KPICardSpec, KPIValue, WidgetSpec
+from tracing import traced
+
+PLOTLY_CDN = os.getenv("PLOTLY_CDN", "https://cdn.plot.ly/plotly-2.35.2.min.js")
+MAX_WIDGETS = int(os.getenv("DASHBOARD_MAX_WIDGETS", "12"))
+MAX_KPI_CARDS = int(os.getenv("DASHBOARD_MAX_KPI_CARDS", "8"))
+
+# chart wording in AnalysisPlan.charts -> widget kind (first match wins)
+_KIND_HINTS: List[Tuple[str, Tuple[str, ...]]] = [
+    ("trend", ("trend", "line", "over time", "time series", "daily", "weekly", "monthly")),
+    ("distribution", ("distribution", "histogram", "spread", "box")),
+    ("table", ("table", "list", "detail")),
+    ("breakdown", ("breakdown", "bar", "by ", "share", "pie", "top", "split", "segment")),
+]
+
+
+# ---------- spec: default + validation ----------
+
+def _is_id(col: str) -> bool:
+    c = col.lower()
+    return c == "id" or c.endswith("_id") or c.endswith("id") and len(c) <= 4
+
+
+def _measures(ds) -> List[str]:
+    cols = [c for c in ds.inferred_numeric_columns if not _is_id(c)]
+    return cols or list(ds.inferred_numeric_columns)
+
+
+def _mentioned(text: str, columns: List[str]) -> List[str]:
+    t = text.lower()
+    return [c for c in columns if c.lower() in t or c.lower().replace("_", " ") in t]
+
+
+def _hint_kind(text: str) -> Optional[str]:
+    t = f" {text.lower()} "
+    for kind, words in _KIND_HINTS:
+        if any(w in t for w in words):
+            return kind
+    return None
+
+
+def _fill(w: WidgetSpec, ds) -> Optional[WidgetSpec]:
+    """Complete a widget from the dataset's column roles; None when the dataset can't back it."""
+    cols = set(ds.columns)
+    if w.x is not None and w.x not in cols or w.y is not None and w.y not in cols:
+        return None
+    measures = _measures(ds)
+    x, y, agg = w.x, w.y, w.agg
+    if w.kind == "trend":
+        x = x or next(iter(ds.inferred_time_columns), None)
+        if x is None:
+            return None
+        y = y or next(iter(measures), None)
+    elif w.kind == "breakdown":
+        x = x or next(iter(ds.inferred_categorical_columns), None)
+        if x is None:
+            return None
+        y = y or next(iter(measures), None)
+    elif w.kind == "distribution":
+        y = y or next(iter(measures), None)
+        if y is None or y not in ds.inferred_numeric_columns:
+            return None
+    if y is None and w.kind != "table":
+        agg = "count"
+    title = w.title or _default_title(w.kind, ds.dataset_name, x, y, agg)
+    return w.model_copy(update={"x": x, "y": y, "agg": agg, "title": title})
+
+
+def _default_title(kind: str, dataset: str, x: Optional[str], y: Optional[str], agg: str) -> str:
+    measure = "rows" if agg == "count" or y is None else f"{agg} of {y}"
+    if kind == "trend":
+        return f"{measure} over {x} ({dataset})"
+    if kind == "breakdown":
+        return f"{measure} by {x} ({dataset})"
+    if kind == "distribution":
+        return f"Distribution of {y} ({dataset})"
+    return f"{dataset} (top rows)"
+
+
+def _default_kpis(bundle: ExecutionBundle, plan: Optional[AnalysisPlan]) -> List[KPICardSpec]:
+    cards: List[KPICardSpec] = []
+    reports = {r.dataset_name: r for r in bundle.reports}
+    plan_names = {k.name.lower() for k in plan.kpis} if plan else set()
+    # planner KPIs first, in report order
+    for r in bundle.reports:
+        for k in r.kpis:
+            if k.name.lower() in plan_names:
+                cards.append(KPICardSpec(dataset=r.dataset_name, kpi=k.name))
+    # then rows + the main measure's total per dataset
+    for ds in bundle.datasets:
+        r = reports.get(ds.dataset_name)
+        if r is None:
+            continue
+        names = {k.name for k in r.kpis}
+        if "rows" in names:
+            cards.append(KPICardSpec(dataset=ds.dataset_name, kpi="rows", label=f"{ds.dataset_name} rows"))
+        m = next(iter(_measures(ds)), None)
+        if m and f"{m}__sum" in names:
+            cards.append(KPICardSpec(dataset=ds.dataset_name, kpi=f"{m}__sum", label=f"Total {m}"))
+    return cards[:MAX_KPI_CARDS]
+
+
+def default_spec(bundle: ExecutionBundle, plan: Optional[AnalysisPlan] = None) -> DashboardSpec:
+    """
+    Layout derived from the data alone: widgets the plan's `charts` ask for (matched by wording
+    and column names), then trend/breakdown/distribution per dataset and one table.
+    """
+    widgets: List[WidgetSpec] = []
+    for text in (plan.charts if plan else []):
+        kind = _hint_kind(text)
+        if kind is None:
+            continue
+        best = None
+        for ds in bundle.datasets:
+            hits = _mentioned(text, ds.columns)
+            if best is None or len(hits) > len(best[1]):
+                best = (ds, hits)
+        if best is None:
+            continue
+        ds, hits = best
+        x = next((c for c in hits if c in ds.inferred_time_columns + ds.inferred_categorical_columns), None)
+        y = next((c for c in hits if c in ds.inferred_numeric_columns), None)
+        if kind == "trend" and x not in ds.inferred_time_columns:
+            x = None
+        if kind == "breakdown" and x not in ds.inferred_categorical_columns:
+            x = None
+        w = _fill(WidgetSpec(kind=kind, dataset=ds.dataset_name, x=x, y=y, title=text[:80]), ds)
+        if w is not None:
+            widgets.append(w)
+
+    for ds in bundle.datasets:
+        for kind in ("trend", "breakdown", "distribution"):
+            w = _fill(WidgetSpec(kind=kind, dataset=ds.dataset_name), ds)
+            if w is not None:
+                widgets.append(w)
+    seen = set()
+    unique = []
+    for w in widgets:
+        k = (w.kind, w.dataset, w.x, w.y, w.agg)
+        if k not in seen:
+            seen.add(k)
+            unique.append(w)
+    unique = unique[: MAX_WIDGETS - 1]
+    if bundle.datasets:
+        ds = bundle.datasets[0]
+        unique.append(_fill(WidgetSpec(kind="table", dataset=ds.dataset_name, limit=20), ds))  # type: ignore[arg-type]
+
+    goal = plan.dashboard_goal if plan else "Dashboard"
+    subtitle = f"Audience: {plan.audience} · grain: {plan.grain}" if plan else None
+    return DashboardSpec(
+        title=goal[:120],
+        subtitle=subtitle,
+        kpis=_default_kpis(bundle, plan),
+        widgets=unique,
+    )
+
+
+def validate_spec(spec: DashboardSpec, bundle: ExecutionBundle, plan: Optional[AnalysisPlan] = None) -> Tuple[DashboardSpec, List[str]]:
+    """
+    Keep what the data can back (known datasets, columns, KPIs) and fill gaps from column roles.
+    An LLM-written spec can't break the build: unusable parts are dropped and reported.
+    """
+    datasets = {d.dataset_name: d for d in bundle.datasets}
+    kpi_names = {r.dataset_name: {k.name for k in r.kpis} for r in bundle.reports}
+    dropped: List[str] = []
+
+    widgets = []
+    for w in spec.widgets:
+        ds = datasets.get(w.dataset)
+        filled = _fill(w, ds) if ds is not None else None
+        if filled is None:
+            dropped.append(f"widget {w.kind} on {w.dataset} ({w.x}, {w.y})")
+        else:
+            widgets.append(filled)
+
+    kpis = []
+    for k in spec.kpis:
+        if k.kpi in kpi_names.get(k.dataset, ()):
+            kpis.append(k)
+        else:
+            dropped.append(f"kpi {k.dataset}/{k.kpi}")
+
+    fallback = default_spec(bundle, plan) if not widgets or not kpis else None
+    return (
+        spec.model_copy(
+            update={
+                "kpis": kpis[:MAX_KPI_CARDS] or (fallback.kpis if fallback else []),
+                "widgets": widgets[:MAX_WIDGETS] or (fallback.widgets if fallback else []),
+            }
+        ),
+        dropped,
+    )
+
+
+# ---------- HTML ----------
+
+def _fmt(v: Any) -> str:
+    if isinstance(v, bool) or not isinstance(v, (int, float)):
+        return html.escape(str(v))
+    a = abs(v)
+    for div, suffix in ((1e9, "B"), (1e6, "M"), (1e3, "K")):
+        if a >= div:
+            return f"{v / div:.1f}{suffix}"
+    return f"{v:,.0f}" if float(v).is_integer() else f"{v:,.2f}"
+
+
+def _table_html(data: Dict[str, Any], el_id: str) -> str:
+    head = "".join(f"<th>{html.escape(c)}</th>" for c in data["columns"])
+    body = "".join(
+        "<tr>" + "".join(f"<td>{'' if v is None else html.escape(str(v))}</td>" for v in row) + "</tr>"
+        for row in data["rows"]
+    )
+    return f'<div class="tbl" id="{el_id}"><table><thead><tr>{head}</tr></thead><tbody>{body}</tbody></table></div>'
+
+
+_CSS = """
+body{font-family:system-ui,-apple-system,Segoe UI,Roboto,sans-serif;margin:0;background:#f5f6f8;color:#1f2933}
+header{padding:18px 24px;background:#fff;border-bottom:1px solid #e4e7eb}
+header h1{font-size:20px;margin:0}header p{margin:4px 0 0;color:#616e7c;font-size:13px}
+.kpis{display:grid;grid-template-columns:repeat(auto-fit,minmax(170px,1fr));gap:12px;padding:16px 24px}
+.kpi{background:#fff;border-radius:8px;padding:12px 14px;box-shadow:0 1px 2px rgba(0,0,0,.06)}
+.kpi .v{font-size:22px;font-weight:600}.kpi .l{font-size:12px;color:#616e7c;margin-top:2px}
+.grid{display:grid;grid-template-columns:repeat(auto-fit,minmax(420px,1fr));gap:12px;padding:0 24px 24px}
+.card{background:#fff;border-radius:8px;padding:10px 12px;box-shadow:0 1px 2px rgba(0,0,0,.06)}
+.card h3{font-size:14px;margin:2px 0 6px}.chart{height:320px}
+.tbl{max-height:320px;overflow:auto}table{border-collapse:collapse;font-size:12px;width:100%}
+th,td{padding:4px 6px;border-bottom:1px solid #eef0f2;text-align:left;white-space:nowrap}th{position:sticky;top:0;background:#fff}
+.filters{display:flex;gap:12px;align-items:end;flex-wrap:wrap;padding:12px 24px 0;font-size:12px;color:#616e7c}
+.filters label{display:flex;flex-direction:column;gap:2px}.filters input,.filters select{font-size:13px;padding:3px 4px}
+#status{font-size:12px;color:#b44d12}
+"""
+
+_JS = """
+const W = JSON.parse(document.getElementById('dash-data').textContent);
+const CFG = JSON.parse(document.getElementById('dash-cfg').textContent);
+const layout = {margin:{l:48,r:12,t:8,b:40}, paper_bgcolor:'rgba(0,0,0,0)', plot_bgcolor:'rgba(0,0,0,0)'};
+const cfg = {responsive:true, displaylogo:false};
+const esc = v => v === null || v === undefined ? '' : String(v).replace(/[&<>"]/g, c => ({'&':'&amp;','<':'&lt;','>':'&gt;','"':'&quot;'}[c]));
+function fmt(v) {
+  if (typeof v !== 'number') return esc(v);
+  const a = Math.abs(v);
+  for (const [d, s] of [[1e9,'B'],[1e6,'M'],[1e3,'K']]) if (a >= d) return (v / d).toFixed(1) + s;
+  return Number.isInteger(v) ? v.toLocaleString() : v.toLocaleString(undefined, {maximumFractionDigits:2});
+}
+function draw(i, kind, d) {
+  const el = document.getElementById('w' + i);
+  if (!el) return;
+  if (kind === 'table') {
+    el.innerHTML = '<table><thead><tr>' + d.columns.map(c => '<th>' + esc(c) + '</th>').join('') + '</tr></thead><tbody>' +
+      d.rows.map(r => '<tr>' + r.map(v => '<td>' + esc(v) + '</td>').join('') + '</tr>').join('') + '</tbody></table>';
+    return;
+  }
+  let trace;
+  if (kind === 'trend') trace = {type:'scatter', mode:'lines', x:d.x, y:d.y};
+  else if (kind === 'breakdown') trace = {type:'bar', x:d.y.slice().reverse(), y:d.x.slice().reverse(), orientation:'h'};
+  else trace = {type:'bar', x:d.x, y:d.y, width:d.width};
+  Plotly.react(el, [trace], Object.assign({}, layout, kind === 'breakdown' ? {margin:{l:120,r:12,t:8,b:30}} : {}), cfg);
+}
+W.forEach((w, i) => { if (w.data && w.kind !== 'table') draw(i, w.kind, w.data); });
+
+// live filters: re-query the local data API (filtered aggregates over the full cached data)
+if (CFG.api) {
+  const $ = id => document.getElementById(id);
+  const status = m => { $('status').textContent = m || ''; };
+  function filtersFor(ds) {
+    const m = CFG.datasets[ds] || {}, f = [];
+    const a = $('f-from') ? $('f-from').value : '', b = $('f-to') ? $('f-to').value : '';
+    if (m.time && (a || b)) f.push({column:m.time, op:'between', value:[a || '0001-01-01', (b || '9999-12-31') + 'T23:59:59'], time:true});
+    const c = $('f-cat');
+    if (c && c.value && CFG.cat && m.columns.includes(CFG.cat.column)) f.push({column:CFG.cat.column, op:'eq', value:c.value});
+    return f;
+  }
+  async function q(body) {
+    const r = await fetch(CFG.api + '/query', {method:'POST', headers:{'Content-Type':'application/json'}, body:JSON.stringify(body)});
+    if (!r.ok) throw new Error((await r.json()).error || r.status);
+    return r.json();
+  }
+  let gen = 0;
+  async function refresh() {
+    const g = ++gen;
+    status('');
+    const jobs = W.map((w, i) => w.q && q(Object.assign({}, w.q, {filters:filtersFor(w.dataset)}))
+      .then(d => { if (g === gen) draw(i, w.kind, d); }));
+    CFG.kpis.forEach(k => jobs.push(q(Object.assign({}, k.q, {filters:filtersFor(k.dataset)}))
+      .then(d => { if (g === gen) $(k.id).textContent = fmt(d.value); })));
+    try { await Promise.all(jobs); } catch (e) { status('Data API: ' + e.message); }
+  }
+  ['f-from', 'f-to', 'f-cat'].forEach(id => $(id) && $(id).addEventListener('change', refresh));
+  if (CFG.cat) fetch(CFG.api + '/values?dataset=' + encodeURIComponent(CFG.cat.dataset) + '&column=' + encodeURIComponent(CFG.cat.column))
+    .then(r => r.json()).then(vs => { const s = $('f-cat'); vs.forEach(v => s.add(new Option(v, v))); })
+    .catch(() => status('Data API unreachable: filters are off'));
+}
+"""
+
+
+def _kpi(bundle: ExecutionBundle, card: KPICardSpec) -> Optional[KPIValue]:
+    for r in bundle.reports:
+        if r.dataset_name == card.dataset:
+            for k in r.kpis:
+                if k.name == card.kpi:
+                    return k
+    return None
+
+
+_HINT_NOTE = re.compile(r"^from formula_hint: (sum|avg|min|max|p95)\(\s*[\"']?([^)\"']+?)[\"']?\s*\)$", re.IGNORECASE)
+
+
+def _kpi_query(card: KPICardSpec, note: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """
+    Data API request recomputing a KPI card under filters: generic KPIs by name, planner KPIs
+    whose formula hint is a plain aggregate (others, e.g. count_distinct or heuristics, stay static).
+    """
+    if card.kpi == "rows" or note == "from formula_hint":  # count_rows()
+        return {"kind": "kpi", "agg": "count"}
+    m = _HINT_NOTE.match(note or "")
+    if m:
+        return {"kind": "kpi", "y": m.group(2), "agg": m.group(1).lower()}
+    col, _, agg = card.kpi.rpartition("__")
+    if col and agg in ("sum", "avg", "p95"):
+        return {"kind": "kpi", "y": col, "agg": agg}
+    return None
+
+
+def _grain_unit(grain: str) -> str:
+    g = grain.lower()
+    for word, unit in (("month", "month"), ("week", "week"), ("day", "day"), ("daily", "day"), ("hour", "hour")):
+        if word in g:
+            return unit
+    return "auto"
+
+
+@traced("dashboard.compile", cat="dashboard")
+def compile_dashboard(
+    bundle: ExecutionBundle,
+    spec: Optional[DashboardSpec] = None,
+    plan: Optional[AnalysisPlan] = None,
+    store: Optional[ChartDataStore] = None,
+    api_url: Optional[str] = None,
+) -> str:
+    """
+    Self-contained HTML dashboard (Plotly from a CDN) for the cached datasets of `bundle`.
+    Deterministic: the same bundle and spec always give the same page. `spec` (e.g. from
+    the LLM) is validated against the data first; without one the layout is `default_spec`.
+    Widget data comes from `store` when prepare_chart_data() ran, else it is computed here.
+    With `api_url` (data_api) the page gets date/category filters that re-query the data API;
+    the embedded payloads are only the first paint.
+    """
+    spec = validate_spec(spec, bundle, plan)[0] if spec is not None else default_spec(bundle, plan)
+    datasets = {d.dataset_name: d for d in bundle.datasets}
+    grain = plan.grain if plan else ""
+
+    cards = []
+    live_kpis = []
+    for i, c in enumerate(spec.kpis):
+        k = _kpi(bundle, c)
+        v = None if k is None else k.value
+        q = _kpi_query(c, None if k is None else k.note) if api_url else None
+        if q is not None and c.dataset in datasets:
+            live_kpis.append({"id": f"k{i}", "dataset": c.dataset, "q": {**q, "dataset": datasets[c.dataset].cache_key}})
+        cards.append(
+            f'<div class="kpi"><div class="v" id="k{i}">{_fmt(v)}</div><div class="l">{html.escape(c.label or c.kpi)}</div></div>'
+        )
+
+    payload = []
+    blocks = []
+    for i, w in enumerate(spec.widgets):
+        ds = datasets[w.dataset]
+        data = chart_payload(w, ds, grain, store)
+        body = _table_html(data, f"w{i}") if w.kind == "table" else f'<div class="chart" id="w{i}"></div>'
+        blocks.append(f'<div class="card"><h3>{html.escape(w.title or "")}</h3>{body}</div>')
+        entry: Dict[str, Any] = {"kind": w.kind, "dataset": w.dataset}
+        if w.kind != "table":
+            entry["data"] = data
+        if api_url:
+            q: Dict[str, Any] = {"dataset": ds.cache_key, "kind": w.kind, "x": w.x, "y": w.y, "agg": w.agg, "limit": w.limit}
+            if w.kind == "trend":
+                q["grain"] = _grain_unit(grain)
+            if w.kind == "table":
+                q["columns"] = data["columns"]
+            entry["q"] = q
+        payload.append(entry)
+
+    cfg: Dict[str, Any] = {"api": api_url, "kpis": live_kpis, "datasets": {}, "cat": None}
+    filters = ""
+    if api_url:
+        used = {w.dataset for w in spec.widgets} | {k["dataset"] for k in live_kpis}
+        for name in sorted(used):
+            ds = datasets[name]
+            cfg["datasets"][name] = {"time": next(iter(ds.inferred_time_columns), None), "columns": ds.columns}
+        cat = next((w for w in spec.widgets if w.kind == "breakdown"), None)
+        if cat is not None:
+            cfg["cat"] = {"column": cat.x, "dataset": datasets[cat.dataset].cache_key}
+        parts = []
+        if any(v["time"] for v in cfg["datasets"].values()):
+            parts.append('<label>From<input type="date" id="f-from"></label><label>To<input type="date" id="f-to"></label>')
+        if cfg["cat"]:
+            parts.append(f'<label>{html.escape(cfg["cat"]["column"])}<select id="f-cat"><option value="">All</option></select></label>')
+        filters = f'<section class="filters">{"".join(parts)}<span id="status"></span></section>'
+
+    # "</" must not appear inside the <script> blocks
+    data_json = json.dumps(payload, separators=(",", ":")).replace("</", "<\\/")
+    cfg_json = json.dumps(cfg, separators=(",", ":")).replace("</", "<\\/")
+    subtitle = f"<p>{html.escape(spec.subtitle)}</p>" if spec.subtitle else ""
+    return (
+        "<html><head><meta charset=\"utf-8\">"
+        f"<title>{html.escape(spec.title)}</title>"
+        f'<script src="{html.escape(PLOTLY_CDN)}"></script>'
+        f"<style>{_CSS}</style></head><body>"
+        f"<header><h1>{html.escape(spec.title)}</h1>{subtitle}</header>"
+        f"{filters}"
+        f'<section class="kpis">{"".join(cards)}</section>'
+        f'<section class="grid">{"".join(blocks)}</section>'
+        f'<script id="dash-data" type="application/json">{data_json}</script>'
+        f'<script id="dash-cfg" type="application/json">{cfg_json}</script>'
+        f"<script>{_JS}</script>"
+        "</body></html>"
+    )
+
+
+# ---------- optional LLM layout ----------
+
+def spec_context(bundle: ExecutionBundle, plan: Optional[AnalysisPlan] = None) -> str:
+    """
+    What a DashboardSpec may refer to: each executed dataset with its column roles, and the KPI
+    names, no rows, so the model call stays small regardless of dataset size.
+    """
+    lines = []
+    for ds in bundle.datasets:
+        lines.append(
+            f"- {ds.dataset_name} ({ds.n_rows} rows): time={ds.inferred_time_columns} "
+            f"numeric={ds.inferred_numeric_columns} categorical={ds.inferred_categorical_columns[:15]}"
+        )
+    kpis = [f"{r.dataset_name}/{k.name}" for r in bundle.reports for k in r.kpis][:60]
+    plan_txt = ""
+    if plan:
+        plan_txt = f"Goal: {plan.dashboard_goal}\nAudience: {plan.audience}\nGrain: {plan.grain}\nRequested charts: {plan.charts}\n"
+    return f"{plan_txt}Datasets:\n" + "\n".join(lines) + f"\nKPIs (dataset/kpi): {kpis}\n"
+
+
+def spec_prompt(bundle: ExecutionBundle, plan: Optional[AnalysisPlan] = None) -> str:
+    """Compact request for a DashboardSpec over `spec_context`."""
+    return (
+        "Choose a dashboard layout. Return ONLY JSON matching DashboardSpec:\n"
+        '{"title": str, "subtitle": str|null, "kpis": [{"dataset": str, "kpi": str, "label": str|null}], '
+        '"widgets": [{"kind": "trend"|"breakdown"|"distribution"|"table", "dataset": str, "title": str|null, '
+        '"x": str|null, "y": str|null, "agg": "sum"|"avg"|"count"|"min"|"max", "limit": int}]}\n'
+        f"Use at most {MAX_KPI_CARDS} kpis and {MAX_WIDGETS} widgets; only the datasets, columns and KPI names below.\n"
+        + spec_context(bundle, plan)
+    )
+
+
+def benchmark(n_rows: int = 200_000, repeats: int = 5) -> Dict[str, float]:
+    """
+    Compile time for the benchmark warehouse's datasets: a cold build computing the chart data,
+    the prepare stage alone, and rebuilds from prepared payloads.
+    """
+    import tempfile
+
+    from sqlalchemy import create_engine
+
+    import chart_data
+    from bench_suite import WarehouseSpec, generate_warehouse, synthetic_plan_and_artifacts
+    from executor import execute_and_cache_artifacts
+    from memory_store import MemoryStore
+
+    with tempfile.TemporaryDirectory() as tmp:
+        wspec = WarehouseSpec(n_tables=4, n_rows=n_rows)
+        engine = create_engine(generate_warehouse(wspec, Path(tmp) / "wh.sqlite"))
+        plan, artifacts = synthetic_plan_and_artifacts(wspec)
+        bundle, _ = execute_and_cache_artifacts(engine, MemoryStore(Path(tmp) / "cache"), artifacts, analysis_plan=plan)
+        plan_obj = AnalysisPlan(**plan)
+        chart_data._frames.clear()
+        t0 = time.perf_counter()
+        page = compile_dashboard(bundle, plan=plan_obj)
+        cold = time.perf_counter() - t0
+        store = chart_data.ChartDataStore(Path(tmp) / "charts")
+        t0 = time.perf_counter()
+        prep = chart_data.prepare_chart_data(bundle, default_spec(bundle, plan_obj), plan_obj, store)
+        prepare_s = time.perf_counter() - t0
+        times = []
+        for _ in range(repeats):
+            t0 = time.perf_counter()
+            compile_dashboard(bundle, plan=plan_obj, store=store)
+            times.append(time.perf_counter() - t0)
+        engine.dispose()
+    return {
+        "rows_per_dataset": n_rows,
+        "cold_s": cold,
+        "prepare_s": prepare_s,
+        "rebuild_s": min(times),
+        "chart_data_kb": prep["bytes"] / 1024,
+        "html_kb": len(page) / 1024,
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+
+    ap = argparse.ArgumentParser(description="Time the deterministic dashboard compiler")
+    ap.add_argument("--rows", type=int, default=200_000)
+    args = ap.parse_args()
+    print(json.dumps(benchmark(args.rows), indent=2))
@@ -0,0 +1,666 @@
+from __future__ import annotations
+
+import json
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Deque, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+from memory_store import MemoryStore, parquet_scan
+from parquet_layout import load_layout, prune_sql
+from tracing import span
+
+AGGS = {
+    "sum": "SUM(TRY_CAST({y} AS DOUBLE))",
+    "avg": "AVG(TRY_CAST({y} AS DOUBLE))",
+    "min": "MIN(TRY_CAST({y} AS DOUBLE))",
+    "max": "MAX(TRY_CAST({y} AS DOUBLE))",
+    "p95": "QUANTILE_CONT(TRY_CAST({y} AS DOUBLE), 0.95)",
+    "count": "COUNT(*)",
+}
+UNITS = ("hour", "day", "week", "month", "quarter", "year")
+OPS = {"eq": "=", "ne": "<>", "gt": ">", "ge": ">=", "lt": "<", "le": "<="}
+KINDS = ("trend", "breakdown", "distribution", "table", "kpi")
+
+
+class QueryError(ValueError):
+    """Bad request: unknown dataset/column, unsupported kind/agg/op (HTTP 400)."""
+
+
+class Busy(RuntimeError):
+    """All query slots stayed taken for `queue_timeout_s` (HTTP 429)."""
+
+
+def _ident(col: str) -> str:
+    return '"' + col.replace('"', '""') + '"'
+
+
+def _lit(text: str) -> str:
+    return "'" + text.replace("'", "''") + "'"
+
+
+def _percentile(values: List[float], q: float) -> Optional[float]:
+    import numpy as np
+
+    return float(np.percentile(values, q)) if values else None
+
+
+class DataService:
+    """
+    Filtered aggregates over the cached Parquet datasets, answered by DuckDB.
+
+    Datasets are addressed by cache key (DatasetSummary.cache_key) and resolved through the
+    MemoryStore registry. Results are cached per (file version, request), so identical
+    dashboard queries from many viewers cost one scan; at most `max_concurrency` queries
+    run at once, the rest wait up to `queue_timeout_s` and are then rejected (Busy).
+    """
+
+    def __init__(
+        self,
+        cache_dir: Path,
+        max_concurrency: int = 4,
+        cache_entries: int = 512,
+        queue_timeout_s: float = 5.0,
+        max_points: Optional[int] = None,
+    ) -> None:
+        import duckdb
+
+        from chart_data import MAX_CATEGORIES, MAX_POINTS, MAX_TABLE_ROWS
+
+        self.mem = MemoryStore(Path(cache_dir))
+        self.max_concurrency = max_concurrency
+        self.cache_entries = cache_entries
+        self.queue_timeout_s = queue_timeout_s
+        self.max_points = max_points or MAX_POINTS
+        self.max_categories = MAX_CATEGORIES
+        self.max_rows = MAX_TABLE_ROWS
+        self._db = duckdb.connect()  # in-memory: only reads Parquet, never touches cache.duckdb
+        self._local = threading.local()
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._lock = threading.Lock()
+        self._registry_lock = threading.Lock()
+        self._paths: Dict[str, str] = {}
+        self._schemas: Dict[Tuple[str, int], Dict[str, str]] = {}
+        self._results: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._latency: Deque[Tuple[float, bool]] = deque(maxlen=10_000)
+        self.queries = 0
+        self.hits = 0
+        self.rejected = 0
+        self.errors = 0
+        self.in_flight = 0
+
+    # ---------- datasets ----------
+
+    def _cursor(self):
+        cur = getattr(self._local, "cur", None)
+        if cur is None:
+            cur = self._local.cur = self._db.cursor()
+        return cur
+
+    def path(self, dataset: str) -> Path:
+        with self._lock:
+            p = self._paths.get(dataset)
+        if p is None:
+            # new dataset since the last lookup: re-read the registry, one thread at a time
+            # (concurrent connects to the same cache.duckdb conflict inside one process)
+            with self._registry_lock:
+                p = self._paths.get(dataset)
+                if p is None:
+                    self._paths = self.mem.cached_paths()
+                    p = self._paths.get(dataset)
+        if p is None or not Path(p).exists():
+            raise QueryError(f"unknown dataset {dataset!r}")
+        return Path(p)
+
+    def datasets(self) -> List[Dict[str, Any]]:
+        out = []
+        with self._registry_lock:
+            self._paths = self.mem.cached_paths()
+        for key, p in sorted(self._paths.items()):
+            if Path(p).exists():
+                out.append({"dataset": key, "columns": self.schema(Path(p))})
+        return out
+
+    def schema(self, path: Path) -> Dict[str, str]:
+        key = (str(path), path.stat().st_mtime_ns)
+        with self._lock:
+            cols = self._schemas.get(key)
+        if cols is None:
+            rows = self._cursor().execute(f"DESCRIBE SELECT * FROM {parquet_scan(path)}").fetchall()
+            layout = load_layout(path)
+            hidden = set(layout.fields()) if layout is not None else set()  # hive partition fields
+            cols = {r[0]: r[1] for r in rows if r[0] not in hidden}
+            with self._lock:
+                self._schemas[key] = cols
+        return cols
+
+    # ---------- SQL ----------
+
+    def _col(self, cols: Dict[str, str], name: Any) -> str:
+        if not isinstance(name, str) or name not in cols:
+            raise QueryError(f"unknown column {name!r}")
+        return _ident(name)
+
+    def _where(self, cols: Dict[str, str], filters: Any) -> Tuple[str, List[Any]]:
+        """[{"column", "op": eq|ne|gt|ge|lt|le|in|between, "value", "time": bool}] -> WHERE clause + params."""
+        clauses: List[str] = []
+        params: List[Any] = []
+        for f in filters or []:
+            if not isinstance(f, dict):
+                raise QueryError("filters must be objects")
+            col = self._col(cols, f.get("column"))
+            op = f.get("op", "eq")
+            value = f.get("value")
+            if f.get("time"):
+                col = f"TRY_CAST({col} AS TIMESTAMP)"
+                cast = "CAST(? AS TIMESTAMP)"
+            else:
+                col = f"CAST({col} AS VARCHAR)" if isinstance(value, str) or op == "in" else col
+                cast = "?"
+            if op == "between":
+                if not isinstance(value, list) or len(value) != 2:
+                    raise QueryError("between needs [low, high]")
+                clauses.append(f"{col} BETWEEN {cast} AND {cast}")
+                params.extend(value)
+            elif op == "in":
+                if not isinstance(value, list) or not value:
+                    raise QueryError("in needs a non-empty list")
+                clauses.append(f"{col} IN ({', '.join('?' * len(value))})")
+                params.extend(str(v) for v in value)
+            elif op in OPS:
+                clauses.append(f"{col} {OPS[op]} {cast}")
+                params.append(value)
+            else:
+                raise QueryError(f"unsupported op {op!r}")
+        return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+    def _agg(self, cols: Dict[str, str], req: Dict[str, Any]) -> str:
+        agg = req.get("agg") or "sum"
+        if req.get("y") is None:
+            agg = "count"
+        if agg not in AGGS:
+            raise QueryError(f"unsupported agg {agg!r}")
+        return AGGS[agg].format(y=self._col(cols, req["y"]) if agg != "count" else "")
+
+    def _unit(self, src: str, x: str, where: str, params: List[Any], unit: Any) -> str:
+        if unit in UNITS:
+            return unit
+        if unit not in (None, "", "auto"):
+            raise QueryError(f"unsupported grain {unit!r}")
+        lo, hi = self._cursor().execute(
+            f"SELECT MIN(TRY_CAST({x} AS TIMESTAMP)), MAX(TRY_CAST({x} AS TIMESTAMP)) FROM {src}{where}", params
+        ).fetchone()
+        days = (hi - lo).days if lo is not None and hi is not None else 0
+        return "month" if days > 730 else "week" if days > 120 else "day"
+
+    def _run(self, req: Dict[str, Any], path: Path) -> Dict[str, Any]:
+        import numpy as np
+
+        from chart_data import OTHER, compact_numbers, compact_times, downsample
+
+        kind = req.get("kind")
+        if kind not in KINDS:
+            raise QueryError(f"kind must be one of {KINDS}")
+        cols = self.schema(path)
+        src = parquet_scan(path)
+        where, params = self._where(cols, req.get("filters"))
+        prune = prune_sql(load_layout(path), req.get("filters"))  # skip partitions outside the filters
+        if prune:
+            where = (where + " AND " if where else " WHERE ") + " AND ".join(prune)
+        cur = self._cursor()
+
+        if kind == "kpi":
+            (value,) = cur.execute(f"SELECT {self._agg(cols, req)} FROM {src}{where}", params).fetchone()
+            return {"value": None if value is None else float(f"{float(value):.6g}")}
+
+        if kind == "trend":
+            x = self._col(cols, req.get("x"))
+            unit = self._unit(src, x, where, params, req.get("grain"))
+            rows = cur.execute(
+                f"SELECT DATE_TRUNC('{unit}', TRY_CAST({x} AS TIMESTAMP)) AS t, {self._agg(cols, req)} AS v "
+                f"FROM {src}{where} GROUP BY 1 HAVING t IS NOT NULL ORDER BY 1",
+                params,
+            ).fetchnumpy()
+            import pandas as pd
+
+            ts = pd.DatetimeIndex(rows["t"])
+            v = np.asarray(rows["v"], dtype=float)
+            n_points = len(ts)
+            method = None
+            if n_points > self.max_points:
+                from chart_data import DOWNSAMPLE
+
+                method = DOWNSAMPLE
+                idx = downsample(ts.asi8.astype(float), np.nan_to_num(v), self.max_points, method)
+                ts, v = ts[idx], v[idx]
+            return {"x": compact_times(ts), "y": compact_numbers(v), "n_points": n_points, "downsampled": method, "grain": unit}
+
+        if kind == "breakdown":
+            x = self._col(cols, req.get("x"))
+            agg = "count" if req.get("y") is None else (req.get("agg") or "sum")
+            if agg not in ("sum", "avg", "min", "max", "count"):
+                raise QueryError(f"unsupported agg {agg!r} for breakdown")
+            y = f"TRY_CAST({self._col(cols, req['y'])} AS DOUBLE)" if agg != "count" else "NULL"
+            n = max(2, min(int(req.get("limit") or 10), self.max_categories))
+            value = {"sum": "s", "count": "n", "avg": "s / NULLIF(c, 0)", "min": "mn", "max": "mx"}[agg]
+            merged = {"sum": "SUM(s)", "count": "SUM(n)", "avg": "SUM(s) / NULLIF(SUM(c), 0)", "min": "MIN(mn)", "max": "MAX(mx)"}[agg]
+            # top n-1 groups plus one "Other" aggregated from the remaining groups' partials
+            rows = cur.execute(
+                f"""
+                WITH g AS (
+                  SELECT CAST({x} AS VARCHAR) AS k, SUM({y}) AS s, COUNT({y}) AS c, MIN({y}) AS mn, MAX({y}) AS mx, COUNT(*) AS n
+                  FROM {src}{where} GROUP BY 1
+                ),
+                r AS (SELECT *, ROW_NUMBER() OVER (ORDER BY {value} DESC NULLS LAST) AS rn, COUNT(*) OVER () AS groups FROM g)
+                SELECT label, v FROM (
+                  SELECT CASE WHEN rn < {n} OR groups <= {n} THEN COALESCE(k, 'null') ELSE {_lit(OTHER)} END AS label, {merged} AS v
+                  FROM r GROUP BY 1
+                ) ORDER BY (label = {_lit(OTHER)}), v DESC NULLS LAST
+                """,
+                params,
+            ).fetchall()
+            return {"x": [r[0] for r in rows], "y": compact_numbers(np.array([np.nan if r[1] is None else r[1] for r in rows], dtype=float))}
+
+        if kind == "distribution":
+            y = f"TRY_CAST({self._col(cols, req.get('y'))} AS DOUBLE)"
+            bins = max(2, min(int(req.get("bins") or 30), 200))
+            lo, hi = cur.execute(f"SELECT MIN({y}), MAX({y}) FROM {src}{where}", params).fetchone()
+            if lo is None:
+                return {"x": [], "y": [], "width": 0}
+            width = (hi - lo) / bins or 1.0
+            rows = cur.execute(
+                f"SELECT LEAST(CAST(FLOOR(({y} - ?) / ?) AS BIGINT), {bins - 1}) AS b, COUNT(*) "
+                f"FROM {src}{where}{' AND' if where else ' WHERE'} {y} IS NOT NULL GROUP BY 1",
+                [lo, width, *params],
+            ).fetchall()
+            counts = np.zeros(bins, dtype=np.int64)
+            for b, c in rows:
+                counts[int(b)] = c
+            centers = lo + width * (np.arange(bins) + 0.5)
+            return {"x": compact_numbers(centers), "y": compact_numbers(counts), "width": float(f"{width:.6g}")}
+
+        # table
+        wanted = req.get("columns") or list(cols)
+        select = ", ".join(self._col(cols, c) for c in wanted)
+        limit = max(1, min(int(req.get("limit") or 20), self.max_rows))
+        cur_ = cur.execute(f"SELECT {select} FROM {src}{where} LIMIT {limit}", params)
+        from chart_data import compact_cell
+
+        return {"columns": list(wanted), "rows": [[compact_cell(v) for v in r] for r in cur_.fetchall()]}
+
+    # ---------- entry points ----------
+
+    def query(self, req: Dict[str, Any]) -> Dict[str, Any]:
+        t0 = time.perf_counter()
+        path = self.path(str(req.get("dataset")))
+        key = json.dumps([str(path), path.stat().st_mtime_ns, req], sort_keys=True, default=str)
+        with self._lock:
+            self.queries += 1
+            hit = self._results.get(key)
+            if hit is not None:
+                self._results.move_to_end(key)
+                self.hits += 1
+        if hit is not None:
+            self._latency.append(((time.perf_counter() - t0) * 1000, True))
+            return hit
+        if not self._slots.acquire(timeout=self.queue_timeout_s):
+            with self._lock:
+                self.rejected += 1
+            raise Busy(f"{self.max_concurrency} queries already running")
+        try:
+            with self._lock:
+                self.in_flight += 1
+            with span("data_api.query", cat="sql", kind=req.get("kind"), dataset=req.get("dataset")):
+                result = self._run(req, path)
+        except QueryError:
+            raise
+        except Exception as e:
+            with self._lock:
+                self.errors += 1
+            raise QueryError(f"{type(e).__name__}: {e}") from e
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+            self._slots.release()
+        with self._lock:
+            self._results[key] = result
+            while len(self._results) > self.cache_entries:
+                self._results.popitem(last=False)
+        self._latency.append(((time.perf_counter() - t0) * 1000, False))
+        return result
+
+    def values(self, dataset: str, column: str, limit: int = 50) -> List[Any]:
+        """Most frequent values of a column (filter dropdowns)."""
+        res = self.query({"dataset": dataset, "kind": "breakdown", "x": column, "limit": min(limit, self.max_categories)})
+        return [v for v in res["x"] if v != "Other"]
+
+    def metrics(self) -> Dict[str, Any]:
+        lat = list(self._latency)
+        all_ms = [ms for ms, _ in lat]
+        miss_ms = [ms for ms, cached in lat if not cached]
+        with self._lock:
+            return {
+                "queries": self.queries,
+                "cache_hits": self.hits,
+                "cache_hit_rate": round(self.hits / self.queries, 3) if self.queries else None,
+                "rejected": self.rejected,
+                "errors": self.errors,
+                "in_flight": self.in_flight,
+                "max_concurrency": self.max_concurrency,
+                "p50_ms": _percentile(all_ms, 50),
+                "p99_ms": _percentile(all_ms, 99),
+                "uncached_p50_ms": _percentile(miss_ms, 50),
+                "uncached_p99_ms": _percentile(miss_ms, 99),
+                "cached_entries": len(self._results),
+            }
+
+
+class _HTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128  # the default backlog of 5 resets connections when many viewers open at once
+
+
+class DataAPIServer:
+    """
+    HTTP front of DataService for generated dashboards (JSON, CORS open: the dashboard page is
+    an iframe with its own origin).
+
+    GET  /health · /metrics · /datasets · /values?dataset=&column=&limit=
+    POST /query  {"dataset", "kind": trend|breakdown|distribution|table|kpi, "x", "y", "agg",
+                  "limit", "grain", "filters": [{"column", "op", "value", "time"}]}
+    """
+
+    def __init__(self, service: DataService, host: str = "127.0.0.1", port: int = 0) -> None:
+        self.service = service
+        svc = service
+
+        class _Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args: Any) -> None:
+                pass
+
+            def _send(self, status: int, body: Any) -> None:
+                data = json.dumps(body, separators=(",", ":"), default=str).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.send_header("Access-Control-Allow-Origin", "*")
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _guard(self, fn: Any) -> None:
+                try:
+                    self._send(200, fn())
+                except Busy as e:
+                    self._send(429, {"error": str(e)})
+                except QueryError as e:
+                    self._send(400, {"error": str(e)})
+                except Exception as e:  # keep the server up whatever a request does
+                    self._send(500, {"error": f"{type(e).__name__}: {e}"})
+
+            def do_OPTIONS(self) -> None:  # CORS preflight for JSON POSTs
+                self.send_response(204)
+                self.send_header("Access-Control-Allow-Origin", "*")
+                self.send_header("Access-Control-Allow-Methods", "GET, POST, OPTIONS")
+                self.send_header("Access-Control-Allow-Headers", "Content-Type")
+                self.send_header("Access-Control-Max-Age", "86400")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            def do_GET(self) -> None:
+                url = urlparse(self.path)
+                qs = {k: v[0] for k, v in parse_qs(url.query).items()}
+                if url.path == "/health":
+                    self._send(200, {"ok": True})
+                elif url.path == "/metrics":
+                    self._send(200, svc.metrics())
+                elif url.path == "/datasets":
+                    self._guard(svc.datasets)
+                elif url.path == "/values":
+                    self._guard(lambda: svc.values(qs.get("dataset", ""), qs.get("column", ""), int(qs.get("limit", 50))))
+                else:
+                    self._send(404, {"error": "not found"})
+
+            def do_POST(self) -> None:
+                length = int(self.headers.get("Content-Length") or 0)
+                raw = self.rfile.read(length) if length else b""
+                if urlparse(self.path).path != "/query":
+                    self._send(404, {"error": "not found"})
+                    return
+                try:
+                    req = json.loads(raw or b"{}")
+                except json.JSONDecodeError:
+                    self._send(400, {"error": "body must be JSON"})
+                    return
+                if not isinstance(req, dict):
+                    self._send(400, {"error": "body must be a JSON object"})
+                    return
+                self._guard(lambda: svc.query(req))
+
+        self._httpd = _HTTPServer((host, port), _Handler)
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def public_url(self) -> str:
+        """URL the dashboard's browser should call (DATA_API_PUBLIC_URL behind a proxy/remote host)."""
+        return os.getenv("DATA_API_PUBLIC_URL") or self.url
+
+    def start(self) -> "DataAPIServer":
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="data-api", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self) -> "DataAPIServer":
+        return self.start()
+
+    def __exit__(self, *exc: Any) -> None:
+        self.stop()
+
+
+_server: Optional[DataAPIServer] = None
+_server_lock = threading.Lock()
+_starting = False
+_start_error: Optional[str] = None
+
+
+def get_data_api() -> Optional[DataAPIServer]:
+    """
+    The process-wide data API, started on first use (DATA_API=0 disables it).
+    Settings: DATA_API_HOST, DATA_API_PORT (busy port -> a free one), DATA_API_CONCURRENCY,
+    DATA_API_CACHE_ENTRIES, DATA_API_QUEUE_TIMEOUT_S, DATA_API_PUBLIC_URL.
+    """
+    global _server
+    if os.getenv("DATA_API", "1") != "1":
+        return None
+    with _server_lock:
+        if _server is None:
+            service = DataService(
+                Path(os.getenv("CACHE_DIR", "./cache")),
+                max_concurrency=int(os.getenv("DATA_API_CONCURRENCY", "4")),
+                cache_entries=int(os.getenv("DATA_API_CACHE_ENTRIES", "512")),
+                queue_timeout_s=float(os.getenv("DATA_API_QUEUE_TIMEOUT_S", "5")),
+            )
+            host = os.getenv("DATA_API_HOST", "127.0.0.1")
+            try:
+                server = DataAPIServer(service, host, int(os.getenv("DATA_API_PORT", "8765")))
+            except OSError:
+                server = DataAPIServer(service, host, 0)
+            _server = server.start()
+        return _server
+
+
+def _start() -> None:
+    global _starting, _start_error
+    try:
+        get_data_api()
+        _start_error = None
+    except Exception as e:
+        _start_error = f"{type(e).__name__}: {e}"
+    finally:
+        with _server_lock:
+            _starting = False
+
+
+def start_data_api_background(retry: bool = False) -> None:
+    """
+    Start the data API off the caller's thread. Safe to call on every app run: it starts once,
+    and after a failed start (see data_api_error) only tries again with `retry=True`.
+    """
+    global _starting
+    with _server_lock:
+        if _server is not None or _starting or os.getenv("DATA_API", "1") != "1":
+            return
+        if _start_error is not None and not retry:
+            return
+        _starting = True
+    threading.Thread(target=_start, name="data-api-start", daemon=True).start()
+
+
+def data_api_starting() -> bool:
+    return _starting
+
+
+def data_api_error() -> Optional[str]:
+    """Why the last background start failed, or None."""
+    return _start_error
+
+
+def running_data_api() -> Optional[DataAPIServer]:
+    """The server if it is up already (never starts it)."""
+    return _server
+
+
+def stop_data_api() -> None:
+    global _server
+    with _server_lock:
+        if _server is not None:
+            _server.stop()
+            _server = None
+
+
+# ---------- load test ----------
+
+def load_test(
+    url: str,
+    datasets: List[Dict[str, Any]],
+    viewers: int = 32,
+    requests_per_viewer: int = 25,
+    seed: int = 0,
+) -> Dict[str, Any]:
+    """
+    Simulated dashboard viewers, each on its own thread and keep-alive connection, issuing
+    random filter changes (a shared pool of date ranges/categories, so popular filters repeat
+    like real traffic). `datasets`: [{"dataset", "time", "category", "measure"}].
+    """
+    import http.client
+    import random
+
+    host, port = urlparse(url).netloc.split(":")
+    # preset ranges, like a dashboard's "last N months" buttons
+    ranges = [
+        ["2023-01-01", "2024-12-31"],
+        ["2024-01-01", "2024-12-31"],
+        ["2024-07-01", "2024-12-31"],
+        ["2024-10-01", "2024-12-31"],
+        ["2023-01-01", "2023-12-31"],
+        ["2023-07-01", "2024-06-30"],
+    ]
+    client_ms: List[float] = []
+    statuses: Dict[Any, int] = {}
+    lock = threading.Lock()
+
+    def requests_for(rng: random.Random) -> List[Dict[str, Any]]:
+        ds = rng.choice(datasets)
+        filters = [{"column": ds["time"], "op": "between", "value": rng.choice(ranges), "time": True}]
+        if rng.random() < 0.5:
+            filters.append({"column": ds["category"], "op": "eq", "value": f"cat_{rng.randint(0, 4)}"})
+        base = {"dataset": ds["dataset"], "filters": filters}
+        return [
+            {**base, "kind": "trend", "x": ds["time"], "y": ds["measure"], "agg": "sum", "grain": "week"},
+            {**base, "kind": "breakdown", "x": ds["category"], "y": ds["measure"], "agg": "sum", "limit": 10},
+            {**base, "kind": "kpi", "y": ds["measure"], "agg": "sum"},
+        ]
+
+    def viewer(i: int) -> None:
+        rng = random.Random(seed + i)
+        conn = http.client.HTTPConnection(host, int(port), timeout=60)
+        sent = 0
+        while sent < requests_per_viewer:
+            for req in requests_for(rng)[: requests_per_viewer - sent]:
+                body = json.dumps(req)
+                t0 = time.perf_counter()
+                try:
+                    conn.request("POST", "/query", body=body, headers={"Content-Type": "application/json"})
+                    resp = conn.getresponse()
+                    resp.read()
+                    status: Any = resp.status
+                except (OSError, http.client.HTTPException) as e:
+                    status = type(e).__name__
+                    conn.close()  # reconnects on the next request
+                ms = (time.perf_counter() - t0) * 1000
+                with lock:
+                    client_ms.append(ms)
+                    statuses[status] = statuses.get(status, 0) + 1
+                sent += 1
+        conn.close()
+
+    t0 = time.perf_counter()
+    threads = [threading.Thread(target=viewer, args=(i,)) for i in range(viewers)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - t0
+    n = len(client_ms)
+    return {
+        "viewers": viewers,
+        "requests": n,
+        "wall_s": round(wall, 2),
+        "throughput_rps": round(n / wall, 1) if wall > 0 else None,
+        "client_p50_ms": _percentile(client_ms, 50),
+        "client_p99_ms": _percentile(client_ms, 99),
+        "statuses": statuses,
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+    import tempfile
+
+    ap = argparse.ArgumentParser(description="Load-test the dashboard data API on synthetic cached datasets")
+    ap.add_argument("--datasets", type=int, default=3)
+    ap.add_argument("--rows", type=int, default=500_000)
+    ap.add_argument("--viewers", type=int, default=32)
+    ap.add_argument("--requests", type=int, default=25, help="per viewer")
+    ap.add_argument("--concurrency", type=int, default=4)
+    ap.add_argument("--cache-entries", type=int, default=512, help="0 disables the result cache")
+    args = ap.parse_args()
+
+    from bench_suite import WarehouseSpec, synthetic_table
+
+    with tempfile.TemporaryDirectory() as tmp:
+        mem = MemoryStore(Path(tmp))
+        spec = WarehouseSpec(n_rows=args.rows)
+        described = []
+        for i in range(args.datasets):
+            mem.cache_df(f"ds_{i}", synthetic_table(spec, i))
+            described.append({"dataset": f"ds_{i}", "time": "event_date", "category": "category", "measure": "amount"})
+        service = DataService(Path(tmp), max_concurrency=args.concurrency, cache_entries=args.cache_entries)
+        with DataAPIServer(service) as server:
+            report = load_test(server.url, described, viewers=args.viewers, requests_per_viewer=args.requests)
+            report["server"] = service.metrics()
+        print(json.dumps(report, indent=2))
@@ -1,17 +1,25 @@
 from __future__ import annotations
 
 import os
-from typing import Any, Dict, Optional
+from typing import Any, Callable, Dict, Optional
 
 import pandas as pd
-from sqlalchemy import create_engine, text
+from sqlalchemy import create_engine, inspect, text
 from sqlalchemy.engine import Engine
 from sqlalchemy.engine import URL
 
 from safety import enforce_select_only
+from single_flight import get_single_flight, query_key
+from tracing import span
 
 
 def build_engine() -> Engine:
+    # DB_URL (any SQLAlchemy URL, e.g. sqlite:///warehouse.db) overrides the SQL Server settings;
+    # used for local runs and the benchmark warehouse
+    db_url = os.getenv("DB_URL")
+    if db_url:
+        return create_engine(db_url)
+
     host = os.getenv("DB_HOST", "")
     port = int(os.getenv("DB_PORT", "1433"))
     database = os.getenv("DB_NAME", "")
@@ -47,16 +55,45 @@ def build_engine() -> Engine:
     return engine
 
 
+def is_mssql(engine: Engine) -> bool:
+    return engine.dialect.name == "mssql"
+
+
+def qualified_name(engine: Engine, schema: str, table: str) -> str:
+    if is_mssql(engine):
+        return f"[{schema}].[{table}]"
+    q = engine.dialect.identifier_preparer.quote
+    return f"{q(schema)}.{q(table)}" if schema else q(table)
+
+
 def run_sql(engine: Engine, sql: str, params: Optional[Dict[str, Any]] = None, limit: Optional[int] = None) -> pd.DataFrame:
     enforce_select_only(sql)
     q = sql.strip().rstrip(";")
     if limit is not None:
-        q = f"SELECT TOP {int(limit)} * FROM ({q}) AS __q"
-    with engine.connect() as conn:
-        return pd.read_sql(text(q), conn, params=params or {})
+        if is_mssql(engine):
+            q = f"SELECT TOP {int(limit)} * FROM ({q}) AS __q"
+        else:
+            q = f"SELECT * FROM ({q}) AS __q LIMIT {int(limit)}"
+
+    def read() -> pd.DataFrame:
+        with span("db.run_sql", cat="sql", sql=q[:200]) as sp:
+            with engine.connect() as conn:
+                df = pd.read_sql(text(q), conn, params=params or {})
+            sp.set(rows=int(df.shape[0]), cols=int(df.shape[1]))
+        return df
+
+    # identical queries in flight from other sessions share one execution
+    df, _ = get_single_flight().do(query_key(engine, q, params), read, label=q, share=pd.DataFrame.copy)
+    return df
 
 
 def list_tables(engine: Engine) -> pd.DataFrame:
+    if not is_mssql(engine):
+        insp = inspect(engine)
+        schema = insp.default_schema_name or ""
+        names = sorted(insp.get_table_names())
+        return pd.DataFrame({"schema_name": [schema] * len(names), "table_name": names})
+
     sql = """
     SELECT s.name AS schema_name, t.name AS table_name
     FROM sys.tables t
@@ -67,6 +104,21 @@ def list_tables(engine: Engine) -> pd.DataFrame:
 
 
 def get_columns(engine: Engine, schema: str, table: str) -> pd.DataFrame:
+    if not is_mssql(engine):
+        cols = inspect(engine).get_columns(table, schema=schema or None)
+        return pd.DataFrame(
+            [
+                {
+                    "COLUMN_NAME": c["name"],
+                    "DATA_TYPE": str(c["type"]).lower(),
+                    "IS_NULLABLE": "YES" if c.get("nullable", True) else "NO",
+                    "CHARACTER_MAXIMUM_LENGTH": getattr(c["type"], "length", None),
+                }
+                for c in cols
+            ],
+            columns=["COLUMN_NAME", "DATA_TYPE", "IS_NULLABLE", "CHARACTER_MAXIMUM_LENGTH"],
+        )
+
     sql = """
     SELECT COLUMN_NAME, DATA_TYPE, IS_NULLABLE, CHARACTER_MAXIMUM_LENGTH
     FROM INFORMATION_SCHEMA.COLUMNS
@@ -77,11 +129,68 @@ def get_columns(engine: Engine, schema: str, table: str) -> pd.DataFrame:
 
 
 def get_row_count(engine: Engine, schema: str, table: str) -> int:
-    sql = f"SELECT COUNT(1) AS cnt FROM [{schema}].[{table}]"
+    sql = f"SELECT COUNT(1) AS cnt FROM {qualified_name(engine, schema, table)}"
     df = run_sql(engine, sql)
     return int(df["cnt"].iloc[0]) if not df.empty else 0
 
 
 def sample_table(engine: Engine, schema: str, table: str, n: int = 500) -> pd.DataFrame:
-    sql = f"SELECT * FROM [{schema}].[{table}]"
-    return run_sql(engine, sql, limit=n)
\ No newline at end of file
+    sql = f"SELECT * FROM {qualified_name(engine, schema, table)}"
+    return run_sql(engine, sql, limit=n)
+
+
+def build_db_profile(
+    engine: Optional[Engine] = None,
+    progress: Optional[Callable[[float, str], None]] = None,
+) -> Dict[str, Any]:
+    """
+    Tables with their columns, row counts and a few example rows. With PROFILE_COLUMN_STATS (the
+    default) every column also gets null fraction, distinct count, min / max and top values from
+    column_stats.py, and only PROFILE_SAMPLE_ROWS raw rows are kept instead of 500.
+    """
+    import column_stats
+
+    engine = engine if engine is not None else build_engine()
+    tables_df = list_tables(engine)
+
+    profile: Dict[str, Any] = {"tables": []}
+    n_tables = len(tables_df)
+    for i, (_, row) in enumerate(tables_df.iterrows()):
+        schema = row["schema_name"]
+        table = row["table_name"]
+        if progress is not None:
+            progress(i / max(n_tables, 1), f"Profiling {schema}.{table}")
+        stats = None
+        with span("db.profile_table", cat="sql", table=f"{schema}.{table}"):
+            cols = get_columns(engine, schema, table)
+            cnt = None
+            if column_stats.ENABLED:
+                # metadata estimate only: the stats aggregate counts the rows in the same scan
+                cnt = column_stats.estimate_rows(engine, schema, table)
+                try:
+                    stats = column_stats.column_stats(engine, schema, table, cols.to_dict(orient="records"), rows=cnt)
+                    if not stats["sampled"]:
+                        cnt = stats["rows_scanned"]
+                except Exception as e:
+                    stats = {"error": f"{type(e).__name__}: {e}"}
+            if cnt is None:
+                try:
+                    cnt = get_row_count(engine, schema, table)
+                except Exception:
+                    cnt = None
+            try:
+                samp = sample_table(engine, schema, table, n=column_stats.SAMPLE_ROWS if column_stats.ENABLED else 500)
+            except Exception:
+                samp = pd.DataFrame()
+
+        entry = {
+            "schema": schema,
+            "table": table,
+            "row_count": cnt,
+            "columns": cols.to_dict(orient="records"),
+            "sample_rows": samp.head(5000).to_dict(orient="records"),
+        }
+        if stats is not None:
+            column_stats.apply_stats(entry, stats)
+        profile["tables"].append(entry)
+    return profile
@@ -1,17 +1,28 @@
 from __future__ import annotations
 
 import hashlib
-from typing import Dict, List, Tuple, Optional
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Tuple, Optional
 
 import pandas as pd
 from sqlalchemy.engine import Engine
 
 from safety import enforce_select_only
-from memory_store import MemoryStore
+from single_flight import get_single_flight, query_key
+from tracing import span, traced
+from memory_store import MemoryStore, parquet_scan
 from models import SQLArtifact, DatasetSummary, KPIReport, KPIValue, ExecutionBundle
+from incremental import AggState, cache_full, refresh as incremental_refresh
+from parquet_layout import choose_layout
+from artifact_dag import SHARED_MAX_ROWS, plan_artifacts, run_local, source_stats
+from query_guard import QueryGuard, QueryGuardError
 
 # NEW: planner-driven KPI engine
-from kpi_engine import compute_kpis_from_plan
+from kpi_engine import compute_kpis_from_plan, compute_kpis_from_state
+
+EXEC_CONCURRENCY = int(os.getenv("EXEC_CONCURRENCY", "2"))  # warehouse queries in flight per execute
 
 
 def _mk_cache_key(prefix: str, sql: str) -> str:
@@ -19,6 +30,7 @@ def _mk_cache_key(prefix: str, sql: str) -> str:
     return f"{prefix}_{h}"
 
 
+@traced("executor.infer_types", cat="executor")
 def _infer_column_types(df: pd.DataFrame) -> Tuple[List[str], List[str], List[str]]:
     time_cols: List[str] = []
     num_cols: List[str] = []
@@ -35,7 +47,7 @@ def _infer_column_types(df: pd.DataFrame) -> Tuple[List[str], List[str], List[st
 
     # additionally: try parse dates from object columns (light heuristic)
     for c in list(cat_cols):
-        if df[c].dtype == "object":
+        if pd.api.types.is_object_dtype(df[c]) or pd.api.types.is_string_dtype(df[c]):
             try:
                 parsed = pd.to_datetime(df[c], errors="coerce", utc=False)
                 if parsed.notna().mean() > 0.8:
@@ -50,8 +62,129 @@ def _infer_column_types(df: pd.DataFrame) -> Tuple[List[str], List[str], List[st
 def run_sql_select(engine: Engine, sql: str) -> pd.DataFrame:
     enforce_select_only(sql)
     q = sql.strip().rstrip(";")
-    with engine.connect() as conn:
-        return pd.read_sql_query(q, conn)
+
+    def read() -> pd.DataFrame:
+        with span("executor.run_sql_select", cat="sql", sql=q[:200]) as sp:
+            with engine.connect() as conn:
+                df = pd.read_sql_query(q, conn)
+            sp.set(rows=int(df.shape[0]), cols=int(df.shape[1]))
+        return df
+
+    # several sessions executing the same plan: one warehouse query, a copy of the result each
+    df, _ = get_single_flight().do(query_key(engine, q), read, label=q, share=pd.DataFrame.copy)
+    return df
+
+
+def run_sql_select_capped(engine: Engine, sql: str, max_rows: int, chunk_rows: int = 50_000) -> Optional[pd.DataFrame]:
+    """run_sql_select that stops reading once the result passes `max_rows` (returns None then)."""
+    enforce_select_only(sql)
+    q = sql.strip().rstrip(";")
+    with span("executor.run_sql_select", cat="sql", sql=q[:200], max_rows=max_rows) as sp:
+        chunks: List[pd.DataFrame] = []
+        n = 0
+        with engine.connect() as conn:
+            for chunk in pd.read_sql_query(q, conn, chunksize=min(chunk_rows, max_rows + 1)):
+                chunks.append(chunk)
+                n += len(chunk)
+                if n > max_rows:
+                    sp.set(rows=n, capped=True)
+                    return None
+        sp.set(rows=n)
+    return pd.concat(chunks, ignore_index=True) if chunks else None
+
+
+def _generic_report(
+    dataset_name: str,
+    state: AggState,
+    p95: Dict[str, float],
+    top: Optional[Tuple[str, List[Tuple[str, int]]]],
+) -> KPIReport:
+    """
+    Generic KPIs / insights from the dataset's mergeable aggregates plus the two statistics that do
+    not merge (p95 of the first numeric columns, top values of the first categorical column).
+    """
+    kpis: List[KPIValue] = []
+    highlights: List[str] = []
+    risks: List[str] = []
+
+    kpis.append(KPIValue(name="rows", value=int(state.rows)))
+    kpis.append(KPIValue(name="columns", value=len(state.columns)))
+
+    # missingness
+    if state.rows:
+        miss = (pd.Series(state.nulls, dtype=float) / state.rows * 100).sort_values(ascending=False)
+        top_miss = miss.head(5)
+        if not top_miss.empty and float(top_miss.iloc[0]) > 0:
+            risks.append(
+                "Top missing columns (%): "
+                + ", ".join([f"{i}:{float(top_miss[i]):.1f}" for i in top_miss.index])
+            )
+
+    # numeric summaries
+    if state.num_cols:
+        for c in state.num_cols[:6]:
+            if state.counts.get(c):
+                kpis.append(KPIValue(name=f"{c}__sum", value=float(state.sums[c])))
+                kpis.append(KPIValue(name=f"{c}__avg", value=float(state.sums[c] / state.counts[c])))
+                if c in p95:
+                    kpis.append(KPIValue(name=f"{c}__p95", value=float(p95[c])))
+        highlights.append(f"Detected numeric columns: {', '.join(state.num_cols[:10])}")
+
+    # time span
+    if state.time_cols:
+        c = state.time_cols[0]
+        if state.mins.get(c) is not None:
+            highlights.append(f"Time column `{c}` spans {pd.Timestamp(state.mins[c])} → {pd.Timestamp(state.maxs[c])}")
+
+    # top categories
+    if top is not None:
+        c, vc = top
+        highlights.append(f"Top `{c}`: " + ", ".join([f"{k}({v})" for k, v in vc]))
+
+    return KPIReport(dataset_name=dataset_name, kpis=kpis, highlights=highlights, risks=risks)
+
+
+def _frame_stats(df: pd.DataFrame, state: AggState) -> Tuple[Dict[str, float], Optional[Tuple[str, List[Tuple[str, int]]]]]:
+    p95: Dict[str, float] = {}
+    for c in state.num_cols[:6]:
+        s = pd.to_numeric(df[c], errors="coerce").dropna()
+        if len(s) > 0:
+            p95[c] = float(s.quantile(0.95))
+    top = None
+    if state.cat_cols:
+        c = state.cat_cols[0]
+        vc = df[c].astype(str).value_counts(dropna=True).head(5)
+        top = (c, [(k, int(v)) for k, v in vc.items()])
+    return p95, top
+
+
+def _parquet_stats(path: str, state: AggState) -> Tuple[Dict[str, float], Optional[Tuple[str, List[Tuple[str, int]]]]]:
+    """_frame_stats computed by DuckDB over the cached Parquet: reads only the columns involved."""
+    import duckdb
+
+    def q(c: str) -> str:
+        return '"' + c.replace('"', '""') + '"'
+
+    con = duckdb.connect()
+    try:
+        src = parquet_scan(path)
+        p95: Dict[str, float] = {}
+        num = [c for c in state.num_cols[:6] if state.counts.get(c)]
+        if num:
+            exprs = ", ".join(f"quantile_cont(TRY_CAST({q(c)} AS DOUBLE), 0.95)" for c in num)
+            row = con.execute(f"SELECT {exprs} FROM {src}").fetchone()
+            p95 = {c: float(v) for c, v in zip(num, row) if v is not None}
+        top = None
+        if state.cat_cols:
+            c = state.cat_cols[0]
+            rows = con.execute(
+                f"SELECT CAST({q(c)} AS VARCHAR) AS k, count(*) AS n FROM {src} "
+                f"WHERE {q(c)} IS NOT NULL GROUP BY 1 ORDER BY n DESC LIMIT 5"
+            ).fetchall()
+            top = (c, [(k, int(n)) for k, n in rows])
+    finally:
+        con.close()
+    return p95, top
 
 
 def execute_and_cache_artifacts(
@@ -61,7 +194,31 @@ def execute_and_cache_artifacts(
     analysis_plan: Optional[Dict] = None,  # NEW: pass AnalysisPlan.model_dump()
     cache_prefix: str = "ds",
     max_rows_preview: int = 50,
+    progress: Optional[Callable[[float, str], None]] = None,
+    incremental: bool = False,
+    concurrency: int = EXEC_CONCURRENCY,
+    errors: Optional[Dict[str, str]] = None,
+    guard: Optional[QueryGuard] = None,
+    deadline: Optional[float] = None,
 ) -> Tuple[ExecutionBundle, Dict[str, pd.DataFrame]]:
+    """
+    Runs each artifact's SQL, caches the result and computes its KPIs. With `incremental=True`,
+    source artifacts (no `depends_on`) that declare a `watermark_column` and already have a cached watermark only fetch the
+    rows at or after `watermark - lookback` and fold them into the cache (see incremental.py);
+    everything else, and any artifact the incremental path cannot handle, is refreshed in full.
+
+    Artifacts run in dependency order (artifact_dag.py): `depends_on` artifacts and those reading
+    a CTE shared with other artifacts are computed in DuckDB, everything that goes to the
+    warehouse in full is fetched up front on `concurrency` threads. With an `errors` dict, a
+    failing artifact is recorded there (name -> message) and skipped instead of raising.
+
+    With a `guard` (query_guard.py), every warehouse query is reviewed first: findings become report
+    risks, capped artifacts run their rewritten SQL, and held ones raise QueryGuardError before
+    anything runs (or, with `errors`, are recorded there along with their dependents).
+
+    `deadline` is a time.perf_counter() value: past it, no further warehouse query is sent (queued
+    prefetches are cancelled) and the artifacts not yet processed fail with TimeoutError.
+    """
     dataset_summaries: List[DatasetSummary] = []
     reports: List[KPIReport] = []
     previews: Dict[str, pd.DataFrame] = {}
@@ -69,86 +226,206 @@ def execute_and_cache_artifacts(
     # Keep full datasets for planner-driven KPI computation
     # NOTE: If datasets are huge, we can switch to sampling later.
     full_datasets: Dict[str, pd.DataFrame] = {}
-
-    for art in artifacts:
-        sql = art.sql.strip()
-        enforce_select_only(sql)
-
-        cache_key = art.cache_key or _mk_cache_key(cache_prefix, sql)
-
+    # incremental refreshes: planner KPIs from the merged aggregates when every hint decomposes
+    states: Dict[str, Tuple[str, AggState]] = {}
+
+    dialect = engine.dialect.name
+    reviews = {}
+    if guard is not None:
+        with span("executor.query_guard", cat="executor", artifacts=len(artifacts)):
+            # capped artifacts keep the cache key of the query as written
+            keyed = [
+                a if a.cache_key else a.model_copy(update={"cache_key": _mk_cache_key(cache_prefix, a.sql.strip())})
+                for a in artifacts
+            ]
+            artifacts, reviews, held = guard.screen(keyed, dialect, engine.dialect.identifier_preparer.quote)
+        if held:
+            if errors is None:
+                raise QueryGuardError([r for r in reviews.values() if r.held])
+            errors.update(held)
+    capped = [n for n, r in reviews.items() if r.action == "cap"]
+
+    by_name = {a.dataset_name: a for a in artifacts}
+    # `depends_on` artifacts are DuckDB SQL over other datasets: never sent to the warehouse
+    # with a watermark window, always recomputed in full from their upstream caches
+    incremental_names = {a.dataset_name for a in artifacts if incremental and a.watermark_column and not a.depends_on}
+    dag = plan_artifacts(
+        artifacts,
+        source_only=sorted(incremental_names) + capped,
+        dialect=dialect,
+    )
+    paths: Dict[str, str] = {}
+    fetched: Dict[str, int] = {}  # warehouse query (dataset or intermediate) -> rows returned
+    local_rows: Dict[str, int] = {}
+    fallbacks: List[str] = []
+
+    def expired() -> bool:
+        return deadline is not None and time.perf_counter() > deadline
+
+    def fetch(name: str, sql: str) -> pd.DataFrame:
+        if expired():
+            raise TimeoutError("run timeout reached before the query was sent")
         df = run_sql_select(engine, sql)
-        full_datasets[art.dataset_name] = df
-
-        parquet_path = mem.cache_df(cache_key, df)
-
-        time_cols, num_cols, cat_cols = _infer_column_types(df)
-
-        ds_sum = DatasetSummary(
-            dataset_name=art.dataset_name,
-            cache_key=cache_key,
-            parquet_path=parquet_path,
-            n_rows=int(df.shape[0]),
-            n_cols=int(df.shape[1]),
-            columns=[str(c) for c in df.columns],
-            inferred_time_columns=time_cols,
-            inferred_numeric_columns=num_cols,
-            inferred_categorical_columns=cat_cols,
-        )
-        dataset_summaries.append(ds_sum)
-
-        # -------------------------
-        # Generic KPI / insights
-        # -------------------------
-        kpis: List[KPIValue] = []
-        highlights: List[str] = []
-        risks: List[str] = []
-
-        kpis.append(KPIValue(name="rows", value=int(df.shape[0])))
-        kpis.append(KPIValue(name="columns", value=int(df.shape[1])))
-
-        # missingness
-        miss = (df.isna().mean() * 100).sort_values(ascending=False)
-        top_miss = miss.head(5)
-        if not top_miss.empty and float(top_miss.iloc[0]) > 0:
-            risks.append(
-                "Top missing columns (%): "
-                + ", ".join([f"{i}:{float(top_miss[i]):.1f}" for i in top_miss.index])
-            )
-
-        # numeric summaries
-        if num_cols:
-            for c in num_cols[:6]:
-                s = pd.to_numeric(df[c], errors="coerce").dropna()
-                if len(s) > 0:
-                    kpis.append(KPIValue(name=f"{c}__sum", value=float(s.sum())))
-                    kpis.append(KPIValue(name=f"{c}__avg", value=float(s.mean())))
-                    kpis.append(KPIValue(name=f"{c}__p95", value=float(s.quantile(0.95))))
-            highlights.append(f"Detected numeric columns: {', '.join(num_cols[:10])}")
-
-        # time span
-        if time_cols:
-            c = time_cols[0]
-            t = pd.to_datetime(df[c], errors="coerce")
-            if t.notna().any():
-                highlights.append(f"Time column `{c}` spans {t.min()} → {t.max()}")
-
-        # top categories
-        if cat_cols:
-            c = cat_cols[0]
-            vc = df[c].astype(str).value_counts(dropna=True).head(5)
-            highlights.append(f"Top `{c}`: " + ", ".join([f"{k}({v})" for k, v in vc.items()]))
-
-        reports.append(KPIReport(dataset_name=art.dataset_name, kpis=kpis, highlights=highlights, risks=risks))
-
-        # store preview for dashboard builder context (small)
-        previews[art.dataset_name] = df.head(max_rows_preview).copy()
+        fetched[name] = int(df.shape[0])
+        return df
+
+    def fetch_shared(key: str) -> pd.DataFrame:
+        if expired():
+            raise TimeoutError("run timeout reached before the query was sent")
+        with span("executor.shared_cte", cat="executor", key=key, consumers=len(dag.shared[key].consumers)):
+            df = run_sql_select_capped(engine, dag.shared[key].sql, SHARED_MAX_ROWS)
+            if df is None:
+                fetched[key] = SHARED_MAX_ROWS
+                raise ValueError(f"shared intermediate {key} exceeds {SHARED_MAX_ROWS} rows")
+            fetched[key] = int(df.shape[0])
+            mem.cache_df(key, df)
+        return df
+
+    pool = ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix="executor")
+    try:
+        shared = {k: pool.submit(fetch_shared, k) for k in dag.shared}
+        prefetch = {
+            n: pool.submit(fetch, n, by_name[n].sql.strip())
+            for n in dag.order
+            if dag.needs_source(n) and n not in incremental_names
+        }
+
+        def load(art: SQLArtifact, sql: str) -> pd.DataFrame:
+            name = art.dataset_name
+            if name in dag.depends:
+                missing = [d for d in dag.depends[name] if d not in paths]
+                if missing:
+                    raise ValueError(f"upstream datasets {missing} were not refreshed")
+                df = run_local(sql, {d: paths[d] for d in dag.depends[name]}, dialect)
+            elif name in dag.duplicate_of and dag.duplicate_of[name] in full_datasets:
+                df = full_datasets[dag.duplicate_of[name]]
+            elif name in dag.rewritten:
+                try:
+                    tables = {cte: shared[key].result() for cte, key in dag.intermediates_of(name).items()}
+                    df = run_local(dag.rewritten[name], tables, dialect)
+                except Exception:
+                    # the intermediate failed or DuckDB rejects the remainder: run the artifact as written
+                    fallbacks.append(name)
+                    return fetch(name, sql)
+            elif name in prefetch:
+                return prefetch[name].result()
+            else:
+                return fetch(name, sql)
+            local_rows[name] = int(df.shape[0])
+            return df
+
+        for i, name in enumerate(dag.order):
+            art = by_name[name]
+            with span("executor.artifact", cat="executor", dataset=art.dataset_name):
+                try:
+                    if expired():
+                        for f in (*shared.values(), *prefetch.values()):
+                            f.cancel()  # queued warehouse queries; running ones finish
+                        raise TimeoutError("run timeout reached before the dataset was processed")
+                    if progress is not None:
+                        progress(i / max(len(artifacts), 1), f"Executing {art.dataset_name}")
+                    sql = art.sql.strip()
+                    enforce_select_only(sql)
+
+                    cache_key = art.cache_key or _mk_cache_key(cache_prefix, sql)
+
+                    inc, inc_error = None, None
+                    if name in incremental_names:
+                        quote = engine.dialect.identifier_preparer.quote
+                        try:
+                            inc = incremental_refresh(
+                                mem, cache_key, art.watermark_column, sql, quote,
+                                lambda q: fetch(name, q), lookback=art.lookback,
+                                preview_rows=max_rows_preview,
+                            )
+                        except (ValueError, TypeError, KeyError, OSError) as e:
+                            # schema drift between fragments, a cast that no longer fits, ...: start over
+                            inc_error = f"Incremental refresh failed, refreshed in full: {e}"
+
+                    if inc is not None:
+                        state = inc.state
+                        parquet_path = inc.path
+                        with span("executor.generic_kpis", cat="kpi", rows=int(state.rows), incremental=True):
+                            p95, top = _parquet_stats(parquet_path, state)
+                        states[art.dataset_name] = (cache_key, state)
+                        watermark, refresh = inc.watermark, "incremental"
+                        rows_fetched = inc.fetched
+                        preview = inc.preview
+                    else:
+                        df = load(art, sql)
+                        full_datasets[art.dataset_name] = df
+                        time_cols, num_cols, cat_cols = _infer_column_types(df)
+                        layout = choose_layout(df, time_cols, time_column=art.watermark_column, dims=art.partition_by or None)
+                        watermark = None
+                        if art.watermark_column:
+                            parquet_path, watermark = cache_full(
+                                mem, cache_key, df, art.watermark_column, time_cols, num_cols, cat_cols, layout
+                            )
+                        else:
+                            parquet_path = mem.cache_df(cache_key, df, layout)
+                        state = AggState.of(df, time_cols, num_cols, cat_cols)
+                        with span("executor.generic_kpis", cat="kpi", rows=int(df.shape[0])):
+                            p95, top = _frame_stats(df, state)
+                        refresh = "full"
+                        rows_fetched = 0 if name in local_rows else int(df.shape[0])
+                        preview = df.head(max_rows_preview)
+                except Exception as e:
+                    if errors is None:
+                        raise
+                    errors[name] = f"{type(e).__name__}: {e}"
+                    continue
+                paths[name] = parquet_path
+
+                ds_sum = DatasetSummary(
+                    dataset_name=art.dataset_name,
+                    cache_key=cache_key,
+                    parquet_path=parquet_path,
+                    n_rows=int(state.rows),
+                    n_cols=len(state.columns),
+                    columns=list(state.columns),
+                    inferred_time_columns=list(state.time_cols),
+                    inferred_numeric_columns=list(state.num_cols),
+                    inferred_categorical_columns=list(state.cat_cols),
+                    watermark=watermark,
+                    refresh=refresh,
+                    rows_fetched=rows_fetched,
+                    computed="local" if name in local_rows else "source",
+                )
+                dataset_summaries.append(ds_sum)
+
+                # -------------------------
+                # Generic KPI / insights
+                # -------------------------
+                report = _generic_report(art.dataset_name, state, p95, top)
+                if inc_error:
+                    report.risks.append(inc_error)
+                if name in reviews:
+                    report.risks.extend(reviews[name].risks())
+                reports.append(report)
+
+                # store preview for dashboard builder context (small)
+                previews[art.dataset_name] = preview.copy()
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+    # back to the order the artifacts were given in
+    position = {a.dataset_name: i for i, a in enumerate(artifacts)}
+    dataset_summaries.sort(key=lambda d: position[d.dataset_name])
+    reports.sort(key=lambda r: position[r.dataset_name])
 
     # -------------------------
     # Planner-driven KPI merge
     # -------------------------
     if analysis_plan:
         try:
-            computed_map = compute_kpis_from_plan(analysis_plan, full_datasets)
+            computed_map = {}
+            for ds_name, (key, state) in states.items():
+                from_state = compute_kpis_from_state(analysis_plan, state)
+                if from_state is not None:
+                    computed_map[ds_name] = from_state
+                else:
+                    full_datasets[ds_name] = mem.load_cached_df(key)
+            computed_map.update(compute_kpis_from_plan(analysis_plan, full_datasets))
             # merge into existing reports
             report_by_name = {r.dataset_name: r for r in reports}
             for ds_name, computed_list in computed_map.items():
@@ -156,12 +433,13 @@ def execute_and_cache_artifacts(
                 if not r:
                     continue
                 for kc in computed_list:
-                    r.kpis.append(KPIValue(name=kc.name [kc.name], value=kc.value, note=kc.note))
+                    r.kpis.append(KPIValue(name=kc.name, value=kc.value, note=kc.note))
         except Exception as e:
             # Don't fail execution just because KPI mapping failed
             # Keep generic KPIs and add a risk note to all reports
             for r in reports:
                 r.risks.append(f"Planner-driven KPI computation failed: {e}")
 
-    bundle = ExecutionBundle(datasets=dataset_summaries, reports=reports)
-    return bundle, previews
\ No newline at end of file
+    stats = source_stats(dag, local_rows, fetched, fallbacks)
+    bundle = ExecutionBundle(datasets=dataset_summaries, reports=reports, source_stats=stats)
+    return bundle, previews
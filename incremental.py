@@ -0,0 +1,439 @@
+from __future__ import annotations
+
+import os
+import re
+from dataclasses import asdict, dataclass, field
+from datetime import datetime
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import pandas as pd
+
+from tracing import span
+
+if TYPE_CHECKING:
+    from memory_store import MemoryStore
+    from parquet_layout import ParquetLayout
+
+# ---------- settings ----------
+# Rows at or above `watermark - lookback` are re-fetched on every refresh (late arrivals, restated days).
+LOOKBACK_DAYS = float(os.getenv("INCREMENTAL_LOOKBACK_DAYS", "3"))
+LOOKBACK_IDS = float(os.getenv("INCREMENTAL_LOOKBACK_IDS", "0"))
+# A full refresh is forced once the last one is older than this: rows that arrive later than the
+# lookback, and the rolling "last 90/180 days" filters of the SQL, only catch up on full runs.
+FULL_AFTER_H = float(os.getenv("INCREMENTAL_FULL_AFTER_H", "24"))
+MAX_FRAGMENTS = int(os.getenv("INCREMENTAL_MAX_FRAGMENTS", "24"))
+
+
+# ---------- watermark ----------
+
+def watermark_of(s: pd.Series) -> Optional[Dict[str, Any]]:
+    """
+    High-water mark of a column: {"kind": "time"|"id", "value", "format"}, or None when the column
+    is neither numeric nor (mostly) parseable as dates. `format` records how time values look in
+    the source (native datetime, "YYYY-MM-DD" or "YYYY-MM-DD hh:mm:ss" strings) so the lower
+    bound can be written as a literal that compares correctly in the source database.
+    """
+    if pd.api.types.is_bool_dtype(s):
+        return None
+    if pd.api.types.is_numeric_dtype(s):
+        v = pd.to_numeric(s, errors="coerce").max()
+        return None if pd.isna(v) else {"kind": "id", "value": _encode(v, "id"), "format": "number"}
+    t = _sort_key(s, "time")
+    if t.notna().mean() <= 0.8:
+        return None
+    fmt = "native"
+    if not pd.api.types.is_datetime64_any_dtype(s):
+        sample = str(s.dropna().iloc[0])
+        fmt = "date" if len(sample) == 10 else "iso" if "T" in sample else "datetime"
+    return {"kind": "time", "value": _encode(t.max(), "time"), "format": fmt}
+
+
+def _sort_key(s: pd.Series, kind: str) -> pd.Series:
+    if kind == "time":
+        return pd.to_datetime(s, errors="coerce")
+    return pd.to_numeric(s, errors="coerce")
+
+
+def _encode(v: Any, kind: str) -> Any:
+    if v is None or pd.isna(v):
+        return None
+    if kind == "time":
+        return pd.Timestamp(v).isoformat()
+    v = float(v)
+    return int(v) if v.is_integer() else v
+
+
+def _decode(v: Any, kind: str) -> Any:
+    if v is None:
+        return None
+    return pd.Timestamp(v) if kind == "time" else v
+
+
+def lower_bound(watermark: Dict[str, Any], lookback: Optional[float] = None) -> Any:
+    """First watermark value to re-fetch: the mark minus `lookback` days (time) or IDs (id)."""
+    v = _decode(watermark["value"], watermark["kind"])
+    if watermark["kind"] == "time":
+        return v - pd.Timedelta(days=LOOKBACK_DAYS if lookback is None else lookback)
+    return v - (LOOKBACK_IDS if lookback is None else lookback)
+
+
+def sql_literal(value: Any, watermark: Dict[str, Any]) -> str:
+    """The lower bound as a SQL literal; string dates keep their own layout so they compare as text."""
+    if watermark["kind"] == "id":
+        return repr(_encode(value, "id"))
+    t = pd.Timestamp(value)
+    fmt = {
+        "date": "%Y-%m-%d",
+        "datetime": "%Y-%m-%d %H:%M:%S",
+    }.get(watermark.get("format"), "%Y-%m-%dT%H:%M:%S")
+    return "'" + t.strftime(fmt) + "'"
+
+
+# ---------- SQL ----------
+
+_WORD = re.compile(r"[A-Za-z_][A-Za-z0-9_]*")
+
+
+def top_level_words(sql: str) -> List[Tuple[str, int]]:
+    """(UPPER word, offset) outside parentheses, quotes, brackets and comments."""
+    out: List[Tuple[str, int]] = []
+    depth, i, n = 0, 0, len(sql)
+    while i < n:
+        ch = sql[i]
+        if ch in "'\"[":
+            close = "]" if ch == "[" else ch
+            j = sql.find(close, i + 1)
+            while j != -1 and close != "]" and sql[j + 1:j + 2] == close:  # doubled quote escapes
+                j = sql.find(close, j + 2)
+            i = n if j == -1 else j + 1
+        elif sql.startswith("--", i):
+            j = sql.find("\n", i)
+            i = n if j == -1 else j + 1
+        elif sql.startswith("/*", i):
+            j = sql.find("*/", i + 2)
+            i = n if j == -1 else j + 2
+        elif ch == "(":
+            depth += 1
+            i += 1
+        elif ch == ")":
+            depth -= 1
+            i += 1
+        else:
+            m = _WORD.match(sql, i)
+            if m is None:
+                i += 1
+                continue
+            if depth == 0:
+                out.append((m.group(0).upper(), i))
+            i = m.end()
+    return out
+
+
+def wrap_since(sql: str, column_sql: str, literal: str) -> Optional[str]:
+    """
+    Restrict a SELECT to `column >= literal` without touching its body: a trailing ORDER BY is
+    dropped (row order is irrelevant to the cache) and CTE queries get one more CTE, since SQL
+    Server allows neither ORDER BY nor WITH inside a derived table. Returns None when the result
+    would change meaning (TOP/LIMIT/OFFSET/FETCH at the outermost level).
+    """
+    body = sql.strip().rstrip(";").strip()
+    words = top_level_words(body)
+    names = [w for w, _ in words]
+    if any(w in ("TOP", "LIMIT", "OFFSET", "FETCH") for w in names):
+        return None
+    for k, (w, pos) in enumerate(words):
+        if w == "ORDER" and k + 1 < len(words) and words[k + 1][0] == "BY":
+            body = body[:pos].rstrip()
+            words = words[:k]
+            break
+    pred = f"WHERE {column_sql} >= {literal}"
+    if names and names[0] == "WITH":
+        starts = [pos for w, pos in words if w == "SELECT"]
+        if not starts:
+            return None
+        head, final = body[:starts[0]].rstrip(), body[starts[0]:]
+        return f"{head},\n_inc_src AS (\n{final}\n)\nSELECT * FROM _inc_src {pred}"
+    return f"SELECT * FROM (\n{body}\n) AS _inc_src {pred}"
+
+
+# ---------- mergeable aggregates ----------
+
+@dataclass
+class AggState:
+    """
+    Aggregates of a cached dataset that survive an incremental refresh without re-reading it:
+    row count, NULLs per column, non-NULL count / sum / min / max per numeric column and min / max
+    per time column. Removing rows can take away an extreme; such columns are listed in `stale`
+    until they are re-read from the Parquet (`resolve_stale`).
+    """
+
+    rows: int = 0
+    columns: List[str] = field(default_factory=list)
+    time_cols: List[str] = field(default_factory=list)
+    num_cols: List[str] = field(default_factory=list)
+    cat_cols: List[str] = field(default_factory=list)
+    nulls: Dict[str, int] = field(default_factory=dict)
+    counts: Dict[str, int] = field(default_factory=dict)
+    sums: Dict[str, float] = field(default_factory=dict)
+    mins: Dict[str, Any] = field(default_factory=dict)
+    maxs: Dict[str, Any] = field(default_factory=dict)
+    stale: List[str] = field(default_factory=list)
+
+    @classmethod
+    def of(
+        cls, df: pd.DataFrame, time_cols: Sequence[str], num_cols: Sequence[str], cat_cols: Sequence[str]
+    ) -> "AggState":
+        st = cls(
+            rows=int(df.shape[0]),
+            columns=[str(c) for c in df.columns],
+            time_cols=list(time_cols),
+            num_cols=list(num_cols),
+            cat_cols=list(cat_cols),
+            nulls={str(c): int(v) for c, v in df.isna().sum().items()},
+        )
+        for c in num_cols:
+            s = pd.to_numeric(df[c], errors="coerce").dropna()
+            st.counts[c] = int(len(s))
+            st.sums[c] = float(s.sum())
+            st.mins[c] = _encode(s.min(), "id") if len(s) else None
+            st.maxs[c] = _encode(s.max(), "id") if len(s) else None
+        for c in time_cols:
+            t = pd.to_datetime(df[c], errors="coerce").dropna()
+            st.mins[c] = _encode(t.min(), "time") if len(t) else None
+            st.maxs[c] = _encode(t.max(), "time") if len(t) else None
+        return st
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+    @classmethod
+    def from_dict(cls, d: Dict[str, Any]) -> "AggState":
+        return cls(**d)
+
+    def kind(self, c: str) -> str:
+        return "time" if c in self.time_cols else "id"
+
+    def apply(self, removed: "AggState", added: "AggState") -> "AggState":
+        """self − removed + added (both computed with this state's column types)."""
+        out = AggState.from_dict(self.to_dict())
+        out.rows = self.rows - removed.rows + added.rows
+        for c in out.columns:
+            out.nulls[c] = self.nulls.get(c, 0) - removed.nulls.get(c, 0) + added.nulls.get(c, 0)
+        for c in out.num_cols:
+            out.counts[c] = self.counts.get(c, 0) - removed.counts.get(c, 0) + added.counts.get(c, 0)
+            out.sums[c] = self.sums.get(c, 0.0) - removed.sums.get(c, 0.0) + added.sums.get(c, 0.0)
+        stale = set(self.stale)
+        for c in out.num_cols + out.time_cols:
+            k = self.kind(c)
+            cur_lo, cur_hi = _decode(self.mins.get(c), k), _decode(self.maxs.get(c), k)
+            rm_lo, rm_hi = _decode(removed.mins.get(c), k), _decode(removed.maxs.get(c), k)
+            if (rm_lo is not None and cur_lo is not None and rm_lo <= cur_lo) or (
+                rm_hi is not None and cur_hi is not None and rm_hi >= cur_hi
+            ):
+                stale.add(c)
+            lo = [v for v in (cur_lo, _decode(added.mins.get(c), k)) if v is not None]
+            hi = [v for v in (cur_hi, _decode(added.maxs.get(c), k)) if v is not None]
+            out.mins[c] = _encode(min(lo), k) if lo else None
+            out.maxs[c] = _encode(max(hi), k) if hi else None
+        out.stale = sorted(stale)
+        return out
+
+    def resolve_stale(self, scan: str) -> None:
+        """Re-read min/max of the stale columns with one DuckDB query over `scan` (see parquet_scan)."""
+        if not self.stale:
+            return
+        import duckdb
+
+        exprs = []
+        for c in self.stale:
+            q = '"' + c.replace('"', '""') + '"'
+            if c in self.time_cols:
+                q = f"TRY_CAST({q} AS TIMESTAMP)"
+            else:
+                q = f"TRY_CAST({q} AS DOUBLE)"
+            exprs += [f"min({q})", f"max({q})"]
+        with span("incremental.resolve_stale", cat="io", cols=len(self.stale)):
+            con = duckdb.connect()
+            row = con.execute(f"SELECT {', '.join(exprs)} FROM {scan}").fetchone()
+            con.close()
+        for i, c in enumerate(self.stale):
+            k = self.kind(c)
+            self.mins[c], self.maxs[c] = _encode(row[2 * i], k), _encode(row[2 * i + 1], k)
+        self.stale = []
+
+
+# ---------- fragments ----------
+
+def fragment_meta(path: str, df: pd.DataFrame, column: str, kind: str) -> Dict[str, Any]:
+    key = _sort_key(df[column], kind)
+    return {"path": path, "n_rows": int(df.shape[0]), "wm_min": _encode(key.min(), kind), "wm_max": _encode(key.max(), kind)}
+
+
+def trim_fragments(
+    mem: "MemoryStore", key: str, fragments: List[Dict[str, Any]], column: str, kind: str, lo: Any
+) -> Tuple[List[Dict[str, Any]], pd.DataFrame]:
+    """
+    Drop the cached rows with `column >= lo` (the window about to be re-fetched). Only fragments
+    whose recorded maximum reaches the window are read; they are rewritten in place or deleted.
+    Returns the remaining fragments and the removed rows.
+    """
+    from pathlib import Path
+
+    kept: List[Dict[str, Any]] = []
+    removed: List[pd.DataFrame] = []
+    for f in fragments:
+        hi = _decode(f["wm_max"], kind)
+        if hi is None or hi < lo:
+            kept.append(f)
+            continue
+        df = pd.read_parquet(f["path"])
+        mask = (_sort_key(df[column], kind) >= lo).to_numpy()
+        removed.append(df[mask])
+        rest = df[~mask]
+        if rest.empty:
+            Path(f["path"]).unlink(missing_ok=True)
+        else:
+            name = str(Path(f["path"]).relative_to(mem.fragment_dir(key)))
+            ((path, _),) = mem.write_fragment(key, rest, name=name)
+            kept.append(fragment_meta(path, rest, column, kind))
+    gone = pd.concat(removed, ignore_index=True) if removed else pd.DataFrame()
+    return kept, gone
+
+
+def compact_fragments(
+    mem: "MemoryStore", key: str, fragments: List[Dict[str, Any]], column: str, kind: str
+) -> List[Dict[str, Any]]:
+    """Merge the files of a partition into one once it holds more than INCREMENTAL_MAX_FRAGMENTS."""
+    from pathlib import Path
+
+    by_dir: Dict[str, List[Dict[str, Any]]] = {}
+    for f in fragments:
+        by_dir.setdefault(str(Path(f["path"]).parent), []).append(f)
+    out: List[Dict[str, Any]] = []
+    root = mem.fragment_dir(key)
+    for group in by_dir.values():
+        if len(group) <= MAX_FRAGMENTS:
+            out.extend(group)
+            continue
+        with span("incremental.compact", cat="io", key=key, fragments=len(group)):
+            df = pd.concat([pd.read_parquet(f["path"]) for f in group], ignore_index=True)
+            first = str(Path(group[0]["path"]).relative_to(root))
+            ((path, _),) = mem.write_fragment(key, df, name=first)
+            for f in group[1:]:
+                Path(f["path"]).unlink(missing_ok=True)
+        out.append(fragment_meta(path, df, column, kind))
+    return out
+
+
+def due_for_full(entry: Dict[str, Any], now: Optional[datetime] = None) -> bool:
+    full_at = entry.get("full_at")
+    if full_at is None:
+        return True
+    return ((now or datetime.now()) - full_at).total_seconds() > FULL_AFTER_H * 3600
+
+
+@dataclass
+class RefreshResult:
+    path: str
+    state: AggState
+    watermark: Dict[str, Any]
+    fetched: int
+    replaced: int
+    fragments: int
+    preview: pd.DataFrame
+
+
+def refresh(
+    mem: "MemoryStore",
+    key: str,
+    column: str,
+    sql: str,
+    quote: Callable[[str], str],
+    fetch: Callable[[str], pd.DataFrame],
+    lookback: Optional[float] = None,
+    preview_rows: int = 50,
+) -> Optional[RefreshResult]:
+    """
+    Incremental refresh of cache entry `key`. `fetch` runs SQL against the source and `quote`
+    quotes an identifier for its dialect. Returns None whenever a full refresh is needed instead:
+    no watermark yet, a different watermark column, full refresh due, SQL that cannot be
+    restricted, or fetched rows whose columns no longer match the cache.
+    """
+    entry = mem.cache_entry(key)
+    if not entry or not entry.get("watermark") or not entry.get("agg_state"):
+        return None
+    wm = entry["watermark"]
+    if wm.get("column") != column or due_for_full(entry):
+        return None
+    state = AggState.from_dict(entry["agg_state"])
+    kind = wm["kind"]
+    lo = lower_bound(wm, lookback)
+    inc_sql = wrap_since(sql, quote(column), sql_literal(lo, wm))
+    if inc_sql is None:
+        return None
+
+    new = fetch(inc_sql)
+    if list(map(str, new.columns)) != state.columns:
+        return None
+
+    with span("incremental.apply", cat="io", key=key, fetched=int(new.shape[0])):
+        fragments, gone = trim_fragments(mem, key, entry["fragments"], column, kind, lo)
+        if not new.empty:
+            for path, part in mem.write_fragment(key, new):
+                fragments.append(fragment_meta(path, part, column, kind))
+        fragments = compact_fragments(mem, key, fragments, column, kind)
+
+        types = (state.time_cols, state.num_cols, state.cat_cols)
+        if gone.empty:
+            gone = new.iloc[:0]
+        state = state.apply(AggState.of(gone, *types), AggState.of(new, *types))
+
+        from memory_store import parquet_scan
+
+        d = str(mem.fragment_dir(key))
+        state.resolve_stale(parquet_scan(d))
+        highs = [_decode(f["wm_max"], kind) for f in fragments if f["wm_max"] is not None]
+        wm = {**wm, "value": _encode(max(highs), kind) if highs else wm["value"]}
+        mem.register(key, d, watermark=wm, agg_state=state.to_dict(), full=False)
+        mem.save_fragments(key, fragments)
+
+    if new.empty and fragments:
+        new_or_last = pd.read_parquet(fragments[-1]["path"])
+    else:
+        new_or_last = new
+    return RefreshResult(
+        path=d,
+        state=state,
+        watermark=wm,
+        fetched=int(new.shape[0]),
+        replaced=int(gone.shape[0]),
+        fragments=len(fragments),
+        preview=new_or_last.head(preview_rows),
+    )
+
+
+def cache_full(
+    mem: "MemoryStore",
+    key: str,
+    df: pd.DataFrame,
+    column: str,
+    time_cols: Sequence[str],
+    num_cols: Sequence[str],
+    cat_cols: Sequence[str],
+    layout: Optional["ParquetLayout"] = None,
+) -> Tuple[str, Optional[Dict[str, Any]]]:
+    """
+    Full refresh of an entry with a watermark column: fresh fragments (one per partition of
+    `layout`) plus the watermark and aggregates. Falls back to a plain entry when the column is
+    missing or unusable.
+    """
+    wm = watermark_of(df[column]) if column in df.columns else None
+    if wm is None:
+        return mem.cache_df(key, df, layout), None
+    wm["column"] = column
+    d = mem.reset_fragments(key, layout)
+    files = mem.write_fragment(key, df)
+    state = AggState.of(df, time_cols, num_cols, cat_cols)
+    mem.register(key, str(d), watermark=wm, agg_state=state.to_dict(), full=True)
+    mem.save_fragments(key, [fragment_meta(path, part, column, wm["kind"]) for path, part in files])
+    return str(d), wm
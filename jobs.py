@@ -0,0 +1,240 @@
+from __future__ import annotations
+
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+from memory_store import MemoryStore
+from tracing import Trace, start_trace
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+FINISHED = (SUCCEEDED, FAILED, CANCELLED)
+
+
+class JobCancelled(Exception):
+    pass
+
+
+@dataclass
+class Job:
+    job_id: str
+    kind: str
+    label: str
+    owner: str
+    meta: Dict[str, Any] = field(default_factory=dict)
+    status: str = QUEUED
+    progress: float = 0.0
+    message: str = ""
+    error: Optional[str] = None
+    created_at: datetime = field(default_factory=datetime.now)
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    result: Any = None
+    # live state the job chooses to expose while running (e.g. a LiveStreamRenderer)
+    live: Any = None
+    # timing spans of the run (tracing.Trace); also written as a Chrome trace file
+    trace: Optional[Trace] = None
+    _cancel_event: threading.Event = field(default_factory=threading.Event, repr=False)
+    _cancel_callbacks: List[Callable[[], None]] = field(default_factory=list, repr=False)
+
+    @property
+    def done(self) -> bool:
+        return self.status in FINISHED
+
+    @property
+    def elapsed_s(self) -> Optional[float]:
+        if self.started_at is None:
+            return None
+        end = self.finished_at or datetime.now()
+        return (end - self.started_at).total_seconds()
+
+    def record(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.job_id,
+            "kind": self.kind,
+            "label": self.label,
+            "owner": self.owner,
+            "status": self.status,
+            "progress": self.progress,
+            "message": self.message,
+            "error": self.error,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class JobContext:
+    """Handed to job functions: progress reporting + cooperative cancellation."""
+
+    def __init__(self, job: Job) -> None:
+        self._job = job
+
+    @property
+    def job_id(self) -> str:
+        return self._job.job_id
+
+    @property
+    def cancelled(self) -> bool:
+        return self._job._cancel_event.is_set()
+
+    def check_cancelled(self) -> None:
+        if self.cancelled:
+            raise JobCancelled(f"Job {self._job.job_id} cancelled")
+
+    def progress(self, fraction: float, message: str = "") -> None:
+        self._job.progress = max(0.0, min(1.0, float(fraction)))
+        if message:
+            self._job.message = message
+
+    def on_cancel(self, callback: Callable[[], None]) -> None:
+        """Register e.g. CancellationToken.cancel so cancel() reaches in-flight model calls."""
+        self._job._cancel_callbacks.append(callback)
+        if self.cancelled:
+            callback()
+
+    def set_live(self, obj: Any) -> None:
+        self._job.live = obj
+
+
+class JobManager:
+    """
+    Process-wide background job runner (thread pool).
+    Jobs survive Streamlit reruns; the UI polls `get()` / `jobs_for()` instead of blocking.
+    Status transitions and results are persisted in the cache store (MemoryStore).
+    """
+
+    def __init__(self, store: Optional[MemoryStore] = None, max_workers: Optional[int] = None) -> None:
+        self.store = store
+        self._pool = ThreadPoolExecutor(
+            max_workers=max_workers or int(os.getenv("JOB_WORKERS", "4")),
+            thread_name_prefix="job",
+        )
+        self._jobs: Dict[str, Job] = {}
+        self._lock = threading.Lock()
+
+    def submit(
+        self,
+        kind: str,
+        fn: Callable[..., Any],
+        *args: Any,
+        owner: str = "",
+        label: str = "",
+        meta: Optional[Dict[str, Any]] = None,
+        **kwargs: Any,
+    ) -> str:
+        """Run fn(ctx, *args, **kwargs) in the background; returns the job id."""
+        job = Job(job_id=uuid.uuid4().hex[:12], kind=kind, label=label or kind, owner=owner, meta=meta or {})
+        with self._lock:
+            self._jobs[job.job_id] = job
+        self._persist(job)
+        self._pool.submit(self._run, job, fn, args, kwargs)
+        return job.job_id
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self._jobs.get(job_id)
+
+    def jobs_for(self, owner: str) -> List[Job]:
+        with self._lock:
+            jobs = [j for j in self._jobs.values() if j.owner == owner]
+        return sorted(jobs, key=lambda j: j.created_at)
+
+    def cancel(self, job_id: str) -> bool:
+        job = self._jobs.get(job_id)
+        if job is None or job.done:
+            return False
+        with self._lock:
+            job._cancel_event.set()
+            queued = job.status == QUEUED
+        for cb in list(job._cancel_callbacks):
+            try:
+                cb()
+            except Exception:
+                pass
+        if queued:
+            self._finish(job, CANCELLED)
+        return True
+
+    def forget(self, job_id: str) -> None:
+        """Drop a finished job from memory (its persisted record stays)."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None and job.done:
+                del self._jobs[job_id]
+
+    def shutdown(self, wait: bool = False) -> None:
+        for job in list(self._jobs.values()):
+            self.cancel(job.job_id)
+        self._pool.shutdown(wait=wait, cancel_futures=True)
+
+    def _run(self, job: Job, fn: Callable[..., Any], args: tuple, kwargs: Dict[str, Any]) -> None:
+        with self._lock:
+            if job._cancel_event.is_set():
+                return
+            job.status = RUNNING
+            job.started_at = datetime.now()
+        self._persist(job)
+        ctx = JobContext(job)
+        try:
+            with start_trace(job.label, kind=job.kind, job_id=job.job_id) as trace:
+                job.trace = trace
+                result = fn(ctx, *args, **kwargs)
+        except BaseException as e:
+            if ctx.cancelled:
+                self._finish(job, CANCELLED)
+            else:
+                job.error = f"{type(e).__name__}: {e}"
+                self._finish(job, FAILED)
+            return
+        job.result = result
+        job.progress = 1.0
+        self._finish(job, CANCELLED if ctx.cancelled else SUCCEEDED)
+
+    def _finish(self, job: Job, status: str) -> None:
+        job.status = status
+        job.finished_at = datetime.now()
+        self._persist(job)
+
+    def _persist(self, job: Job) -> None:
+        if self.store is None:
+            return
+        try:
+            self.store.save_job(job.record(), job.result if job.status == SUCCEEDED else None)
+        except Exception:
+            # persistence is best-effort; never fail the job because of it
+            pass
+
+
+_manager: Optional[JobManager] = None
+_manager_lock = threading.Lock()
+
+
+def get_job_manager() -> JobManager:
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            _manager = JobManager(MemoryStore(Path(os.getenv("CACHE_DIR", "./cache"))))
+        return _manager
+
+
+def wait_for(job_id: str, timeout: Optional[float] = None, poll_s: float = 0.05) -> Optional[Job]:
+    """Blocking helper for scripts/tests."""
+    mgr = get_job_manager()
+    t0 = time.monotonic()
+    while True:
+        job = mgr.get(job_id)
+        if job is None or job.done:
+            return job
+        if timeout is not None and time.monotonic() - t0 > timeout:
+            return job
+        time.sleep(poll_s)
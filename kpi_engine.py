@@ -6,6 +6,8 @@ from typing import Any, Dict, List, Optional, Tuple
 
 import pandas as pd
 
+from tracing import traced
+
 
 @dataclass
 class KPIComputed:
@@ -71,6 +73,7 @@ def _safe_count_rows(df: pd.DataFrame) -> int:
     return int(df.shape[0])
 
 
+@traced("kpi_engine.compute_kpis_from_plan", cat="kpi")
 def compute_kpis_from_plan(
     plan: Dict[str, Any],
     datasets: Dict[str, pd.DataFrame],
@@ -162,4 +165,35 @@ def compute_kpis_from_plan(
 
         results[ds_name] = out
 
-    return results
\ No newline at end of file
+    return results
+
+def compute_kpis_from_state(plan: Dict[str, Any], state: Any) -> Optional[List[KPIComputed]]:
+    """
+    Plan KPIs of one dataset from its mergeable aggregates (incremental.AggState) without reading
+    the rows. Only formula hints that decompose qualify: count_rows(), and sum/avg/min/max of a
+    numeric column. Returns None if any KPI needs the data (p95, count_distinct, heuristics);
+    the caller then computes them with compute_kpis_from_plan on the full dataset.
+    """
+    hint_re = re.compile(r"^(sum|avg|min|max)\(([^)]+)\)$|^count_rows\(\)$", re.IGNORECASE)
+    out: List[KPIComputed] = []
+    for k in plan.get("kpis", []) or []:
+        k_name = str(k.get("name", "")).strip()
+        h = str(k.get("formula_hint") or "").strip()
+        m = hint_re.match(h)
+        if not m:
+            return None
+        if h.lower().startswith("count_rows"):
+            out.append(KPIComputed(name=k_name or "count_rows", value=int(state.rows), note="from formula_hint"))
+            continue
+        agg = m.group(1).lower()
+        col = m.group(2).strip().strip('"').strip("'")
+        if col not in state.num_cols or col in state.stale or not state.counts.get(col):
+            return None
+        if agg == "sum":
+            val = state.sums[col]
+        elif agg == "avg":
+            val = state.sums[col] / state.counts[col]
+        else:
+            val = (state.mins if agg == "min" else state.maxs)[col]
+        out.append(KPIComputed(name=k_name, value=float(val), note=f"from formula_hint: {h}"))
+    return out
@@ -0,0 +1,115 @@
+from __future__ import annotations
+
+import os
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+
+@dataclass
+class AgentStreamStats:
+    agent: str
+    turn_start: float
+    first_token_at: Optional[float] = None
+    last_token_at: Optional[float] = None
+    n_tokens: int = 0
+    text: List[str] = field(default_factory=list)
+    closed: bool = False
+
+    @property
+    def ttft_s(self) -> Optional[float]:
+        if self.first_token_at is None:
+            return None
+        return self.first_token_at - self.turn_start
+
+    @property
+    def tokens_per_s(self) -> Optional[float]:
+        if self.first_token_at is None or self.last_token_at is None or self.n_tokens < 2:
+            return None
+        dt = self.last_token_at - self.first_token_at
+        return (self.n_tokens - 1) / dt if dt > 0 else None
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "agent": self.agent,
+            "ttft_s": None if self.ttft_s is None else round(self.ttft_s, 2),
+            "tokens": self.n_tokens,
+            "tokens_per_s": None if self.tokens_per_s is None else round(self.tokens_per_s, 1),
+        }
+
+
+class LiveStreamRenderer:
+    """
+    Renders streamed model chunks into one placeholder per agent turn.
+    Redraws are throttled (STREAM_REDRAW_S, default 0.15s) since every Streamlit
+    element update is a websocket round-trip.
+
+    With container=None nothing is drawn; the renderer only accumulates text and
+    stats (background jobs), and the UI polls `markdown()` instead.
+    """
+
+    def __init__(self, container: Any, min_interval: Optional[float] = None) -> None:
+        self.container = container
+        self.min_interval = float(os.getenv("STREAM_REDRAW_S", "0.15")) if min_interval is None else min_interval
+        self.turns: List[AgentStreamStats] = []
+        self._placeholder: Any = None
+        self._last_draw = 0.0
+        self._turn_start = time.perf_counter()
+
+    @property
+    def current(self) -> Optional[AgentStreamStats]:
+        return self.turns[-1] if self.turns else None
+
+    def on_chunk(self, agent: str, chunk: str) -> None:
+        now = time.perf_counter()
+        cur = self.current
+        if cur is None or cur.agent != agent or cur.closed:
+            cur = AgentStreamStats(agent=agent, turn_start=self._turn_start)
+            self.turns.append(cur)
+            self._placeholder = self.container.empty() if self.container is not None else None
+            self._last_draw = 0.0
+        if cur.first_token_at is None:
+            cur.first_token_at = now
+        cur.last_token_at = now
+        cur.n_tokens += 1
+        cur.text.append(chunk)
+        if now - self._last_draw >= self.min_interval:
+            self._draw(cur)
+            self._last_draw = now
+
+    def on_message(self, agent: str, completion_tokens: Optional[int] = None) -> None:
+        """A full message arrived: final redraw, close the turn, start timing the next one."""
+        cur = self.current
+        if cur is not None and cur.agent == agent and not cur.closed:
+            if completion_tokens:
+                cur.n_tokens = int(completion_tokens)
+            self._draw(cur, final=True)
+            cur.closed = True
+            self._placeholder = None
+        self._turn_start = time.perf_counter()
+
+    def partial_text(self) -> str:
+        cur = self.current
+        return "".join(cur.text) if cur is not None and not cur.closed else ""
+
+    def stats(self) -> List[Dict[str, Any]]:
+        return [t.summary() for t in self.turns]
+
+    def markdown(self, turn: Optional[AgentStreamStats] = None) -> str:
+        cur = turn or self.current
+        if cur is None:
+            return ""
+        ttft = "…" if cur.ttft_s is None else f"{cur.ttft_s:.1f}s"
+        tps = "…" if cur.tokens_per_s is None else f"{cur.tokens_per_s:.1f}"
+        cursor = "" if cur.closed else " ▌"
+        return (
+            f"**{cur.agent}** · TTFT {ttft} · {tps} tok/s · {cur.n_tokens} tok\n\n"
+            f"```text\n{''.join(cur.text)[-4000:]}{cursor}\n```"
+        )
+
+    def _draw(self, cur: AgentStreamStats, final: bool = False) -> None:
+        if self._placeholder is None:
+            return
+        if final:
+            cur.closed = True
+        self._placeholder.markdown(self.markdown(cur))
@@ -1,10 +1,182 @@
 import os
-from typing import Optional,Type
+import threading
+from dataclasses import dataclass
+from typing import Any, AsyncGenerator, Dict, Optional, Tuple, Type, Union
 from pydantic import BaseModel
+from autogen_core.models import CreateResult, RequestUsage
 from autogen_ext.models.ollama import OllamaChatCompletionClient
 
-def make_model_client(response_format:Optional[Type[BaseModel]]=None):
-    model = os.getenv("OLLAMA_MODEL","qwen2.5:7b")
+from llm_json import StreamingJSONParser
+from model_manager import ModelManager, get_model_manager
+
+
+class _TimedAsyncClient:
+    """Wraps ollama.AsyncClient: hands every final response (or final stream chunk) to the manager."""
+
+    def __init__(self, inner: Any, manager: ModelManager) -> None:
+        self._inner = inner
+        self._manager = manager
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._inner, name)
+
+    async def chat(self, *args: Any, **kwargs: Any) -> Any:
+        resp = await self._inner.chat(*args, **kwargs)
+        if kwargs.get("stream"):
+            return self._stream(resp)
+        self._manager.record(resp)
+        return resp
+
+    async def _stream(self, stream: Any) -> AsyncGenerator[Any, None]:
+        async for chunk in stream:
+            if getattr(chunk, "done", False):
+                self._manager.record(chunk)
+            yield chunk
+
+
+class ManagedOllamaClient(OllamaChatCompletionClient):
+    """
+    OllamaChatCompletionClient configured from the ModelManager (host, num_ctx, keep_alive)
+    that reports load/eval timings of every response back to it.
+    """
+
+    def __init__(self, manager: Optional[ModelManager] = None, **kwargs: Any):
+        self._manager = manager or get_model_manager()
+        super().__init__(**{**self._manager.client_kwargs(), **kwargs})
+        self._client = _TimedAsyncClient(self._client, self._manager)
+
+    async def close(self) -> None:
+        # the base class leaves ollama's httpx client open
+        http = getattr(self._client, "_client", None)
+        if http is not None and hasattr(http, "aclose"):
+            await http.aclose()
+        await super().close()
+
+
+@dataclass
+class EstimatedUsage(RequestUsage):
+    """
+    Usage of a stream the client cut short. Ollama reports token counts only in the final chunk,
+    which an early stop never reads: completion_tokens is the number of streamed chunks (about one
+    token each) and prompt_tokens is unknown, left at 0.
+    """
+
+    estimated: bool = True
+
+
+class JSONEarlyStopOllamaClient(ManagedOllamaClient):
+    """
+    Ollama client for agents that must answer with a single JSON value.
+    Streams the response through StreamingJSONParser and closes the stream as soon
+    as the top-level JSON is complete (skipping <think> blocks), which drops the
+    HTTP connection so Ollama stops generating trailing padding / commentary.
+    """
+
+    def __init__(self, response_format: Optional[Type[BaseModel]] = None, **kwargs: Any):
+        if response_format is not None:
+            kwargs["response_format"] = response_format
+        super().__init__(**kwargs)
+        self._json_model = response_format
+        # tokens of streams cut short: the base client only counts usage from a final chunk
+        self._early_stop_tokens = 0
+
+    def _with_early_stops(self, usage: RequestUsage) -> RequestUsage:
+        return RequestUsage(
+            prompt_tokens=usage.prompt_tokens,
+            completion_tokens=usage.completion_tokens + self._early_stop_tokens,
+        )
+
+    def total_usage(self) -> RequestUsage:
+        return self._with_early_stops(super().total_usage())
+
+    def actual_usage(self) -> RequestUsage:
+        return self._with_early_stops(super().actual_usage())
+
+    async def create_stream(self, messages, **kwargs) -> AsyncGenerator[Union[str, CreateResult], None]:
+        parser = StreamingJSONParser(model=self._json_model)
+        inner = super().create_stream(messages, **kwargs)
+        n_chunks = 0
+        try:
+            async for item in inner:
+                if isinstance(item, CreateResult):
+                    # stream finished on its own: the provider's usage is in it
+                    yield item
+                    return
+                n_chunks += 1
+                yield item
+                if parser.feed(item):
+                    break
+        finally:
+            await inner.aclose()
+
+        thought = parser.buf[: parser.start].strip() if parser.start > 0 else None
+        self._early_stop_tokens += n_chunks
+        yield CreateResult(
+            finish_reason="stop",
+            content=parser.text or parser.buf,
+            usage=EstimatedUsage(prompt_tokens=0, completion_tokens=n_chunks),
+            cached=False,
+            thought=thought or None,
+        )
+
+    async def create(self, messages, **kwargs) -> CreateResult:
+        result: Optional[CreateResult] = None
+        async for item in self.create_stream(messages, **kwargs):
+            if isinstance(item, CreateResult):
+                result = item
+        assert result is not None
+        return result
+
+
+def _live_model_client(response_format:Optional[Type[BaseModel]]=None):
+    # host / model / num_ctx / keep_alive come from the ModelManager so every client shares
+    # one resident model instance on the server
     if response_format is not None:
-        return OllamaChatCompletionClient(model=model,response_format=response_format)
-    return OllamaChatCompletionClient(model=model)
+        if os.getenv("JSON_EARLY_STOP","1") == "1":
+            return JSONEarlyStopOllamaClient(response_format=response_format)
+        return ManagedOllamaClient(response_format=response_format)
+    return ManagedOllamaClient()
+
+
+def make_model_client(response_format:Optional[Type[BaseModel]]=None):
+    """
+    LLM_MODE=live (default) talks to Ollama; record also tees every response to REPLAY_DIR;
+    replay serves those recordings offline (see replay_client.py).
+    """
+    from replay_client import wrap_for_mode
+
+    return wrap_for_mode(lambda: _live_model_client(response_format), response_format=response_format)
+
+
+_shared_clients: Dict[Tuple[str, Optional[str], str, str], Any] = {}
+_shared_lock = threading.Lock()
+
+
+def get_model_client(response_format: Optional[Type[BaseModel]] = None):
+    """
+    Process-wide model client per (model, response_format), shared by every session's team.
+    Clients hold no conversation state (that lives in the agents), and all calls run on the
+    shared loop service, so one HTTP connection pool per client is reused across sessions.
+    The client is closed when the loop service shuts down.
+    """
+    from loop_service import get_loop_service
+
+    key = (
+        get_model_manager().settings.model,
+        None if response_format is None else f"{response_format.__module__}.{response_format.__qualname__}",
+        os.getenv("JSON_EARLY_STOP", "1"),
+        os.getenv("LLM_MODE", "live"),
+    )
+    with _shared_lock:
+        client = _shared_clients.get(key)
+        if client is None:
+            client = make_model_client(response_format=response_format)
+            _shared_clients[key] = client
+            get_loop_service().on_shutdown(client.close)
+        return client
+
+
+def reset_shared_clients() -> None:
+    """Forget shared clients (e.g. after changing OLLAMA_MODEL); already-built teams keep theirs."""
+    with _shared_lock:
+        _shared_clients.clear()
@@ -2,10 +2,12 @@ from __future__ import annotations
 
 import json
 import re
-from typing import Any, Type, TypeVar
+from typing import Any, Dict, List, Optional, Type, TypeVar
 
 from pydantic import BaseModel
 
+from tracing import span
+
 T = TypeVar("T", bound=BaseModel)
 
 
@@ -53,16 +55,288 @@ def parse_llm_json(text: str, model: Type[T]) -> T:
     Strict: returns a Pydantic model instance.
     Robust: strips <think>, extracts JSON block if present.
     """
-    candidate = _extract_json_candidate(text)
+    with span("llm_json.parse", cat="parse", model=model.__name__, chars=len(text)):
+        candidate = _extract_json_candidate(text)
+
+        if not candidate or candidate.strip() == "":
+            raise ValueError("Invalid JSON from model: empty response")
+
+        try:
+            data = json.loads(candidate)
+        except Exception as e:
+            # Helpful debug snippet
+            snippet = candidate[:500].replace("\n", "\\n")
+            raise ValueError(f"Invalid JSON from model: {e}. Candidate starts with: {snippet}") from e
+
+        return model.model_validate(data)
+
+# ---------- incremental (streaming) parsing ----------
+
+_THINK_OPEN = "<think>"
+_THINK_CLOSE = "</think>"
+_CLOSERS = {"{": "}", "[": "]"}
+
+
+class JSONStreamError(ValueError):
+    """Invalid/incomplete JSON in a model stream; `pos` is the absolute offset in the stream."""
+
+    def __init__(self, msg: str, text: str, pos: int) -> None:
+        self.pos = pos
+        self.lineno = text.count("\n", 0, pos) + 1
+        self.colno = pos - text.rfind("\n", 0, pos)
+        super().__init__(f"{msg}: line {self.lineno} column {self.colno} (char {pos})")
+
+
+class StreamingJSONParser:
+    """
+    Incremental JSON extractor for token streams.
+
+    Feed chunks as they arrive; `feed()` returns True as soon as the first complete
+    top-level object/array outside <think>...</think> has been seen, so the caller
+    can stop generation right there. Prose, code fences and <think> blocks before
+    the JSON are skipped (tags may be split across chunks).
+
+    If `model` is given the value is validated when complete; a validation failure
+    is kept in `.error` (generation is still over, the JSON is final).
+    With strict=False (default) a `{`/`[` that does not lead to valid JSON is
+    treated as prose and scanning resumes after it; with strict=True the first
+    invalid candidate ends the parse (done=True, `.error` set).
+    """
+
+    def __init__(self, model: Optional[Type[BaseModel]] = None, strict: bool = False) -> None:
+        self.model = model
+        self.strict = strict
+        self.buf = ""
+        self.done = False
+        self.value: Any = None
+        self.parsed: Optional[BaseModel] = None
+        self.error: Optional[Exception] = None
+        self.start = -1  # offset of the current JSON candidate
+        self.end = -1  # offset just past the completed JSON value
+        self._i = 0
+        self._in_think = False
+        self._stack: List[str] = []
+        self._in_str = False
+        self._esc = False
+
+    @property
+    def text(self) -> str:
+        """The completed JSON text (empty until done)."""
+        return self.buf[self.start : self.end] if self.end != -1 else ""
+
+    def feed(self, chunk: str) -> bool:
+        if self.done:
+            return True
+        self.buf += chunk or ""
+        self._scan()
+        return self.done
+
+    def close(self) -> Any:
+        """End of stream: return the parsed value or raise JSONStreamError with position."""
+        if self.done:
+            if self.error is not None:
+                raise self.error
+            return self.parsed if self.parsed is not None else self.value
+        if self.error is not None:
+            raise self.error
+        if self.start == -1:
+            raise JSONStreamError("No JSON value found in model output", self.buf, len(self.buf))
+        expecting = "".join(reversed(self._stack))
+        raise JSONStreamError(
+            f"Unexpected end of stream inside JSON (expecting {expecting!r})", self.buf, len(self.buf)
+        )
+
+    def _reset_candidate(self) -> None:
+        self._i = self.start + 1
+        self.start = -1
+        self._stack = []
+        self._in_str = False
+        self._esc = False
+
+    def _scan(self) -> None:
+        buf = self.buf
+        n = len(buf)
+        i = self._i
+        while i < n:
+            if self.start == -1:
+                # --- outside JSON: skip prose and <think> blocks ---
+                if self._in_think:
+                    j = buf[i:].lower().find(_THINK_CLOSE)
+                    if j != -1:
+                        j += i
+                    if j == -1:
+                        # keep a possible partial closing tag for the next chunk
+                        i = max(i, n - len(_THINK_CLOSE) + 1)
+                        break
+                    i = j + len(_THINK_CLOSE)
+                    self._in_think = False
+                    continue
+                ch = buf[i]
+                if ch == "<":
+                    head = buf[i : i + len(_THINK_OPEN)].lower()
+                    if head == _THINK_OPEN:
+                        self._in_think = True
+                        i += len(_THINK_OPEN)
+                        continue
+                    if _THINK_OPEN.startswith(head):
+                        break  # partial tag, wait for more input
+                elif ch in _CLOSERS:
+                    self.start = i
+                    self._stack = [_CLOSERS[ch]]
+                i += 1
+                continue
+
+            # --- inside JSON: track strings and nesting ---
+            ch = buf[i]
+            if self._in_str:
+                if self._esc:
+                    self._esc = False
+                elif ch == "\\":
+                    self._esc = True
+                elif ch == '"':
+                    self._in_str = False
+            elif ch == '"':
+                self._in_str = True
+            elif ch in _CLOSERS:
+                self._stack.append(_CLOSERS[ch])
+            elif ch in "}]":
+                if ch != self._stack[-1]:
+                    self.error = JSONStreamError(f"Mismatched {ch!r}, expecting {self._stack[-1]!r}", buf, i)
+                    if self.strict:
+                        self.done = True
+                        self._i = i
+                        return
+                    self._reset_candidate()
+                    i = self._i
+                    continue
+                self._stack.pop()
+                if not self._stack:
+                    if self._complete(i + 1):
+                        self._i = i + 1
+                        return
+                    i = self._i
+                    continue
+            i += 1
+        self._i = i
+
+    def _complete(self, end: int) -> bool:
+        candidate = self.buf[self.start : end]
+        try:
+            value = json.loads(candidate)
+        except json.JSONDecodeError as e:
+            self.error = JSONStreamError(f"Invalid JSON ({e.msg})", self.buf, self.start + e.pos)
+            if self.strict:
+                self.done = True
+                return True
+            self._reset_candidate()
+            return False
+
+        self.value = value
+        self.end = end
+        self.done = True
+        self.error = None
+        if self.model is not None:
+            try:
+                self.parsed = self.model.model_validate(value)
+            except Exception as e:
+                self.error = e
+        return True
+
+
+# ---------- fuzzing ----------
+
+def fuzz_stream_parser(iterations: int = 20_000, seed: int = 42) -> Dict[str, Any]:
+    """
+    Random documents fed to StreamingJSONParser in random chunk splits, checked against json.loads:
+    valid documents (with prose, <think> and fences around them) must parse to the same value and
+    stop within the chunk that completes them, truncated ones must never yield a value, and garbage
+    must never crash or yield anything json.loads disagrees with. Raises AssertionError on the
+    first mismatch; returns counts.
+    """
+    import random
+    import string
+    import time
+
+    rnd = random.Random(seed)
+    noisy = string.printable + '{}[]"\\<>'
+
+    def value(depth: int = 0) -> Any:
+        k = rnd.random()
+        if depth > 3 or k < 0.3:
+            text = "".join(rnd.choice(noisy) for _ in range(rnd.randint(0, 12)))
+            return rnd.choice([rnd.randint(-1000, 1000), rnd.random(), True, False, None, text])
+        if k < 0.65:
+            keys = ("".join(rnd.choice(string.ascii_letters + '{}"\\') for _ in range(rnd.randint(1, 6))) for _ in range(rnd.randint(0, 4)))
+            return {key: value(depth + 1) for key in keys}
+        return [value(depth + 1) for _ in range(rnd.randint(0, 4))]
+
+    def chunks(s: str) -> List[str]:
+        out, i = [], 0
+        while i < len(s):
+            n = rnd.randint(1, 9)
+            out.append(s[i : i + n])
+            i += n
+        return out
+
+    prefixes = ["", "Sure! ", "<think>maybe {a: [} here</think>", "<THINK>x}</THINK>\n```json\n", "Here {is} prose "]
+    suffixes = ["", "\n```", "   \n" * 50, " trailing {"]
+    stats: Dict[str, Any] = {"documents": 0, "truncations": 0, "garbage": 0, "chars_after_stop": 0}
+    t0 = time.perf_counter()
+    for _ in range(iterations):
+        v = value()
+        if not isinstance(v, (dict, list)):
+            v = {"v": v}
+        doc = json.dumps(v, indent=rnd.choice([None, 1]), ensure_ascii=rnd.random() < 0.5)
+        head, tail = rnd.choice(prefixes), rnd.choice(suffixes)
+        stream = head + doc + tail
+
+        # valid: same value as json.loads, and the parser stops within the chunk that completes it
+        p, fed = StreamingJSONParser(), 0
+        for c in chunks(stream):
+            fed += len(c)
+            if p.feed(c):
+                break
+        assert p.done and p.error is None, stream
+        assert p.value == json.loads(doc) and p.text == doc, stream
+        assert fed < len(head) + len(doc) + 9, stream
+        stats["documents"] += 1
+        stats["chars_after_stop"] += fed - len(head) - len(doc)
+
+        # truncated: never a value, and close() points inside what was fed
+        cut = rnd.randint(0, len(head) + len(doc) - 1)
+        q = StreamingJSONParser()
+        for c in chunks(stream[:cut]):
+            q.feed(c)
+        assert not q.done, stream[:cut]
+        try:
+            q.close()
+            raise AssertionError(f"no error for truncated {stream[:cut]!r}")
+        except JSONStreamError as e:
+            assert 0 <= e.pos <= cut, (stream[:cut], e.pos)
+        stats["truncations"] += 1
+
+        # garbage: whatever it finds must be what json.loads makes of that span; it never crashes
+        junk = "".join(rnd.choice(['{', '}', '[', ']', '"', '\\', '<think>', '</think>', 'a', ':', ',', ' ', '1']) for _ in range(rnd.randint(0, 60)))
+        z = StreamingJSONParser(strict=rnd.random() < 0.5)
+        for c in chunks(junk):
+            z.feed(c)
+        if z.done and z.error is None:
+            assert z.value == json.loads(z.text), junk
+        try:
+            z.close()
+        except JSONStreamError:
+            pass
+        stats["garbage"] += 1
+
+    stats["s"] = round(time.perf_counter() - t0, 2)
+    return stats
 
-    if not candidate or candidate.strip() == "":
-        raise ValueError("Invalid JSON from model: empty response")
 
-    try:
-        data = json.loads(candidate)
-    except Exception as e:
-        # Helpful debug snippet
-        snippet = candidate[:500].replace("\n", "\\n")
-        raise ValueError(f"Invalid JSON from model: {e}. Candidate starts with: {snippet}") from e
+if __name__ == "__main__":
+    import argparse
 
-    return model.model_validate(data)
\ No newline at end of file
+    ap = argparse.ArgumentParser(description="Fuzz StreamingJSONParser against json.loads over random chunk splits")
+    ap.add_argument("--iterations", type=int, default=20_000)
+    ap.add_argument("--seed", type=int, default=42)
+    args = ap.parse_args()
+    print(json.dumps(fuzz_stream_parser(args.iterations, args.seed)))
@@ -0,0 +1,300 @@
+from __future__ import annotations
+
+import json
+import os
+import time
+from collections import OrderedDict
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+
+@dataclass
+class LogEntry:
+    id: int
+    step: str
+    agent: str
+    size: int
+    ts: float
+    has_artifacts: bool = False
+    is_html: bool = False
+    inline: Optional[str] = None  # small contents stay in memory; large ones live on disk
+
+
+class LogStore:
+    """
+    Agent-output log indexed by step and agent.
+
+    - latest entry per (step, agent) and per step is O(1); agent list per step is a set
+    - contents larger than `inline_max_chars` are spilled to disk and loaded lazily
+      (small LRU), so full HTML dashboards / prompt echoes don't sit in session memory
+    - retention: at most `max_per_step` entries per step (oldest dropped, files deleted)
+    - with a `root` dir the log is persisted (index.jsonl + spilled files) and reloaded,
+      so it survives browser reloads
+    """
+
+    def __init__(
+        self,
+        root: Optional[Path] = None,
+        max_per_step: Optional[int] = None,
+        inline_max_chars: Optional[int] = None,
+        cache_entries: int = 8,
+    ) -> None:
+        self.root = Path(root) if root is not None else None
+        self.max_per_step = max_per_step or int(os.getenv("LOG_MAX_PER_STEP", "50"))
+        self.inline_max_chars = inline_max_chars or int(os.getenv("LOG_INLINE_MAX_CHARS", "4000"))
+        self._cache_entries = cache_entries
+        self._cache: "OrderedDict[int, str]" = OrderedDict()
+
+        self._entries: Dict[int, LogEntry] = {}
+        self._by_step: Dict[str, List[int]] = {}
+        self._latest: Dict[Tuple[str, str], int] = {}
+        self._latest_artifacts: Dict[str, int] = {}
+        self._latest_html: Optional[int] = None
+        self._next_id = 0
+
+        if self.root is not None:
+            self.root.mkdir(parents=True, exist_ok=True)
+            self._load()
+
+    # ---------- write ----------
+
+    def append(self, step: str, agent: str, content: str) -> LogEntry:
+        content = str(content)
+        e = LogEntry(
+            id=self._next_id,
+            step=step,
+            agent=agent,
+            size=len(content),
+            ts=time.time(),
+            has_artifacts='"artifacts"' in content or "'artifacts'" in content,
+            is_html=agent == "dashboard_builder" and "<html" in content.lower(),
+        )
+        self._next_id += 1
+
+        if e.size <= self.inline_max_chars or self.root is None:
+            e.inline = content
+        else:
+            self._content_path(e.id).write_text(content, encoding="utf-8")
+            self._remember(e.id, content)
+
+        self._index(e)
+        if self.root is not None:
+            with (self.root / "index.jsonl").open("a", encoding="utf-8") as f:
+                f.write(json.dumps(asdict(e)) + "\n")
+
+        if len(self._by_step[step]) > self.max_per_step:
+            self._evict(step)
+        return e
+
+    def clear(self) -> None:
+        for eid in list(self._entries):
+            self._drop_file(eid)
+        self._entries.clear()
+        self._by_step.clear()
+        self._latest.clear()
+        self._latest_artifacts.clear()
+        self._latest_html = None
+        self._cache.clear()
+        if self.root is not None:
+            (self.root / "index.jsonl").write_text("", encoding="utf-8")
+
+    # ---------- read ----------
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def entries(self, step: str) -> List[LogEntry]:
+        return [self._entries[i] for i in self._by_step.get(step, [])]
+
+    def agents(self, step: str) -> List[str]:
+        return sorted({a for (s, a) in self._latest if s == step})
+
+    def content(self, entry: LogEntry) -> str:
+        if entry.inline is not None:
+            return entry.inline
+        cached = self._cache.get(entry.id)
+        if cached is not None:
+            self._cache.move_to_end(entry.id)
+            return cached
+        text = self._content_path(entry.id).read_text(encoding="utf-8")
+        self._remember(entry.id, text)
+        return text
+
+    def latest(self, step: str, agent: Optional[str] = None) -> Optional[LogEntry]:
+        if agent is None:
+            ids = self._by_step.get(step)
+            return self._entries[ids[-1]] if ids else None
+        eid = self._latest.get((step, agent))
+        return self._entries[eid] if eid is not None else None
+
+    def latest_matching_agent(self, step: str, needle: str) -> Optional[LogEntry]:
+        """Latest entry in `step` whose agent equals or contains `needle` (case-insensitive)."""
+        needle = needle.strip().lower()
+        best: Optional[int] = None
+        for (s, a), eid in self._latest.items():
+            if s != step:
+                continue
+            al = a.strip().lower()
+            if (al == needle or needle in al) and (best is None or eid > best):
+                best = eid
+        return self._entries[best] if best is not None else None
+
+    def latest_artifacts(self, step: str) -> Optional[LogEntry]:
+        eid = self._latest_artifacts.get(step)
+        return self._entries[eid] if eid is not None else None
+
+    def latest_html(self) -> Optional[LogEntry]:
+        return self._entries[self._latest_html] if self._latest_html is not None else None
+
+    # ---------- internals ----------
+
+    def _index(self, e: LogEntry) -> None:
+        self._entries[e.id] = e
+        self._by_step.setdefault(e.step, []).append(e.id)
+        self._latest[(e.step, e.agent)] = e.id
+        if e.has_artifacts:
+            self._latest_artifacts[e.step] = e.id
+        if e.is_html:
+            self._latest_html = e.id
+
+    def _reindex(self) -> None:
+        entries = sorted(self._entries.values(), key=lambda x: x.id)
+        self._entries.clear()
+        self._by_step.clear()
+        self._latest.clear()
+        self._latest_artifacts.clear()
+        self._latest_html = None
+        for e in entries:
+            self._index(e)
+
+    def _evict(self, step: str) -> None:
+        ids = self._by_step[step]
+        for eid in ids[: len(ids) - self.max_per_step]:
+            self._entries.pop(eid, None)
+            self._cache.pop(eid, None)
+            self._drop_file(eid)
+        self._reindex()
+        self._rewrite_index()
+
+    def _remember(self, eid: int, text: str) -> None:
+        self._cache[eid] = text
+        self._cache.move_to_end(eid)
+        while len(self._cache) > self._cache_entries:
+            self._cache.popitem(last=False)
+
+    def _content_path(self, eid: int) -> Path:
+        assert self.root is not None
+        return self.root / f"{eid}.txt"
+
+    def _drop_file(self, eid: int) -> None:
+        if self.root is None:
+            return
+        try:
+            self._content_path(eid).unlink()
+        except FileNotFoundError:
+            pass
+
+    def _rewrite_index(self) -> None:
+        if self.root is None:
+            return
+        tmp = self.root / "index.jsonl.tmp"
+        with tmp.open("w", encoding="utf-8") as f:
+            for eid in sorted(self._entries):
+                f.write(json.dumps(asdict(self._entries[eid])) + "\n")
+        tmp.replace(self.root / "index.jsonl")
+
+    def _load(self) -> None:
+        assert self.root is not None
+        path = self.root / "index.jsonl"
+        if not path.exists():
+            return
+        for line in path.read_text(encoding="utf-8").splitlines():
+            if not line.strip():
+                continue
+            try:
+                e = LogEntry(**json.loads(line))
+            except (json.JSONDecodeError, TypeError):
+                continue  # partial last line after a crash
+            if e.inline is None and not self._content_path(e.id).exists():
+                continue
+            self._index(e)
+            self._next_id = max(self._next_id, e.id + 1)
+        for step in list(self._by_step):
+            if len(self._by_step[step]) > self.max_per_step:
+                self._evict(step)
+
+
+# ---------- benchmark: rerun cost of list scans vs. the indexed store ----------
+
+def _bench_list_ops(logs: List[Dict[str, Any]], steps: List[str]) -> None:
+    from ui_formatter import beautify_step
+
+    for step in steps:  # render_logs
+        for it in [x for x in logs if x["step"] == step]:
+            beautify_step(step, it["agent"], it["content"])
+    for it in reversed(logs):  # latest_agent_output(TASK_4)
+        if it["step"] == "TASK_4_INTERMEDIATE_VIEWS" and '"artifacts"' in str(it["content"]):
+            break
+    sorted({x["agent"] for x in logs if x["step"] == "TASK_4_INTERMEDIATE_VIEWS"})
+    for it in reversed(logs):  # dashboard html lookup
+        if it["agent"] == "dashboard_builder" and "<html" in it["content"].lower():
+            break
+
+
+def _bench_store_ops(store: LogStore, steps: List[str]) -> None:
+    from ui_formatter import beautify_step
+
+    active = steps[0]  # only the active tab renders contents
+    for e in store.entries(active):
+        beautify_step(active, e.agent, store.content(e))
+    store.latest_artifacts("TASK_4_INTERMEDIATE_VIEWS")
+    store.agents("TASK_4_INTERMEDIATE_VIEWS")
+    store.latest_html()
+
+
+def benchmark(iterations: int = 10, runs_per_step: int = 5) -> Dict[str, float]:
+    import tempfile
+
+    from prompts import STEPS
+
+    steps = [k for k, _ in STEPS]
+    agents = ["user", "planner", "schema_profiler", "table_describer", "sql_builder", "python_analyst", "dashboard_builder", "reviewer"]
+    echo = "x" * 60000
+    html = "<html>" + ("<div>chart</div>" * 5000) + "</html>"
+
+    logs: List[Dict[str, Any]] = []
+    with tempfile.TemporaryDirectory() as tmp:
+        store = LogStore(Path(tmp), max_per_step=10_000)
+        for step in steps:
+            for _ in range(runs_per_step):
+                for a in agents:
+                    c = echo if a == "user" else html if a == "dashboard_builder" else '{"artifacts": []} ' * 50
+                    logs.append({"step": step, "agent": a, "content": c})
+                    store.append(step, a, c)
+
+        t0 = time.perf_counter()
+        for _ in range(iterations):
+            _bench_list_ops(logs, steps)
+        list_ms = (time.perf_counter() - t0) / iterations * 1000
+
+        t0 = time.perf_counter()
+        for _ in range(iterations):
+            _bench_store_ops(store, steps)
+        store_ms = (time.perf_counter() - t0) / iterations * 1000
+
+        list_bytes = sum(len(x["content"]) for x in logs)
+        store_bytes = sum(len(e.inline or "") for e in store._entries.values()) + sum(len(v) for v in store._cache.values())
+
+    return {
+        "entries": float(len(logs)),
+        "list_rerun_ms": list_ms,
+        "store_rerun_ms": store_ms,
+        "list_resident_mb": list_bytes / 1e6,
+        "store_resident_mb": store_bytes / 1e6,
+    }
+
+
+if __name__ == "__main__":
+    for key, val in benchmark().items():
+        print(f"{key}: {val:.3f}")
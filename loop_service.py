@@ -0,0 +1,128 @@
+from __future__ import annotations
+
+import asyncio
+import atexit
+import concurrent.futures
+import contextvars
+import threading
+from typing import Any, Awaitable, Callable, List, Optional
+
+
+async def _in_context(ctx: contextvars.Context, coro: Awaitable[Any]) -> Any:
+    # the task runs in a copy of the loop thread's context; carry the submitter's values over
+    for var, value in ctx.items():
+        var.set(value)
+    return await coro
+
+
+class LoopService:
+    """
+    One long-lived asyncio event loop on a daemon thread, shared by the whole process.
+
+    Every coroutine (team runs, model calls) is scheduled here via `submit()`, so async
+    clients bound to a loop, like httpx connection pools inside the Ollama client,
+    keep their connections alive across calls instead of being rebuilt per loop.
+    """
+
+    def __init__(self, name: str = "async-loop") -> None:
+        self._loop = asyncio.new_event_loop()
+        self._ready = threading.Event()
+        self._cleanups: List[Callable[[], Awaitable[Any]]] = []
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+        self._ready.wait()
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        return self._loop
+
+    @property
+    def running(self) -> bool:
+        return not self._closed and self._thread.is_alive()
+
+    def _run(self) -> None:
+        asyncio.set_event_loop(self._loop)
+        self._loop.call_soon(self._ready.set)
+        self._loop.run_forever()
+
+    def in_loop_thread(self) -> bool:
+        return threading.current_thread() is self._thread
+
+    def submit(self, coro: Awaitable[Any]) -> "concurrent.futures.Future[Any]":
+        """
+        Thread-safe: schedule `coro` on the loop; returns a concurrent.futures.Future.
+        The caller's context variables (e.g. the active trace) are visible inside `coro`.
+        """
+        if self._closed:
+            raise RuntimeError("LoopService is shut down")
+        return asyncio.run_coroutine_threadsafe(_in_context(contextvars.copy_context(), coro), self._loop)
+
+    def run(self, coro: Awaitable[Any], timeout: Optional[float] = None) -> Any:
+        """Blocking submit(): returns the result or re-raises the coroutine's exception."""
+        if self.in_loop_thread():
+            raise RuntimeError("LoopService.run() called from the loop thread; await the coroutine instead")
+        fut = self.submit(coro)
+        try:
+            return fut.result(timeout=timeout)
+        except concurrent.futures.TimeoutError:
+            fut.cancel()
+            raise
+
+    def call_soon(self, fn: Callable[..., Any], *args: Any) -> None:
+        """Thread-safe: run a plain callback on the loop (e.g. CancellationToken.cancel)."""
+        self._loop.call_soon_threadsafe(fn, *args)
+
+    def on_shutdown(self, cleanup: Callable[[], Awaitable[Any]]) -> None:
+        """Register an async cleanup (e.g. closing an HTTP client) to run before the loop stops."""
+        self._cleanups.append(cleanup)
+
+    def shutdown(self, timeout: float = 5.0) -> None:
+        if self._closed:
+            return
+        self._closed = True
+
+        async def _drain() -> None:
+            for cleanup in self._cleanups:
+                try:
+                    await cleanup()
+                except Exception:
+                    pass
+            tasks = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+            for t in tasks:
+                t.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await self._loop.shutdown_asyncgens()
+
+        if self._thread.is_alive():
+            try:
+                asyncio.run_coroutine_threadsafe(_drain(), self._loop).result(timeout=timeout)
+            except Exception:
+                pass
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join(timeout=timeout)
+        if not self._loop.is_running():
+            self._loop.close()
+
+
+_service: Optional[LoopService] = None
+_service_lock = threading.Lock()
+
+
+def get_loop_service() -> LoopService:
+    global _service
+    with _service_lock:
+        if _service is None or not _service.running:
+            _service = LoopService()
+        return _service
+
+
+def shutdown_loop_service() -> None:
+    global _service
+    with _service_lock:
+        if _service is not None:
+            _service.shutdown()
+            _service = None
+
+
+atexit.register(shutdown_loop_service)
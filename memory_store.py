@@ -1,20 +1,52 @@
 from __future__ import annotations
 import json
+import os
+import shutil
+import threading
+import time
+from contextlib import contextmanager
 from dataclasses import dataclass
 from datetime import date, datetime
 from pathlib import Path
-from typing import Any, Dict, Optional
-import duckdb
-import pandas as pd
+from typing import TYPE_CHECKING, Any, Dict, Iterator, List, Optional, Tuple
+
+from parquet_layout import ParquetLayout, load_layout, read_dataset, save_layout, scan_sql, write_partitioned, write_table
+from tracing import span
+
+if TYPE_CHECKING:  # duckdb/pandas are imported on first use to keep app start-up light
+    import duckdb
+    import pandas as pd
+
+
+# DuckDB lets one process at a time open a database file; the app and a scheduled refresh
+# (refresh.py) share cache.duckdb, so a connect that hits the other process's lock waits a bit
+LOCK_WAIT_S = float(os.getenv("MEMORY_LOCK_WAIT_S", "15"))
+JSON_LOCK_STALE_S = 60.0  # a read-modify-write takes milliseconds: an older lock file is a dead writer's
+
+
+def _connect(path: Path) -> "duckdb.DuckDBPyConnection":
+    import duckdb
+
+    deadline = time.monotonic() + LOCK_WAIT_S
+    delay = 0.02
+    while True:
+        try:
+            return duckdb.connect(str(path))
+        except duckdb.IOException as e:
+            if "lock" not in str(e).lower() or time.monotonic() >= deadline:
+                raise
+            time.sleep(delay)
+            delay = min(delay * 2, 0.5)
+
+
+def parquet_scan(path: str | Path) -> str:
+    """DuckDB table expression for a cached dataset: one Parquet file or a directory of fragments."""
+    return scan_sql(path)
 
 
 def _to_jsonable(obj: Any) -> Any:
     """Convert non-JSON-serializable objects into JSON-friendly values."""
-    # pandas Timestamp
-    if isinstance(obj, pd.Timestamp):
-        return obj.isoformat()
-
-    # python datetime/date
+    # python datetime/date (pandas Timestamp is a datetime subclass)
     if isinstance(obj, (datetime, date)):
         return obj.isoformat()
 
@@ -54,7 +86,7 @@ class MemoryStore:
         self._init_duckdb()
 
     def _init_duckdb(self) -> None:
-        con = duckdb.connect(str(self.duckdb_path))
+        con = _connect(self.duckdb_path)
         con.execute(
             """
             CREATE TABLE IF NOT EXISTS cached_queries (
@@ -64,6 +96,63 @@ class MemoryStore:
             )
             """
         )
+        # incremental refresh (see incremental.py): high-water mark + mergeable aggregates per entry
+        for col, typ in (
+            ("watermark", "VARCHAR"),
+            ("agg_state", "VARCHAR"),
+            ("full_at", "TIMESTAMP"),
+            ("refreshed_at", "TIMESTAMP"),
+        ):
+            con.execute(f"ALTER TABLE cached_queries ADD COLUMN IF NOT EXISTS {col} {typ}")
+        con.execute(
+            """
+            CREATE TABLE IF NOT EXISTS cache_fragments (
+              cache_key VARCHAR,
+              path VARCHAR,
+              n_rows BIGINT,
+              wm_min VARCHAR,
+              wm_max VARCHAR,
+              PRIMARY KEY (cache_key, path)
+            )
+            """
+        )
+        con.execute(
+            """
+            CREATE TABLE IF NOT EXISTS jobs (
+              job_id VARCHAR PRIMARY KEY,
+              kind VARCHAR,
+              label VARCHAR,
+              owner VARCHAR,
+              status VARCHAR,
+              progress DOUBLE,
+              message VARCHAR,
+              error VARCHAR,
+              created_at TIMESTAMP,
+              finished_at TIMESTAMP,
+              result_path VARCHAR
+            )
+            """
+        )
+        con.execute(
+            """
+            CREATE TABLE IF NOT EXISTS agent_usage (
+              run_id VARCHAR,
+              seq INTEGER,
+              step VARCHAR,
+              agent VARCHAR,
+              prompt_tokens INTEGER,
+              completion_tokens INTEGER,
+              gen_s DOUBLE,
+              ttft_s DOUBLE,
+              tokens_per_s DOUBLE,
+              chars INTEGER,
+              cancelled BOOLEAN,
+              cost DOUBLE,
+              created_at TIMESTAMP,
+              PRIMARY KEY (run_id, seq)
+            )
+            """
+        )
         con.close()
 
     def load_json(self) -> Dict[str, Any]:
@@ -76,33 +165,309 @@ class MemoryStore:
             return {}
 
     def save_json(self, data: Dict[str, Any]) -> None:
-        self.json_path.write_text(safe_json_dumps(data, indent=2), encoding="utf-8")
+        with span("memory.save_json", cat="io") as sp:
+            text = safe_json_dumps(data, indent=2)
+            # write-then-rename: the app and refresh.py may both save, readers never see half a file
+            tmp = self.json_path.with_name(f".{self.json_path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+            tmp.write_text(text, encoding="utf-8")
+            os.replace(tmp, self.json_path)
+            sp.set(bytes=len(text))
 
-    def cache_df(self, key: str, df: pd.DataFrame) -> str:
+    @contextmanager
+    def edit_json(self) -> Iterator[Dict[str, Any]]:
+        """
+        load_json -> modify in place -> save_json, under an exclusive lock file next to memory.json
+        (created with O_EXCL, as refresh.lock is), so the app and refresh.py never drop each
+        other's updates. Nothing is saved if the block raises. Keep the block short.
+        """
+        lock = self.json_path.with_name(f"{self.json_path.name}.lock")
+        deadline = time.monotonic() + LOCK_WAIT_S
+        delay = 0.005
+        with span("memory.edit_json", cat="io"):
+            while True:
+                try:
+                    os.close(os.open(lock, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644))
+                    break
+                except FileExistsError:
+                    try:
+                        if time.time() - lock.stat().st_mtime > JSON_LOCK_STALE_S:
+                            lock.unlink()
+                            continue
+                    except FileNotFoundError:
+                        continue
+                    if time.monotonic() >= deadline:
+                        raise TimeoutError(f"{lock} held for more than {LOCK_WAIT_S:g}s")
+                    time.sleep(delay)
+                    delay = min(delay * 2, 0.1)
+            try:
+                data = self.load_json()
+                yield data
+                self.save_json(data)
+            finally:
+                try:
+                    lock.unlink()
+                except FileNotFoundError:
+                    pass
+
+    def cache_df(self, key: str, df: pd.DataFrame, layout: Optional[ParquetLayout] = None) -> str:
+        """
+        Write a dataset: one `<key>.parquet`, or a hive-partitioned `<key>/` directory when the
+        layout partitions (see parquet_layout.choose_layout). A directory is staged next to the
+        old entry and swapped in, so readers never see a half-written dataset.
+        """
         parquet_dir = self.base_dir / "parquet"
         parquet_dir.mkdir(parents=True, exist_ok=True)
+        layout = layout or ParquetLayout()
+
+        with span("memory.write_parquet", cat="io", key=key, rows=int(df.shape[0])) as sp:
+            if layout.partitioned:
+                parquet_path = self.fragment_dir(key)
+                staging = parquet_dir / f".{key}.tmp"
+                shutil.rmtree(staging, ignore_errors=True)
+                staging.mkdir()
+                save_layout(staging, layout)
+                files = write_partitioned(df, staging, layout, "part-000000.parquet")
+                shutil.rmtree(parquet_path, ignore_errors=True)
+                (parquet_dir / f"{key}.parquet").unlink(missing_ok=True)
+                os.replace(staging, parquet_path)
+                sp.set(files=len(files), bytes=sum(f.stat().st_size for f in parquet_path.rglob("*.parquet")))
+            else:
+                parquet_path = parquet_dir / f"{key}.parquet"
+                write_table(df, parquet_path, layout)
+                shutil.rmtree(self.fragment_dir(key), ignore_errors=True)
+                sp.set(bytes=parquet_path.stat().st_size)
+
+        with span("memory.register", cat="io"):
+            self.register(key, str(parquet_path))
+        return str(parquet_path)
+
+    # ---------- fragmented entries (incremental refresh) ----------
+
+    def fragment_dir(self, key: str) -> Path:
+        return self.base_dir / "parquet" / key
+
+    def reset_fragments(self, key: str, layout: Optional[ParquetLayout] = None) -> Path:
+        """Empty fragment directory for a full rewrite of `key` (drops a single-file entry too)."""
+        d = self.fragment_dir(key)
+        shutil.rmtree(d, ignore_errors=True)
+        (self.base_dir / "parquet" / f"{key}.parquet").unlink(missing_ok=True)
+        d.mkdir(parents=True, exist_ok=True)
+        save_layout(d, layout or ParquetLayout())
+        return d
+
+    def write_fragment(self, key: str, df: pd.DataFrame, name: Optional[str] = None) -> List[Tuple[str, pd.DataFrame]]:
+        """
+        Write rows of `key`: to the file `name` (relative to the entry, rewritten in place), or as a
+        new part-NNNNNN file in each partition the rows fall into. Returns (path, rows) per file.
+        Later fragments take the first fragment's Arrow schema, so the directory reads as one table.
+        """
+        import pyarrow.parquet as pq
 
-        parquet_path = parquet_dir / f"{key}.parquet"
-        df.to_parquet(parquet_path, index=False)
+        d = self.fragment_dir(key)
+        d.mkdir(parents=True, exist_ok=True)
+        layout = load_layout(d) or ParquetLayout()
+        parts = list(d.rglob("part-*.parquet"))
+        schema = pq.read_schema(parts[0]).remove_metadata() if parts else None
+        with span("memory.write_fragment", cat="io", key=key, rows=int(df.shape[0])):
+            if name is not None:
+                write_table(df, d / name, layout, schema)
+                return [(str(d / name), df)]
+            seq = max(int(p.stem.split("-")[1]) for p in parts) + 1 if parts else 0
+            return write_partitioned(df, d, layout, f"part-{seq:06d}.parquet", schema)
 
-        con = duckdb.connect(str(self.duckdb_path))
+    def register(
+        self,
+        key: str,
+        parquet_path: str,
+        watermark: Optional[Dict[str, Any]] = None,
+        agg_state: Optional[Dict[str, Any]] = None,
+        full: bool = True,
+    ) -> None:
+        """Upsert the registry row; `full=False` keeps the time of the last full refresh."""
+        con = _connect(self.duckdb_path)
+        full_at = None
+        if not full:
+            rows = con.execute("SELECT full_at FROM cached_queries WHERE cache_key = ?", [key]).fetchall()
+            full_at = rows[0][0] if rows else None
+        now = datetime.now()
+        if Path(parquet_path).is_dir():
+            os.utime(parquet_path)  # readers key their caches on the entry's mtime
         con.execute(
-            "INSERT OR REPLACE INTO cached_queries(cache_key, parquet_path) VALUES (?, ?)",
-            [key, str(parquet_path)],
+            """
+            INSERT OR REPLACE INTO cached_queries
+              (cache_key, created_at, parquet_path, watermark, agg_state, full_at, refreshed_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            """,
+            [
+                key,
+                now,
+                parquet_path,
+                None if watermark is None else safe_json_dumps(watermark, indent=None),
+                None if agg_state is None else safe_json_dumps(agg_state, indent=None),
+                now if full else (full_at or now),
+                now,
+            ],
         )
+        if watermark is None:
+            con.execute("DELETE FROM cache_fragments WHERE cache_key = ?", [key])
+        con.close()
+
+    def save_fragments(self, key: str, fragments: List[Dict[str, Any]]) -> None:
+        con = _connect(self.duckdb_path)
+        con.execute("DELETE FROM cache_fragments WHERE cache_key = ?", [key])
+        if fragments:
+            con.executemany(
+                "INSERT INTO cache_fragments (cache_key, path, n_rows, wm_min, wm_max) VALUES (?, ?, ?, ?, ?)",
+                [
+                    [key, f["path"], int(f["n_rows"]), json.dumps(f["wm_min"]), json.dumps(f["wm_max"])]
+                    for f in fragments
+                ],
+            )
         con.close()
-        return str(parquet_path)
 
-    def load_cached_df(self, key: str) -> Optional[pd.DataFrame]:
-        con = duckdb.connect(str(self.duckdb_path))
+    def cache_entry(self, key: str) -> Optional[Dict[str, Any]]:
+        """Registry row of `key` with decoded watermark / aggregates and its fragments (oldest first)."""
+        con = _connect(self.duckdb_path)
+        cur = con.execute(
+            "SELECT cache_key, parquet_path, watermark, agg_state, full_at, refreshed_at FROM cached_queries WHERE cache_key = ?",
+            [key],
+        )
+        cols = [d[0] for d in cur.description]
+        rows = cur.fetchall()
+        frags = con.execute(
+            "SELECT path, n_rows, wm_min, wm_max FROM cache_fragments WHERE cache_key = ? ORDER BY path",
+            [key],
+        ).fetchall()
+        con.close()
+        if not rows:
+            return None
+        entry = dict(zip(cols, rows[0]))
+        for k in ("watermark", "agg_state"):
+            entry[k] = json.loads(entry[k]) if entry[k] else None
+        entry["fragments"] = [
+            {"path": p, "n_rows": n, "wm_min": json.loads(lo), "wm_max": json.loads(hi)} for p, n, lo, hi in frags
+        ]
+        return entry
+
+    def cached_path(self, key: str) -> Optional[str]:
+        con = _connect(self.duckdb_path)
         rows = con.execute(
             "SELECT parquet_path FROM cached_queries WHERE cache_key = ?",
             [key],
         ).fetchall()
         con.close()
+        return rows[0][0] if rows else None
 
-        if not rows:
+    def cached_paths(self) -> Dict[str, str]:
+        con = _connect(self.duckdb_path)
+        rows = con.execute("SELECT cache_key, parquet_path FROM cached_queries").fetchall()
+        con.close()
+        return {k: p for k, p in rows}
+
+    def load_cached_df(
+        self, key: str, columns: Optional[List[str]] = None, filters: Optional[List[Dict[str, Any]]] = None
+    ) -> Optional[pd.DataFrame]:
+        """
+        Cached dataset, optionally projected to `columns` and filtered (data API filter format:
+        {"column", "op", "value", "time"}). Projection and filters are pushed down to the Parquet
+        read, so a partitioned entry only opens the matching fragments.
+        """
+        path = self.cached_path(key)
+        if path is None:
+            return None
+
+        with span("memory.read_parquet", cat="io", key=key) as sp:
+            df = read_dataset(path, columns, filters)
+            sp.set(rows=int(df.shape[0]))
+        return df
+
+    def save_job(self, record: Dict[str, Any], result: Any = None) -> None:
+        """Upsert a background job record; a result (if any) is written as JSON next to the cache."""
+        result_path = None
+        if result is not None:
+            jobs_dir = self.base_dir / "jobs"
+            jobs_dir.mkdir(parents=True, exist_ok=True)
+            path = jobs_dir / f"{record['job_id']}.json"
+            path.write_text(safe_json_dumps(result, indent=None), encoding="utf-8")
+            result_path = str(path)
+
+        con = _connect(self.duckdb_path)
+        con.execute(
+            """
+            INSERT OR REPLACE INTO jobs
+              (job_id, kind, label, owner, status, progress, message, error, created_at, finished_at, result_path)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            [
+                record["job_id"],
+                record.get("kind"),
+                record.get("label"),
+                record.get("owner"),
+                record.get("status"),
+                record.get("progress"),
+                record.get("message"),
+                record.get("error"),
+                record.get("created_at"),
+                record.get("finished_at"),
+                result_path,
+            ],
+        )
+        con.close()
+
+    def load_jobs(self, owner: Optional[str] = None, limit: int = 50) -> List[Dict[str, Any]]:
+        con = _connect(self.duckdb_path)
+        sql = "SELECT * FROM jobs"
+        params: List[Any] = []
+        if owner is not None:
+            sql += " WHERE owner = ?"
+            params.append(owner)
+        sql += " ORDER BY created_at DESC LIMIT ?"
+        params.append(int(limit))
+        cur = con.execute(sql, params)
+        cols = [d[0] for d in cur.description]
+        rows = [dict(zip(cols, r)) for r in cur.fetchall()]
+        con.close()
+        return rows
+
+    def load_job_result(self, job_id: str) -> Optional[Any]:
+        con = _connect(self.duckdb_path)
+        rows = con.execute("SELECT result_path FROM jobs WHERE job_id = ?", [job_id]).fetchall()
+        con.close()
+        if not rows or not rows[0][0]:
             return None
+        return json.loads(Path(rows[0][0]).read_text(encoding="utf-8"))
+
+    _USAGE_COLS = (
+        "run_id", "seq", "step", "agent", "prompt_tokens", "completion_tokens", "gen_s",
+        "ttft_s", "tokens_per_s", "chars", "cancelled", "cost", "created_at",
+    )
+
+    def save_agent_usage(self, rows: List[Dict[str, Any]]) -> None:
+        """Per-message token/latency rows of a team run (see usage_accounting.MessageUsage)."""
+        if not rows:
+            return
+        cols = self._USAGE_COLS
+        con = _connect(self.duckdb_path)
+        con.executemany(
+            f"INSERT OR REPLACE INTO agent_usage ({', '.join(cols)}) VALUES ({', '.join('?' * len(cols))})",
+            [[r.get(c) for c in cols] for r in rows],
+        )
+        con.close()
 
-        path = rows[0][0]
-        return pd.read_parquet(path)
\ No newline at end of file
+    def load_agent_usage(self, run_ids: Optional[List[str]] = None, limit: int = 5000) -> List[Dict[str, Any]]:
+        con = _connect(self.duckdb_path)
+        sql = f"SELECT {', '.join(self._USAGE_COLS)} FROM agent_usage"
+        params: List[Any] = []
+        if run_ids is not None:
+            if not run_ids:
+                con.close()
+                return []
+            sql += f" WHERE run_id IN ({', '.join('?' * len(run_ids))})"
+            params.extend(run_ids)
+        sql += " ORDER BY created_at DESC LIMIT ?"
+        params.append(int(limit))
+        cur = con.execute(sql, params)
+        cols = [d[0] for d in cur.description]
+        rows = [dict(zip(cols, r)) for r in cur.fetchall()]
+        con.close()
+        return rows
@@ -0,0 +1,242 @@
+from __future__ import annotations
+
+import os
+import threading
+import time
+from collections import deque
+from dataclasses import asdict, dataclass, field
+from typing import Any, Deque, Dict, List, Optional
+
+IDLE = "idle"
+WARMING = "warming"
+READY = "ready"
+FAILED = "failed"
+
+
+@dataclass(frozen=True)
+class ModelSettings:
+    """
+    One set of Ollama options for every client of the app.
+
+    Ollama keeps a loaded model per (model, num_ctx, ...) combination: clients that
+    disagree on options make the server reload the model between calls, so every
+    client gets the same `options` and `keep_alive` from here.
+    Request parallelism is a server setting (OLLAMA_NUM_PARALLEL on `ollama serve`);
+    `num_ctx` must cover one request, the server multiplies it per parallel slot.
+    """
+
+    model: str = "qwen2.5:7b"
+    host: str = "http://localhost:11434"
+    keep_alive: str = "30m"
+    num_ctx: int = 8192
+    timeout_s: Optional[float] = None
+
+    @classmethod
+    def from_env(cls) -> "ModelSettings":
+        timeout = os.getenv("OLLAMA_TIMEOUT_S")
+        return cls(
+            model=os.getenv("OLLAMA_MODEL", "qwen2.5:7b"),
+            host=os.getenv("OLLAMA_BASE_URL", "http://localhost:11434"),
+            keep_alive=os.getenv("OLLAMA_KEEP_ALIVE", "30m"),
+            num_ctx=int(os.getenv("OLLAMA_NUM_CTX", "8192")),
+            timeout_s=float(timeout) if timeout else None,
+        )
+
+    @property
+    def options(self) -> Dict[str, Any]:
+        return {"num_ctx": self.num_ctx}
+
+    def client_kwargs(self) -> Dict[str, Any]:
+        """Constructor kwargs for OllamaChatCompletionClient."""
+        kwargs: Dict[str, Any] = {
+            "model": self.model,
+            "host": self.host,
+            "options": self.options,
+            "keep_alive": self.keep_alive,
+        }
+        if self.timeout_s is not None:
+            kwargs["timeout"] = self.timeout_s
+        return kwargs
+
+
+@dataclass
+class ModelTiming:
+    """Server-side timings of one Ollama response (durations are reported in ns)."""
+
+    model: str
+    at: float
+    load_s: float = 0.0
+    prompt_eval_count: int = 0
+    prompt_eval_s: float = 0.0
+    eval_count: int = 0
+    eval_s: float = 0.0
+    total_s: float = 0.0
+    kind: str = "chat"
+
+    @classmethod
+    def from_response(cls, resp: Any, kind: str = "chat") -> "ModelTiming":
+        def get(name: str) -> Any:
+            if isinstance(resp, dict):
+                return resp.get(name)
+            return getattr(resp, name, None)
+
+        def secs(name: str) -> float:
+            return (get(name) or 0) / 1e9
+
+        return cls(
+            model=str(get("model") or ""),
+            at=time.time(),
+            load_s=secs("load_duration"),
+            prompt_eval_count=int(get("prompt_eval_count") or 0),
+            prompt_eval_s=secs("prompt_eval_duration"),
+            eval_count=int(get("eval_count") or 0),
+            eval_s=secs("eval_duration"),
+            total_s=secs("total_duration"),
+            kind=kind,
+        )
+
+    @property
+    def eval_tokens_per_s(self) -> Optional[float]:
+        return self.eval_count / self.eval_s if self.eval_s > 0 else None
+
+    def to_dict(self) -> Dict[str, Any]:
+        d = asdict(self)
+        d["eval_tokens_per_s"] = None if self.eval_tokens_per_s is None else round(self.eval_tokens_per_s, 1)
+        return d
+
+
+@dataclass
+class ModelManager:
+    """
+    Process-wide owner of the Ollama model lifecycle: shared settings for all clients,
+    a background warm-up that loads the model (and pins it for `keep_alive`), and the
+    load/eval timings of recent responses.
+    """
+
+    settings: ModelSettings = field(default_factory=ModelSettings.from_env)
+    max_timings: int = 200
+    status: str = IDLE
+    error: Optional[str] = None
+    warmup: Optional[ModelTiming] = None
+    _timings: Deque[ModelTiming] = field(default_factory=deque, repr=False)
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+    _thread: Optional[threading.Thread] = field(default=None, repr=False)
+
+    def client_kwargs(self) -> Dict[str, Any]:
+        return self.settings.client_kwargs()
+
+    def record(self, resp: Any, kind: str = "chat") -> ModelTiming:
+        timing = ModelTiming.from_response(resp, kind=kind)
+        with self._lock:
+            self._timings.append(timing)
+            while len(self._timings) > self.max_timings:
+                self._timings.popleft()
+        return timing
+
+    def timings(self) -> List[ModelTiming]:
+        with self._lock:
+            return list(self._timings)
+
+    def summary(self) -> Dict[str, Any]:
+        timings = self.timings()
+        calls = len(timings)
+        return {
+            "model": self.settings.model,
+            "status": self.status,
+            "error": self.error,
+            "warmup_load_s": None if self.warmup is None else round(self.warmup.load_s, 2),
+            "calls": calls,
+            "reloads": sum(1 for t in timings if t.kind != "warmup" and t.load_s > 0.5),
+            "load_s": round(sum(t.load_s for t in timings), 2),
+            "prompt_eval_s": round(sum(t.prompt_eval_s for t in timings), 2),
+            "eval_s": round(sum(t.eval_s for t in timings), 2),
+        }
+
+    def warm_up(self, background: bool = True) -> Optional[threading.Thread]:
+        """
+        Load the model with an empty prompt (Ollama loads without generating) using the
+        same options/keep_alive as the chat clients, so the first step doesn't pay the load.
+        A warm-up already running or done is not repeated; a failed one can be retried.
+        """
+        with self._lock:
+            if self.status in (WARMING, READY):
+                return self._thread
+            self.status = WARMING
+            self.error = None
+            self._thread = threading.Thread(target=self._warm, name="model-warmup", daemon=True)
+        if background:
+            self._thread.start()
+        else:
+            self._warm()
+        return self._thread
+
+    def _warm(self) -> None:
+        from ollama import Client
+
+        s = self.settings
+        try:
+            client = Client(host=s.host, timeout=s.timeout_s)
+            resp = client.generate(model=s.model, prompt="", keep_alive=s.keep_alive, options=s.options)
+            self.warmup = self.record(resp, kind="warmup")
+            self.status = READY
+        except Exception as e:
+            self.error = f"{type(e).__name__}: {e}"
+            self.status = FAILED
+
+
+_manager: Optional[ModelManager] = None
+_manager_lock = threading.Lock()
+
+
+def get_model_manager() -> ModelManager:
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            _manager = ModelManager()
+        return _manager
+
+
+def reset_model_manager(settings: Optional[ModelSettings] = None) -> ModelManager:
+    """Replace the process-wide manager (settings changed, or a test pointing at a stub server)."""
+    global _manager
+    with _manager_lock:
+        _manager = ModelManager(settings=settings) if settings is not None else ModelManager()
+        return _manager
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+
+    ap = argparse.ArgumentParser(description="Warm the Ollama model and print load/eval timings")
+    ap.add_argument("--stub", action="store_true", help="run against a local StubOllamaServer")
+    args = ap.parse_args()
+
+    if args.stub:
+        from ollama_stub import StubOllamaServer
+
+        stub = StubOllamaServer(reply='{"ok": true}', load_ms=1500).start()
+        mgr = reset_model_manager(ModelSettings(host=stub.url))
+    else:
+        mgr = get_model_manager()
+
+    t0 = time.perf_counter()
+    mgr.warm_up(background=False)
+    print(f"warm-up: {time.perf_counter() - t0:.2f}s wall, status={mgr.status} {mgr.error or ''}")
+
+    from ollama import Client
+
+    client = Client(host=mgr.settings.host)
+    for i in range(2):
+        t0 = time.perf_counter()
+        resp = client.chat(
+            model=mgr.settings.model,
+            messages=[{"role": "user", "content": "ping"}],
+            keep_alive=mgr.settings.keep_alive,
+            options=mgr.settings.options,
+        )
+        timing = mgr.record(resp)
+        print(f"chat #{i + 1}: {time.perf_counter() - t0:.2f}s wall, load {timing.load_s:.2f}s")
+    print(json.dumps(mgr.summary(), indent=2))
+    if args.stub:
+        stub.stop()
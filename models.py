@@ -58,6 +58,13 @@ class SQLArtifact(BaseModel):
     sql: str
     expected_columns: List[str] = Field(default_factory=list)
     cache_key: Optional[str] = None
+    # incremental refresh: monotonic time/ID column; lookback in days (time) or IDs, None = env default
+    watermark_column: Optional[str] = None
+    lookback: Optional[float] = None
+    # partitioned Parquet layout: dimension columns to partition by (None/empty = PARQUET_PARTITION_DIMS)
+    partition_by: List[str] = Field(default_factory=list)
+    # artifact DAG: upstream dataset_names; the sql is then DuckDB SQL over those datasets by name
+    depends_on: List[str] = Field(default_factory=list)
 
 
 class SQLBuildOutput(BaseModel):
@@ -75,6 +82,10 @@ class DatasetSummary(BaseModel):
     inferred_time_columns: List[str] = Field(default_factory=list)
     inferred_numeric_columns: List[str] = Field(default_factory=list)
     inferred_categorical_columns: List[str] = Field(default_factory=list)
+    watermark: Optional[Dict[str, Any]] = None  # {"column", "kind", "value", "format"} for incremental entries
+    refresh: Literal["full", "incremental"] = "full"
+    rows_fetched: Optional[int] = None
+    computed: Literal["source", "local"] = "source"  # local: DuckDB over upstream / shared intermediates
 
 
 class KPIValue(BaseModel):
@@ -93,10 +104,35 @@ class KPIReport(BaseModel):
 class ExecutionBundle(BaseModel):
     datasets: List[DatasetSummary]
     reports: List[KPIReport]
+    source_stats: Dict[str, Any] = Field(default_factory=dict)  # warehouse round trips / rows, see artifact_dag
 
 class TableDescription(BaseModel):
     description:str
     business_meaning:str
     important_columns:List[str]
     typical_joins:List[str]
-    dashboard_use_cases:List[str]
\ No newline at end of file
+    dashboard_use_cases:List[str]
+
+
+# ---------- Task 7: dashboard layout (LLM output, optional; compiled without an LLM otherwise) ----------
+class KPICardSpec(BaseModel):
+    dataset: str
+    kpi: str  # KPIValue.name in that dataset's KPIReport
+    label: Optional[str] = None
+
+
+class WidgetSpec(BaseModel):
+    kind: Literal["trend", "breakdown", "distribution", "table"]
+    dataset: str
+    title: Optional[str] = None
+    x: Optional[str] = None  # time column (trend) / category column (breakdown)
+    y: Optional[str] = None  # numeric column; None = row count
+    agg: Literal["sum", "avg", "count", "min", "max"] = "sum"
+    limit: int = 10  # categories (breakdown) / rows (table)
+
+
+class DashboardSpec(BaseModel):
+    title: str = "Dashboard"
+    subtitle: Optional[str] = None
+    kpis: List[KPICardSpec] = Field(default_factory=list)
+    widgets: List[WidgetSpec] = Field(default_factory=list)
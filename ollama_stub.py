@@ -0,0 +1,221 @@
+from __future__ import annotations
+
+import json
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+
+
+def _approx_tokens(n_chars: int) -> int:
+    # ~4 chars/token is close enough for English + JSON
+    return max(0, (n_chars + 3) // 4)
+
+
+def _keep_alive_s(value: Any) -> float:
+    """Ollama keep_alive: seconds, or a duration string like "30s" / "5m" / "1h"; negative = forever."""
+    if isinstance(value, (int, float)):
+        secs = float(value)
+    else:
+        text = str(value).strip()
+        units = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+        unit = next((u for u in ("ms", "s", "m", "h") if text.endswith(u)), "")
+        secs = float(text[: len(text) - len(unit)] or 0) * units.get(unit, 1)
+    return float("inf") if secs < 0 else secs
+
+
+def _chat_to_prompt(messages: List[Dict[str, Any]]) -> str:
+    return "".join(f"<{m.get('role', '')}>{m.get('content', '')}" for m in messages or [])
+
+
+class StubOllamaServer:
+    """
+    Minimal local stand-in for the Ollama HTTP API (/api/generate, /api/chat, /api/tags).
+
+    It mimics Ollama's single-slot prefix cache: only the part of a prompt that
+    differs from the previous prompt is "evaluated", at `eval_ms_per_token`.
+    Responses carry the same timing fields Ollama returns, so clients and
+    harnesses can be exercised without a GPU or network.
+
+    Streaming requests ("stream": true, Ollama's default) get NDJSON chunks of
+    ~4 chars each, `gen_ms_per_token` apart. `aborted` counts streams the client
+    closed before the end (what early-stopping clients should cause).
+    Speaks HTTP/1.1 keep-alive; `connections` counts TCP connections accepted,
+    so connection reuse by clients is observable.
+
+    Model residency: the first request, a request with a different model/num_ctx, or
+    one arriving after the previous `keep_alive` expired "loads" the model (`load_ms`,
+    reported as load_duration, counted in `loads`). An empty /api/generate prompt only
+    loads, like Ollama's warm-up call.
+    """
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        reply: str = "APPROVE_STEP",
+        eval_ms_per_token: float = 0.0,
+        gen_ms_per_token: float = 0.0,
+        load_ms: float = 0.0,
+    ) -> None:
+        self.reply = reply
+        self.load_ms = load_ms
+        self.loads = 0
+        self._loaded: Optional[tuple] = None
+        self._expires_at = 0.0
+        self.eval_ms_per_token = eval_ms_per_token
+        self.gen_ms_per_token = gen_ms_per_token
+        self.requests: List[Dict[str, Any]] = []
+        self.aborted = 0
+        self.connections = 0
+        self._last_prompt = ""
+        self._lock = threading.Lock()
+
+        stub = self
+
+        class _Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def setup(self) -> None:
+                super().setup()
+                # small NDJSON writes on a keep-alive socket: avoid Nagle/delayed-ACK stalls
+                self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                with stub._lock:
+                    stub.connections += 1
+
+            def log_message(self, *args: Any) -> None:  # keep test output quiet
+                pass
+
+            def _write_chunk(self, data: bytes) -> None:
+                self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+                self.wfile.flush()
+
+            def _send(self, body: Dict[str, Any]) -> None:
+                data = json.dumps(body).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self) -> None:
+                if self.path.startswith("/api/tags"):
+                    self._send({"models": []})
+                else:
+                    self.send_error(404)
+
+            def _stream(self, final: Dict[str, Any], chat: bool) -> None:
+                self.send_response(200)
+                self.send_header("Content-Type", "application/x-ndjson")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                text = stub.reply
+                try:
+                    for i in range(0, len(text), 4):
+                        piece = text[i : i + 4]
+                        chunk: Dict[str, Any] = {"model": final["model"], "created_at": final["created_at"], "done": False}
+                        if chat:
+                            chunk["message"] = {"role": "assistant", "content": piece}
+                        else:
+                            chunk["response"] = piece
+                        self._write_chunk((json.dumps(chunk) + "\n").encode("utf-8"))
+                        if stub.gen_ms_per_token:
+                            time.sleep(stub.gen_ms_per_token / 1000)
+                    if chat:
+                        final["message"] = {"role": "assistant", "content": ""}
+                    else:
+                        final["response"] = ""
+                    self._write_chunk((json.dumps(final) + "\n").encode("utf-8"))
+                    self.wfile.write(b"0\r\n\r\n")
+                    self.wfile.flush()
+                except (BrokenPipeError, ConnectionResetError):
+                    with stub._lock:
+                        stub.aborted += 1
+                    self.close_connection = True
+
+            def do_POST(self) -> None:
+                n = int(self.headers.get("Content-Length", "0") or 0)
+                req = json.loads(self.rfile.read(n) or b"{}")
+                if self.path.startswith("/api/generate"):
+                    prompt, chat = req.get("prompt", ""), False
+                elif self.path.startswith("/api/chat"):
+                    prompt, chat = _chat_to_prompt(req.get("messages", [])), True
+                else:
+                    self.send_error(404)
+                    return
+                out = stub._respond(req, prompt, chat=chat)
+                if req.get("stream", True):
+                    self._stream(out, chat)
+                else:
+                    self._send(out)
+
+        self._httpd = ThreadingHTTPServer((host, port), _Handler)
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def _load(self, req: Dict[str, Any]) -> float:
+        """Returns the simulated load time (ms) for this request, 0 if the model is resident."""
+        key = (req.get("model"), (req.get("options") or {}).get("num_ctx"))
+        now = time.monotonic()
+        load = key != self._loaded or now > self._expires_at
+        if load:
+            self.loads += 1
+            self._loaded = key
+            self._last_prompt = ""  # a reload drops the KV cache
+        self._expires_at = now + _keep_alive_s(req.get("keep_alive", "5m"))
+        return self.load_ms if load else 0.0
+
+    def _respond(self, req: Dict[str, Any], prompt: str, chat: bool) -> Dict[str, Any]:
+        with self._lock:
+            self.requests.append(req)
+            load_ms = self._load(req)
+            shared = 0
+            prev = self._last_prompt
+            n = min(len(prev), len(prompt))
+            while shared < n and prev[shared] == prompt[shared]:
+                shared += 1
+            self._last_prompt = prompt
+
+        evaluated = _approx_tokens(len(prompt) - shared)
+        eval_ms = evaluated * self.eval_ms_per_token
+        if eval_ms + load_ms:
+            time.sleep((eval_ms + load_ms) / 1000)
+        reply = self.reply if (chat or prompt) else ""
+
+        out: Dict[str, Any] = {
+            "model": req.get("model", "stub"),
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "done": True,
+            "done_reason": "stop" if reply else "load",
+            "total_duration": int((eval_ms + load_ms) * 1e6),
+            "load_duration": int(load_ms * 1e6),
+            "prompt_eval_count": evaluated,
+            "prompt_eval_duration": int(eval_ms * 1e6),
+            "eval_count": _approx_tokens(len(reply)),
+            "eval_duration": int(_approx_tokens(len(reply)) * self.gen_ms_per_token * 1e6),
+        }
+        if chat:
+            out["message"] = {"role": "assistant", "content": reply}
+        else:
+            out["response"] = reply
+        return out
+
+    def start(self) -> "StubOllamaServer":
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self) -> "StubOllamaServer":
+        return self.start()
+
+    def __exit__(self, *exc: Any) -> None:
+        self.stop()
@@ -0,0 +1,571 @@
+from __future__ import annotations
+
+import json
+import os
+import re
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Sequence, Tuple
+
+from tracing import span
+
+if TYPE_CHECKING:  # pandas/pyarrow are imported on first use (memory_store imports this module)
+    import pandas as pd
+
+# ---------- settings ----------
+PARTITION = os.getenv("PARQUET_PARTITION", "none")  # none | date | dims | date,dims (opt-in)
+DATE_BUCKET = os.getenv("PARQUET_DATE_BUCKET", "month")  # day | week | month | year
+PARTITION_DIMS = [c.strip() for c in os.getenv("PARQUET_PARTITION_DIMS", "").split(",") if c.strip()]
+PARTITION_MIN_ROWS = int(os.getenv("PARQUET_PARTITION_MIN_ROWS", "250000"))  # smaller datasets stay one file
+MAX_PARTITIONS = int(os.getenv("PARQUET_MAX_PARTITIONS", "256"))
+ROW_GROUP_ROWS = int(os.getenv("PARQUET_ROW_GROUP_ROWS", "131072"))
+STATISTICS = os.getenv("PARQUET_STATISTICS", "1") == "1"
+COMPRESSION = os.getenv("PARQUET_COMPRESSION", "snappy")
+
+BUCKETS = ("day", "week", "month", "year")
+LAYOUT_FILE = "_layout.json"  # leading "_": ignored by pyarrow datasets and by the *.parquet globs
+NULL_PART = "null"
+_SAFE_VALUE = re.compile(r"^[A-Za-z0-9_.\- ]+$")
+_STRFTIME = {"day": "%Y-%m-%d", "week": "%Y-%m-%d", "month": "%Y-%m", "year": "%Y"}
+
+
+@dataclass
+class ParquetLayout:
+    """
+    How a cached dataset is written. With `time_column` and/or `dims` it is a hive-style directory
+    (`<col>__<bucket>=2024-03/<dim>__part=EU/part-000000.parquet`). The partition fields are derived
+    copies; every file still holds all data columns, so a single fragment is self-contained and
+    dtypes survive the round trip. Date buckets are ISO strings, so ranges compare as text.
+    """
+
+    time_column: Optional[str] = None
+    bucket: str = DATE_BUCKET
+    dims: List[str] = field(default_factory=list)
+    row_group_rows: int = ROW_GROUP_ROWS
+    statistics: bool = STATISTICS
+    compression: str = COMPRESSION
+
+    @property
+    def partitioned(self) -> bool:
+        return bool(self.time_column or self.dims)
+
+    @property
+    def time_field(self) -> Optional[str]:
+        return f"{self.time_column}__{self.bucket}" if self.time_column else None
+
+    @staticmethod
+    def dim_field(col: str) -> str:
+        return f"{col}__part"
+
+    def fields(self) -> List[str]:
+        out = [self.time_field] if self.time_column else []
+        return out + [self.dim_field(c) for c in self.dims]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+    @classmethod
+    def from_dict(cls, d: Dict[str, Any]) -> "ParquetLayout":
+        return cls(**d)
+
+
+# ---------- partition keys ----------
+
+def _to_time(s: "pd.Series") -> "pd.Series":
+    """Parse like DuckDB's TRY_CAST(... AS TIMESTAMP): any ISO 8601 precision, anything else NaT."""
+    import pandas as pd
+
+    if pd.api.types.is_datetime64_any_dtype(s):
+        return s
+    return pd.to_datetime(s, errors="coerce", format="ISO8601")
+
+
+def bucket_values(s: "pd.Series", bucket: str) -> "pd.Series":
+    """Partition value per row; only the distinct bucket starts are formatted."""
+    import numpy as np
+    import pandas as pd
+
+    t = _to_time(s)
+    if bucket in ("month", "year"):
+        start = t.dt.to_period("M" if bucket == "month" else "Y").dt.start_time
+    else:
+        start = t.dt.normalize()
+        if bucket == "week":
+            start = start - pd.to_timedelta(start.dt.weekday, unit="D")
+    codes, uniq = pd.factorize(start)  # NaT -> -1 -> the NULL_PART slot at the end
+    labels = np.array([u.strftime(_STRFTIME[bucket]) for u in uniq] + [NULL_PART], dtype=object)
+    return pd.Series(labels[codes], index=s.index)
+
+
+def bucket_of(value: Any, bucket: str) -> Optional[str]:
+    import pandas as pd
+
+    t = pd.to_datetime(value, errors="coerce")
+    if t is None or pd.isna(t):
+        return None
+    if bucket == "week":
+        t = t - pd.Timedelta(days=t.weekday())
+    return t.strftime(_STRFTIME[bucket])
+
+
+def _dim_values(s: "pd.Series") -> "pd.Series":
+    return s.astype("string").fillna(NULL_PART)
+
+
+def partition_keys(df: "pd.DataFrame", layout: ParquetLayout) -> "pd.DataFrame":
+    import pandas as pd
+
+    keys = {}
+    if layout.time_column:
+        keys[layout.time_field] = bucket_values(df[layout.time_column], layout.bucket)
+    for c in layout.dims:
+        keys[layout.dim_field(c)] = _dim_values(df[c])
+    return pd.DataFrame(keys, index=df.index)
+
+
+def _dim_ok(s: "pd.Series") -> bool:
+    import pandas as pd
+
+    if pd.api.types.is_float_dtype(s) or pd.api.types.is_datetime64_any_dtype(s):
+        return False
+    vals = s.dropna().astype(str).unique()
+    return len(vals) <= MAX_PARTITIONS and all(_SAFE_VALUE.match(v) for v in vals)
+
+
+def _usable_name(col: str) -> bool:
+    return not col.startswith(("_", ".")) and "=" not in col and "/" not in col
+
+
+def choose_layout(
+    df: "pd.DataFrame",
+    time_cols: Sequence[str],
+    time_column: Optional[str] = None,
+    dims: Optional[Sequence[str]] = None,
+) -> ParquetLayout:
+    """
+    Layout for one dataset from the PARQUET_* settings. Without PARQUET_PARTITION (the default
+    "none") and for datasets under PARQUET_PARTITION_MIN_ROWS, the dataset stays a single file (row-group size and statistics still apply). The time partition uses
+    `time_column` (e.g. the watermark column) if it is one of `time_cols`, else the first of them; dims come from
+    the artifact or PARQUET_PARTITION_DIMS and must be low-cardinality with path-safe values.
+    Past PARQUET_MAX_PARTITIONS, dims are dropped first, then the date bucket coarsens.
+    """
+    modes = {m.strip() for m in PARTITION.split(",")}
+    layout = ParquetLayout()
+    if len(df) < PARTITION_MIN_ROWS or not modes & {"date", "dims"}:
+        return layout
+    if "date" in modes:
+        for c in ([time_column] if time_column in time_cols else []) + list(time_cols):
+            if c in df.columns and _usable_name(c):
+                layout.time_column = c
+                break
+    if "dims" in modes:
+        for c in (PARTITION_DIMS if dims is None else dims):
+            if c in df.columns and _usable_name(c) and c != layout.time_column and _dim_ok(df[c]):
+                layout.dims.append(c)
+    while layout.partitioned:
+        n = len(partition_keys(df, layout).drop_duplicates())
+        if n <= MAX_PARTITIONS:
+            break
+        if layout.dims:
+            layout.dims.pop()
+        elif layout.bucket != "year":
+            layout.bucket = BUCKETS[BUCKETS.index(layout.bucket) + 1]
+        else:
+            layout.time_column = None
+    return layout
+
+
+# ---------- writing ----------
+
+def save_layout(root: Path, layout: ParquetLayout) -> None:
+    (Path(root) / LAYOUT_FILE).write_text(json.dumps(layout.to_dict()), encoding="utf-8")
+
+
+_layouts: Dict[Tuple[str, int], Optional[ParquetLayout]] = {}
+
+
+def load_layout(path: str | Path) -> Optional[ParquetLayout]:
+    """Layout of a dataset directory (None for single files and directories without one)."""
+    f = Path(path) / LAYOUT_FILE
+    try:
+        key = (str(f), f.stat().st_mtime_ns)
+    except (FileNotFoundError, NotADirectoryError):
+        return None
+    if key not in _layouts:
+        _layouts[key] = ParquetLayout.from_dict(json.loads(f.read_text(encoding="utf-8")))
+    return _layouts[key]
+
+
+def write_table(df: "pd.DataFrame", path: Path, layout: Optional[ParquetLayout] = None, schema: Any = None) -> None:
+    """One Parquet file with the layout's row-group size / statistics / codec, written atomically."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    layout = layout or ParquetLayout()
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    if schema is not None and not table.schema.remove_metadata().equals(schema):
+        table = table.cast(schema)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.parent / f".{path.name}.tmp"
+    pq.write_table(
+        table,
+        tmp,
+        row_group_size=layout.row_group_rows,
+        write_statistics=layout.statistics,
+        compression=layout.compression,
+    )
+    os.replace(tmp, path)
+
+
+def write_partitioned(
+    df: "pd.DataFrame", root: Path, layout: ParquetLayout, name: str, schema: Any = None
+) -> List[Tuple[str, "pd.DataFrame"]]:
+    """Split `df` by the layout's partition keys into `root/<k>=<v>/.../<name>`; returns (path, rows) per file."""
+    if not layout.partitioned:
+        path = Path(root) / name
+        write_table(df, path, layout, schema)
+        return [(str(path), df)]
+    keys = partition_keys(df, layout)
+    out: List[Tuple[str, "pd.DataFrame"]] = []
+    with span("parquet.write_partitioned", cat="io", rows=int(df.shape[0])) as sp:
+        for vals, idx in keys.groupby(list(keys.columns), sort=True).indices.items():
+            vals = vals if isinstance(vals, tuple) else (vals,)
+            rel = "/".join(f"{f}={v}" for f, v in zip(keys.columns, vals))
+            part = df.iloc[idx]
+            path = Path(root) / rel / name
+            write_table(part, path, layout, schema)
+            out.append((str(path), part))
+        sp.set(files=len(out))
+    return out
+
+
+# ---------- reading ----------
+
+def scan_sql(path: str | Path) -> str:
+    """DuckDB table expression for a cached dataset (single file, flat fragments or hive layout)."""
+    p = Path(path)
+    if not p.is_dir():
+        return "read_parquet('" + str(p).replace("'", "''") + "')"
+    target = str(p / "**" / "*.parquet").replace("'", "''")
+    layout = load_layout(p)
+    if layout is not None and layout.partitioned:
+        return f"read_parquet('{target}', hive_partitioning = true, hive_types_autocast = false)"
+    return f"read_parquet('{target}', hive_partitioning = false)"
+
+
+def _lit(v: Any) -> str:
+    return "'" + str(v).replace("'", "''") + "'"
+
+
+def _bounds(f: Dict[str, Any]) -> Tuple[Any, Any]:
+    """(low, high) a time filter allows; None = unbounded."""
+    op, v = f.get("op", "eq"), f.get("value")
+    if op == "between" and isinstance(v, list) and len(v) == 2:
+        return v[0], v[1]
+    if op in ("ge", "gt"):
+        return v, None
+    if op in ("le", "lt"):
+        return None, v
+    if op == "eq":
+        return v, v
+    return None, None
+
+
+def partition_predicates(layout: Optional[ParquetLayout], filters: Any) -> List[Tuple[str, str, Any]]:
+    """
+    Filters ({"column", "op", "value", "time"}, as used by the data API) restated on the partition
+    fields: (field, op, value) with op in ge/le/eq/in. They only narrow which files are read; the
+    row-level filter still applies, so a partition predicate may be looser but never stricter.
+    """
+    if layout is None or not layout.partitioned:
+        return []
+    out: List[Tuple[str, str, Any]] = []
+    for f in filters or []:
+        if not isinstance(f, dict):
+            continue
+        col, op, v = f.get("column"), f.get("op", "eq"), f.get("value")
+        if col == layout.time_column:
+            lo, hi = _bounds(f)
+            lo_b = bucket_of(lo, layout.bucket) if lo is not None else None
+            hi_b = bucket_of(hi, layout.bucket) if hi is not None else None
+            if lo_b is not None:
+                out.append((layout.time_field, "ge", lo_b))
+            if hi_b is not None:
+                out.append((layout.time_field, "le", hi_b))
+        elif col in layout.dims and not f.get("time"):
+            if op == "eq" and v is not None:
+                out.append((layout.dim_field(col), "eq", str(v)))
+            elif op == "in" and isinstance(v, list) and v:
+                out.append((layout.dim_field(col), "in", [str(x) for x in v]))
+    return out
+
+
+def prune_sql(layout: Optional[ParquetLayout], filters: Any) -> List[str]:
+    """partition_predicates as DuckDB clauses over scan_sql (hive fields are VARCHAR)."""
+    sql_ops = {"ge": ">=", "le": "<=", "eq": "="}
+    out = []
+    for fld, op, v in partition_predicates(layout, filters):
+        q = '"' + fld.replace('"', '""') + '"'
+        if op == "in":
+            out.append(f"{q} IN ({', '.join(_lit(x) for x in v)})")
+        else:
+            out.append(f"{q} {sql_ops[op]} {_lit(v)}")
+    return out
+
+
+_ISO_DATE = re.compile(r"^\d{4}-\d{2}-\d{2}")
+
+
+def _iso_text(dataset: Any, col: str) -> bool:
+    """Whether a string column holds ISO dates (judged by the first row group's min/max statistics)."""
+    for frag in dataset.get_fragments():
+        md = frag.metadata
+        if md.num_row_groups == 0:
+            continue
+        idx = md.schema.to_arrow_schema().get_field_index(col)
+        st = md.row_group(0).column(idx).statistics if idx >= 0 else None
+        return bool(st is not None and st.has_min_max and _ISO_DATE.match(str(st.min)) and _ISO_DATE.match(str(st.max)))
+    return False
+
+
+def _arrow_filter(layout: Optional[ParquetLayout], filters: Any, dataset: Any) -> Any:
+    """
+    pyarrow expression for a read: partition predicates (prune directories), the non-time filters
+    whose value type matches the column, and time filters as a day range on native timestamps or
+    ISO date strings (prune row groups by their statistics). Time bounds are widened to whole days
+    and strict bounds are not applied, so the expression never drops a matching row.
+    """
+    import pandas as pd
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+
+    schema = dataset.schema
+    ops = {"eq": "__eq__", "ne": "__ne__", "gt": "__gt__", "ge": "__ge__", "lt": "__lt__", "le": "__le__"}
+    expr = None
+
+    def add(e: Any) -> None:
+        nonlocal expr
+        expr = e if expr is None else expr & e
+
+    for fld, op, v in partition_predicates(layout, filters):
+        if op == "in":
+            add(ds.field(fld).isin(v))
+        else:
+            add(getattr(ds.field(fld), ops[op])(v))
+    for f in filters or []:
+        if not isinstance(f, dict) or f.get("column") not in schema.names:
+            continue
+        col = f["column"]
+        t = schema.field(col).type
+        op, v = f.get("op", "eq"), f.get("value")
+        is_str = pa.types.is_string(t) or pa.types.is_large_string(t)
+        is_num = pa.types.is_integer(t) or pa.types.is_floating(t)
+
+        if f.get("time"):
+            lo, hi = _bounds(f)
+            lo_t = pd.to_datetime(lo, errors="coerce") if lo is not None else None
+            hi_t = pd.to_datetime(hi, errors="coerce") if hi is not None else None
+            if pa.types.is_timestamp(t) and t.tz is None:
+                if lo_t is not None and not pd.isna(lo_t):
+                    add(ds.field(col) >= pa.scalar(lo_t.floor("D").to_pydatetime(), type=t))
+                if hi_t is not None and not pd.isna(hi_t):
+                    add(ds.field(col) < pa.scalar((hi_t.floor("D") + pd.Timedelta(days=1)).to_pydatetime(), type=t))
+            elif is_str and _iso_text(dataset, col):
+                if lo_t is not None and not pd.isna(lo_t):
+                    add(ds.field(col) >= lo_t.strftime("%Y-%m-%d"))
+                if hi_t is not None and not pd.isna(hi_t):
+                    add(ds.field(col) < (hi_t.floor("D") + pd.Timedelta(days=1)).strftime("%Y-%m-%d"))
+            continue
+
+        def fits(x: Any) -> bool:
+            return (is_str and isinstance(x, str)) or (is_num and isinstance(x, (int, float)) and not isinstance(x, bool))
+
+        if op in ops and fits(v):
+            add(getattr(ds.field(col), ops[op])(v))
+        elif op == "in" and is_str and isinstance(v, list) and v:
+            add(ds.field(col).isin([str(x) for x in v]))
+    return expr
+
+
+def apply_filters(df: "pd.DataFrame", filters: Any) -> "pd.DataFrame":
+    """Row-level filters with the data API's semantics (time filters compare parsed timestamps)."""
+    import pandas as pd
+
+    mask = pd.Series(True, index=df.index)
+    for f in filters or []:
+        col, op, v = f["column"], f.get("op", "eq"), f.get("value")
+        s = df[col]
+        if f.get("time"):
+            s = _to_time(s)
+            v = [pd.Timestamp(x) for x in v] if isinstance(v, list) else pd.Timestamp(v)
+        elif isinstance(v, str) or op == "in":
+            s = s.astype(str)
+        if op == "between":
+            m = (s >= v[0]) & (s <= v[1])
+        elif op == "in":
+            m = s.isin([str(x) for x in v])
+        else:
+            m = {"eq": s == v, "ne": s != v, "gt": s > v, "ge": s >= v, "lt": s < v, "le": s <= v}[op]
+        mask &= m.fillna(False).astype(bool)
+    return df[mask.to_numpy()] if not bool(mask.all()) else df
+
+
+def _dataset(path: Path, layout: Optional[ParquetLayout]) -> Any:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+
+    partitioning = None
+    if layout is not None and layout.partitioned:
+        partitioning = ds.partitioning(pa.schema([(f, pa.string()) for f in layout.fields()]), flavor="hive")
+    return ds.dataset(str(path), format="parquet", partitioning=partitioning)
+
+
+def read_dataset(
+    path: str | Path, columns: Optional[Sequence[str]] = None, filters: Any = None
+) -> "pd.DataFrame":
+    """
+    Read a cached dataset with projection and filter pushdown: only the requested columns (plus
+    those the filters need) are decoded, partition predicates skip whole directories, and typed
+    non-time filters skip row groups by their min/max statistics. The exact filters are applied
+    to the decoded rows afterwards.
+    """
+    p = Path(path)
+    layout = load_layout(p) if p.is_dir() else None
+    dataset = _dataset(p, layout)
+    part_fields = set(layout.fields()) if layout is not None else set()
+    data_cols = [n for n in dataset.schema.names if n not in part_fields]
+    wanted = list(columns) if columns is not None else data_cols
+    need = wanted + [f["column"] for f in (filters or []) if f["column"] not in wanted]
+    with span("parquet.read_dataset", cat="io", path=p.name, cols=len(need), filters=len(filters or [])) as sp:
+        expr = _arrow_filter(layout, filters, dataset)
+        table = dataset.to_table(columns=need, filter=expr)
+        df = table.to_pandas()
+        sp.set(rows=int(df.shape[0]))
+    if filters:
+        df = apply_filters(df, filters)
+    return df[wanted] if list(df.columns) != wanted else df
+
+
+def fragments_touched(path: str | Path, filters: Any = None) -> Tuple[int, int]:
+    """(files a filtered read opens, files in the dataset)."""
+    p = Path(path)
+    if not p.is_dir():
+        return 1, 1
+    layout = load_layout(p)
+    dataset = _dataset(p, layout)
+    total = len(dataset.files)
+    expr = _arrow_filter(layout, filters, dataset)
+    return len(list(dataset.get_fragments(filter=expr))) if expr is not None else total, total
+
+
+# ---------- benchmark ----------
+
+def _bench_frame(n: int, seed: int = 7) -> "pd.DataFrame":
+    import numpy as np
+    import pandas as pd
+
+    rng = np.random.default_rng(seed)
+    days = rng.integers(0, 730, n)
+    order = np.argsort(days, kind="stable")  # arrival order: roughly by date, like an event log
+    return pd.DataFrame(
+        {
+            "event_date": (pd.Timestamp("2023-01-01") + pd.to_timedelta(days[order], unit="D")).strftime("%Y-%m-%d"),
+            "region": np.char.add("region_", rng.integers(0, 8, n).astype(str)),
+            "category": np.char.add("cat_", rng.integers(0, 40, n).astype(str)),
+            "amount": np.round(rng.lognormal(3.0, 1.0, n), 2),
+            "qty": rng.integers(1, 20, n),
+        }
+    )
+
+
+def benchmark(sizes: Sequence[int] = (250_000, 1_000_000, 4_000_000), repeats: int = 3) -> List[Dict[str, Any]]:
+    """
+    Read time vs dataset size for a single file, a month-partitioned and a month x region layout:
+    full read, one projected column, the last 7 days, one region, and 7 days of one region, via
+    read_dataset (pandas) and DuckDB (SUM over scan_sql + prune_sql).
+    """
+    import shutil
+    import statistics
+    import tempfile
+    import time
+
+    import duckdb
+
+    layouts = {
+        "single": ParquetLayout(),
+        "month": ParquetLayout(time_column="event_date", bucket="month"),
+        "month+region": ParquetLayout(time_column="event_date", bucket="month", dims=["region"]),
+    }
+    last7 = {"column": "event_date", "op": "ge", "value": "2024-12-24", "time": True}
+    one_region = {"column": "region", "op": "eq", "value": "region_3"}
+    reads = {
+        "full": (None, []),
+        "1 column": (["amount"], []),
+        "last 7 days": (["event_date", "amount"], [last7]),
+        "one region": (["region", "amount"], [one_region]),
+        "7 days, 1 region": (["amount"], [last7, one_region]),
+    }
+
+    def timed(fn: Any) -> float:
+        ts = []
+        for _ in range(repeats):
+            t0 = time.perf_counter()
+            fn()
+            ts.append(time.perf_counter() - t0)
+        return statistics.median(ts) * 1000
+
+    rows: List[Dict[str, Any]] = []
+    tmp = Path(tempfile.mkdtemp())
+    con = duckdb.connect()
+    try:
+        for n in sizes:
+            df = _bench_frame(n)
+            for lname, layout in layouts.items():
+                root = tmp / f"{lname}_{n}"
+                if layout.partitioned:
+                    root.mkdir()
+                    save_layout(root, layout)
+                    write_partitioned(df, root, layout, "part-000000.parquet")
+                    target: Path = root
+                else:
+                    target = tmp / f"{lname}_{n}.parquet"
+                    write_table(df, target, layout)
+                for rname, (cols, flt) in reads.items():
+                    where = []
+                    for f in flt:
+                        if f.get("time"):
+                            where.append(f"TRY_CAST(event_date AS TIMESTAMP) >= TIMESTAMP '{f['value']}'")
+                        else:
+                            where.append(f"region = '{f['value']}'")
+                    where += prune_sql(load_layout(target), flt)
+                    sql = f"SELECT SUM(amount) FROM {scan_sql(target)}" + (" WHERE " + " AND ".join(where) if where else "")
+                    touched, total = fragments_touched(target, flt)
+                    rows.append(
+                        {
+                            "rows": n,
+                            "layout": lname,
+                            "read": rname,
+                            "files": f"{touched}/{total}",
+                            "pandas_ms": round(timed(lambda: read_dataset(target, cols, flt)), 1),
+                            "duckdb_ms": round(timed(lambda: con.execute(sql).fetchone()), 1),
+                        }
+                    )
+    finally:
+        con.close()
+        shutil.rmtree(tmp, ignore_errors=True)
+    return rows
+
+
+if __name__ == "__main__":
+    import argparse
+
+    ap = argparse.ArgumentParser(description="Read-time scaling of the cached Parquet layouts")
+    ap.add_argument("--rows", default="250000,1000000,4000000", help="comma-separated dataset sizes")
+    ap.add_argument("--repeats", type=int, default=3)
+    args = ap.parse_args()
+    result = benchmark([int(x) for x in args.rows.split(",")], args.repeats)
+    print(f"{'rows':>9}  {'layout':<13} {'read':<17} {'files':>7} {'pandas_ms':>10} {'duckdb_ms':>10}")
+    for r in result:
+        print(
+            f"{r['rows']:>9}  {r['layout']:<13} {r['read']:<17} {r['files']:>7} {r['pandas_ms']:>10} {r['duckdb_ms']:>10}"
+        )
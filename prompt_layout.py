@@ -0,0 +1,178 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence
+
+from memory_store import safe_json_dumps
+
+# Static part of every step prompt. Must stay byte-identical across steps so the
+# model server (Ollama) can reuse the KV-cache for the prefix; anything that varies
+# per step/click belongs in the suffix.
+STEP_PROMPT_RULES = """
+You are a multi-agent TEAM executing one step of a dashboard-building workflow.
+
+Context:
+- Model: Ollama deepseek-r1:8b
+- Human-in-loop: ALWAYS (user approves each step in UI)
+- Database profile (tables/columns with stats/samples) is provided as JSON below.
+
+Rules:
+- Be extremely detailed and practical.
+- SQLBuilder must produce SELECT-only SQL (read-only) and MUST output JSON (no extra text).
+- Reviewer must end with exactly "APPROVE_STEP" if the step is acceptable, otherwise list specific fixes.
+- Do NOT proceed to other steps.
+""".strip()
+
+PROFILE_JSON_MAX_CHARS = 60000
+
+_PROFILE_CACHE_SIZE = 8
+_profile_json_cache: "OrderedDict[str, str]" = OrderedDict()
+
+
+def profile_hash(profile: Dict[str, Any]) -> str:
+    """
+    Fingerprint of everything DB_PROFILE_JSON embeds: the profile serialized exactly as the
+    prompt does, minus indentation. Without indent json.dumps runs in C, about 4x faster than
+    the indented text it stands for, so any change to types, descriptions, sample rows or column
+    stats gives a new hash.
+    """
+    text = safe_json_dumps(profile, indent=None)
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+
+
+def profile_json(profile: Dict[str, Any], max_chars: int = PROFILE_JSON_MAX_CHARS) -> str:
+    """Serialized DB_PROFILE_JSON, memoized by profile hash (small LRU)."""
+    key = f"{profile_hash(profile)}:{max_chars}"
+    cached = _profile_json_cache.get(key)
+    if cached is not None:
+        _profile_json_cache.move_to_end(key)
+        return cached
+
+    # Use safe_json_dumps so Timestamp/Date won't crash prompts
+    text = safe_json_dumps(profile, indent=2)[:max_chars]
+    _profile_json_cache[key] = text
+    while len(_profile_json_cache) > _PROFILE_CACHE_SIZE:
+        _profile_json_cache.popitem(last=False)
+    return text
+
+
+def stable_prefix(profile: Dict[str, Any]) -> str:
+    """System rules + profile: identical for every step that shares the same profile."""
+    return f"{STEP_PROMPT_RULES}\n\nDB_PROFILE_JSON:\n{profile_json(profile)}\n"
+
+
+def step_suffix(
+    step_key: str,
+    step_goal: str,
+    user_request: str,
+    carryover: str = "",
+    executed: str = "",
+    step_tables: Sequence[Dict[str, Any]] = (),
+) -> str:
+    prev = ""
+    if step_tables:
+        prev += (
+            "\nSTEP_TABLES_JSON (more tables relevant to this step, same format as DB_PROFILE_JSON tables):\n"
+            f"{safe_json_dumps(list(step_tables), indent=2)[:PROFILE_JSON_MAX_CHARS]}\n"
+        )
+    if carryover:
+        prev += f"\nPREVIOUS_STEPS_JSON (compact results of earlier steps):\n{carryover}\n"
+    if executed:
+        prev += f"\nEXECUTED_DATASETS (cached results the dashboard is compiled from):\n{executed}"
+    return f"""{prev}
+STEP: {step_key}
+Goal: {step_goal}
+
+User dashboard request (may be empty in early steps):
+{user_request}
+
+Execute ONLY {step_key}.
+"""
+
+
+def build_step_prompt(
+    step_key: str,
+    step_goal: str,
+    user_request: str,
+    profile: Dict[str, Any],
+    carryover: str = "",
+    executed: str = "",
+    step_tables: Sequence[Dict[str, Any]] = (),
+) -> str:
+    return stable_prefix(profile) + step_suffix(step_key, step_goal, user_request, carryover, executed, step_tables)
+
+
+def common_prefix_len(a: str, b: str) -> int:
+    n = min(len(a), len(b))
+    i = 0
+    while i < n and a[i] == b[i]:
+        i += 1
+    return i
+
+
+# ---------- measurement harness ----------
+
+def measure_prompt_eval(
+    prompts: Dict[str, str],
+    model: Optional[str] = None,
+    host: Optional[str] = None,
+    num_predict: int = 1,
+) -> List[Dict[str, Any]]:
+    """
+    Send each prompt to Ollama /api/generate (in order) and report prompt-eval
+    stats per step. With prefix reuse working, prompt_eval_count after the first
+    step should drop to roughly the suffix size.
+    """
+    from ollama import Client
+
+    client = Client(host=host or os.getenv("OLLAMA_BASE_URL", "http://localhost:11434"))
+    model = model or os.getenv("OLLAMA_MODEL", "qwen2.5:7b")
+
+    rows: List[Dict[str, Any]] = []
+    prev = ""
+    for step_key, prompt in prompts.items():
+        t0 = time.perf_counter()
+        resp = client.generate(model=model, prompt=prompt, options={"num_predict": num_predict})
+        wall = time.perf_counter() - t0
+        rows.append(
+            {
+                "step": step_key,
+                "prompt_chars": len(prompt),
+                "shared_prefix_chars": common_prefix_len(prev, prompt),
+                "prompt_eval_count": resp.get("prompt_eval_count"),
+                "prompt_eval_ms": (resp.get("prompt_eval_duration") or 0) / 1e6,
+                "load_ms": (resp.get("load_duration") or 0) / 1e6,
+                "wall_ms": wall * 1000,
+            }
+        )
+        prev = prompt
+    return rows
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from prompts import STEPS
+    from schema_index import synthetic_catalog
+
+    ap = argparse.ArgumentParser(description="Measure per-step prompt-eval time / prefix reuse")
+    ap.add_argument("--host", default=None, help="Ollama URL (default: OLLAMA_BASE_URL)")
+    ap.add_argument("--model", default=None)
+    ap.add_argument("--tables", type=int, default=40)
+    ap.add_argument("--request", default="leadership dashboard: earnings, redemptions, active customers")
+    ap.add_argument("--stub", action="store_true", help="run against a local stub server instead of Ollama")
+    args = ap.parse_args()
+
+    prof = synthetic_catalog(args.tables)
+    step_prompts = {k: build_step_prompt(k, goal, args.request, prof) for k, goal in STEPS}
+    if args.stub:
+        from ollama_stub import StubOllamaServer
+
+        with StubOllamaServer() as stub:
+            print(json.dumps(measure_prompt_eval(step_prompts, model=args.model, host=stub.url), indent=2))
+    else:
+        print(json.dumps(measure_prompt_eval(step_prompts, model=args.model, host=args.host), indent=2))
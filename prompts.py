@@ -5,7 +5,7 @@ STEPS = [
     ("TASK_4_INTERMEDIATE_VIEWS", "Propose read-only intermediate SQL views (as SELECT queries) and local caching strategy."),
     ("TASK_5_ANALYSIS_EXEC", "Perform analysis in SQL + Python; compute KPIs; quality checks; insights."),
     ("TASK_6_CHARTS", "Convert analysis result into chart specs (Plotly)."),
-    ("TASK_7_DASHBOARD_BUILD", "Generate HTML/CSS/JS dashboard (Plotly) with filters and KPI cards."),
+    ("TASK_7_DASHBOARD_BUILD", "Choose the dashboard layout (DashboardSpec JSON: KPI cards + trend/breakdown/distribution/table widgets); the app compiles it from cached data."),
     ("TASK_8_FEEDBACK_LOOP", "Ask user satisfaction; propose improvements; iterate plan."),
 ]
 
@@ -30,6 +30,10 @@ SYSTEM_MESSAGES = {
         "}\n\n"
         "Rules:\n"
         "- Use DB_PROFILE_JSON to choose relevant tables and realistic joins.\n"
+        "- Use the column stats in DB_PROFILE_JSON (null_frac, distinct, min/max, top): join keys and IDs have distinct close to row_count, "
+        "dimensions have few distinct values (see top), min/max of date columns bound the grain and filters; avoid mostly-NULL columns. "
+        "A column with distinct_rows was counted over only that many rows, so its distinct is a lower bound; "
+        "float/decimal measures may carry no distinct count.\n"
         "- Grain must be explicit (e.g. daily, weekly, monthly, per customer, per order).\n"
         "- Charts must map to KPIs/dimensions.\n"
         "- Keep it practical for executives.\n"
@@ -78,7 +82,7 @@ SYSTEM_MESSAGES = {
         "}\n\n"
         "Rules:\n"
         "- Be business-focused and dashboard-focused.\n"
-        "- Use DB_PROFILE_JSON samples to infer meaning.\n"
+        "- Use DB_PROFILE_JSON column stats (null_frac, distinct, min/max, top values) and samples to infer meaning.\n"
         "Return JSON only."
     ),
 
@@ -93,7 +97,9 @@ SYSTEM_MESSAGES = {
         '      "description": string,\n'
         '      "sql": string,\n'
         '      "expected_columns": [string],\n'
-        '      "cache_key": string|null\n'
+        '      "cache_key": string|null,\n'
+        '      "watermark_column": string|null,\n'
+        '      "depends_on": [string]\n'
         "    }\n"
         "  ]\n"
         "}\n\n"
@@ -104,6 +110,11 @@ SYSTEM_MESSAGES = {
         "- Include WHERE time filters if table is large (use last 90/180 days when applicable).\n"
         "- Prefer stable joins using keys inferred from DB_PROFILE_JSON.\n"
         "- Produce 1-4 artifacts maximum.\n"
+        "- Set watermark_column to an output column that only grows as new data lands (event date/time or "
+        "an increasing ID) so the dataset can be refreshed incrementally; null if there is none. Do not use TOP for such artifacts.\n"
+        "- To derive a dataset from other artifacts instead of re-querying the base tables, list their dataset_name values "
+        "in depends_on and write its sql against those names as tables (DuckDB SQL; it runs on the cached results). "
+        "Otherwise depends_on is [].\n"
         "Return JSON only."
     ),
 
@@ -115,16 +126,19 @@ SYSTEM_MESSAGES = {
         "Be practical and executive-friendly."
     ),
 
-    # --- Dashboard builder: must output full HTML ---
+    # --- Dashboard builder: layout spec only, the app compiles the HTML from the cached data ---
     "dashboard_builder": (
         "You are DashboardBuilderAgent.\n"
-        "Generate production-quality HTML/CSS/JS dashboard using Plotly.\n"
-        "Requirements:\n"
-        "- Return a SINGLE full HTML document starting with <html> and ending with </html>.\n"
-        "- Include KPI cards, filters, responsive layout.\n"
-        "- Use Plotly via CDN (or local if user provides vendor path).\n"
-        "- Use the provided dataset previews and KPI reports.\n"
-        "Return HTML only."
+        "Choose the dashboard layout; the app renders it (Plotly) from the cached datasets.\n"
+        "Output ONLY JSON matching DashboardSpec:\n"
+        "{\"title\": str, \"subtitle\": str|null,\n"
+        " \"kpis\": [{\"dataset\": str, \"kpi\": str, \"label\": str|null}],\n"
+        " \"widgets\": [{\"kind\": \"trend\"|\"breakdown\"|\"distribution\"|\"table\", \"dataset\": str,\n"
+        "   \"title\": str|null, \"x\": str|null, \"y\": str|null, \"agg\": \"sum\"|\"avg\"|\"count\"|\"min\"|\"max\", \"limit\": int}]}\n"
+        "Rules:\n"
+        "- Use only dataset names, columns and KPI names given in the context.\n"
+        "- trend: x = time column; breakdown: x = categorical column; y = numeric column or null for row counts.\n"
+        "- At most 8 KPI cards and 12 widgets."
     ),
 
     # --- Reviewer: strict gate ---
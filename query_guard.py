@@ -0,0 +1,792 @@
+"""
+Static cost guard for artifact SQL, run before anything reaches the warehouse.
+
+`safety.enforce_select_only` keeps writes out; this catches reads that are legal but expensive,
+by parsing each query with sqlparse and cross-checking the tables it reads against the row and
+column counts in the DB profile:
+- cartesian joins: a CROSS JOIN, a JOIN without ON/USING, or comma-joined tables / ON clauses
+  with no predicate linking the two sides;
+- unfiltered scans: a table of GUARD_LARGE_ROWS or more read without a WHERE condition on it;
+- SELECT * over a table of GUARD_WIDE_COLS or more columns.
+
+What happens next depends on QUERY_GUARD_POLICY (medium findings are only ever reported):
+  warn     report every finding as a risk and run as written
+  cap      block critical findings; restrict high ones to the last GUARD_WINDOW_DAYS on the
+           artifact's watermark column when it is a date column of the tables scanned, and hold
+           them for confirmation when no such window applies (a row limit is no cap: GROUP BY,
+           ORDER BY and DISTINCT still read everything, and it silently cuts results)
+  confirm  hold critical and high findings until someone approves that exact SQL
+  block    refuse critical and high findings
+The parsed shape of a query is cached by its text (comments and layout ignored), so reviewing
+the same artifacts again only redoes the profile lookups.
+"""
+from __future__ import annotations
+
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import asdict, dataclass, field
+from datetime import date, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+from artifact_dag import normalize_sql
+from incremental import top_level_words, wrap_since
+from models import SQLArtifact
+
+POLICY = os.getenv("QUERY_GUARD_POLICY", "confirm")  # warn | cap | confirm | block
+LARGE_ROWS = int(os.getenv("GUARD_LARGE_ROWS", "10000000"))
+WIDE_COLS = int(os.getenv("GUARD_WIDE_COLS", "40"))
+WINDOW_DAYS = int(os.getenv("GUARD_WINDOW_DAYS", "90"))
+PARSE_CACHE_SIZE = int(os.getenv("GUARD_PARSE_CACHE", "512"))
+
+POLICIES = ("warn", "cap", "confirm", "block")
+_ACTIONS = {
+    "warn": {"critical": "warn", "high": "warn"},
+    "cap": {"critical": "block", "high": "cap"},
+    "confirm": {"critical": "confirm", "high": "confirm"},
+    "block": {"critical": "block", "high": "block"},
+}
+_SEVERITY = {"medium": 1, "high": 2, "critical": 3}
+_DATE_TYPES = ("date", "datetime", "datetime2", "smalldatetime", "datetimeoffset", "timestamp")
+
+
+# ---------- query shape (profile-independent, cached) ----------
+
+Ref = Tuple[Optional[str], str]  # (qualifier, column), lower-case
+
+
+@dataclass
+class _Source:
+    alias: str  # what column references qualify it with, lower-case
+    table: Optional[str] = None  # "schema.table" / "table" as written; None for CTEs, subqueries, functions
+    cte: Optional[str] = None  # the CTE it reads
+    join: str = "from"  # from (first / comma item) | on | using | natural | cross | apply | bare (JOIN without ON)
+    ref: str = ""  # the qualifier as written, for predicates added to the query
+    outer: str = ""  # left | right | full for outer joins / OUTER APPLY
+
+
+@dataclass
+class _Scope:
+    """One SELECT: its FROM items, the comparisons that could link them, and its WHERE columns."""
+
+    name: Optional[str] = None  # CTE name or derived-table alias the scope is read through
+    sources: List[_Source] = field(default_factory=list)
+    links: List[List[Ref]] = field(default_factory=list)  # column refs of each ON / WHERE comparison
+    filters: List[Ref] = field(default_factory=list)  # column refs anywhere in WHERE
+    stars: List[Optional[str]] = field(default_factory=list)  # None for *, the qualifier for x.*
+    columns: List[str] = field(default_factory=list)  # output columns passed through unchanged; "*" for a star
+    capped: bool = False  # TOP / LIMIT / FETCH
+    ordered: bool = False  # ORDER BY / GROUP BY / DISTINCT: a cap still reads everything
+
+
+@dataclass
+class _Shape:
+    scopes: List[_Scope]
+    ctes: Set[str]
+    error: Optional[str] = None
+
+
+_shape_cache: "OrderedDict[str, _Shape]" = OrderedDict()
+_shape_lock = threading.Lock()
+_cache_stats = {"hits": 0, "misses": 0}
+
+
+def _unquote(name: str) -> str:
+    return name[1:-1] if name[:1] in '["`' and len(name) > 1 else name
+
+
+def _is_select(tok: Any) -> bool:
+    from sqlparse import tokens as T
+
+    return any(t.ttype is T.DML and t.normalized == "SELECT" for t in tok.tokens)
+
+
+def _meaningful(tokens: Iterable[Any]) -> List[Any]:
+    from sqlparse import tokens as T
+
+    return [t for t in tokens if not t.is_whitespace and t.ttype not in T.Comment and t.ttype is not T.Punctuation]
+
+
+def _names(ident: Any) -> List[str]:
+    """Dotted name parts directly under an Identifier (not its alias)."""
+    from sqlparse import tokens as T
+
+    out = []
+    for t in ident.tokens:
+        if t.ttype in T.Name or t.ttype in T.Literal.String.Symbol:
+            out.append(_unquote(t.value))
+        elif t.is_keyword and t.normalized == "AS":
+            break
+        elif t.is_group:
+            break  # the alias
+    return out
+
+
+def _refs(tok: Any, out: List[Ref], scopes: List[_Scope], ctes: Set[str]) -> None:
+    """Column references under `tok`; subqueries become scopes of their own."""
+    from sqlparse import sql as S
+    from sqlparse import tokens as T
+
+    for t in tok.tokens:
+        if isinstance(t, S.Parenthesis) and _is_select(t):
+            _scope(t, scopes, ctes)
+        elif isinstance(t, S.Identifier) and not any(c.is_group for c in t.tokens):
+            parts = [p.lower() for p in _names(t)]
+            if parts:
+                out.append((parts[-2] if len(parts) > 1 else None, parts[-1]))
+        elif t.ttype in T.Name:
+            out.append((None, _unquote(t.value).lower()))
+        elif t.is_group:
+            _refs(t, out, scopes, ctes)
+
+
+def _comparisons(tokens: Iterable[Any], scope: _Scope, scopes: List[_Scope], ctes: Set[str]) -> None:
+    from sqlparse import sql as S
+
+    for t in tokens:
+        if isinstance(t, S.Parenthesis) and _is_select(t):
+            _scope(t, scopes, ctes)
+        elif isinstance(t, S.Comparison):
+            refs: List[Ref] = []
+            _refs(t, refs, scopes, ctes)
+            scope.links.append(refs)
+        elif t.is_group:
+            _comparisons(t.tokens, scope, scopes, ctes)
+
+
+def _source(tok: Any, join: str, scope: _Scope, scopes: List[_Scope], ctes: Set[str]) -> None:
+    from sqlparse import sql as S
+
+    if isinstance(tok, S.Parenthesis):  # unaliased derived table
+        if _is_select(tok):
+            _scope(tok, scopes, ctes)
+        scope.sources.append(_Source(alias="", join=join))
+        return
+    if not isinstance(tok, S.Identifier):
+        if isinstance(tok, S.Function):
+            scope.sources.append(_Source(alias=tok.get_name().lower(), join=join))
+        return
+    first = _meaningful(tok.tokens)[0]
+    alias = (tok.get_alias() or "").strip()
+    if isinstance(first, (S.Parenthesis, S.Function)):
+        if isinstance(first, S.Parenthesis) and _is_select(first):
+            _scope(first, scopes, ctes, name=_unquote(alias).lower() or None)
+        scope.sources.append(_Source(alias=_unquote(alias).lower(), join=join))
+        return
+    parts = _names(tok)
+    if not parts:
+        return
+    if parts[0].upper() == "APPLY":  # sqlparse reads CROSS / OUTER APPLY f(x) as CROSS + Identifier
+        scope.sources.append(_Source(alias=_unquote(alias).lower(), join="apply", ref=alias))
+        return
+    table = ".".join(parts[-2:])
+    is_cte = len(parts) == 1 and parts[0].lower() in ctes
+    scope.sources.append(
+        _Source(
+            alias=_unquote(alias or parts[-1]).lower(),
+            table=None if is_cte else table,
+            cte=parts[0].lower() if is_cte else None,
+            join=join,
+            ref=tok.get_name() or "",
+        )
+    )
+
+
+def _scope(tl: Any, scopes: List[_Scope], ctes: Set[str], name: Optional[str] = None) -> None:
+    """Walk one statement / parenthesis level; UNION branches each get their own scope."""
+    from sqlparse import sql as S
+    from sqlparse import tokens as T
+
+    scope = _Scope(name=name)
+    scopes.append(scope)
+    mode, join, side = None, "from", ""
+    toks = _meaningful(tl.tokens)
+    for i, t in enumerate(toks):
+        kw = t.normalized if t.is_keyword else None
+        if t.ttype is T.Keyword.CTE:
+            if i == 0:
+                mode = "cte"
+            else:
+                mode = "hint"  # WITH (NOLOCK) table hint
+            continue
+        if mode == "cte" and isinstance(t, (S.Identifier, S.IdentifierList)):
+            for ident in t.get_identifiers() if isinstance(t, S.IdentifierList) else [t]:
+                if not isinstance(ident, S.Identifier):
+                    continue
+                cte = _unquote(ident.get_name() or "").lower()
+                ctes.add(cte)
+                body = next((c for c in ident.tokens if isinstance(c, S.Parenthesis) and _is_select(c)), None)
+                if body is not None:
+                    _scope(body, scopes, ctes, name=cte)
+            continue
+        if mode == "hint" and isinstance(t, S.Parenthesis):
+            mode = None
+            continue
+        if t.ttype is T.DML and t.normalized == "SELECT":
+            if scope.sources or scope.stars or mode not in (None, "cte"):
+                scope = _Scope(name=name)  # next UNION / EXCEPT branch
+                scopes.append(scope)
+            mode = "select"
+            continue
+        if kw is not None:
+            if kw == "FROM":
+                mode, join, side = "from", "from", ""
+            elif kw.endswith("JOIN"):
+                mode = "from"
+                join = "cross" if kw.startswith("CROSS") else "natural" if kw.startswith("NATURAL") else "bare"
+                side = next((o for o in ("left", "right", "full") if kw.startswith(o.upper())), "")
+            elif kw in ("ON", "USING"):
+                if scope.sources:
+                    scope.sources[-1].join = kw.lower()
+                mode = "on"
+            elif kw in ("CROSS", "OUTER"):
+                mode, join = "from", "apply"  # CROSS / OUTER APPLY
+                side = "left" if kw == "OUTER" else ""
+            elif kw in ("GROUP BY", "ORDER BY"):
+                scope.ordered = True
+                mode = "other"
+            elif kw == "DISTINCT":
+                scope.ordered = True
+            elif kw in ("TOP", "LIMIT", "FETCH"):
+                scope.capped = True
+            elif kw in ("HAVING", "WINDOW", "QUALIFY", "OFFSET"):
+                mode = "other"
+            elif kw.startswith("UNION") or kw in ("EXCEPT", "INTERSECT", "MINUS"):
+                mode = "set"
+            continue
+        if isinstance(t, S.Where):
+            _refs(t, scope.filters, scopes, ctes)
+            _comparisons(t.tokens, scope, [], set())  # subqueries were collected by _refs
+            mode = "other"
+            continue
+        if mode == "select":
+            if isinstance(t, S.Function) and t.get_name() and t.get_name().upper() == "TOP":
+                scope.capped = True
+            elif isinstance(t, S.Identifier) and _names(t)[:1] == ["TOP"]:
+                scope.capped = True
+            else:
+                _columns(t, scope)
+                _stars(t, scope, scopes, ctes)
+        elif mode == "from":
+            for item in t.get_identifiers() if isinstance(t, S.IdentifierList) else [t]:
+                n = len(scope.sources)
+                _source(item, join, scope, scopes, ctes)
+                if len(scope.sources) > n:
+                    scope.sources[-1].outer = side
+                join, side = "from", ""  # further comma items
+        elif mode == "on":
+            _comparisons([t], scope, scopes, ctes)
+        elif t.is_group:
+            _refs(t, [], scopes, ctes)  # subqueries in GROUP BY / HAVING / ORDER BY
+
+
+def _columns(tok: Any, scope: _Scope) -> None:
+    """Output columns that are a bare column reference under its own name (a.col, col AS col)."""
+    from sqlparse import sql as S
+    from sqlparse import tokens as T
+
+    for item in tok.get_identifiers() if isinstance(tok, S.IdentifierList) else [tok]:
+        if item.ttype is T.Wildcard or (isinstance(item, S.Identifier) and any(c.ttype is T.Wildcard for c in item.tokens)):
+            scope.columns.append("*")
+        elif isinstance(item, S.Identifier):
+            first, parts = _meaningful(item.tokens)[0], _names(item)
+            plain = first.ttype in T.Name or first.ttype in T.Literal.String.Symbol
+            if plain and parts and _unquote(item.get_name() or "").lower() == parts[-1].lower():
+                scope.columns.append(parts[-1].lower())
+
+
+def _stars(tok: Any, scope: _Scope, scopes: List[_Scope], ctes: Set[str]) -> None:
+    from sqlparse import sql as S
+    from sqlparse import tokens as T
+
+    if tok.ttype is T.Wildcard:
+        scope.stars.append(None)
+    elif isinstance(tok, S.Parenthesis):
+        if _is_select(tok):
+            _scope(tok, scopes, ctes)
+    elif isinstance(tok, S.Identifier) and any(c.ttype is T.Wildcard for c in tok.tokens):
+        parts = _names(tok)
+        scope.stars.append(parts[-1].lower() if parts else None)
+    elif isinstance(tok, (S.Identifier, S.IdentifierList)):
+        for c in tok.tokens:
+            if c.is_group or c.ttype is T.Wildcard:
+                _stars(c, scope, scopes, ctes)
+    elif tok.is_group:
+        _refs(tok, [], scopes, ctes)  # CASE / functions: only their subqueries matter
+
+
+def query_shape(sql: str) -> _Shape:
+    """Parsed shape of `sql`, from the cache when the same text was seen before."""
+    import sqlparse
+
+    key = normalize_sql(sql, fold_case=False)  # cheap regex pass; sqlparse only runs on a miss
+    with _shape_lock:
+        shape = _shape_cache.get(key)
+        if shape is not None:
+            _shape_cache.move_to_end(key)
+            _cache_stats["hits"] += 1
+            return shape
+        _cache_stats["misses"] += 1
+    scopes: List[_Scope] = []
+    ctes: Set[str] = set()
+    try:
+        text = sqlparse.format(sql.strip().rstrip(";"), strip_comments=True)
+        statements = [s for s in sqlparse.parse(text) if s.tokens]
+        for stmt in statements:
+            _scope(stmt, scopes, ctes)
+        shape = _Shape(scopes=scopes, ctes=ctes)
+    except Exception as e:  # sqlparse is lenient, but a reviewer must never take execution down
+        shape = _Shape(scopes=[], ctes=set(), error=f"{type(e).__name__}: {e}")
+    with _shape_lock:
+        _shape_cache[key] = shape
+        while len(_shape_cache) > PARSE_CACHE_SIZE:
+            _shape_cache.popitem(last=False)
+    return shape
+
+
+def parse_cache_stats() -> Dict[str, int]:
+    with _shape_lock:
+        return {**_cache_stats, "size": len(_shape_cache)}
+
+
+# ---------- rewrites ----------
+
+_CLAUSE_ENDS = {"GROUP", "HAVING", "WINDOW", "QUALIFY", "ORDER", "LIMIT", "OFFSET", "FETCH", "OPTION"}
+
+
+def restrict_where(sql: str, predicates: Sequence[str]) -> Optional[str]:
+    """
+    `sql` with `predicates` ANDed into the WHERE clause of its final SELECT (added when there is
+    none), so they bound the scan itself whatever the query groups, sorts or deduplicates. None
+    when the final SELECT is a UNION / EXCEPT / INTERSECT or reads no table.
+    """
+    body = sql.strip().rstrip(";").strip()
+    words = top_level_words(body)
+    names = [w for w, _ in words]
+    if any(w in ("UNION", "EXCEPT", "INTERSECT", "MINUS") for w in names):
+        return None
+    start = names.index("SELECT") if names and names[0] == "WITH" and "SELECT" in names else 0
+    tail = words[start:]
+    if "FROM" not in [w for w, _ in tail]:
+        return None
+    tail = tail[[w for w, _ in tail].index("FROM"):]
+    where = next((pos for w, pos in tail if w == "WHERE"), None)
+    end = next(
+        (pos for k, (w, pos) in enumerate(tail) if pos > (where or 0) and (
+            w in _CLAUSE_ENDS or (w == "FOR" and k + 1 < len(tail) and tail[k + 1][0] in ("XML", "JSON", "BROWSE"))
+        )),
+        len(body),
+    )
+    pred = " AND ".join(predicates)
+    rest = f"\n{body[end:]}" if end < len(body) else ""
+    if where is None:
+        return f"{body[:end].rstrip()}\nWHERE {pred}{rest}"
+    # the original condition keeps its own parentheses (OR) and may end in a -- comment
+    return f"{body[:where]}WHERE {pred} AND (\n{body[where + len('WHERE'):end].strip()}\n){rest}"
+
+
+def window_literal(days: int, dialect: str, today: Optional[date] = None) -> str:
+    d = (today or date.today()) - timedelta(days=days)
+    # YYYYMMDD is the one form SQL Server reads the same under every DATEFORMAT / language
+    return "'" + d.strftime("%Y%m%d" if dialect == "mssql" else "%Y-%m-%d") + "'"
+
+
+# ---------- review ----------
+
+@dataclass
+class Finding:
+    kind: str  # cartesian_join | unfiltered_scan | select_star_wide
+    severity: str  # medium | high | critical
+    detail: str
+    table: Optional[str] = None
+    rows: Optional[int] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+@dataclass
+class GuardReview:
+    dataset_name: str
+    sql_hash: str
+    action: str  # run | warn | cap | confirm | block
+    findings: List[Finding] = field(default_factory=list)
+    sql: Optional[str] = None  # the capped query when action == "cap"
+    note: str = ""
+
+    @property
+    def held(self) -> bool:
+        return self.action in ("confirm", "block")
+
+    def message(self) -> str:
+        what = "needs confirmation" if self.action == "confirm" else "blocked"
+        msg = f"Query guard: {what}: " + "; ".join(f.detail for f in self.findings if f.severity != "medium")
+        return f"{msg} ({self.note})" if self.note else msg
+
+    def risks(self) -> List[str]:
+        out = [f"Query guard ({f.severity}): {f.detail}" for f in self.findings]
+        if self.note:
+            out.append(f"Query guard: {self.note}")
+        return out
+
+    def to_dict(self) -> Dict[str, Any]:
+        d = asdict(self)
+        d["findings"] = [f.to_dict() for f in self.findings]
+        return d
+
+
+class QueryGuardError(ValueError):
+    """Raised with the reviews that held an execution back (blocked, or waiting for confirmation)."""
+
+    def __init__(self, reviews: Sequence[GuardReview]):
+        self.reviews = list(reviews)
+        super().__init__("; ".join(f"{r.dataset_name}: {r.message()}" for r in self.reviews))
+
+
+def sql_hash(sql: str) -> str:
+    """What an approval is tied to: editing the query (beyond layout and comments) voids it."""
+    return hashlib.sha256(normalize_sql(sql).encode("utf-8")).hexdigest()[:16]
+
+
+class _Table:
+    __slots__ = ("name", "rows", "columns")
+
+    def __init__(self, name: str, rows: Optional[int], columns: Dict[str, str]):
+        self.name, self.rows, self.columns = name, rows, columns
+
+
+class QueryGuard:
+    def __init__(
+        self,
+        profile: Optional[Dict[str, Any]] = None,
+        policy: str = POLICY,
+        approved: Iterable[str] = (),
+        large_rows: int = LARGE_ROWS,
+        wide_cols: int = WIDE_COLS,
+        window_days: int = WINDOW_DAYS,
+    ) -> None:
+        if policy not in POLICIES:
+            raise ValueError(f"unknown query guard policy {policy!r}; expected one of {', '.join(POLICIES)}")
+        self.policy = policy
+        self.approved = set(approved)
+        self.large_rows, self.wide_cols = large_rows, wide_cols
+        self.window_days = window_days
+        self._tables: Dict[str, _Table] = {}
+        by_name: Dict[str, List[_Table]] = {}
+        for t in (profile or {}).get("tables", []) or []:
+            name = f"{t.get('schema')}.{t.get('table')}" if t.get("schema") else str(t.get("table"))
+            cols = {
+                str(c.get("COLUMN_NAME", c.get("name", ""))).lower(): str(c.get("DATA_TYPE", "")).lower()
+                for c in t.get("columns", []) or []
+            }
+            tab = _Table(name, t.get("row_count"), cols)
+            self._tables[name.lower()] = tab
+            by_name.setdefault(str(t.get("table")).lower(), []).append(tab)
+        for short, tabs in by_name.items():
+            if len(tabs) == 1:
+                self._tables.setdefault(short, tabs[0])  # unqualified names resolve when unambiguous
+
+    def _table(self, name: Optional[str]) -> Optional[_Table]:
+        return self._tables.get(name.lower()) if name else None
+
+    def inspect(self, sql: str) -> List[Finding]:
+        shape = query_shape(sql)
+        findings: List[Finding] = []
+        # derived tables / CTEs that some outer scope filters: the optimizer pushes that down
+        filtered_outside: Set[str] = set()
+        per_scope = []
+        for scope in shape.scopes:
+            nodes, resolve = self._resolver(scope)
+            filtered = self._filtered(scope, resolve, len(nodes))
+            per_scope.append((scope, nodes, resolve, filtered))
+            filtered_outside.update(scope.sources[i].cte or scope.sources[i].alias for i in filtered)
+        seen: Set[Tuple[str, str]] = set()
+        for scope, nodes, resolve, filtered in per_scope:
+            for f in self._cartesian(scope, nodes, resolve) + self._scans(scope, nodes, filtered, filtered_outside) + self._stars(scope, nodes):
+                if (f.kind, f.detail) not in seen:
+                    seen.add((f.kind, f.detail))
+                    findings.append(f)
+        findings.sort(key=lambda f: -_SEVERITY[f.severity])
+        return findings
+
+    def _resolver(self, scope: _Scope):
+        nodes = [self._table(s.table) for s in scope.sources]
+        by_alias: Dict[str, int] = {}
+        for i, s in enumerate(scope.sources):
+            by_alias.setdefault(s.alias, i)
+            if s.table:
+                by_alias.setdefault(s.table.split(".")[-1].lower(), i)
+        opaque = [i for i, t in enumerate(nodes) if t is None]  # columns unknown
+
+        def resolve(ref: Ref) -> Optional[List[int]]:
+            """Sources a column may belong to; [] for an outer or unknown name, None when any could."""
+            qual, col = ref
+            if qual is not None:
+                return [by_alias[qual]] if qual in by_alias else []
+            owners = [i for i, t in enumerate(nodes) if t is not None and col in t.columns]
+            if len(owners) == 1:
+                return owners
+            if owners or opaque:
+                return None
+            return []
+
+        return nodes, resolve
+
+    def _filtered(self, scope: _Scope, resolve, n: int) -> Set[int]:
+        out: Set[int] = set()
+        refs = list(scope.filters)
+        for link in scope.links:  # an ON condition on one side only (JOIN f ON ... AND f.day >= ...)
+            owners = {i for r in link for i in (resolve(r) or [])}
+            if len(owners) == 1:
+                refs.extend(link)
+        for r in refs:
+            owners = resolve(r)
+            out.update(range(n) if owners is None else owners)
+        return out
+
+    def _cartesian(self, scope: _Scope, nodes: List[Optional[_Table]], resolve) -> List[Finding]:
+        n = len(scope.sources)
+        if n < 2:
+            return []
+        parent = list(range(n))
+
+        def find(i: int) -> int:
+            while parent[i] != i:
+                parent[i] = parent[parent[i]]
+                i = parent[i]
+            return i
+
+        def union(group: Iterable[int]) -> None:
+            group = [find(i) for i in group]
+            for i in group[1:]:
+                parent[i] = group[0]
+
+        for i, s in enumerate(scope.sources):
+            if s.join in ("using", "natural", "apply"):
+                union(range(i + 1))  # joined on same-named columns / correlated with what precedes it
+        for link in scope.links:
+            owners: Set[int] = set()
+            for r in link:
+                o = resolve(r)
+                owners.update([i for i, t in enumerate(nodes) if t is None] if o is None else o)
+            if len(owners) > 1:
+                union(owners)
+
+        out: List[Finding] = []
+        for i in range(1, n):
+            root = find(i)
+            if any(find(j) == root for j in range(i)):
+                continue
+            s = scope.sources[i]
+            left = self._largest([j for j in range(i)], nodes)
+            right = self._largest([j for j in range(n) if find(j) == root], nodes)
+            known = left is not None and right is not None
+            estimate = (left or 1) * (right or 1)
+            explicit = s.join == "cross"
+            if explicit and known and estimate < self.large_rows:
+                continue  # CROSS JOIN to a small calendar / parameter table
+            sev = "critical" if estimate >= self.large_rows else "medium" if explicit else "high"
+            how = "CROSS JOIN" if explicit else "JOIN without a join condition" if s.join in ("bare", "on") else "comma join without a linking WHERE condition"
+            what = self._label(s, nodes[i])
+            size = f"≈{estimate:,} rows" if known else f"≥{estimate:,} rows (some sizes unknown)"
+            out.append(Finding("cartesian_join", sev, f"{how} with {what} ({size})", s.table, estimate))
+        return out
+
+    def _largest(self, idx: List[int], nodes: List[Optional[_Table]]) -> Optional[int]:
+        sizes = [nodes[j].rows for j in idx if nodes[j] is not None and nodes[j].rows is not None]
+        return max(sizes) if sizes else None
+
+    @staticmethod
+    def _label(s: _Source, t: Optional[_Table]) -> str:
+        if t is not None:
+            return t.name
+        return s.alias or "a derived table"
+
+    def _scans(self, scope: _Scope, nodes, filtered: Set[int], filtered_outside: Set[str]) -> List[Finding]:
+        if scope.capped and not scope.ordered:
+            return []  # the engine stops after the first rows
+        if scope.name and scope.name in filtered_outside:
+            return []
+        out = []
+        for i, (s, t) in enumerate(zip(scope.sources, nodes)):
+            if t is None or t.rows is None or t.rows < self.large_rows or i in filtered:
+                continue
+            out.append(Finding("unfiltered_scan", "high", f"{t.name} ({t.rows:,} rows) is read without a WHERE filter", t.name, t.rows))
+        return out
+
+    def _stars(self, scope: _Scope, nodes) -> List[Finding]:
+        out = []
+        for star in scope.stars:
+            for s, t in zip(scope.sources, nodes):
+                if t is None or (star is not None and star != s.alias) or len(t.columns) < self.wide_cols:
+                    continue
+                out.append(Finding("select_star_wide", "medium", f"SELECT * over {t.name} ({len(t.columns)} columns)", t.name, t.rows))
+        return out
+
+    def review(self, art: SQLArtifact, dialect: str, quote=lambda c: c) -> GuardReview:
+        sql = art.sql.strip()
+        h = sql_hash(sql)
+        findings = self.inspect(sql)
+        worst = max((f.severity for f in findings), key=_SEVERITY.__getitem__, default=None)
+        if worst is None:
+            return GuardReview(art.dataset_name, h, "run")
+        action = "warn" if worst == "medium" else _ACTIONS[self.policy][worst]
+        review = GuardReview(art.dataset_name, h, action, findings)
+        if action == "cap":
+            self._cap(review, art, sql, dialect, quote)
+        if review.action == "confirm" and h in self.approved:
+            review.action, review.note = "warn", "run as approved"
+        return review
+
+    def _cap(self, review: GuardReview, art: SQLArtifact, sql: str, dialect: str, quote) -> None:
+        """Restrict the scanned tables to the last `window_days`, or hold the query for confirmation."""
+        col = art.watermark_column or ""
+        serious = [f for f in review.findings if f.severity != "medium"]
+        tables = [self._table(f.table) for f in serious]
+        if any(f.kind != "unfiltered_scan" for f in serious):
+            why = "a date window does not bound a join without a join condition"
+        elif not col:
+            why = "no watermark column to restrict it to"
+        elif not all(t is not None and t.columns.get(col.lower(), "").startswith(_DATE_TYPES) for t in tables):
+            why = f"{col} is not a date column of every table scanned"
+        else:
+            since = window_literal(self.window_days, dialect)
+            review.sql, why = self._window(sql, {t.name for t in tables}, col.lower(), quote(col), since)
+            if review.sql is not None:
+                review.note = f"restricted to the last {self.window_days} days of {col}"
+                return
+        review.action, review.note = "confirm", f"not capped: {why}"
+
+    def _window(self, sql: str, tables: Set[str], col: str, column_sql: str, since: str) -> Tuple[Optional[str], str]:
+        """(`sql` with `tables` restricted to `column_sql >= since`, or None and why not)."""
+        shape = query_shape(sql)
+        if shape.error or not shape.scopes:
+            return None, "the query could not be parsed"
+        outer = shape.scopes[0]
+        nodes = [self._table(s.table) for s in outer.sources]
+        direct = [i for i, t in enumerate(nodes) if t is not None and t.name in tables]
+        nullable = {
+            i for i, s in enumerate(outer.sources)
+            if s.outer in ("left", "full") or any(o.outer in ("right", "full") for o in outer.sources[i + 1:])
+        }
+        if {nodes[i].name for i in direct} == tables and not nullable & set(direct):
+            # into the final SELECT's own WHERE: bounds the scan even under GROUP BY / ORDER BY
+            out = restrict_where(sql, [f"{outer.sources[i].ref}.{column_sql} >= {since}" for i in direct])
+            if out is not None:
+                return out, ""
+        # otherwise around the whole query, which only the optimizer can push down to the scan
+        if any(s.ordered for s in shape.scopes):
+            return None, "the table is read inside a grouped, sorted or DISTINCT subquery"
+        if not self._passes(shape, outer, col):
+            return None, f"the query does not return {col} unchanged"
+        out = wrap_since(sql, column_sql, since)
+        return (out, "") if out is not None else (None, "the query limits its own rows")
+
+    def _passes(self, shape: _Shape, scope: _Scope, col: str, depth: int = 0) -> bool:
+        """Whether `scope` outputs `col` as read, directly or through a star over tables / CTEs."""
+        if col in scope.columns:
+            return True
+        if "*" not in scope.columns or depth > 8:
+            return False
+        for s in scope.sources:
+            t = self._table(s.table)
+            if t is not None:
+                if col in t.columns:
+                    return True
+                continue
+            name = s.cte or s.alias
+            inner = [sc for sc in shape.scopes if name and sc.name == name]
+            if inner and all(self._passes(shape, sc, col, depth + 1) for sc in inner):
+                return True
+        return False
+
+    def screen(
+        self, artifacts: Sequence[SQLArtifact], dialect: str, quote=lambda c: c
+    ) -> Tuple[List[SQLArtifact], Dict[str, GuardReview], Dict[str, str]]:
+        """
+        (artifacts to run, reviews by dataset, held dataset -> reason). Capped artifacts come back
+        with the rewritten SQL; held ones are dropped together with everything depending on them.
+        `depends_on` artifacts run in DuckDB over cached results and are not reviewed.
+        """
+        reviews: Dict[str, GuardReview] = {}
+        held: Dict[str, str] = {}
+        for a in artifacts:
+            if a.depends_on:
+                continue
+            r = reviews[a.dataset_name] = self.review(a, dialect, quote)
+            if r.held:
+                held[a.dataset_name] = r.message()
+        changed = True
+        while changed:
+            changed = False
+            for a in artifacts:
+                up = [d for d in a.depends_on if d in held]
+                if a.dataset_name not in held and up:
+                    held[a.dataset_name] = f"Query guard: upstream dataset {up[0]} was held back"
+                    changed = True
+        kept = []
+        for a in artifacts:
+            if a.dataset_name in held:
+                continue
+            r = reviews.get(a.dataset_name)
+            kept.append(a.model_copy(update={"sql": r.sql}) if r is not None and r.sql else a)
+        return kept, reviews, held
+
+
+def approvals(mem_json: Dict[str, Any]) -> List[str]:
+    return list(mem_json.get("guard_approvals") or [])
+
+
+def approve(mem_json: Dict[str, Any], hashes: Iterable[str], keep: int = 500) -> None:
+    """Record approved query hashes in memory.json (newest last, bounded)."""
+    new = list(dict.fromkeys(hashes))
+    merged = [h for h in approvals(mem_json) if h not in new] + new
+    mem_json["guard_approvals"] = merged[-keep:]
+
+
+def guard_from_memory(mem_json: Dict[str, Any], policy: Optional[str] = None) -> QueryGuard:
+    return QueryGuard(mem_json.get("db_profile"), policy or POLICY, approvals(mem_json))
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+    import time
+
+    ap = argparse.ArgumentParser(description="Review SQL against a DB profile (memory.json) and time cached re-checks")
+    ap.add_argument("sql", nargs="?", help="query to review; default: a few built-in examples")
+    ap.add_argument("--memory", default=os.path.join(os.getenv("CACHE_DIR", "./cache"), "memory.json"))
+    ap.add_argument("--policy", default=POLICY, choices=POLICIES)
+    ap.add_argument("--dialect", default="mssql")
+    args = ap.parse_args()
+
+    try:
+        with open(args.memory, "r", encoding="utf-8") as f:
+            profile = json.load(f).get("db_profile")
+    except (OSError, ValueError):
+        profile = None
+    if not profile:
+        cols = [{"COLUMN_NAME": f"c{i}", "DATA_TYPE": "int"} for i in range(60)]
+        profile = {"tables": [
+            {"schema": "dbo", "table": "sales", "row_count": 50_000_000,
+             "columns": cols + [{"COLUMN_NAME": "order_date", "DATA_TYPE": "date"}, {"COLUMN_NAME": "customer_id", "DATA_TYPE": "int"}]},
+            {"schema": "dbo", "table": "customers", "row_count": 2_000_000,
+             "columns": [{"COLUMN_NAME": "customer_id", "DATA_TYPE": "int"}, {"COLUMN_NAME": "region", "DATA_TYPE": "nvarchar"}]},
+        ]}
+    queries = [args.sql] if args.sql else [
+        "SELECT * FROM dbo.sales",
+        "SELECT s.order_date, c.region FROM dbo.sales s, dbo.customers c WHERE s.order_date >= '20240101'",
+        "SELECT c.region, SUM(s.c1) AS v FROM dbo.sales s JOIN dbo.customers c ON c.customer_id = s.customer_id "
+        "WHERE s.order_date >= '20240101' GROUP BY c.region",
+    ]
+    guard = QueryGuard(profile, args.policy)
+    for q in queries:
+        t0 = time.perf_counter()
+        r = guard.review(SQLArtifact(dataset_name="q", description="", sql=q, watermark_column="order_date"), args.dialect)
+        cold = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        guard.review(SQLArtifact(dataset_name="q", description="", sql=q, watermark_column="order_date"), args.dialect)
+        warm = time.perf_counter() - t0
+        print(json.dumps({**r.to_dict(), "cold_ms": round(cold * 1000, 2), "cached_ms": round(warm * 1000, 2)}, default=str))
+    print(json.dumps(parse_cache_stats()))
@@ -0,0 +1,384 @@
+"""
+Headless refresh of the cached datasets, for cron / systemd timers:
+
+    python refresh.py [--full] [--datasets a,b] [--concurrency N] [--report run.json]
+
+Re-runs the SQL artifacts the app persisted in memory.json on its last Task-5 execute, folds
+the results into the cache (incrementally where an artifact has a watermark), recomputes the
+KPI reports and the dashboard chart data, and writes a JSON run report. A dataset that fails
+keeps serving its previous cache; the failure is recorded in the report and its KPI risks.
+Queries the query guard holds back (query_guard.py) count as failed with status "held": a
+scheduled run has nobody to confirm them, so only SQL approved in the app goes through.
+
+Exit codes: 0 ok, 1 some datasets failed, 2 nothing to run / bad input, 3 another refresh
+holds the lock, 4 every dataset failed.
+"""
+from __future__ import annotations
+
+import json
+import os
+import socket
+import sys
+import time
+import uuid
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+from memory_store import MemoryStore, safe_json_dumps
+from models import AnalysisPlan, DashboardSpec, ExecutionBundle, SQLArtifact
+from query_guard import POLICIES
+from tracing import span
+
+CONCURRENCY = int(os.getenv("REFRESH_CONCURRENCY", "2"))  # warehouse queries in flight
+LOCK_STALE_H = float(os.getenv("REFRESH_LOCK_STALE_H", "6"))  # a lock older than this is broken
+KEEP_REPORTS = int(os.getenv("REFRESH_KEEP_REPORTS", "50"))
+
+EXIT_OK = 0
+EXIT_PARTIAL = 1
+EXIT_NO_INPUT = 2
+EXIT_LOCKED = 3
+EXIT_FAILED = 4
+
+
+class RefreshInputError(ValueError):
+    """memory.json holds nothing this run can refresh."""
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat(timespec="seconds")
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except (PermissionError, OSError):
+        return True  # exists but not ours, or a platform without signal 0: assume alive
+    return True
+
+
+class RefreshLock:
+    """
+    `refresh.lock` next to the cache, created with O_EXCL so overlapping cron runs back off.
+    A lock whose process is gone (same host) or older than REFRESH_LOCK_STALE_H is broken.
+    """
+
+    def __init__(self, path: Path, stale_h: float = LOCK_STALE_H) -> None:
+        self.path = path
+        self.stale_h = stale_h
+        self.token = uuid.uuid4().hex
+        self.held = False
+
+    def holder(self) -> Optional[Dict[str, Any]]:
+        try:
+            return json.loads(self.path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return None
+
+    def _stale(self) -> bool:
+        try:
+            age_h = (time.time() - self.path.stat().st_mtime) / 3600
+        except FileNotFoundError:
+            return True
+        if age_h > self.stale_h:
+            return True
+        info = self.holder()
+        if info is None:
+            return age_h * 3600 > 60  # unreadable: only a writer that died mid-write
+        if info.get("host") == socket.gethostname():
+            return not _pid_alive(int(info.get("pid", 0)))
+        return False
+
+    def acquire(self) -> bool:
+        for _ in range(2):
+            try:
+                fd = os.open(self.path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+            except FileExistsError:
+                if not self._stale():
+                    return False
+                try:
+                    self.path.unlink()
+                except FileNotFoundError:
+                    pass
+                continue
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(
+                    {"pid": os.getpid(), "host": socket.gethostname(), "token": self.token, "started_at": _now()}, f
+                )
+            self.held = True
+            return True
+        return False
+
+    def release(self) -> None:
+        if not self.held:
+            return
+        info = self.holder()
+        if info is not None and info.get("token") == self.token:  # never remove a lock that was broken and retaken
+            try:
+                self.path.unlink()
+            except FileNotFoundError:
+                pass
+        self.held = False
+
+    def __enter__(self) -> "RefreshLock":
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.release()
+
+
+def load_inputs(mem: MemoryStore, datasets: Optional[Sequence[str]] = None) -> Dict[str, Any]:
+    """Artifacts, plan and dashboard spec from memory.json, filtered to `datasets`."""
+    state = mem.load_json()
+    artifacts = [SQLArtifact(**a) for a in state.get("sql_artifacts") or []]
+    if not artifacts:
+        raise RefreshInputError(f"no sql_artifacts in {mem.json_path}; run Task-5 'Execute' in the app once first")
+    if datasets:
+        known = {a.dataset_name for a in artifacts}
+        unknown = [d for d in datasets if d not in known]
+        if unknown:
+            raise RefreshInputError(f"unknown datasets {unknown}; memory.json has {sorted(known)}")
+        wanted = _with_dependencies(artifacts, datasets)
+        artifacts = [a for a in artifacts if a.dataset_name in wanted]
+    return {
+        "state": state,
+        "artifacts": artifacts,
+        "analysis_plan": state.get("analysis_plan"),
+        "dashboard_spec": state.get("dashboard_spec"),
+    }
+
+
+def _with_dependencies(artifacts: Sequence[SQLArtifact], names: Sequence[str]) -> set:
+    """`names` plus what they are computed from (upstream) and what is computed from them (downstream)."""
+    up = {a.dataset_name: set(a.depends_on) for a in artifacts}
+    wanted = set(names)
+    for edges in (up, {n: {m for m, deps in up.items() if n in deps} for n in up}):
+        todo = list(names)
+        while todo:
+            for nxt in edges.get(todo.pop(), ()):
+                if nxt not in wanted:
+                    wanted.add(nxt)
+                    todo.append(nxt)
+    return wanted
+
+
+def _merge_bundles(
+    artifacts: Sequence[SQLArtifact],
+    fresh: Dict[str, ExecutionBundle],
+    previous: Optional[ExecutionBundle],
+    errors: Dict[str, str],
+) -> ExecutionBundle:
+    """Fresh results in artifact order; failed or unselected datasets keep their previous entry."""
+    prev_ds = {d.dataset_name: d for d in previous.datasets} if previous else {}
+    prev_rep = {r.dataset_name: r for r in previous.reports} if previous else {}
+    order = [a.dataset_name for a in artifacts] + [n for n in prev_ds if n not in {a.dataset_name for a in artifacts}]
+
+    datasets, reports = [], []
+    for name in order:
+        b = fresh.get(name)
+        if b is not None:
+            datasets.extend(b.datasets)
+            reports.extend(b.reports)
+            continue
+        if name in prev_ds:
+            datasets.append(prev_ds[name])
+        if name in prev_rep:
+            rep = prev_rep[name].model_copy(deep=True)
+            if name in errors:
+                rep.risks.append(f"Scheduled refresh failed at {_now()}, serving the previous cache: {errors[name]}")
+            reports.append(rep)
+    return ExecutionBundle(datasets=datasets, reports=reports)
+
+
+def run_refresh(
+    mem: MemoryStore,
+    datasets: Optional[Sequence[str]] = None,
+    incremental: bool = True,
+    concurrency: int = CONCURRENCY,
+    timeout_s: Optional[float] = None,
+    charts: bool = True,
+    engine: Any = None,
+    log: Optional[Callable[[str], None]] = None,
+    guard_policy: Optional[str] = None,
+) -> Dict[str, Any]:
+    """
+    One refresh run; returns the JSON-able run report (see `exit_code`). The artifacts go
+    through one execute_and_cache_artifacts call, so the dependency graph and shared
+    intermediates apply and up to `concurrency` warehouse queries run at once; a failing
+    artifact is recorded and skipped, not fatal. Past `timeout_s` no further warehouse query
+    is sent and the artifacts not yet processed are skipped.
+    """
+    from executor import execute_and_cache_artifacts
+    from query_guard import guard_from_memory
+
+    inputs = load_inputs(mem, datasets)
+    artifacts: List[SQLArtifact] = inputs["artifacts"]
+    plan = inputs["analysis_plan"]
+    log = log or (lambda msg: None)
+    if engine is None:
+        from db import build_engine
+
+        engine = build_engine()
+
+    t0 = time.perf_counter()
+    deadline = t0 + timeout_s if timeout_s else None
+    errors: Dict[str, str] = {}
+
+    def progress(fraction: float, message: str) -> None:
+        log(message)
+
+    with span("refresh.run", cat="executor", artifacts=len(artifacts), concurrency=concurrency):
+        fresh_bundle, _ = execute_and_cache_artifacts(
+            engine, mem, artifacts, analysis_plan=plan, progress=progress,
+            incremental=incremental, concurrency=concurrency, errors=errors,
+            guard=guard_from_memory(mem.load_json(), guard_policy), deadline=deadline,
+        )
+        fresh = {d.dataset_name: ExecutionBundle(
+            datasets=[d], reports=[r for r in fresh_bundle.reports if r.dataset_name == d.dataset_name]
+        ) for d in fresh_bundle.datasets}
+        results: Dict[str, Dict[str, Any]] = {}
+        for d in fresh_bundle.datasets:
+            results[d.dataset_name] = {
+                "dataset": d.dataset_name,
+                "status": "ok",
+                "refresh": d.refresh,
+                "computed": d.computed,
+                "rows": d.n_rows,
+                "rows_fetched": d.rows_fetched,
+                "watermark": d.watermark,
+                "risks": [r for rep in fresh[d.dataset_name].reports for r in rep.risks],
+            }
+            log(f"{d.dataset_name}: {d.refresh} ({d.computed}), {d.n_rows} rows, {d.rows_fetched} fetched")
+        for name, err in errors.items():
+            status = "skipped" if err.startswith("TimeoutError") else "held" if err.startswith("Query guard") else "failed"
+            results[name] = {"dataset": name, "status": status, "error": err}
+            log(f"{name}: {status.upper()} {err}")
+
+        # merged under the lock with what memory.json holds now, not what it held when the run
+        # started: the app may have executed or approved something while the queries ran
+        with mem.edit_json() as state:
+            current = state.get("execution_bundle")
+            bundle = _merge_bundles(artifacts, fresh, ExecutionBundle(**current) if current else None, errors)
+            bundle.source_stats = fresh_bundle.source_stats
+            state["execution_bundle"] = bundle.model_dump()
+
+        chart_stats, chart_error = None, None
+        if charts and fresh:
+            try:
+                chart_stats = _prepare_charts(bundle, plan, inputs["dashboard_spec"])
+            except Exception as e:
+                chart_error = f"{type(e).__name__}: {e}"
+                log(f"chart data: FAILED {chart_error}")
+
+    report = {
+        "run_id": uuid.uuid4().hex[:12],
+        "finished_at": _now(),
+        "elapsed_s": round(time.perf_counter() - t0, 3),
+        "incremental": incremental,
+        "concurrency": concurrency,
+        "datasets": [results[a.dataset_name] for a in artifacts if a.dataset_name in results],
+        "ok": sum(1 for r in results.values() if r["status"] == "ok"),
+        "failed": sum(1 for r in results.values() if r["status"] != "ok"),
+        "source_stats": fresh_bundle.source_stats,
+        "chart_data": chart_stats,
+        "chart_error": chart_error,
+    }
+    report["exit_code"] = exit_code(report)
+    with mem.edit_json() as state:
+        state["last_refresh"] = {k: report[k] for k in ("run_id", "finished_at", "elapsed_s", "ok", "failed", "exit_code")}
+    return report
+
+
+def _prepare_charts(bundle: ExecutionBundle, plan: Optional[Dict[str, Any]], spec: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    from chart_data import default_chart_store, prepare_chart_data
+    from dashboard_compiler import default_spec, validate_spec
+
+    p = AnalysisPlan(**plan) if plan else None
+    s = validate_spec(DashboardSpec(**spec), bundle, p)[0] if spec else default_spec(bundle, p)
+    return prepare_chart_data(bundle, s, p, default_chart_store())
+
+
+def exit_code(report: Dict[str, Any]) -> int:
+    if report["ok"] == 0 and report["failed"]:
+        return EXIT_FAILED
+    if report["failed"] or report.get("chart_error"):
+        return EXIT_PARTIAL
+    return EXIT_OK
+
+
+def write_report(report: Dict[str, Any], out: Optional[Path], runs_dir: Path) -> Path:
+    """The report goes to `out` if given, else to `runs_dir`, which keeps the last REFRESH_KEEP_REPORTS runs."""
+    text = safe_json_dumps(report, indent=2)
+    if out is not None:
+        out.parent.mkdir(parents=True, exist_ok=True)
+        out.write_text(text, encoding="utf-8")
+        return out
+    runs_dir.mkdir(parents=True, exist_ok=True)
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S")
+    path = runs_dir / f"refresh-{stamp}-{report['run_id']}.json"
+    path.write_text(text, encoding="utf-8")
+    for old in sorted(runs_dir.glob("refresh-*.json"))[:-KEEP_REPORTS or None]:
+        old.unlink(missing_ok=True)
+    return path
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    import argparse
+
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    ap = argparse.ArgumentParser(description="Refresh the cached datasets, KPIs and chart data without the app")
+    ap.add_argument("--cache-dir", default=os.getenv("CACHE_DIR", "./cache"))
+    ap.add_argument("--datasets", help="comma-separated dataset names (default: every persisted artifact)")
+    ap.add_argument("--full", action="store_true", help="ignore watermarks and refresh every dataset in full")
+    ap.add_argument("--concurrency", type=int, default=CONCURRENCY)
+    ap.add_argument("--timeout", type=float, help="seconds after which datasets not yet started are skipped")
+    ap.add_argument("--no-charts", action="store_true", help="skip the dashboard chart-data stage")
+    ap.add_argument("--report", type=Path, help="write the JSON run report here (default: <cache>/refresh_runs/)")
+    ap.add_argument("--dry-run", action="store_true", help="list what would be refreshed and exit")
+    ap.add_argument("--quiet", action="store_true", help="no per-dataset progress on stderr")
+    ap.add_argument("--guard", choices=POLICIES, help="query guard policy for this run (default: QUERY_GUARD_POLICY)")
+    args = ap.parse_args(argv)
+
+    cache_dir = Path(args.cache_dir)
+    os.environ["CACHE_DIR"] = str(cache_dir)  # chart store and friends resolve it from the environment
+    mem = MemoryStore(cache_dir)
+    names = [d.strip() for d in args.datasets.split(",") if d.strip()] if args.datasets else None
+    log = None if args.quiet else (lambda msg: print(f"[refresh] {msg}", file=sys.stderr, flush=True))
+
+    try:
+        inputs = load_inputs(mem, names)
+    except (RefreshInputError, ValueError) as e:
+        print(f"refresh: {e}", file=sys.stderr)
+        return EXIT_NO_INPUT
+    if args.dry_run:
+        for a in inputs["artifacts"]:
+            mode = "incremental" if a.watermark_column and not args.full else "full"
+            print(f"{a.dataset_name}\t{mode}\t{a.watermark_column or '-'}")
+        return EXIT_OK
+
+    lock = RefreshLock(cache_dir / "refresh.lock")
+    if not lock.acquire():
+        print(f"refresh: another run holds {lock.path}: {lock.holder()}", file=sys.stderr)
+        return EXIT_LOCKED
+    with lock:
+        try:
+            report = run_refresh(
+                mem, names, incremental=not args.full, concurrency=args.concurrency,
+                timeout_s=args.timeout, charts=not args.no_charts, log=log, guard_policy=args.guard,
+            )
+        except RefreshInputError as e:
+            print(f"refresh: {e}", file=sys.stderr)
+            return EXIT_NO_INPUT
+        path = write_report(report, args.report, cache_dir / "refresh_runs")
+    if log:
+        log(f"{report['ok']} ok, {report['failed']} failed in {report['elapsed_s']}s; report {path}")
+    print(safe_json_dumps(report, indent=2))
+    return report["exit_code"]
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,324 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Any, AsyncGenerator, Dict, Mapping, Optional, Sequence, Union
+
+from autogen_core import CancellationToken
+from autogen_core.models import (
+    ChatCompletionClient,
+    CreateResult,
+    LLMMessage,
+    ModelCapabilities,
+    ModelInfo,
+    RequestUsage,
+)
+
+LIVE = "live"
+RECORD = "record"
+REPLAY = "replay"
+
+
+class ReplayMiss(LookupError):
+    """Replay mode found no recording for a request."""
+
+
+def _approx_tokens(text: str) -> int:
+    return max(1, (len(text) + 3) // 4) if text else 0
+
+
+def request_key(
+    model: str,
+    messages: Sequence[LLMMessage],
+    json_output: Any = None,
+    response_format: Any = None,
+) -> str:
+    """Stable key of a model request: model, output format and the full message list."""
+
+    def fmt_name(f: Any) -> Any:
+        if isinstance(f, type):
+            return f"{f.__module__}.{f.__qualname__}"
+        return f
+
+    payload = {
+        "model": model,
+        "json_output": fmt_name(json_output),
+        "response_format": fmt_name(response_format),
+        "messages": [m.model_dump(mode="json") for m in messages],
+    }
+    blob = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()[:32]
+
+
+class Cassette:
+    """One JSON file per recorded request under `root` (safe for concurrent sessions)."""
+
+    def __init__(self, root: Path) -> None:
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+
+    def path(self, key: str) -> Path:
+        return self.root / f"{key}.json"
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        p = self.path(key)
+        if not p.exists():
+            return None
+        return json.loads(p.read_text(encoding="utf-8"))
+
+    def put(self, key: str, record: Dict[str, Any]) -> None:
+        with self._lock:
+            tmp = self.path(key).with_suffix(".tmp")
+            tmp.write_text(json.dumps(record, ensure_ascii=False, indent=2), encoding="utf-8")
+            tmp.replace(self.path(key))
+
+
+class RecordReplayClient(ChatCompletionClient):
+    """
+    Model client for deterministic offline runs.
+
+    - record: forwards to `inner` (a live client) and writes every final response to the
+      cassette, keyed by `request_key(...)`.
+    - replay: serves recorded responses without any network; `latency_s` is added before the
+      first token and streamed chunks are paced at `tokens_per_s` (0 = instant), so runs can
+      mimic a real model's timing without its variance. Unknown requests raise ReplayMiss.
+    """
+
+    def __init__(
+        self,
+        mode: str,
+        cassette: Cassette,
+        model: str,
+        inner: Optional[ChatCompletionClient] = None,
+        response_format: Any = None,
+        latency_s: float = 0.0,
+        tokens_per_s: float = 0.0,
+        num_ctx: int = 8192,
+    ) -> None:
+        if mode not in (RECORD, REPLAY):
+            raise ValueError(f"mode must be {RECORD!r} or {REPLAY!r}, got {mode!r}")
+        if mode == RECORD and inner is None:
+            raise ValueError("record mode needs the live client to forward to")
+        self.mode = mode
+        self.cassette = cassette
+        self.model = model
+        self.inner = inner
+        self.response_format = response_format
+        self.latency_s = latency_s
+        self.tokens_per_s = tokens_per_s
+        self.num_ctx = num_ctx
+        self.hits = 0
+        self.misses = 0
+        self.recorded = 0
+        self._total_usage = RequestUsage(prompt_tokens=0, completion_tokens=0)
+        self._actual_usage = RequestUsage(prompt_tokens=0, completion_tokens=0)
+
+    # ---------- recording / lookup ----------
+
+    def _key(self, messages: Sequence[LLMMessage], json_output: Any) -> str:
+        return request_key(self.model, messages, json_output, self.response_format)
+
+    def _save(self, key: str, messages: Sequence[LLMMessage], result: CreateResult) -> None:
+        self.cassette.put(
+            key,
+            {
+                "key": key,
+                "model": self.model,
+                "recorded_at": time.time(),
+                "n_messages": len(messages),
+                "content": result.content if isinstance(result.content, str) else None,
+                "thought": result.thought,
+                "finish_reason": result.finish_reason,
+                "usage": result.usage.model_dump() if hasattr(result.usage, "model_dump") else {
+                    "prompt_tokens": result.usage.prompt_tokens,
+                    "completion_tokens": result.usage.completion_tokens,
+                    "estimated": bool(getattr(result.usage, "estimated", False)),
+                },
+            },
+        )
+        self.recorded += 1
+
+    def _lookup(self, key: str) -> Dict[str, Any]:
+        rec = self.cassette.get(key)
+        if rec is None or rec.get("content") is None:
+            self.misses += 1
+            raise ReplayMiss(f"No recording for request {key} in {self.cassette.root}; run once with LLM_MODE=record")
+        self.hits += 1
+        return rec
+
+    def _add_usage(self, usage: RequestUsage) -> None:
+        self._total_usage = RequestUsage(
+            prompt_tokens=self._total_usage.prompt_tokens + usage.prompt_tokens,
+            completion_tokens=self._total_usage.completion_tokens + usage.completion_tokens,
+        )
+        self._actual_usage = RequestUsage(
+            prompt_tokens=self._actual_usage.prompt_tokens + usage.prompt_tokens,
+            completion_tokens=self._actual_usage.completion_tokens + usage.completion_tokens,
+        )
+
+    def _result(self, rec: Dict[str, Any]) -> CreateResult:
+        u = rec.get("usage") or {}
+        usage = RequestUsage(prompt_tokens=int(u.get("prompt_tokens", 0)), completion_tokens=int(u.get("completion_tokens", 0)))
+        if u.get("estimated"):
+            from llm import EstimatedUsage  # only recordings of early-stopped streams carry the flag
+
+            usage = EstimatedUsage(prompt_tokens=usage.prompt_tokens, completion_tokens=usage.completion_tokens)
+        self._add_usage(usage)
+        return CreateResult(
+            finish_reason=rec.get("finish_reason") or "stop",
+            content=rec["content"],
+            usage=usage,
+            cached=True,
+            thought=rec.get("thought"),
+        )
+
+    @staticmethod
+    async def _sleep(seconds: float, cancellation_token: Optional[CancellationToken]) -> None:
+        if seconds <= 0:
+            return
+        fut = asyncio.ensure_future(asyncio.sleep(seconds))
+        if cancellation_token is not None:
+            cancellation_token.link_future(fut)
+        await fut
+
+    # ---------- ChatCompletionClient ----------
+
+    async def create(
+        self,
+        messages: Sequence[LLMMessage],
+        *,
+        tools: Sequence[Any] = [],
+        tool_choice: Any = "auto",
+        json_output: Optional[Any] = None,
+        extra_create_args: Mapping[str, Any] = {},
+        cancellation_token: Optional[CancellationToken] = None,
+    ) -> CreateResult:
+        key = self._key(messages, json_output)
+        if self.mode == RECORD:
+            assert self.inner is not None
+            result = await self.inner.create(
+                messages,
+                tools=tools,
+                tool_choice=tool_choice,
+                json_output=json_output,
+                extra_create_args=extra_create_args,
+                cancellation_token=cancellation_token,
+            )
+            self._save(key, messages, result)
+            return result
+
+        rec = self._lookup(key)
+        n = _approx_tokens(rec["content"])
+        delay = self.latency_s + (n / self.tokens_per_s if self.tokens_per_s > 0 else 0.0)
+        await self._sleep(delay, cancellation_token)
+        return self._result(rec)
+
+    async def create_stream(
+        self,
+        messages: Sequence[LLMMessage],
+        *,
+        tools: Sequence[Any] = [],
+        tool_choice: Any = "auto",
+        json_output: Optional[Any] = None,
+        extra_create_args: Mapping[str, Any] = {},
+        cancellation_token: Optional[CancellationToken] = None,
+    ) -> AsyncGenerator[Union[str, CreateResult], None]:
+        key = self._key(messages, json_output)
+        if self.mode == RECORD:
+            assert self.inner is not None
+            async for item in self.inner.create_stream(
+                messages,
+                tools=tools,
+                tool_choice=tool_choice,
+                json_output=json_output,
+                extra_create_args=extra_create_args,
+                cancellation_token=cancellation_token,
+            ):
+                if isinstance(item, CreateResult):
+                    self._save(key, messages, item)
+                yield item
+            return
+
+        rec = self._lookup(key)
+        await self._sleep(self.latency_s, cancellation_token)
+        text: str = rec["content"]
+        per_chunk = 1.0 / self.tokens_per_s if self.tokens_per_s > 0 else 0.0
+        for i in range(0, len(text), 4):
+            yield text[i : i + 4]
+            await self._sleep(per_chunk, cancellation_token)
+        yield self._result(rec)
+
+    async def close(self) -> None:
+        if self.inner is not None:
+            await self.inner.close()
+
+    def actual_usage(self) -> RequestUsage:
+        return self._actual_usage
+
+    def total_usage(self) -> RequestUsage:
+        return self._total_usage
+
+    def count_tokens(self, messages: Sequence[LLMMessage], *, tools: Sequence[Any] = []) -> int:
+        if self.inner is not None:
+            return self.inner.count_tokens(messages, tools=tools)
+        return sum(_approx_tokens(str(getattr(m, "content", ""))) for m in messages)
+
+    def remaining_tokens(self, messages: Sequence[LLMMessage], *, tools: Sequence[Any] = []) -> int:
+        if self.inner is not None:
+            return self.inner.remaining_tokens(messages, tools=tools)
+        return self.num_ctx - self.count_tokens(messages, tools=tools)
+
+    @property
+    def capabilities(self) -> ModelCapabilities:  # type: ignore[override]
+        return self.model_info  # type: ignore[return-value]
+
+    @property
+    def model_info(self) -> ModelInfo:
+        if self.inner is not None:
+            return self.inner.model_info
+        return ModelInfo(
+            vision=False,
+            function_calling=False,
+            json_output=True,
+            family="unknown",
+            structured_output=True,
+        )
+
+
+def llm_mode() -> str:
+    return os.getenv("LLM_MODE", LIVE).strip().lower()
+
+
+def wrap_for_mode(
+    live_factory: Any,
+    response_format: Any = None,
+    mode: Optional[str] = None,
+) -> Any:
+    """
+    Client for the current LLM_MODE: the live client itself, or a RecordReplayClient around
+    it (record) / instead of it (replay). `live_factory()` is only called when needed.
+    Settings: REPLAY_DIR (default <CACHE_DIR>/replay), REPLAY_LATENCY_S, REPLAY_TOKENS_PER_S.
+    """
+    from model_manager import get_model_manager
+
+    mode = mode or llm_mode()
+    if mode == LIVE:
+        return live_factory()
+    settings = get_model_manager().settings
+    root = Path(os.getenv("REPLAY_DIR") or Path(os.getenv("CACHE_DIR", "./cache")) / "replay")
+    return RecordReplayClient(
+        mode=mode,
+        cassette=Cassette(root),
+        model=settings.model,
+        inner=live_factory() if mode == RECORD else None,
+        response_format=response_format,
+        latency_s=float(os.getenv("REPLAY_LATENCY_S", "0")),
+        tokens_per_s=float(os.getenv("REPLAY_TOKENS_PER_S", "0")),
+        num_ctx=settings.num_ctx,
+    )
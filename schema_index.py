@@ -0,0 +1,264 @@
+from __future__ import annotations
+
+import heapq
+import math
+import random
+import re
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+# BM25 parameters (standard defaults)
+_K1 = 1.2
+_B = 0.75
+
+# Field weights: a hit on a table name matters more than a hit in a description
+_FIELD_WEIGHTS = {
+    "name": 3,
+    "columns": 2,
+    "important_columns": 2,
+    "description": 1,
+    "business_meaning": 1,
+    "dashboard_use_cases": 1,
+}
+
+_STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "how", "i", "in", "is", "it",
+    "of", "on", "or", "show", "that", "the", "this", "to", "want", "we", "what", "with", "dashboard",
+}
+
+_CAMEL_RE = re.compile(r"([a-z0-9])([A-Z])")
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase tokens; splits snake_case, camelCase and dotted names."""
+    t = _CAMEL_RE.sub(r"\1 \2", str(text or ""))
+    out: List[str] = []
+    for tok in _TOKEN_RE.findall(t.lower()):
+        if tok in _STOPWORDS or len(tok) < 2:
+            continue
+        out.append(tok)
+        # cheap plural folding: "customers" also matches "customer"
+        if len(tok) > 3 and tok.endswith("s"):
+            out.append(tok[:-1])
+    return out
+
+
+def table_id(table: Dict[str, Any]) -> str:
+    return f"{table.get('schema')}.{table.get('table')}"
+
+
+def _table_terms(table: Dict[str, Any]) -> Counter:
+    """Weighted bag of words for one profile table entry."""
+    fields: Dict[str, str] = {
+        "name": f"{table.get('schema', '')} {table.get('table', '')}",
+        "columns": " ".join(str(c.get("COLUMN_NAME", c.get("name", ""))) for c in table.get("columns", []) or []),
+        "important_columns": " ".join(str(c) for c in table.get("important_columns", []) or []),
+        "description": str(table.get("table_description", "") or ""),
+        "business_meaning": str(table.get("business_meaning", "") or ""),
+        "dashboard_use_cases": " ".join(str(u) for u in table.get("dashboard_use_cases", []) or []),
+    }
+    terms: Counter = Counter()
+    for f, text in fields.items():
+        w = _FIELD_WEIGHTS[f]
+        for tok in tokenize(text):
+            terms[tok] += w
+    return terms
+
+
+@dataclass
+class SchemaIndex:
+    """
+    In-memory BM25 index over DB profile tables.
+    Built once at scan time, then updated per table (e.g. after LLM descriptions).
+    """
+
+    postings: Dict[str, Dict[str, int]] = field(default_factory=dict)
+    doc_len: Dict[str, int] = field(default_factory=dict)
+    doc_terms: Dict[str, List[str]] = field(default_factory=dict)
+    total_len: int = 0
+
+    @property
+    def n_docs(self) -> int:
+        return len(self.doc_len)
+
+    def remove_table(self, tid: str) -> None:
+        for term in self.doc_terms.pop(tid, []):
+            plist = self.postings.get(term)
+            if plist is None:
+                continue
+            plist.pop(tid, None)
+            if not plist:
+                del self.postings[term]
+        self.total_len -= self.doc_len.pop(tid, 0)
+
+    def upsert_table(self, table: Dict[str, Any]) -> None:
+        tid = table_id(table)
+        if tid in self.doc_len:
+            self.remove_table(tid)
+
+        terms = _table_terms(table)
+        for term, tf in terms.items():
+            self.postings.setdefault(term, {})[tid] = tf
+        length = int(sum(terms.values()))
+        self.doc_terms[tid] = list(terms.keys())
+        self.doc_len[tid] = length
+        self.total_len += length
+
+    def search(self, query: str, k: int = 20) -> List[Tuple[str, float]]:
+        """Returns [(schema.table, score), ...] best first; empty if nothing matches."""
+        n = self.n_docs
+        if n == 0:
+            return []
+        avgdl = self.total_len / n if n else 0.0
+
+        scores: Dict[str, float] = {}
+        for term in set(tokenize(query)):
+            plist = self.postings.get(term)
+            if not plist:
+                continue
+            df = len(plist)
+            idf = math.log(1.0 + (n - df + 0.5) / (df + 0.5))
+            for tid, tf in plist.items():
+                dl = self.doc_len[tid]
+                denom = tf + _K1 * (1 - _B + _B * dl / (avgdl or 1.0))
+                scores[tid] = scores.get(tid, 0.0) + idf * tf * (_K1 + 1) / denom
+
+        return heapq.nlargest(k, scores.items(), key=lambda x: x[1])
+
+
+def build_schema_index(profile: Dict[str, Any]) -> SchemaIndex:
+    idx = SchemaIndex()
+    for t in profile.get("tables", []) or []:
+        idx.upsert_table(t)
+    return idx
+
+
+def select_profile_slice(
+    profile: Dict[str, Any],
+    index: Optional[SchemaIndex],
+    query: str,
+    k: int = 25,
+) -> Dict[str, Any]:
+    """
+    Return a copy of `profile` whose "tables" are the top-k relevant ones for `query`.
+    Tables that do not match are used (in scan order) only to fill up to k,
+    so early steps with an empty request still get context.
+    """
+    tables = profile.get("tables", []) or []
+    if index is None or len(tables) <= k:
+        return profile
+
+    by_id = {table_id(t): t for t in tables}
+    picked: List[Dict[str, Any]] = []
+    seen = set()
+    for tid, _score in index.search(query, k=k):
+        t = by_id.get(tid)
+        if t is not None:
+            picked.append(t)
+            seen.add(tid)
+
+    for t in tables:
+        if len(picked) >= k:
+            break
+        tid = table_id(t)
+        if tid not in seen:
+            picked.append(t)
+            seen.add(tid)
+
+    out = {key: val for key, val in profile.items() if key != "tables"}
+    out["tables"] = picked
+    return out
+
+
+def select_step_tables(
+    profile: Dict[str, Any],
+    index: Optional[SchemaIndex],
+    query: str,
+    exclude: Dict[str, Any],
+    k: int = 5,
+) -> List[Dict[str, Any]]:
+    """
+    Up to k tables that match `query` (a step's goal and carry-over) and are not already in the
+    `exclude` slice: the per-step complement of select_profile_slice. Matches only, no filler.
+    """
+    if index is None or k <= 0:
+        return []
+    have = {table_id(t) for t in exclude.get("tables", []) or []}
+    by_id = {table_id(t): t for t in profile.get("tables", []) or []}
+    out: List[Dict[str, Any]] = []
+    for tid, _score in index.search(query, k=k + len(have)):
+        if tid in by_id and tid not in have:
+            out.append(by_id[tid])
+            if len(out) >= k:
+                break
+    return out
+
+
+# ---------- benchmark ----------
+
+_WORDS = [
+    "customer", "order", "invoice", "reward", "points", "redemption", "earning", "store", "region",
+    "product", "campaign", "session", "payment", "refund", "member", "tier", "partner", "voucher",
+    "account", "ledger", "shipment", "inventory", "price", "promotion", "channel", "device", "event",
+]
+
+
+def synthetic_catalog(n_tables: int = 5000, n_cols: int = 20, seed: int = 0) -> Dict[str, Any]:
+    rnd = random.Random(seed)
+    tables = []
+    for i in range(n_tables):
+        a, b = rnd.sample(_WORDS, 2)
+        cols = [
+            {"COLUMN_NAME": f"{rnd.choice(_WORDS)}_{rnd.choice(['id', 'date', 'amount', 'code', 'name'])}", "DATA_TYPE": "int"}
+            for _ in range(n_cols)
+        ]
+        tables.append(
+            {
+                "schema": rnd.choice(["dbo", "sales", "loyalty", "ops"]),
+                "table": f"{a.title()}{b.title()}_{i}",
+                "row_count": rnd.randint(0, 10_000_000),
+                "columns": cols,
+                "table_description": f"Stores {a} and {b} records.",
+                "business_meaning": f"Tracks {a} activity by {b}.",
+                "important_columns": [c["COLUMN_NAME"] for c in cols[:3]],
+                "dashboard_use_cases": [f"{a} trend", f"{b} breakdown"],
+            }
+        )
+    return {"tables": tables}
+
+
+def benchmark(n_tables: int = 5000, n_queries: int = 200, k: int = 25) -> Dict[str, float]:
+    profile = synthetic_catalog(n_tables)
+
+    t0 = time.perf_counter()
+    idx = build_schema_index(profile)
+    build_s = time.perf_counter() - t0
+
+    rnd = random.Random(1)
+    lat: List[float] = []
+    for _ in range(n_queries):
+        q = " ".join(rnd.sample(_WORDS, 4))
+        t0 = time.perf_counter()
+        idx.search(q, k=k)
+        lat.append(time.perf_counter() - t0)
+    lat.sort()
+
+    t0 = time.perf_counter()
+    idx.upsert_table(profile["tables"][0])
+    upsert_s = time.perf_counter() - t0
+
+    return {
+        "n_tables": float(n_tables),
+        "build_ms": build_s * 1000,
+        "upsert_ms": upsert_s * 1000,
+        "query_p50_ms": lat[len(lat) // 2] * 1000,
+        "query_p99_ms": lat[min(len(lat) - 1, int(len(lat) * 0.99))] * 1000,
+    }
+
+
+if __name__ == "__main__":
+    for key, val in benchmark().items():
+        print(f"{key}: {val:.3f}")
@@ -0,0 +1,193 @@
+"""
+Process-wide single-flight for warehouse queries: concurrent identical requests (several
+sessions executing the same plan, the same profiling query from two tabs) share one
+execution. The first caller runs the query; callers arriving while it is in flight wait for
+it and get the same result or the same exception. Nothing is cached once it completes.
+"""
+from __future__ import annotations
+
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import asdict, dataclass
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from tracing import span
+
+ENABLED = os.getenv("SINGLE_FLIGHT", "1") == "1"
+STATS_KEYS = int(os.getenv("SINGLE_FLIGHT_STATS_KEYS", "256"))  # per-key stats kept (LRU)
+
+
+@dataclass
+class FlightStats:
+    label: str  # first 120 chars of the query
+    executions: int = 0
+    coalesced: int = 0  # callers served by someone else's execution
+    errors: int = 0
+    total_ms: float = 0.0
+    saved_ms: float = 0.0  # execution time the coalesced callers did not spend on the warehouse
+    last_at: float = 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+class _Call:
+    __slots__ = ("done", "result", "error", "waiters")
+
+    def __init__(self) -> None:
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    def __init__(self, enabled: bool = ENABLED, stats_keys: int = STATS_KEYS) -> None:
+        self.enabled = enabled
+        self.stats_keys = stats_keys
+        self._lock = threading.Lock()
+        self._calls: Dict[str, _Call] = {}
+        self._stats: "OrderedDict[str, FlightStats]" = OrderedDict()
+
+    def _stat(self, key: str, label: str) -> FlightStats:
+        st = self._stats.get(key)
+        if st is None:
+            st = self._stats[key] = FlightStats(label=label[:120])
+            while len(self._stats) > self.stats_keys:
+                self._stats.popitem(last=False)
+        self._stats.move_to_end(key)
+        return st
+
+    def do(
+        self,
+        key: str,
+        fn: Callable[[], Any],
+        label: str = "",
+        share: Callable[[Any], Any] = lambda r: r,
+    ) -> Tuple[Any, bool]:
+        """
+        (result, coalesced). `share` gives every caller its own view of a result that was handed
+        to more than one (e.g. DataFrame.copy), so one session mutating its frame can't touch another's.
+        """
+        if not self.enabled:
+            return fn(), False
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                call.waiters += 1
+
+        if not leader:
+            with span("single_flight.wait", cat="sql", label=label[:200]):
+                call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return share(call.result), True
+
+        t0 = time.perf_counter()
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+        finally:
+            ms = (time.perf_counter() - t0) * 1000
+            with self._lock:
+                del self._calls[key]  # later callers start a new execution
+                waiters = call.waiters
+                st = self._stat(key, label)
+                st.executions += 1
+                st.coalesced += waiters
+                st.errors += call.error is not None
+                st.total_ms += ms
+                st.saved_ms += ms * waiters
+                st.last_at = time.time()
+            call.done.set()
+        if call.error is not None:
+            raise call.error
+        return (share(call.result) if waiters else call.result), False
+
+    def stats(self) -> List[Dict[str, Any]]:
+        """Per-key counters, most recently used first."""
+        with self._lock:
+            return [{"key": k, **s.to_dict()} for k, s in reversed(self._stats.items())]
+
+    def summary(self) -> Dict[str, Any]:
+        with self._lock:
+            rows = list(self._stats.values())
+            in_flight = len(self._calls)
+        return {
+            "keys": len(rows),
+            "executions": sum(s.executions for s in rows),
+            "coalesced": sum(s.coalesced for s in rows),
+            "errors": sum(s.errors for s in rows),
+            "saved_ms": round(sum(s.saved_ms for s in rows), 1),
+            "in_flight": in_flight,
+        }
+
+
+def query_key(engine: Any, sql: str, params: Optional[Dict[str, Any]] = None, **extra: Any) -> str:
+    """Target database + SQL (comments and layout normalized, case kept) + parameters."""
+    from artifact_dag import normalize_sql
+
+    parts = {
+        "db": engine.url.render_as_string(hide_password=True),
+        "sql": normalize_sql(sql, fold_case=False),
+        "params": params or {},
+        **extra,
+    }
+    return json.dumps(parts, sort_keys=True, default=str)
+
+
+_flight: Optional[SingleFlight] = None
+_flight_lock = threading.Lock()
+
+
+def get_single_flight() -> SingleFlight:
+    global _flight
+    with _flight_lock:
+        if _flight is None:
+            _flight = SingleFlight()
+        return _flight
+
+
+if __name__ == "__main__":
+    import argparse
+    import tempfile
+    from concurrent.futures import ThreadPoolExecutor
+    from pathlib import Path
+
+    from sqlalchemy import create_engine
+
+    import single_flight  # the instance executor.py uses, not this __main__ copy
+    from bench_suite import WarehouseSpec, generate_warehouse
+    from executor import run_sql_select
+
+    ap = argparse.ArgumentParser(description="N sessions issuing the same query at once, with and without single-flight")
+    ap.add_argument("--sessions", type=int, default=8)
+    ap.add_argument("--rows", type=int, default=200_000)
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(generate_warehouse(WarehouseSpec(n_tables=1, n_rows=args.rows), Path(tmp) / "w.sqlite"))
+        sql = (
+            "SELECT category, region, event_date, SUM(amount) AS amount, COUNT(DISTINCT customer_id) AS customers "
+            "FROM fact_0000 GROUP BY category, region, event_date"
+        )
+        for enabled in (False, True):
+            flight = single_flight.get_single_flight()
+            flight.enabled = enabled
+            t0 = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=args.sessions) as pool:
+                frames = list(pool.map(lambda _: run_sql_select(engine, sql), range(args.sessions)))
+            print(json.dumps({
+                "single_flight": enabled,
+                "sessions": args.sessions,
+                "wall_s": round(time.perf_counter() - t0, 3),
+                "rows": len(frames[0]),
+                **flight.summary(),
+            }))
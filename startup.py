@@ -0,0 +1,117 @@
+from __future__ import annotations
+
+import json
+import os
+import statistics
+import subprocess
+import sys
+import threading
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+HEAVY_MODULES = ["pandas", "duckdb", "sqlalchemy", "autogen_agentchat", "autogen_ext.models.ollama"]
+
+_prewarm_lock = threading.Lock()
+_prewarm_thread: Optional[threading.Thread] = None
+
+
+def _prewarm() -> None:
+    import pandas  # noqa: F401
+    import team_factory  # noqa: F401  (autogen + Ollama client)
+    import db  # noqa: F401  (sqlalchemy)
+    import executor  # noqa: F401
+    from llm import get_model_client
+    from models import AnalysisPlan, SQLBuildOutput
+
+    for fmt in (None, AnalysisPlan, SQLBuildOutput):
+        get_model_client(response_format=fmt)
+
+    from model_manager import get_model_manager
+
+    get_model_manager().warm_up(background=False)
+
+
+def prewarm(background: bool = True) -> Optional[threading.Thread]:
+    """
+    Import the heavy modules, build the shared model clients and load the model on the
+    Ollama server ahead of the first click.
+    Runs once per process; opt-in from the app with PREWARM=1.
+    """
+    global _prewarm_thread
+    with _prewarm_lock:
+        if _prewarm_thread is not None:
+            return _prewarm_thread
+        _prewarm_thread = threading.Thread(target=_prewarm, name="prewarm", daemon=True)
+        if background:
+            _prewarm_thread.start()
+    if not background:
+        _prewarm_thread.run()
+    return _prewarm_thread
+
+
+# ---------- benchmark: cold import time and first-render latency ----------
+
+_IMPORT_SNIPPET = "import time; t = time.perf_counter(); import {mod}; print(time.perf_counter() - t)"
+
+_RENDER_SNIPPET = """
+import json, time, warnings
+warnings.filterwarnings("ignore")
+t0 = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+t1 = time.perf_counter()
+at = AppTest.from_file({app!r}, default_timeout=120)
+at.run()
+t2 = time.perf_counter()
+at.run()
+t3 = time.perf_counter()
+import sys
+heavy = sorted(m for m in {heavy!r} if m in sys.modules)
+print(json.dumps({{"streamlit_import_s": t1 - t0, "first_render_s": t2 - t1, "rerun_s": t3 - t2,
+                  "exception": bool(at.exception), "heavy_loaded": heavy}}))
+"""
+
+
+def _run(code: str, cwd: Path) -> str:
+    env = dict(os.environ, PYTHONPATH=str(cwd), PREWARM="0")
+    out = subprocess.run(
+        [sys.executable, "-c", code], cwd=cwd, env=env, capture_output=True, text=True, check=True
+    )
+    return out.stdout.strip().splitlines()[-1]
+
+
+def benchmark(repeats: int = 3) -> Dict[str, Any]:
+    """Every measurement runs in a fresh interpreter so module caches don't hide import cost."""
+    root = Path(__file__).resolve().parent
+    imports: Dict[str, float] = {}
+    for mod in HEAVY_MODULES:
+        times = [float(_run(_IMPORT_SNIPPET.format(mod=mod), root)) for _ in range(repeats)]
+        imports[mod] = statistics.median(times)
+
+    renders: List[Dict[str, Any]] = [
+        json.loads(_run(_RENDER_SNIPPET.format(app=str(root / "app.py"), heavy=HEAVY_MODULES), root))
+        for _ in range(repeats)
+    ]
+    return {
+        "python": sys.version.split()[0],
+        "repeats": repeats,
+        "import_s": imports,
+        "first_render_s": statistics.median(r["first_render_s"] for r in renders),
+        "rerun_s": statistics.median(r["rerun_s"] for r in renders),
+        "heavy_loaded_after_first_render": renders[-1]["heavy_loaded"],
+        "render_exception": any(r["exception"] for r in renders),
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+
+    ap = argparse.ArgumentParser(description="Cold import / first-render benchmark for the Streamlit app")
+    ap.add_argument("--repeats", type=int, default=3)
+    ap.add_argument("--out", help="write the JSON result here as well")
+    args = ap.parse_args()
+
+    result = benchmark(args.repeats)
+    text = json.dumps(result, indent=2)
+    print(text)
+    if args.out:
+        Path(args.out).write_text(text, encoding="utf-8")
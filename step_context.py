@@ -0,0 +1,104 @@
+from __future__ import annotations
+
+import re
+from dataclasses import asdict, dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+from llm_json import parse_llm_json
+from memory_store import safe_json_dumps
+from models import AnalysisPlan, SQLBuildOutput
+
+# Structured outputs worth carrying into later steps: step -> (agent, model, key)
+_STRUCTURED_OUTPUTS = {
+    "TASK_3_ANALYSIS_PLAN": ("planner", AnalysisPlan, "analysis_plan"),
+    "TASK_4_INTERMEDIATE_VIEWS": ("sql_builder", SQLBuildOutput, "sql_build_output"),
+}
+
+_THINK_RE = re.compile(r"<think>.*?</think>", flags=re.DOTALL | re.IGNORECASE)
+
+SUMMARY_CHARS_PER_AGENT = 400
+CARRYOVER_MAX_CHARS = 12000
+
+
+def _approx_tokens(n_chars: int) -> int:
+    return (n_chars + 3) // 4
+
+
+def _compact(text: str, limit: int) -> str:
+    t = _THINK_RE.sub("", text or "").strip()
+    t = re.sub(r"\s+", " ", t)
+    return t if len(t) <= limit else t[:limit].rstrip() + " …"
+
+
+def build_carryover(step_key: str, messages: List[Tuple[str, str]]) -> Dict[str, Any]:
+    """
+    Compact state handed to later steps instead of the raw transcript:
+    - the parsed structured output of the step (AnalysisPlan / SQLBuildOutput), if any
+    - a short summary: last message per agent, truncated
+    - whether the reviewer approved
+    `messages` is [(agent, content), ...] for this step's run only.
+    """
+    last_by_agent: Dict[str, str] = {}
+    for agent, content in messages:
+        if agent in ("user", "TaskResult"):
+            continue
+        last_by_agent[agent] = content
+
+    carry: Dict[str, Any] = {
+        "summary": {a: _compact(c, SUMMARY_CHARS_PER_AGENT) for a, c in last_by_agent.items()},
+        "approved": any("APPROVE_STEP" in c for a, c in messages if a == "reviewer"),
+    }
+
+    spec = _STRUCTURED_OUTPUTS.get(step_key)
+    if spec:
+        agent, model, key = spec
+        raw = last_by_agent.get(agent)
+        if raw:
+            try:
+                carry[key] = parse_llm_json(raw, model).model_dump()
+                # the parsed object supersedes the truncated text
+                carry["summary"].pop(agent, None)
+            except Exception:
+                pass
+    return carry
+
+
+def carryover_block(carryover: Dict[str, Dict[str, Any]], exclude_step: Optional[str] = None) -> str:
+    """Serialized PREVIOUS_STEPS_JSON for the prompt suffix (bounded)."""
+    prev = {k: v for k, v in carryover.items() if k != exclude_step}
+    if not prev:
+        return ""
+    return safe_json_dumps(prev, indent=1)[:CARRYOVER_MAX_CHARS]
+
+
+@dataclass
+class StepContextMetrics:
+    step: str
+    prompt_chars: int
+    carryover_chars: int
+    n_messages: int
+    transcript_chars: int
+    approx_context_tokens: int
+    elapsed_s: float
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+def context_metrics(
+    step_key: str,
+    prompt: str,
+    carryover_text: str,
+    messages: List[Tuple[str, str]],
+    elapsed_s: float,
+) -> StepContextMetrics:
+    transcript_chars = sum(len(c) for _, c in messages)
+    return StepContextMetrics(
+        step=step_key,
+        prompt_chars=len(prompt),
+        carryover_chars=len(carryover_text),
+        n_messages=len(messages),
+        transcript_chars=transcript_chars,
+        approx_context_tokens=_approx_tokens(transcript_chars),
+        elapsed_s=round(elapsed_s, 2),
+    )
@@ -7,6 +7,14 @@ def build_table_description_prompt(table: Dict[str, Any]) -> str:
     name = table.get("table")
     cols = table.get("columns", [])[:80]
     samples = table.get("sample_rows", [])[:5]
+    if table.get("stats", {}).get("rows_scanned"):
+        from column_stats import column_lines
+
+        # warehouse-side column stats describe every row; the few raw rows only show value formats
+        columns_block = f"COLUMNS (name type · null share · distinct · min .. max · top values):\n{column_lines(table, 80)}"
+        samples = samples[:3]
+    else:
+        columns_block = f"COLUMNS (name/type/nullability/len):\n{json.dumps(cols, indent=2)[:5000]}"
 
     # IMPORTANT: keep prompt compact but informative
     return f"""
@@ -34,8 +42,7 @@ TABLE:
 schema: {schema}
 table: {name}
 
-COLUMNS (name/type/nullability/len):
-{json.dumps(cols, indent=2)[:5000]}
+{columns_block[:6000]}
 
 SAMPLE_ROWS:
 {json.dumps(samples, indent=2)[:5000]}
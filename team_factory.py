@@ -1,28 +1,38 @@
 from __future__ import annotations
 
+import os
+
 from autogen_agentchat.agents import AssistantAgent
 from autogen_agentchat.teams import RoundRobinGroupChat
 
-from llm import make_model_client
+from llm import get_model_client, make_model_client
 from prompts import SYSTEM_MESSAGES
 from models import AnalysisPlan, SQLBuildOutput
 
 
-def build_team():
+def build_team(shared_clients: bool = True):
+    # Agents keep their own transcripts, so every session gets its own team; the model
+    # clients are stateless HTTP wrappers and are shared process-wide unless disabled.
+    shared = shared_clients and os.getenv("SHARE_MODEL_CLIENTS", "1") == "1"
+    client = get_model_client if shared else make_model_client
+
     # Structured output clients
-    planner_client = make_model_client(response_format=AnalysisPlan)
-    sql_client = make_model_client(response_format=SQLBuildOutput)
+    planner_client = client(response_format=AnalysisPlan)
+    sql_client = client(response_format=SQLBuildOutput)
 
     # Default client (NO response_format)
-    default_client = make_model_client()
+    default_client = client()
 
-    planner = AssistantAgent(name="planner", model_client=planner_client, system_message=SYSTEM_MESSAGES["planner"])
-    schema_profiler = AssistantAgent(name="schema_profiler", model_client=default_client, system_message=SYSTEM_MESSAGES["schema_profiler"])
-    table_describer = AssistantAgent(name="table_describer", model_client=default_client, system_message=SYSTEM_MESSAGES["table_describer"])
-    sql_builder = AssistantAgent(name="sql_builder", model_client=sql_client, system_message=SYSTEM_MESSAGES["sql_builder"])
-    python_analyst = AssistantAgent(name="python_analyst", model_client=default_client, system_message=SYSTEM_MESSAGES["python_analyst"])
-    dashboard_builder = AssistantAgent(name="dashboard_builder", model_client=default_client, system_message=SYSTEM_MESSAGES["dashboard_builder"])
-    reviewer = AssistantAgent(name="reviewer", model_client=default_client, system_message=SYSTEM_MESSAGES["reviewer"])
+    # Token-level streaming: agents emit ModelClientStreamingChunkEvent through team.run_stream
+    stream = os.getenv("STREAM_TOKENS", "1") == "1"
+
+    planner = AssistantAgent(name="planner", model_client=planner_client, system_message=SYSTEM_MESSAGES["planner"], model_client_stream=stream)
+    schema_profiler = AssistantAgent(name="schema_profiler", model_client=default_client, system_message=SYSTEM_MESSAGES["schema_profiler"], model_client_stream=stream)
+    table_describer = AssistantAgent(name="table_describer", model_client=default_client, system_message=SYSTEM_MESSAGES["table_describer"], model_client_stream=stream)
+    sql_builder = AssistantAgent(name="sql_builder", model_client=sql_client, system_message=SYSTEM_MESSAGES["sql_builder"], model_client_stream=stream)
+    python_analyst = AssistantAgent(name="python_analyst", model_client=default_client, system_message=SYSTEM_MESSAGES["python_analyst"], model_client_stream=stream)
+    dashboard_builder = AssistantAgent(name="dashboard_builder", model_client=default_client, system_message=SYSTEM_MESSAGES["dashboard_builder"], model_client_stream=stream)
+    reviewer = AssistantAgent(name="reviewer", model_client=default_client, system_message=SYSTEM_MESSAGES["reviewer"], model_client_stream=stream)
 
     # ✅ Termination condition (different autogen versions have slightly different APIs)
     termination_condition = None
@@ -62,4 +72,10 @@ def build_team():
             ]
         )
 
-    return team, [planner_client, sql_client, default_client]
\ No newline at end of file
+    clients = [planner_client, sql_client, default_client]
+    if not shared:
+        from loop_service import get_loop_service
+
+        for c in {id(c): c for c in clients}.values():
+            get_loop_service().on_shutdown(c.close)
+    return team, clients
\ No newline at end of file
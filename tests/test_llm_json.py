@@ -0,0 +1,53 @@
+import json
+
+import pytest
+
+from llm_json import JSONStreamError, StreamingJSONParser, fuzz_stream_parser
+
+
+def feed_all(parser: StreamingJSONParser, text: str, size: int) -> bool:
+    for i in range(0, len(text), size):
+        if parser.feed(text[i : i + size]):
+            return True
+    return parser.done
+
+
+@pytest.mark.parametrize("seed", [1, 2, 3])
+def test_fuzz_against_json_loads(seed):
+    stats = fuzz_stream_parser(iterations=1500, seed=seed)
+    assert stats["documents"] == stats["truncations"] == stats["garbage"] == 1500
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 7])
+def test_skips_think_block_split_across_chunks(size):
+    doc = {"a": [1, "}", {"b": None}]}
+    p = StreamingJSONParser()
+    assert feed_all(p, '<think>{"not": "this"}</think> ok: ' + json.dumps(doc) + " trailing", size)
+    assert p.value == doc
+
+
+def test_stops_at_end_of_first_value():
+    p = StreamingJSONParser()
+    assert not p.feed('{"a": "x}')
+    assert p.feed('", "b": 2}')
+    assert p.value == {"a": "x}", "b": 2}
+    assert p.feed("more text")  # done: later chunks are ignored
+    assert p.text == '{"a": "x}", "b": 2}'
+
+
+def test_truncated_stream_reports_position():
+    p = StreamingJSONParser()
+    p.feed('prose {"a": [1, 2')
+    with pytest.raises(JSONStreamError) as e:
+        p.close()
+    assert e.value.pos == len('prose {"a": [1, 2')
+
+
+def test_strict_stops_at_first_invalid_candidate():
+    p = StreamingJSONParser(strict=True)
+    assert p.feed("{a: 1} {}")
+    with pytest.raises(JSONStreamError):
+        p.close()
+    lenient = StreamingJSONParser()
+    assert lenient.feed("{a: 1} {}")
+    assert lenient.value == {}
@@ -0,0 +1,261 @@
+from __future__ import annotations
+
+import functools
+import itertools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, TypeVar
+
+F = TypeVar("F", bound=Callable[..., Any])
+
+
+@dataclass
+class Span:
+    name: str
+    cat: str
+    start: float  # time.perf_counter()
+    span_id: int
+    parent_id: Optional[int]
+    depth: int
+    tid: int
+    end: Optional[float] = None
+    args: Dict[str, Any] = field(default_factory=dict)
+
+    def set(self, **attrs: Any) -> None:
+        """Attach attributes known only after the work ran (row counts, bytes, tokens...)."""
+        self.args.update(attrs)
+
+    @property
+    def dur_s(self) -> float:
+        return (self.end if self.end is not None else time.perf_counter()) - self.start
+
+
+class _NullSpan:
+    def set(self, **attrs: Any) -> None:
+        pass
+
+
+NULL_SPAN = _NullSpan()
+
+
+class Trace:
+    """
+    Spans of one run (a background job, a benchmark...). Spans are collected from any
+    thread or task that carries this trace in its context; `write()` emits Chrome trace
+    JSON (open in chrome://tracing or ui.perfetto.dev).
+    """
+
+    def __init__(self, name: str, **meta: Any) -> None:
+        self.name = name
+        self.meta = meta
+        self.t0 = time.perf_counter()
+        self.wall_t0 = time.time()
+        self.spans: List[Span] = []
+        self.path: Optional[Path] = None
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._threads: Dict[int, str] = {}
+
+    def _next_id(self) -> int:
+        with self._lock:
+            return next(self._ids)
+
+    def _add(self, s: Span) -> None:
+        with self._lock:
+            self.spans.append(s)
+
+    def _tid(self, lane: Optional[str] = None) -> int:
+        name = lane or threading.current_thread().name
+        with self._lock:
+            for tid, n in self._threads.items():
+                if n == name:
+                    return tid
+            tid = len(self._threads) + 1
+            self._threads[tid] = name
+            return tid
+
+    def add_span(
+        self,
+        name: str,
+        start: float,
+        end: float,
+        cat: str = "app",
+        lane: Optional[str] = None,
+        **args: Any,
+    ) -> Span:
+        """Record a span after the fact (e.g. an agent turn measured between two stream events)."""
+        parent = _current_span.get()
+        s = Span(
+            name=name,
+            cat=cat,
+            start=start,
+            end=end,
+            span_id=self._next_id(),
+            parent_id=parent.span_id if parent is not None else None,
+            depth=parent.depth + 1 if parent is not None else 0,
+            tid=self._tid(lane),
+            args=dict(args),
+        )
+        self._add(s)
+        return s
+
+    def to_chrome(self) -> Dict[str, Any]:
+        pid = os.getpid()
+        events: List[Dict[str, Any]] = [
+            {"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": name}}
+            for tid, name in self._threads.items()
+        ]
+        for s in sorted(self.spans, key=lambda x: x.start):
+            events.append(
+                {
+                    "name": s.name,
+                    "cat": s.cat,
+                    "ph": "X",
+                    "ts": round((s.start - self.t0) * 1e6, 1),
+                    "dur": round(s.dur_s * 1e6, 1),
+                    "pid": pid,
+                    "tid": s.tid,
+                    "args": {k: _jsonable(v) for k, v in s.args.items()},
+                }
+            )
+        return {
+            "traceEvents": events,
+            "displayTimeUnit": "ms",
+            "otherData": {"name": self.name, "started_at": self.wall_t0, **{k: _jsonable(v) for k, v in self.meta.items()}},
+        }
+
+    def write(self, path: Optional[Path] = None) -> Path:
+        if path is None:
+            root = trace_dir()
+            root.mkdir(parents=True, exist_ok=True)
+            stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(self.wall_t0))
+            safe = "".join(c if c.isalnum() or c in "-_" else "_" for c in self.name)[:60]
+            path = root / f"{stamp}_{safe}_{os.getpid()}_{id(self) & 0xFFFF:04x}.json"
+            _prune(root)
+        path.write_text(json.dumps(self.to_chrome()), encoding="utf-8")
+        self.path = path
+        return path
+
+    def summary(self, limit: int = 500) -> List[Dict[str, Any]]:
+        """Flat span list in start order for UI tables (durations in ms, start relative to the run)."""
+        rows = []
+        for s in sorted(self.spans, key=lambda x: (x.start, x.depth))[:limit]:
+            rows.append(
+                {
+                    "span": "  " * s.depth + s.name,
+                    "name": s.name,
+                    "cat": s.cat,
+                    "depth": s.depth,
+                    "start_ms": round((s.start - self.t0) * 1000, 1),
+                    "dur_ms": round(s.dur_s * 1000, 1),
+                    **{k: _jsonable(v) for k, v in s.args.items()},
+                }
+            )
+        return rows
+
+
+def _jsonable(v: Any) -> Any:
+    if v is None or isinstance(v, (bool, int, float, str)):
+        return v
+    return str(v)
+
+
+def trace_dir() -> Path:
+    return Path(os.getenv("TRACE_DIR") or Path(os.getenv("CACHE_DIR", "./cache")) / "traces")
+
+
+def _prune(root: Path) -> None:
+    keep = int(os.getenv("TRACE_KEEP", "50"))
+    files = sorted(root.glob("*.json"), key=lambda p: p.stat().st_mtime)
+    for p in files[: max(0, len(files) - keep + 1)]:
+        try:
+            p.unlink()
+        except OSError:
+            pass
+
+
+_current_trace: ContextVar[Optional[Trace]] = ContextVar("trace", default=None)
+_current_span: ContextVar[Optional[Span]] = ContextVar("span", default=None)
+
+
+def current_trace() -> Optional[Trace]:
+    return _current_trace.get()
+
+
+@contextmanager
+def span(name: str, cat: str = "app", **args: Any) -> Iterator[Any]:
+    """
+    Nested timing span. Outside a trace this is a no-op yielding NULL_SPAN, so
+    instrumented library code costs ~nothing when nobody is tracing.
+    """
+    trace = _current_trace.get()
+    if trace is None:
+        yield NULL_SPAN
+        return
+    parent = _current_span.get()
+    s = Span(
+        name=name,
+        cat=cat,
+        start=time.perf_counter(),
+        span_id=trace._next_id(),
+        parent_id=parent.span_id if parent is not None else None,
+        depth=parent.depth + 1 if parent is not None else 0,
+        tid=trace._tid(),
+        args=dict(args),
+    )
+    token = _current_span.set(s)
+    try:
+        yield s
+    except BaseException as e:
+        s.args["error"] = type(e).__name__
+        raise
+    finally:
+        s.end = time.perf_counter()
+        _current_span.reset(token)
+        trace._add(s)
+
+
+def traced(name: Optional[str] = None, cat: str = "app") -> Callable[[F], F]:
+    """Decorator form of span() for plain functions."""
+
+    def deco(fn: F) -> F:
+        span_name = name or f"{fn.__module__}.{fn.__qualname__}"
+
+        @functools.wraps(fn)
+        def wrapper(*a: Any, **kw: Any) -> Any:
+            if _current_trace.get() is None:
+                return fn(*a, **kw)
+            with span(span_name, cat=cat):
+                return fn(*a, **kw)
+
+        return wrapper  # type: ignore[return-value]
+
+    return deco
+
+
+@contextmanager
+def start_trace(name: str, write: Optional[bool] = None, **meta: Any) -> Iterator[Trace]:
+    """
+    Root of a trace: everything run in this context (including coroutines handed to the loop
+    service) records into it. Written to TRACE_DIR on exit unless TRACE_WRITE=0.
+    """
+    trace = Trace(name, **meta)
+    t_token = _current_trace.set(trace)
+    s_token = _current_span.set(None)
+    try:
+        with span(name, cat="run"):
+            yield trace
+    finally:
+        _current_span.reset(s_token)
+        _current_trace.reset(t_token)
+        if write if write is not None else os.getenv("TRACE_WRITE", "1") == "1":
+            try:
+                trace.write()
+            except OSError:
+                pass
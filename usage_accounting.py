@@ -0,0 +1,126 @@
+from __future__ import annotations
+
+import os
+import time
+from dataclasses import asdict, dataclass, field
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Sequence
+
+
+def message_cost(prompt_tokens: Optional[int], completion_tokens: Optional[int]) -> float:
+    """
+    Cost of one message from COST_PER_1K_PROMPT_TOKENS / COST_PER_1K_COMPLETION_TOKENS
+    (both default 0: a local model has no per-token price, but a GPU-hour rate can be spread here).
+    """
+    p = float(os.getenv("COST_PER_1K_PROMPT_TOKENS", "0"))
+    c = float(os.getenv("COST_PER_1K_COMPLETION_TOKENS", "0"))
+    return ((prompt_tokens or 0) * p + (completion_tokens or 0) * c) / 1000.0
+
+
+@dataclass
+class MessageUsage:
+    run_id: str
+    step: str
+    agent: str
+    seq: int
+    prompt_tokens: Optional[int]
+    completion_tokens: Optional[int]
+    gen_s: float
+    ttft_s: Optional[float]
+    tokens_per_s: Optional[float]
+    chars: int
+    cancelled: bool = False
+    estimated: bool = False  # token counts guessed (see llm.EstimatedUsage), not reported by the server
+    cost: float = 0.0
+    created_at: datetime = field(default_factory=datetime.now)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+class UsageRecorder:
+    """
+    Per-message accounting for one team run, fed from the run_stream loop.
+
+    A message's generation time runs from the end of the previous message (when the agent's
+    turn starts) to its arrival; TTFT is the first streamed chunk of that turn.
+    `prompt_tokens` is what the server evaluated (Ollama's prompt_eval_count), so prefix-cache
+    hits show up as smaller numbers, not as the full prompt size. Streams stopped early (JSON early
+    stop, cancel) get no server counts: completion is the streamed chunk count, prompt is None, and
+    the row is marked `estimated`.
+    """
+
+    def __init__(self, run_id: str, step: str) -> None:
+        self.run_id = run_id
+        self.step = step
+        self.rows: List[MessageUsage] = []
+        self.turn_start = time.perf_counter()
+        self._first_chunk: Optional[float] = None
+        self._chunks = 0
+
+    def on_chunk(self) -> None:
+        if self._first_chunk is None:
+            self._first_chunk = time.perf_counter()
+        self._chunks += 1
+
+    def on_message(self, agent: str, content: str, usage: Any = None, cancelled: bool = False) -> Optional[MessageUsage]:
+        """Close the current turn; returns the row, or None for messages no model produced (the task)."""
+        now = time.perf_counter()
+        row = None
+        if usage is not None or cancelled or self._chunks:
+            estimated = bool(getattr(usage, "estimated", False))
+            prompt = None if estimated else getattr(usage, "prompt_tokens", None)
+            completion = getattr(usage, "completion_tokens", None)
+            if not completion and self._chunks:
+                completion, estimated = self._chunks, True
+            gen_s = now - self.turn_start
+            ttft = None if self._first_chunk is None else self._first_chunk - self.turn_start
+            decode_s = now - self._first_chunk if self._first_chunk is not None else gen_s
+            row = MessageUsage(
+                run_id=self.run_id,
+                step=self.step,
+                agent=agent,
+                seq=len(self.rows),
+                prompt_tokens=prompt,
+                completion_tokens=completion,
+                gen_s=gen_s,
+                ttft_s=ttft,
+                tokens_per_s=(completion / decode_s) if completion and decode_s > 0 else None,
+                chars=len(content),
+                cancelled=cancelled,
+                estimated=estimated,
+                cost=message_cost(prompt, completion),
+            )
+            self.rows.append(row)
+        self.turn_start = now
+        self._first_chunk = None
+        self._chunks = 0
+        return row
+
+    def to_dicts(self) -> List[Dict[str, Any]]:
+        return [r.to_dict() for r in self.rows]
+
+
+def aggregate(rows: Sequence[Dict[str, Any]], by: Sequence[str]):
+    """
+    Totals per group (tokens, generation time, cost) plus mean TTFT and overall tokens/s;
+    `estimated` counts the messages whose token counts were estimated.
+    """
+    import pandas as pd
+
+    df = pd.DataFrame(list(rows))
+    if df.empty:
+        return df
+    # rows recorded before the flag existed have none
+    df["estimated"] = df["estimated"].fillna(False).astype(bool) if "estimated" in df else False
+    out = df.groupby(list(by), as_index=False).agg(
+        messages=("agent", "size"),
+        prompt_tokens=("prompt_tokens", "sum"),
+        completion_tokens=("completion_tokens", "sum"),
+        gen_s=("gen_s", "sum"),
+        ttft_s=("ttft_s", "mean"),
+        cost=("cost", "sum"),
+        estimated=("estimated", "sum"),
+    )
+    out["tokens_per_s"] = (out["completion_tokens"] / out["gen_s"]).where(out["gen_s"] > 0)
+    return out.sort_values("gen_s", ascending=False)